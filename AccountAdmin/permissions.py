@@ -10,8 +10,18 @@ class IsAdminRole(BasePermission):
         user = getattr(request, "user", None)
         return bool(user and user.is_authenticated and getattr(user, "rol", None) == "admin")
 
+class IsSuperuser(BasePermission):
+    """
+    Solo superusers (diagnóstico: consultas lentas, perfiles, métricas)
+    """
+    message = "Se requiere superuser."
+
+    def has_permission(self, request, view):
+        user = getattr(request, "user", None)
+        return bool(user and user.is_authenticated and user.is_superuser)
+
 # Alias por compatibilidad con imports existentes (p.ej. IsAdmin)
 IsAdmin = IsAdminRole
 IsAdminUser = IsAdminRole
 
-__all__ = ["IsAdminRole", "IsAdmin", "IsAdminUser"]
+__all__ = ["IsAdminRole", "IsAdmin", "IsAdminUser", "IsSuperuser"]
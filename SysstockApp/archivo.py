@@ -0,0 +1,211 @@
+"""
+Archivo de movimientos de stock y compactación en saldos de apertura.
+
+- `archivar_lote` copia los movimientos de unas claves (producto, sucursal)
+  anteriores al corte a StockMovementArchive y los reemplaza en StockMovement
+  por su movimiento de apertura (apertura=True): mismo neto y misma
+  valorización al corte. StockBalance no se toca, así que los saldos quedan
+  exactos, y SUM(movimientos) sigue dando el saldo (rebuild_stock_balances).
+- Apertura: un IN al costo promedio (o un OUT si el neto es negativo). Con FIFO
+  un IN por capa abierta, con su costo, y la CostLayer viva pasa a apuntarle
+  (el promedio, informativo con FIFO, queda en el de las capas abiertas).
+- Cada lote de claves es una transacción: `archive_movements` se puede cortar
+  y volver a correr (la copia al archivo ignora los ya copiados).
+- El archivo vive en la misma base o en un alias aparte (ARCHIVE_DATABASE_URL ->
+  alias 'archivo', ver ArchivoRouter; las empresas en un shard, en su shard).
+  El kardex lo lee con ?archivo=1.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from . import valorizacion
+from .stock import _lotes
+
+ALIAS = "archivo"
+LOTE = 500  # ids por DELETE / filas por INSERT
+
+
+def configurado():
+    return ALIAS in settings.DATABASES
+
+
+def alias(using=DEFAULT_DB_ALIAS):
+    """Base donde vive el archivo de los movimientos de 'using' (un shard guarda el suyo, ver shards.py)."""
+    return ALIAS if configurado() and using == DEFAULT_DB_ALIAS else using
+
+
+class ArchivoRouter:
+    """DATABASE_ROUTERS: StockMovementArchive -> 'archivo' (si existe); nada más va ahí."""
+
+    def _es_archivo(self, model):
+        return model._meta.app_label == "SysstockApp" and model._meta.model_name == "stockmovementarchive"
+
+    def db_for_read(self, model, **hints):
+        return ALIAS if configurado() and self._es_archivo(model) else None
+
+    def db_for_write(self, model, **hints):
+        return ALIAS if configurado() and self._es_archivo(model) else None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not configurado():
+            return None
+        if app_label == "SysstockApp" and model_name == "stockmovementarchive":
+            return db == ALIAS
+        return False if db == ALIAS else None
+
+
+# =========================
+#  Cálculo de la apertura (sin DB)
+# =========================
+def aperturas(movimientos, fifo=False):
+    """
+    movimientos: (tipo, cantidad, costo_unit, id) en orden cronológico.
+    Devuelve [(tipo, cantidad, costo_unit, movimiento_id_de_la_capa)] que,
+    reproducidos, dan el mismo neto, promedio y capas abiertas.
+    """
+    cantidad, promedio, _, capas = valorizacion.reproducir(movimientos, fifo=fifo)
+    resultado = []
+    if fifo:
+        resultado = [("IN", c["restante"], c["costo_unit"], c["movimiento_id"]) for c in capas]
+    elif cantidad > 0:
+        resultado = [("IN", cantidad, promedio, None)]
+    # ajuste si las capas no cubren el neto (historia con stock negativo)
+    resto = cantidad - sum(r[1] for r in resultado)
+    if resto > 0:
+        resultado.append(("IN", resto, promedio, None))
+    elif resto < 0:
+        resultado.append(("OUT", -resto, None, None))
+    return resultado
+
+
+def momento_apertura(corte):
+    # justo antes del corte: queda después de lo archivado y antes de lo que sigue vivo
+    return corte - timedelta(microseconds=1)
+
+
+# =========================
+#  Archivado
+# =========================
+def claves_pendientes(corte, using=DEFAULT_DB_ALIAS):
+    """(producto_id, sucursal_id) con movimientos (no de apertura) anteriores al corte."""
+    from .models import StockMovement
+
+    return sorted(
+        StockMovement.objects.using(using)
+        .filter(creado_en__lt=corte, apertura=False)
+        .order_by()
+        .values_list("producto_id", "sucursal_id")
+        .distinct()
+    )
+
+
+def archivar_lote(claves, corte, using=DEFAULT_DB_ALIAS):
+    """
+    Archiva los movimientos anteriores a 'corte' de las claves dadas y deja una
+    apertura por clave. Devuelve (archivados, aperturas).
+    """
+    from .models import CostLayer, StockBalance, StockMovement, StockMovementArchive
+
+    fifo = valorizacion.metodo() == valorizacion.FIFO
+    destino = alias(using)
+    claves = set(claves)
+    pids = sorted({p for p, _ in claves})
+    campos = (
+        "id", "producto_id", "sucursal_id", "tipo", "cantidad", "motivo", "costo_unit",
+        "transferencia_id", "usuario_id", "creado_en", "apertura",
+    )
+
+    with transaction.atomic(using=using):
+        # mismo lock que actualizar_saldos: ninguna escritura de estas claves en el medio
+        list(
+            StockBalance.objects.using(using).select_for_update()
+            .filter(producto_id__in=pids).values_list("id", flat=True)
+        )
+        movs = defaultdict(list)
+        for row in (
+            StockMovement.objects.using(using)
+            .filter(producto_id__in=pids, creado_en__lt=corte)
+            .order_by("creado_en", "id")
+            .values(*campos)
+        ):
+            if (row["producto_id"], row["sucursal_id"]) in claves:
+                movs[(row["producto_id"], row["sucursal_id"])].append(row)
+        if not movs:
+            return 0, 0
+
+        # 1) copia al archivo (las aperturas anteriores no: se reemplazan por la nueva)
+        copias = [
+            StockMovementArchive(
+                original_id=m["id"], producto_id=m["producto_id"], sucursal_id=m["sucursal_id"],
+                tipo=m["tipo"], cantidad=m["cantidad"],
+                cantidad_signed=m["cantidad"] if m["tipo"] == StockMovement.IN else -m["cantidad"],
+                motivo=m["motivo"], costo_unit=m["costo_unit"], transferencia_id=m["transferencia_id"],
+                usuario_id=m["usuario_id"], creado_en=m["creado_en"],
+            )
+            for filas in movs.values() for m in filas if not m["apertura"]
+        ]
+        if destino == using:
+            StockMovementArchive.objects.using(destino).bulk_create(copias, batch_size=LOTE, ignore_conflicts=True)
+        else:
+            # otra base: se confirma antes que el borrado; si este falla, el reintento ignora las copias
+            with transaction.atomic(using=destino):
+                StockMovementArchive.objects.using(destino).bulk_create(
+                    copias, batch_size=LOTE, ignore_conflicts=True
+                )
+
+        # 2) aperturas
+        motivo = f"Saldo de apertura al {timezone.localtime(corte):%Y-%m-%d}"
+        nuevas, capas = [], []
+        for (p, s), filas in sorted(movs.items()):
+            reproducidos = [(m["tipo"], m["cantidad"], m["costo_unit"], m["id"]) for m in filas]
+            for tipo, cantidad, costo, capa in aperturas(reproducidos, fifo=fifo):
+                nuevas.append(StockMovement(
+                    producto_id=p, sucursal_id=s, tipo=tipo, cantidad=cantidad,
+                    cantidad_signed=cantidad if tipo == StockMovement.IN else -cantidad,
+                    motivo=motivo, costo_unit=costo, apertura=True,
+                ))
+                capas.append(capa)
+        desde = timezone.now()
+        StockMovement.objects.using(using).bulk_create(nuevas, batch_size=LOTE)
+        # creado_en es auto_now_add: se lleva al corte después del INSERT (ids en orden de inserción)
+        creadas = (
+            StockMovement.objects.using(using)
+            .filter(apertura=True, producto_id__in=pids, creado_en__gte=desde)
+            .order_by("id")
+        )
+        ids_nuevas = list(creadas.values_list("id", flat=True))
+        creadas.update(creado_en=momento_apertura(corte))
+
+        # 3) capas FIFO vivas -> su apertura; las agotadas de lo archivado se borran
+        viejos = [m["id"] for filas in movs.values() for m in filas]
+        for capa, nueva_id in zip(capas, ids_nuevas):
+            if capa is not None:
+                CostLayer.objects.using(using).filter(movimiento_id=capa, restante__gt=0).update(movimiento_id=nueva_id)
+        for lote in _lotes(viejos, size=LOTE):
+            CostLayer.objects.using(using).filter(movimiento_id__in=lote, restante=0).delete()
+
+        # 4) borrado sin StockMovement.delete(): el saldo no cambia
+        for lote in _lotes(viejos, size=LOTE):
+            StockMovement.objects.using(using).filter(id__in=lote).delete()
+
+    return len(copias), len(nuevas)
+
+
+# =========================
+#  Lectura (kardex)
+# =========================
+def historia(producto_id, sucursal_id, desde=None, hasta=None):
+    """Movimientos archivados de un producto/sucursal, en orden cronológico."""
+    from .models import StockMovementArchive
+
+    from .particiones import rango_fechas
+
+    qs = StockMovementArchive.objects.filter(producto_id=producto_id, sucursal_id=sucursal_id)
+    if desde and hasta:
+        inicio, fin = rango_fechas(desde, hasta)
+        qs = qs.filter(creado_en__gte=inicio, creado_en__lt=fin)
+    return qs.order_by("creado_en", "original_id")
@@ -0,0 +1,88 @@
+"""
+Consultas del ORM desde vistas async (ASGI).
+
+- en_pool(func, ...): corre una función sync (ORM) en un ThreadPoolExecutor
+  acotado por SYSSTOCK_ASYNC_DB_WORKERS. Cada hilo mantiene su propia conexión
+  (CONN_MAX_AGE), así que el pool también acota las conexiones a la base.
+- reunir(...): lanza varias en paralelo y devuelve los resultados en orden.
+- envolver_sql(wrapper): como connection.execute_wrapper, pero atado al
+  contexto (contextvars) y no al hilo: cubre las queries del pool, las de
+  las vistas sync que Django corre en otro hilo bajo ASGI y las del hilo
+  actual. Cada conexión lleva un único wrapper fijo (_despachar) que aplica
+  los del contexto; sin wrappers activos el costo es un ContextVar.get().
+
+Los contextvars del request (réplica, wrappers) se copian al hilo del pool.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+
+_wrappers = contextvars.ContextVar("sysstock_wrappers_sql", default=())
+
+_pool = None
+_lock = threading.Lock()
+
+
+def pool():
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=int(getattr(settings, "SYSSTOCK_ASYNC_DB_WORKERS", 8)),
+                    thread_name_prefix="sysstock-db",
+                )
+    return _pool
+
+
+def _despachar(execute, sql, params, many, context):
+    wrappers = _wrappers.get()
+    for wrapper in reversed(wrappers):
+        execute = functools.partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def _instalar(connection, **kwargs):
+    if _despachar not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_despachar)
+
+
+connection_created.connect(_instalar, dispatch_uid="sysstock_asincrono_despachar")
+
+
+@contextmanager
+def envolver_sql(wrapper):
+    for conn in connections.all():
+        _instalar(conn)  # conexiones del hilo abiertas antes de importar este módulo
+    token = _wrappers.set(_wrappers.get() + (wrapper,))
+    try:
+        yield
+    finally:
+        _wrappers.reset(token)
+
+
+def _en_hilo(func, args, kwargs):
+    # igual que request_started/finished: descarta conexiones vencidas o rotas
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def en_pool(func, *args, **kwargs):
+    ctx = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool(), functools.partial(ctx.run, _en_hilo, func, args, kwargs))
+
+
+async def reunir(*llamadas):
+    """reunir((func, arg, ...), ...) -> [resultado, ...]; la primera excepción se propaga."""
+    return await asyncio.gather(*(en_pool(func, *args) for func, *args in llamadas))
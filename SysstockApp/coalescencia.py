@@ -0,0 +1,200 @@
+"""
+Coalescencia (single-flight) de reportes caros: requests idénticos simultáneos
+(misma vista, empresa y parámetros) comparten un solo cálculo.
+
+    datos = compartir("ventas_hoy_empresa", (etiqueta_tenant(user), hoy), calcular, modelo=Sale)
+
+- En el proceso: el primero calcula; los que llegan mientras tanto esperan su
+  resultado (o su excepción) hasta SYSSTOCK_COALESCE_WAIT segundos y, si se
+  agota, calculan ellos. Nada se guarda: terminado el cálculo, el próximo
+  request calcula de nuevo.
+- Entre procesos (opcional, SYSSTOCK_COALESCE_CACHE = alias de CACHES con add
+  atómico: Redis / Memcached): el que calcula toma un lock (cache.add) y publica
+  el resultado por SYSSTOCK_COALESCE_TTL segundos; los otros procesos lo esperan
+  leyendo la cache. Los reportes pueden atrasar hasta ese TTL.
+- La clave incluye la base de la que se leería (router: shard de la empresa,
+  réplica o primario), así un request fijado al primario no recibe un
+  resultado leído de la réplica.
+- Métricas: sysstock_coalescencia_total{vista, resultado} con resultado
+  calculada | compartida | remota | espera_agotada (se agregan a /metrics).
+
+Con SYSSTOCK_COALESCE_ENABLED=False cada request calcula lo suyo.
+"""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+
+from . import shards
+
+PREFIJO = "sysstock:coalesce:"
+INTERVALO = 0.05  # segundos entre lecturas de la cache compartida
+
+
+def activa():
+    return getattr(settings, "SYSSTOCK_COALESCE_ENABLED", True)
+
+
+def _espera():
+    return float(getattr(settings, "SYSSTOCK_COALESCE_WAIT", 10))
+
+
+def _cache():
+    alias = getattr(settings, "SYSSTOCK_COALESCE_CACHE", None)
+    return caches[alias] if alias else None
+
+
+# =========================
+#  Métricas (por proceso)
+# =========================
+class Metricas:
+    """Contadores por (vista, resultado)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = defaultdict(int)
+
+    def contar(self, vista, resultado):
+        with self._lock:
+            self._contadores[(vista, resultado)] += 1
+
+    def exportar(self):
+        with self._lock:
+            contadores = dict(self._contadores)
+        out = [
+            "# HELP sysstock_coalescencia_total Cálculos de reportes por resultado "
+            "(calculada, compartida, remota, espera_agotada).",
+            "# TYPE sysstock_coalescencia_total counter",
+        ]
+        out += [
+            f'sysstock_coalescencia_total{{vista="{v}",resultado="{r}"}} {n}'
+            for (v, r), n in sorted(contadores.items())
+        ]
+        return out
+
+
+METRICAS = Metricas()
+
+
+# =========================
+#  Single-flight
+# =========================
+class _Vuelo:
+    __slots__ = ("listo", "resultado", "error")
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+_vuelos = {}
+_lock = threading.Lock()
+
+
+def en_curso():
+    with _lock:
+        return len(_vuelos)
+
+
+def compartir(vista, partes, calcular, modelo=None):
+    """
+    Resultado de calcular() para (vista, partes), compartido con los requests
+    idénticos en curso. 'partes' tiene que identificar todo lo que cambia el
+    resultado (empresa / sucursal, parámetros, día); 'modelo' es el que se lee,
+    para sumar a la clave la base a la que iría (sin modelo: la de la empresa).
+    """
+    if not activa():
+        return calcular()
+    base = router.db_for_read(modelo) if modelo is not None else shards.alias()
+    clave = (vista, base, *partes)
+
+    with _lock:
+        vuelo = _vuelos.get(clave)
+        lider = vuelo is None
+        if lider:
+            vuelo = _vuelos[clave] = _Vuelo()
+
+    if not lider:
+        if not vuelo.listo.wait(_espera()):
+            METRICAS.contar(vista, "espera_agotada")
+            return calcular()
+        METRICAS.contar(vista, "compartida")
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.resultado
+
+    try:
+        vuelo.resultado = _entre_procesos(vista, clave, calcular)
+        return vuelo.resultado
+    except Exception as e:
+        vuelo.error = e
+        raise
+    finally:
+        with _lock:
+            _vuelos.pop(clave, None)
+        vuelo.listo.set()
+
+
+def _entre_procesos(vista, clave, calcular):
+    cache = _cache()
+    if cache is None:
+        METRICAS.contar(vista, "calculada")
+        return calcular()
+
+    k = PREFIJO + hashlib.sha1(repr(clave).encode()).hexdigest()
+    try:
+        hit = cache.get(k)
+        tomado = hit is None and cache.add(k + ":lock", 1, timeout=max(int(_espera()), 1))
+    except Exception:
+        # cache caída: como sin cache compartida
+        hit, tomado = None, True
+    if hit is not None:
+        METRICAS.contar(vista, "remota")
+        return hit[0]
+
+    if not tomado:
+        # otro proceso calcula: esperar su resultado (o que suelte el lock sin publicar)
+        limite = time.monotonic() + _espera()
+        try:
+            while time.monotonic() < limite:
+                time.sleep(INTERVALO)
+                hit = cache.get(k)
+                if hit is not None:
+                    METRICAS.contar(vista, "remota")
+                    return hit[0]
+                if cache.get(k + ":lock") is None:
+                    break
+        except Exception:
+            pass
+        METRICAS.contar(vista, "espera_agotada")
+        return calcular()
+
+    try:
+        resultado = calcular()
+        METRICAS.contar(vista, "calculada")
+        try:
+            # en una tupla: un resultado None también se comparte
+            cache.set(k, (resultado,), timeout=float(getattr(settings, "SYSSTOCK_COALESCE_TTL", 2)))
+        except Exception:
+            pass
+        return resultado
+    finally:
+        try:
+            cache.delete(k + ":lock")
+        except Exception:
+            pass
+
+
+def exportar_metricas():
+    """Líneas Prometheus de la coalescencia (se agregan a /metrics)."""
+    out = METRICAS.exportar() + [
+        "# HELP sysstock_coalescencia_en_curso Cálculos compartibles en curso en este proceso.",
+        "# TYPE sysstock_coalescencia_en_curso gauge",
+        f"sysstock_coalescencia_en_curso {en_curso()}",
+    ]
+    return "\n".join(out) + "\n"
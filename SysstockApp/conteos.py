@@ -0,0 +1,228 @@
+"""
+Conteo físico de inventario (stocktake) y ajuste masivo.
+
+- leer_conteo_*: JSON / CSV / XLSX -> {sku: cantidad contada}
+- diferencias: compara el conteo contra los saldos (una sola query)
+- aplicar_conteo: escribe todos los ajustes IN/OUT con un motivo común,
+  con bulk_create, en una transacción
+"""
+import csv
+import io
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import shards
+from .stock import LOTE, aplicar_movimientos, insertar_movimientos
+
+COLUMNAS_SKU = ("sku", "codigo", "código")
+COLUMNAS_CANTIDAD = ("cantidad", "conteo", "contado", "stock")
+
+
+class ConteoInvalido(ValueError):
+    """Archivo / payload de conteo con formato inválido (se responde 400)."""
+
+
+# =========================
+#  Lectura
+# =========================
+def _cantidad(valor, fila):
+    try:
+        cantidad = Decimal(str(valor).strip().replace(",", "."))
+    except Exception:
+        raise ConteoInvalido(f"Fila {fila}: cantidad inválida ({valor!r}).")
+    if cantidad < 0 or cantidad != cantidad.to_integral_value():
+        raise ConteoInvalido(f"Fila {fila}: la cantidad debe ser un entero >= 0 ({valor!r}).")
+    return int(cantidad)
+
+
+def _acumular(filas):
+    """
+    filas: iterable de (nro_fila, sku, cantidad). Un SKU repetido (contado en
+    dos ubicaciones) suma.
+    """
+    conteo = defaultdict(int)
+    for fila, sku, cantidad in filas:
+        sku = str(sku or "").strip()
+        if not sku:
+            continue
+        conteo[sku] += _cantidad(cantidad, fila)
+    if not conteo:
+        raise ConteoInvalido("El conteo no tiene filas con SKU.")
+    return dict(conteo)
+
+
+def _columnas(header):
+    nombres = [str(h or "").strip().lower() for h in header]
+    try:
+        i_sku = next(i for i, h in enumerate(nombres) if h in COLUMNAS_SKU)
+        i_cant = next(i for i, h in enumerate(nombres) if h in COLUMNAS_CANTIDAD)
+    except StopIteration:
+        raise ConteoInvalido("El archivo debe tener columnas 'sku' y 'cantidad'.")
+    return i_sku, i_cant
+
+
+def leer_conteo_items(items):
+    """JSON: [{"sku": "A1", "cantidad": 10}, ...]"""
+    if not isinstance(items, list):
+        raise ConteoInvalido("'items' debe ser una lista de {sku, cantidad}.")
+    return _acumular(
+        (n, it.get("sku"), it.get("cantidad")) for n, it in enumerate(items, start=1) if isinstance(it, dict)
+    )
+
+
+def leer_conteo_csv(archivo):
+    texto = archivo.read()
+    if isinstance(texto, bytes):
+        texto = texto.decode("utf-8-sig")
+    try:
+        dialecto = csv.Sniffer().sniff(texto[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialecto = csv.excel
+    reader = csv.reader(io.StringIO(texto), dialecto)
+    try:
+        i_sku, i_cant = _columnas(next(reader))
+    except StopIteration:
+        raise ConteoInvalido("El archivo está vacío.")
+    return _acumular(
+        (n, row[i_sku], row[i_cant]) for n, row in enumerate(reader, start=2) if len(row) > max(i_sku, i_cant)
+    )
+
+
+def leer_conteo_xlsx(archivo):
+    from openpyxl import load_workbook
+
+    try:
+        wb = load_workbook(archivo, read_only=True, data_only=True)
+    except Exception:
+        raise ConteoInvalido("No se pudo leer el archivo Excel.")
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        try:
+            i_sku, i_cant = _columnas(next(rows))
+        except StopIteration:
+            raise ConteoInvalido("El archivo está vacío.")
+        return _acumular(
+            (n, row[i_sku], row[i_cant]) for n, row in enumerate(rows, start=2)
+            if len(row) > max(i_sku, i_cant) and row[i_cant] is not None
+        )
+    finally:
+        wb.close()
+
+
+def leer_conteo(archivo=None, items=None):
+    if archivo is None:
+        return leer_conteo_items(items)
+    nombre = (getattr(archivo, "name", "") or "").lower()
+    if nombre.endswith((".xlsx", ".xlsm")):
+        return leer_conteo_xlsx(archivo)
+    if nombre.endswith((".csv", ".txt")):
+        return leer_conteo_csv(archivo)
+    raise ConteoInvalido("Formato no soportado: usá .csv o .xlsx (o JSON con 'items').")
+
+
+# =========================
+#  Diferencias
+# =========================
+def diferencias(sucursal, conteo, completo=False):
+    """
+    Compara el conteo con los saldos actuales de la sucursal en UNA query
+    (productos + saldo por subquery). Devuelve dict con:
+      - lineas: [{producto_id, sku, nombre, stock, contado, diferencia}] (solo las que difieren)
+      - desconocidos: SKUs del conteo que no existen en la sucursal
+      - sin_contar: productos de la sucursal que no aparecen en el conteo
+    completo=True: los productos no contados se ajustan a 0.
+    """
+    from .models import Product, StockBalance
+
+    saldo = (
+        StockBalance.objects
+        .filter(producto=OuterRef("pk"), sucursal=sucursal)
+        .values("cantidad")[:1]
+    )
+    productos = (
+        Product.objects
+        .filter(sucursal=sucursal)
+        .annotate(_stock=Coalesce(Subquery(saldo, output_field=IntegerField()), 0))
+        .order_by("id")
+        .values_list("id", "sku", "nombre", "_stock")
+    )
+
+    vistos = set()
+    lineas, sin_contar, contados = [], 0, 0
+    for pid, sku, nombre, stock in productos.iterator(chunk_size=LOTE * 4):
+        if sku in conteo and sku not in vistos:
+            vistos.add(sku)
+            contado = conteo[sku]
+            contados += 1
+        elif completo:
+            contado = 0
+            sin_contar += 1
+        else:
+            sin_contar += 1
+            continue
+        if contado != stock:
+            lineas.append({
+                "producto_id": pid, "sku": sku, "nombre": nombre,
+                "stock": stock, "contado": contado, "diferencia": contado - stock,
+            })
+
+    return {
+        "contados": contados,
+        "sin_contar": sin_contar,
+        "desconocidos": sorted(set(conteo) - vistos),
+        "lineas": lineas,
+    }
+
+
+def resumen(resultado):
+    lineas = resultado["lineas"]
+    return {
+        "productos_contados": resultado["contados"],
+        "productos_sin_contar": resultado["sin_contar"],
+        "con_diferencia": len(lineas),
+        "unidades_entrada": sum(l["diferencia"] for l in lineas if l["diferencia"] > 0),
+        "unidades_salida": -sum(l["diferencia"] for l in lineas if l["diferencia"] < 0),
+        "desconocidos": resultado["desconocidos"],
+    }
+
+
+# =========================
+#  Ajuste
+# =========================
+def aplicar_conteo(sucursal, conteo, motivo, usuario=None, completo=False):
+    """
+    Recalcula las diferencias con los saldos bloqueados y escribe todos los
+    ajustes (IN si sobra, OUT si falta) con bulk_create. Devuelve
+    (resultado de diferencias, movimientos creados).
+    """
+    from .models import StockBalance, StockMovement
+
+    using = shards.alias()
+    with transaction.atomic(using=using):
+        # bloquea los saldos de la sucursal: nadie mueve stock mientras se ajusta
+        costos = dict(
+            StockBalance.objects.select_for_update()
+            .filter(sucursal=sucursal)
+            .order_by("producto_id")
+            .values_list("producto_id", "costo_promedio")
+        )
+        resultado = diferencias(sucursal, conteo, completo=completo)
+
+        movimientos = []
+        for l in resultado["lineas"]:
+            dif = l["diferencia"]
+            costo = costos.get(l["producto_id"])
+            movimientos.append(StockMovement(
+                producto_id=l["producto_id"], sucursal=sucursal,
+                tipo="IN" if dif > 0 else "OUT", cantidad=abs(dif), cantidad_signed=dif,
+                # los sobrantes entran al costo promedio (no mueven la valorización unitaria)
+                costo_unit=costo.quantize(Decimal("0.01")) if costo else None,
+                motivo=motivo, usuario=usuario,
+            ))
+        insertar_movimientos(movimientos, using=using)
+        aplicar_movimientos(movimientos, using=using)
+    return resultado, len(movimientos)
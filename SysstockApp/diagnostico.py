@@ -0,0 +1,309 @@
+"""
+Diagnóstico en producción: consultas lentas (con EXPLAIN) y perfiles de requests.
+
+Cada tipo de registro se guarda en un ring buffer en memoria (últimos N) y,
+si SYSSTOCK_DIAGNOSTICO_CACHE está definido, se espeja en ese cache de Django
+para que lo lean otros workers y los management commands.
+"""
+import random
+import threading
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.utils import timezone
+
+MAX_SQL = 10000
+MAX_PARAM = 200
+MAX_PARAMS = 50
+# tope de EXPLAIN por request (acota el costo de un request con muchas lentas)
+MAX_EXPLAIN_POR_REQUEST = 5
+
+
+def etiqueta_tenant(user):
+    """
+    Empresa del usuario para logs/métricas:
+    'superuser' | 'admin:<id>' | 'sucursal:<id>' | 'anonimo'
+    """
+    if user is None or not getattr(user, "is_authenticated", False):
+        return "anonimo"
+    if user.is_superuser:
+        return "superuser"
+    if getattr(user, "rol", None) == "admin":
+        return f"admin:{user.pk}"
+    return f"sucursal:{getattr(user, 'sucursal_id', None)}"
+
+
+def vista_de(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<sin_ruta>"
+    return match.view_name or match._func_path
+
+
+# =========================
+#  Ring buffer
+# =========================
+class RingBuffer:
+    """Últimos 'maxlen' registros (dicts), más nuevos primero al listar."""
+
+    def __init__(self, clave, setting_maxlen, default_maxlen=200):
+        self.clave = clave
+        self.setting_maxlen = setting_maxlen
+        self.default_maxlen = default_maxlen
+        self._lock = threading.Lock()
+        self._items = None
+
+    @property
+    def maxlen(self):
+        return int(getattr(settings, self.setting_maxlen, self.default_maxlen))
+
+    def _deque(self):
+        if self._items is None or self._items.maxlen != self.maxlen:
+            self._items = deque(self._items or (), maxlen=self.maxlen)
+        return self._items
+
+    def _cache(self):
+        alias = getattr(settings, "SYSSTOCK_DIAGNOSTICO_CACHE", None)
+        return caches[alias] if alias else None
+
+    def agregar(self, registro):
+        registro.setdefault("id", uuid.uuid4().hex[:12])
+        registro.setdefault("fecha", timezone.now().isoformat())
+        with self._lock:
+            self._deque().append(registro)
+        cache = self._cache()
+        if cache is not None:
+            try:
+                # read-modify-write sin lock entre procesos: es diagnóstico, se tolera perder alguno
+                items = (cache.get(self.clave) or [])[-(self.maxlen - 1):] if self.maxlen > 1 else []
+                cache.set(self.clave, items + [registro], timeout=None)
+            except Exception:
+                pass
+        return registro
+
+    def listar(self, limit=None):
+        cache = self._cache()
+        items = None
+        if cache is not None:
+            try:
+                items = cache.get(self.clave)
+            except Exception:
+                items = None
+        if items is None:
+            with self._lock:
+                items = list(self._deque())
+        items = list(reversed(items))
+        return items[:limit] if limit else items
+
+    def obtener(self, registro_id):
+        return next((r for r in self.listar() if r.get("id") == registro_id), None)
+
+    def limpiar(self):
+        with self._lock:
+            self._deque().clear()
+        cache = self._cache()
+        if cache is not None:
+            cache.delete(self.clave)
+
+
+CONSULTAS_LENTAS = RingBuffer("sysstock:diagnostico:consultas_lentas", "SYSSTOCK_SLOW_QUERY_BUFFER")
+
+
+# =========================
+#  Consultas lentas
+# =========================
+def umbral_lentas_ms():
+    """Umbral en ms (None = desactivado)."""
+    valor = getattr(settings, "SYSSTOCK_SLOW_QUERY_MS", None)
+    return float(valor) if valor else None
+
+
+def _recortar_params(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {str(k): repr(v)[:MAX_PARAM] for k, v in list(params.items())[:MAX_PARAMS]}
+    try:
+        return [repr(p)[:MAX_PARAM] for p in list(params)[:MAX_PARAMS]]
+    except TypeError:
+        return repr(params)[:MAX_PARAM]
+
+
+def explain(alias, sql, params):
+    """
+    Plan de la query: SQLite 'EXPLAIN QUERY PLAN', MySQL 'EXPLAIN FORMAT=JSON',
+    PostgreSQL 'EXPLAIN (FORMAT JSON)'. Solo SELECT / WITH.
+    """
+    if not sql.lstrip()[:6].upper().startswith(("SELECT", "WITH")):
+        return None
+    conn = connections[alias]
+    prefijo = {
+        "sqlite": "EXPLAIN QUERY PLAN ",
+        "mysql": "EXPLAIN FORMAT=JSON ",
+        "postgresql": "EXPLAIN (FORMAT JSON) ",
+    }.get(conn.vendor)
+    if prefijo is None:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute(prefijo + sql, params)
+            filas = cur.fetchall()
+    except Exception as e:
+        return f"EXPLAIN falló: {e}"
+    if conn.vendor == "sqlite":
+        # (id, parent, notused, detail) -> árbol indentado como el shell de sqlite
+        niveles, out = {}, []
+        for id_, parent, _, detalle in filas:
+            niveles[id_] = niveles.get(parent, -1) + 1
+            out.append("  " * niveles[id_] + str(detalle))
+        return "\n".join(out)
+    return filas[0][0] if filas else None
+
+
+def registrar_lentas(request, lentas):
+    """
+    lentas: [(alias, sql, params, many, segundos)] capturadas por el execute_wrapper
+    de QueryMetricsMiddleware. Se corre después de la vista (sin el wrapper activo).
+    """
+    tasa = float(getattr(settings, "SYSSTOCK_SLOW_QUERY_SAMPLE_RATE", 1.0))
+    con_explain = getattr(settings, "SYSSTOCK_SLOW_QUERY_EXPLAIN", True)
+    vista = vista_de(request)
+    tenant = etiqueta_tenant(getattr(request, "user", None))
+    explicadas = 0
+    for alias, sql, params, many, segundos in lentas:
+        if tasa < 1.0 and random.random() >= tasa:
+            continue
+        plan = None
+        if con_explain and not many and explicadas < MAX_EXPLAIN_POR_REQUEST:
+            plan = explain(alias, sql, params)
+            explicadas += 1
+        CONSULTAS_LENTAS.agregar({
+            "duracion_ms": round(segundos * 1000, 2),
+            "vista": vista,
+            "metodo": request.method,
+            "path": request.path,
+            "tenant": tenant,
+            "db": alias,
+            "sql": sql[:MAX_SQL],
+            "params": None if many else _recortar_params(params),
+            "many": bool(many),
+            "explain": plan,
+        })
+
+
+# =========================
+#  Perfiles de requests (?_profile=1)
+# =========================
+PERFILES = RingBuffer("sysstock:diagnostico:perfiles", "SYSSTOCK_PROFILE_BUFFER", default_maxlen=20)
+
+MAX_QUERIES_PERFIL = 500
+TOP_FUNCIONES = 40
+
+
+def perfil_cprofile(func):
+    """Corre func() bajo cProfile. Devuelve (resultado, pstats.Stats)."""
+    import cProfile
+    import pstats
+
+    prof = cProfile.Profile()
+    try:
+        resultado = prof.runcall(func)
+    finally:
+        prof.create_stats()
+    return resultado, pstats.Stats(prof)
+
+
+def pstats_texto(stats, orden="cumulative", top=TOP_FUNCIONES):
+    import io
+
+    buf = io.StringIO()
+    stats.stream = buf
+    stats.sort_stats(orden).print_stats(top)
+    return buf.getvalue()
+
+
+def pstats_binario(stats):
+    """Mismo formato que Stats.dump_stats (abrible con snakeviz / pstats)."""
+    import marshal
+
+    return marshal.dumps(stats.stats)
+
+
+class Muestreador(threading.Thread):
+    """
+    Profiler por muestreo: cada 'intervalo' segundos toma la pila del thread
+    del request (sys._current_frames) y cuenta pilas iguales. Overhead acotado
+    e independiente de la cantidad de llamadas (a diferencia de cProfile).
+    """
+
+    def __init__(self, thread_id, intervalo=0.001):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.intervalo = intervalo
+        self.pilas = {}
+        self.muestras = 0
+        self._fin = threading.Event()
+
+    def run(self):
+        import sys
+
+        while not self._fin.wait(self.intervalo):
+            frame = sys._current_frames().get(self.thread_id)
+            pila = []
+            while frame is not None:
+                code = frame.f_code
+                pila.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if pila:
+                pila = tuple(reversed(pila))
+                self.pilas[pila] = self.pilas.get(pila, 0) + 1
+                self.muestras += 1
+
+    def detener(self):
+        self._fin.set()
+        self.join()
+
+    def speedscope(self, nombre, duracion_ms):
+        """Formato 'sampled' de https://www.speedscope.app (una muestra por pila distinta, con peso)."""
+        frames, indices = [], {}
+        samples, weights = [], []
+        ms = self.intervalo * 1000
+        for pila, n in self.pilas.items():
+            idx = []
+            for frame in pila:
+                if frame not in indices:
+                    indices[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                idx.append(indices[frame])
+            samples.append(idx)
+            weights.append(round(n * ms, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled", "name": nombre, "unit": "milliseconds",
+                "startValue": 0, "endValue": round(duracion_ms, 3),
+                "samples": samples, "weights": weights,
+            }],
+            "name": nombre,
+            "exporter": "sysstock",
+        }
+
+    def texto(self, top=TOP_FUNCIONES):
+        """Funciones con más muestras (propias y acumuladas)."""
+        propias, acumuladas = {}, {}
+        for pila, n in self.pilas.items():
+            propias[pila[-1]] = propias.get(pila[-1], 0) + n
+            for frame in set(pila):
+                acumuladas[frame] = acumuladas.get(frame, 0) + n
+        total = max(self.muestras, 1)
+        lineas = [f"{self.muestras} muestras cada {self.intervalo * 1000:.1f} ms", "", "  propio%  acum%  función"]
+        for frame, n in sorted(acumuladas.items(), key=lambda kv: -kv[1])[:top]:
+            lineas.append(
+                f"  {100 * propias.get(frame, 0) / total:6.1f} {100 * n / total:6.1f}  "
+                f"{frame[0]} ({frame[1]}:{frame[2]})"
+            )
+        return "\n".join(lineas) + "\n"
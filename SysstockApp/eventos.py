@@ -0,0 +1,189 @@
+"""
+Pub/sub en proceso de cambios por sucursal (alimenta el SSE /api/stream/sucursales/<id>/).
+
+- publicar(sucursal_id, tipo, datos): desde cualquier hilo. Los que escriben lo
+  llaman con transaction.on_commit, así solo salen cambios confirmados.
+  Sin suscriptores no hace nada (ni se registra el on_commit: ver activo()).
+- Suscripcion: cola asyncio acotada (SYSSTOCK_STREAM_BUFFER) en el event loop
+  del stream. Backpressure: si el cliente no consume y la cola se llena, se
+  descartan los pendientes y se encola un único "resync" (el stream reenvía el
+  estado completo); quien publica nunca se bloquea y la memoria no crece.
+
+Es un bus por proceso: con varios workers cada stream ve los cambios hechos
+por su propio worker. Para más de un worker hace falta un broker externo.
+"""
+import asyncio
+import itertools
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger("sysstock.stream")
+
+RESYNC = "resync"
+
+
+class Suscripcion:
+    __slots__ = ("sucursal_id", "loop", "cola")
+
+    def __init__(self, sucursal_id, loop, maximo):
+        self.sucursal_id = sucursal_id
+        self.loop = loop
+        self.cola = asyncio.Queue(maxsize=maximo)
+
+    def _entregar(self, evento):
+        # corre en el loop del stream
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            BUS._contar("descartados", self.cola.qsize())
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            self.cola.put_nowait((evento[0], RESYNC, {"motivo": "cliente lento: se descartaron eventos"}))
+
+    async def siguiente(self, timeout):
+        """(id, tipo, datos) o None si pasó `timeout` sin eventos."""
+        try:
+            return await asyncio.wait_for(self.cola.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Bus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = defaultdict(set)
+        self._ids = itertools.count(1)
+        self._contadores = {"publicados": 0, "entregados": 0, "descartados": 0}
+
+    def activo(self, sucursal_id=None):
+        if sucursal_id is None:
+            return bool(self._subs)
+        return bool(self._subs.get(sucursal_id))
+
+    def _total(self):
+        return sum(len(s) for s in self._subs.values())
+
+    def lleno(self):
+        with self._lock:
+            return self._total() >= int(getattr(settings, "SYSSTOCK_STREAM_MAX_SUSCRIPTORES", 1000))
+
+    def suscribir(self, sucursal_id):
+        """Suscripción en el loop actual o None si se llegó a SYSSTOCK_STREAM_MAX_SUSCRIPTORES."""
+        sub = Suscripcion(
+            sucursal_id, asyncio.get_running_loop(), int(getattr(settings, "SYSSTOCK_STREAM_BUFFER", 100))
+        )
+        with self._lock:
+            if self._total() >= int(getattr(settings, "SYSSTOCK_STREAM_MAX_SUSCRIPTORES", 1000)):
+                return None
+            self._subs[sucursal_id].add(sub)
+        return sub
+
+    def desuscribir(self, sub):
+        with self._lock:
+            subs = self._subs.get(sub.sucursal_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.sucursal_id]
+
+    def publicar(self, sucursal_id, tipo, datos):
+        with self._lock:
+            subs = list(self._subs.get(sucursal_id, ()))
+            self._contadores["publicados"] += 1
+            self._contadores["entregados"] += len(subs)
+        if not subs:
+            return
+        evento = (next(self._ids), tipo, datos)
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub._entregar, evento)
+            except RuntimeError:  # loop cerrado (worker apagándose)
+                self.desuscribir(sub)
+
+    def _contar(self, nombre, n):
+        with self._lock:
+            self._contadores[nombre] += n
+
+    def metricas(self):
+        with self._lock:
+            return {**self._contadores, "suscriptores": self._total()}
+
+
+BUS = Bus()
+
+
+def activo(sucursal_id=None):
+    return BUS.activo(sucursal_id)
+
+
+def publicar(sucursal_id, tipo, datos):
+    try:
+        BUS.publicar(sucursal_id, tipo, datos)
+    except Exception:  # nunca romper al que escribe (corre en on_commit)
+        logger.exception("No se pudo publicar %s de la sucursal %s", tipo, sucursal_id)
+
+
+def exportar_metricas():
+    """Líneas Prometheus del bus (se agregan a /metrics)."""
+    m = BUS.metricas()
+    out = [
+        "# HELP sysstock_stream_suscriptores Streams SSE abiertos en este proceso.",
+        "# TYPE sysstock_stream_suscriptores gauge",
+        f"sysstock_stream_suscriptores {m['suscriptores']}",
+    ]
+    for nombre, ayuda in (
+        ("publicados", "Eventos publicados."),
+        ("entregados", "Eventos encolados a suscriptores."),
+        ("descartados", "Eventos descartados por backpressure (cliente lento)."),
+    ):
+        out += [
+            f"# HELP sysstock_stream_eventos_{nombre}_total {ayuda}",
+            f"# TYPE sysstock_stream_eventos_{nombre}_total counter",
+            f"sysstock_stream_eventos_{nombre}_total {m[nombre]}",
+        ]
+    return "\n".join(out) + "\n"
+
+
+# =========================
+#  ASGI: cortar el stream cuando el cliente se desconecta
+# =========================
+def cortar_al_desconectar(app, prefijo="/api/stream/"):
+    """
+    Django 4.2 no escucha http.disconnect mientras manda un StreamingHttpResponse:
+    el generador seguiría (y la suscripción abierta) hasta SYSSTOCK_STREAM_MAX_SECONDS.
+    Para las rutas del stream, una vez leído el cuerpo se escucha el canal y al
+    desconectarse se cancela el request (el finally del generador desuscribe).
+    """
+    async def wrapper(scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(prefijo):
+            return await app(scope, receive, send)
+
+        cuerpo_leido = asyncio.Event()
+
+        async def recibir():
+            mensaje = await receive()
+            if mensaje["type"] != "http.request" or not mensaje.get("more_body"):
+                cuerpo_leido.set()
+            return mensaje
+
+        async def escuchar():
+            await cuerpo_leido.wait()
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        request = asyncio.ensure_future(app(scope, recibir, send))
+        escucha = asyncio.ensure_future(escuchar())
+        try:
+            await asyncio.wait({request, escucha}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for tarea in (request, escucha):
+                if not tarea.done():
+                    tarea.cancel()
+            await asyncio.gather(request, escucha, return_exceptions=True)
+        if request.done() and not request.cancelled() and request.exception() is not None:
+            raise request.exception()
+
+    return wrapper
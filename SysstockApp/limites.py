@@ -0,0 +1,179 @@
+"""
+Límites de requests por empresa y por clase de endpoint (token bucket).
+
+Clases, cada una con su presupuesto (SYSSTOCK_RATE_LIMITS):
+  - checkout:       alta de ventas (POST /api/ventas/)
+  - catalogo:       productos y categorías
+  - reportes:       resúmenes, ventas por rango / día / producto, dashboards, kardex
+  - exportaciones:  los Excel
+
+Cada (clase, empresa) tiene su bucket: una tormenta de reportes de una empresa
+agota solo su bucket de reportes; el checkout (suyo y de las demás) sigue con
+el propio. El exceso recibe 429 con Retry-After (segundos hasta el próximo token).
+
+- Empresa: shards.owner_de (admin o dueño de la sucursal del empleado). El
+  superuser no tiene límite; sin usuario, la IP.
+- Buckets en CACHES[SYSSTOCK_RATE_LIMIT_CACHE]: LocMem ("default") = por
+  proceso; Redis / Memcached = compartidos. Con caches compartidas el
+  leer-y-escribir no es atómico entre procesos: en una carrera pasa algún
+  request de más, nunca de menos.
+- Vistas DRF: throttle_classes = [LimiteReportes] (o en @action / @throttle_classes).
+  Vistas async (fuera del dispatch de DRF): permitir(drf_request, "reportes").
+- Métricas: sysstock_limite_requests_total{clase, resultado="permitido|rechazado"}.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from . import shards
+
+PREFIJO = "sysstock:limite:"
+PERIODOS = {"s": 1, "min": 60, "h": 3600}
+CLASES = ("checkout", "catalogo", "reportes", "exportaciones")
+
+
+def activo():
+    return getattr(settings, "SYSSTOCK_RATE_LIMIT_ENABLED", True)
+
+
+def tasas():
+    """{clase: (capacidad, tokens por segundo)} desde "checkout=1200/min,reportes=60/min,..."."""
+    out = {}
+    for parte in getattr(settings, "SYSSTOCK_RATE_LIMITS", "").split(","):
+        clase, _, tasa = parte.strip().partition("=")
+        if not tasa:
+            continue
+        n, _, periodo = tasa.partition("/")
+        out[clase.strip()] = (int(n), int(n) / PERIODOS[periodo.strip() or "s"])
+    return out
+
+
+def _cache():
+    return caches[getattr(settings, "SYSSTOCK_RATE_LIMIT_CACHE", "default")]
+
+
+# =========================
+#  Métricas (por proceso)
+# =========================
+class Metricas:
+    """Contadores por (clase, resultado): permitido, rechazado."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = defaultdict(int)
+
+    def contar(self, clase, resultado):
+        with self._lock:
+            self._contadores[(clase, resultado)] += 1
+
+    def exportar(self):
+        with self._lock:
+            contadores = dict(self._contadores)
+        out = [
+            "# HELP sysstock_limite_requests_total Requests con límite por clase de endpoint y resultado.",
+            "# TYPE sysstock_limite_requests_total counter",
+        ]
+        out += [
+            f'sysstock_limite_requests_total{{clase="{c}",resultado="{r}"}} {n}'
+            for (c, r), n in sorted(contadores.items())
+        ]
+        return "\n".join(out) + "\n"
+
+
+METRICAS = Metricas()
+
+
+def exportar_metricas():
+    """Líneas Prometheus de los límites (se agregan a /metrics)."""
+    return METRICAS.exportar()
+
+
+# =========================
+#  Token bucket
+# =========================
+# un lock por clase: los chequeos de reportes no hacen esperar a los del checkout
+_locks = {clase: threading.Lock() for clase in CLASES}
+_lock = threading.Lock()
+
+
+def tomar(clase, tenant):
+    """
+    Consume un token del bucket (clase, tenant). Devuelve (permitido, espera):
+    espera = segundos hasta el próximo token si no hay.
+    """
+    tasa = tasas().get(clase)
+    if tasa is None:
+        return True, 0.0
+    capacidad, por_segundo = tasa
+    clave = f"{PREFIJO}{clase}:{tenant}"
+    cache = _cache()
+    with _locks.get(clase, _lock):
+        ahora = time.time()
+        tokens, desde = cache.get(clave) or (capacidad, ahora)
+        tokens = min(capacidad, tokens + max(ahora - desde, 0) * por_segundo)
+        permitido = tokens >= 1
+        if permitido:
+            tokens -= 1
+        # expira cuando el bucket ya estaría lleno: la ausencia equivale a lleno
+        cache.set(clave, (tokens, ahora), timeout=math.ceil((capacidad - tokens) / por_segundo) + 1)
+    return permitido, 0.0 if permitido else (1 - tokens) / por_segundo
+
+
+def tenant_de(request):
+    """Clave de la empresa del request; None = sin límite (superuser)."""
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return "ip:" + BaseThrottle().get_ident(request)
+    if user.is_superuser:
+        return None
+    owner_id = shards.owner_de(user, request)
+    return f"empresa:{owner_id}" if owner_id else f"usuario:{user.pk}"
+
+
+def permitir(request, clase):
+    """(permitido, espera) del request en su bucket de 'clase', y lo cuenta."""
+    if not activo():
+        return True, 0.0
+    tenant = tenant_de(request)
+    if tenant is None:
+        return True, 0.0
+    permitido, espera = tomar(clase, tenant)
+    METRICAS.contar(clase, "permitido" if permitido else "rechazado")
+    return permitido, espera
+
+
+# =========================
+#  Throttles de DRF
+# =========================
+class LimiteEmpresa(BaseThrottle):
+    """Token bucket de la clase 'clase' por empresa. DRF responde 429 + Retry-After."""
+
+    clase = None
+
+    def allow_request(self, request, view):
+        permitido, self.espera = permitir(request, self.clase)
+        return permitido
+
+    def wait(self):
+        return self.espera
+
+
+class LimiteCheckout(LimiteEmpresa):
+    clase = "checkout"
+
+
+class LimiteCatalogo(LimiteEmpresa):
+    clase = "catalogo"
+
+
+class LimiteReportes(LimiteEmpresa):
+    clase = "reportes"
+
+
+class LimiteExportaciones(LimiteEmpresa):
+    clase = "exportaciones"
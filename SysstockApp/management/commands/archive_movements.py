@@ -0,0 +1,93 @@
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from SysstockApp import archivo
+from SysstockApp.models import StockMovement, StockMovementArchive
+
+
+class Command(BaseCommand):
+    help = (
+        "Archiva los movimientos de stock anteriores a la retención (StockMovementArchive, o el alias "
+        "'archivo' con ARCHIVE_DATABASE_URL) y los reemplaza por un movimiento de apertura por "
+        "producto/sucursal. Los saldos no cambian. Corre por lotes de claves, cada uno en su "
+        "transacción: si se corta, volver a correrlo sigue donde quedó."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--antes-de", help="Fecha de corte YYYY-MM-DD (se archiva lo anterior).")
+        parser.add_argument(
+            "--dias", type=int,
+            help="Retención en días en vez de --antes-de (default SYSSTOCK_ARCHIVE_RETENTION_DAYS).",
+        )
+        parser.add_argument("--lote", type=int, default=200, help="Claves producto/sucursal por transacción.")
+        parser.add_argument("--max-lotes", type=int, help="Corta después de N lotes (el resto en la próxima corrida).")
+        parser.add_argument("--simular", action="store_true", help="Solo cuenta lo que se archivaría.")
+        parser.add_argument("--estado", action="store_true", help="Movimientos vivos, aperturas y archivados, y salir.")
+        parser.add_argument(
+            "--database", default=DEFAULT_DB_ALIAS,
+            help="Base (alias) sobre la que corre: un shard de empresas (ver shards.py).",
+        )
+
+    def handle(self, *args, **opts):
+        using = opts["database"]
+        if opts["estado"]:
+            return self._estado(using)
+        corte = self._corte(opts)
+        claves = archivo.claves_pendientes(corte, using=using)
+        self.stdout.write(
+            f"Corte {timezone.localtime(corte):%Y-%m-%d %H:%M} → {len(claves):,} producto/sucursal con movimientos a archivar"
+        )
+        if opts["simular"]:
+            n = StockMovement.objects.using(using).filter(creado_en__lt=corte, apertura=False).aggregate(n=Count("id"))["n"]
+            self.stdout.write(f"{n:,} movimientos se moverían al archivo.")
+            return
+
+        lote = max(opts["lote"], 1)
+        archivados = aperturas = lotes = 0
+        t0 = time.perf_counter()
+        for i in range(0, len(claves), lote):
+            if opts["max_lotes"] is not None and lotes >= opts["max_lotes"]:
+                self.stdout.write(self.style.WARNING("Corte por --max-lotes: volver a correr para seguir."))
+                break
+            a, n = archivo.archivar_lote(claves[i:i + lote], corte, using=using)
+            archivados += a
+            aperturas += n
+            lotes += 1
+            self.stdout.write(
+                f"lote {lotes}: {min(i + lote, len(claves)):,}/{len(claves):,} claves, "
+                f"{archivados:,} archivados, {aperturas:,} aperturas ({time.perf_counter() - t0:.1f}s)"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"✔ {archivados:,} movimientos archivados en '{archivo.alias(using)}', {aperturas:,} aperturas."
+        ))
+
+    def _corte(self, opts):
+        if opts["antes_de"]:
+            try:
+                fecha = datetime.strptime(opts["antes_de"], "%Y-%m-%d")
+            except ValueError:
+                raise CommandError("--antes-de debe ser YYYY-MM-DD.")
+            corte = timezone.make_aware(fecha)
+        else:
+            dias = opts["dias"] if opts["dias"] is not None else settings.SYSSTOCK_ARCHIVE_RETENTION_DAYS
+            hoy = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+            corte = hoy - timedelta(days=dias)
+        if corte > timezone.now():
+            raise CommandError("El corte no puede ser futuro.")
+        return corte
+
+    def _estado(self, using):
+        vivos = StockMovement.objects.using(using).aggregate(
+            total=Count("id"), aperturas=Count("id", filter=Q(apertura=True))
+        )
+        archivados = StockMovementArchive.objects.using(archivo.alias(using)).aggregate(n=Count("id"))["n"]
+        self.stdout.write(
+            f"StockMovement: {vivos['total']:,} ({vivos['aperturas']:,} aperturas)\n"
+            f"Archivo ('{archivo.alias(using)}'): {archivados:,}"
+        )
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import statistics
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from SysstockApp.asincrono import envolver_sql
+from SysstockApp.models import Branch
+
+User = get_user_model()
+
+# (nombre, ruta sync -> WSGI, ruta async -> ASGI); {sucursal} = primera sucursal del usuario
+RUTAS = (
+    ("dashboard", "/api/dashboard/empresa/", "/api/async/dashboard/empresa/"),
+    ("resumen", "/api/sucursales/{sucursal}/resumen/", "/api/async/sucursales/{sucursal}/resumen/"),
+)
+
+
+class _LatenciaDB:
+    """execute_wrapper: suma una espera fija por query (round trip / tiempo de un servidor MySQL remoto)."""
+
+    def __init__(self, ms):
+        self.segundos = ms / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.segundos)
+        return execute(sql, params, many, context)
+
+
+def _percentiles(valores):
+    q = statistics.quantiles(valores, n=100, method="inclusive")
+    return {
+        "p50": round(q[49], 2), "p95": round(q[94], 2), "p99": round(q[98], 2),
+        "max": round(max(valores), 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Latencia bajo concurrencia de los reportes sync por WSGI vs sus variantes async por ASGI "
+        "(/api/async/...). Con --wsgi-url/--asgi-url pega a servidores levantados (gunicorn.conf.py); "
+        "sin URLs compara en proceso (threads + Client vs event loop + AsyncClient)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuario", help="username (admin) a usar; default: el admin con más sucursales.")
+        parser.add_argument("--concurrencia", type=int, default=16, help="Requests simultáneos.")
+        parser.add_argument("--requests", type=int, default=400, help="Requests medidos por ruta y servidor.")
+        parser.add_argument("--wsgi-url", help="Base del servidor WSGI, p.ej. http://127.0.0.1:8000")
+        parser.add_argument("--asgi-url", help="Base del servidor ASGI, p.ej. http://127.0.0.1:8001")
+        parser.add_argument(
+            "--latencia-db", type=float, default=0.0,
+            help="Solo en proceso: ms de espera agregados a cada query (simula una base remota; "
+                 "con SQLite local las queries compiten por la misma CPU y no se solapan).",
+        )
+        parser.add_argument("--timeout", type=float, default=30.0)
+        parser.add_argument("--json", help="Guarda los resultados en este archivo.")
+
+    def handle(self, *args, **opts):
+        if bool(opts["wsgi_url"]) != bool(opts["asgi_url"]):
+            raise CommandError("--wsgi-url y --asgi-url van juntos.")
+        if opts["wsgi_url"] and opts["latencia_db"]:
+            raise CommandError("--latencia-db solo aplica a la comparación en proceso.")
+        user = self._usuario(opts["usuario"])
+        sucursal = (
+            Branch.objects.filter(owner=user).order_by("id")
+            .values_list("id", flat=True).first()
+        )
+        if sucursal is None:
+            raise CommandError(f"{user.username} no tiene sucursales: corré seed_scale primero.")
+
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        token = str(RefreshToken.for_user(user).access_token)
+        modo = "http" if opts["wsgi_url"] else "en proceso"
+        self.stdout.write(
+            f"Usuario {user.username}, sucursal {sucursal}, concurrencia {opts['concurrencia']}, "
+            f"{opts['requests']} requests por ruta ({modo})"
+            + (f", +{opts['latencia_db']} ms por query" if opts["latencia_db"] else "")
+        )
+        header = f"{'ruta':<10} {'camino':<11} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'req/s':>8}  status"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+
+        resultados = {}
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for nombre, ruta_sync, ruta_async in RUTAS:
+                for camino, ruta in (("wsgi-sync", ruta_sync), ("asgi-async", ruta_async)):
+                    path = ruta.format(sucursal=sucursal)
+                    if opts["wsgi_url"]:
+                        base = opts["wsgi_url"] if camino == "wsgi-sync" else opts["asgi_url"]
+                        medicion = self._http(base.rstrip("/") + path, token, opts)
+                    elif camino == "wsgi-sync":
+                        medicion = self._wsgi_local(path, token, opts)
+                    else:
+                        medicion = asyncio.run(self._asgi_local(path, token, opts))
+                    latencias, status, segundos = medicion
+                    r = {**_percentiles(latencias), "rps": round(len(latencias) / segundos, 1), "status": status}
+                    resultados.setdefault(nombre, {})[camino] = r
+                    self.stdout.write(
+                        f"{nombre:<10} {camino:<11} {r['p50']:>8} {r['p95']:>8} {r['p99']:>8} "
+                        f"{r['max']:>8} {r['rps']:>8}  {status}"
+                    )
+
+        if opts["json"]:
+            with open(opts["json"], "w") as f:
+                json.dump({"modo": modo, "concurrencia": opts["concurrencia"], "resultados": resultados}, f, indent=2)
+            self.stdout.write(f"Resultados en {opts['json']}")
+
+    def _usuario(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f"No existe el usuario {username}.")
+            return user
+        user = (
+            User.objects.filter(rol="admin", is_superuser=False)
+            .annotate(n=Count("sucursales"))
+            .order_by("-n", "id")
+            .first()
+        )
+        if user is None:
+            raise CommandError("No hay admins: corré seed_scale primero.")
+        return user
+
+    # -------------------------
+    # Caminos
+    # -------------------------
+    def _en_threads(self, pedir, opts):
+        """N requests con `concurrencia` threads: (latencias ms, status, segundos)."""
+        for _ in range(opts["concurrencia"]):  # calentamiento (conexiones, caches)
+            pedir()
+        with ThreadPoolExecutor(opts["concurrencia"]) as pool:
+            t0 = time.perf_counter()
+            medidas = list(pool.map(lambda _: pedir(), range(opts["requests"])))
+            segundos = time.perf_counter() - t0
+        return [ms for ms, _ in medidas], self._status(medidas), segundos
+
+    def _http(self, url, token, opts):
+        headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+
+        def pedir():
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=opts["timeout"]) as r:
+                    r.read()
+                    status = r.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except OSError as e:  # timeouts, conexión rechazada
+                status = type(e).__name__
+            return (time.perf_counter() - t0) * 1000, status
+
+        return self._en_threads(pedir, opts)
+
+    def _wsgi_local(self, path, token, opts):
+        """Vista sync por el handler WSGI, un thread por request en curso (como gthread)."""
+        headers = {"Authorization": f"Bearer {token}"}
+        latencia = _LatenciaDB(opts["latencia_db"]) if opts["latencia_db"] else None
+
+        def pedir():
+            with envolver_sql(latencia) if latencia else nullcontext():
+                t0 = time.perf_counter()
+                status = Client().get(path, headers=headers).status_code
+                return (time.perf_counter() - t0) * 1000, status
+
+        try:
+            return self._en_threads(pedir, opts)
+        finally:
+            connection.close()
+
+    async def _asgi_local(self, path, token, opts):
+        """Vista async por el handler ASGI, un solo event loop (como un worker uvicorn)."""
+        client, headers = AsyncClient(), {"Authorization": f"Bearer {token}"}
+        limite = asyncio.Semaphore(opts["concurrencia"])
+        latencia = _LatenciaDB(opts["latencia_db"]) if opts["latencia_db"] else None
+
+        async def pedir():
+            async with limite:
+                # envolver_sql llega a los hilos del pool por contextvars
+                with envolver_sql(latencia) if latencia else nullcontext():
+                    t0 = time.perf_counter()
+                    status = (await client.get(path, headers=headers)).status_code
+                    return (time.perf_counter() - t0) * 1000, status
+
+        await asyncio.gather(*(pedir() for _ in range(opts["concurrencia"])))
+        t0 = time.perf_counter()
+        medidas = await asyncio.gather(*(pedir() for _ in range(opts["requests"])))
+        segundos = time.perf_counter() - t0
+        return [ms for ms, _ in medidas], self._status(medidas), segundos
+
+    @staticmethod
+    def _status(medidas):
+        cuenta = Counter(status for _, status in medidas)
+        return " ".join(f"{k}x{v}" for k, v in sorted(cuenta.items(), key=str))
@@ -0,0 +1,114 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from SysstockApp.models import Branch, Sale, StockMovement
+from SysstockApp.renderers import MessagePackRenderer, ORJSONRenderer, msgpack, orjson
+from SysstockApp.views import BranchViewSet, StockMovementViewSet, kardex_producto
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara tiempo de serialización y bytes (crudo/gzip/brotli) de JSONRenderer (DRF), "
+        "ORJSONRenderer y MessagePack sobre ventas_rango, kardex_producto y el listado de movimientos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20, help="Repeticiones por renderer (se informa la mediana).")
+        parser.add_argument("--movimientos", type=int, default=5000, help="Tamaño del listado de movimientos.")
+
+    def handle(self, *args, **opts):
+        user = User.objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError("Se necesita un superuser para llamar a las vistas.")
+
+        payloads = self._payloads(user, opts["movimientos"])
+        if not payloads:
+            raise CommandError("No hay datos: corré seed_demo (o seed_scale) primero.")
+
+        renderers = [("drf-json", JSONRenderer())]
+        if orjson is not None:
+            renderers.append(("orjson", ORJSONRenderer()))
+        if msgpack is not None:
+            renderers.append(("msgpack", MessagePackRenderer()))
+
+        header = f"{'endpoint':<18} {'renderer':<9} {'ms (p50)':>9} {'bytes':>10} {'gzip':>9} {'br':>9}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for name, data in payloads:
+            base = None
+            for rname, renderer in renderers:
+                ms, body = self._medir(renderer, data, opts["repeat"])
+                base = base or ms
+                gz = len(compress_string(body))
+                br = len(brotli.compress(body, quality=4)) if brotli is not None else "-"
+                self.stdout.write(
+                    f"{name:<18} {rname:<9} {ms:>9.2f} {len(body):>10} {gz:>9} {br:>9}"
+                    + (f"   x{base / ms:.1f}" if ms and rname != "drf-json" else "")
+                )
+
+    def _medir(self, renderer, data, repeat):
+        tiempos = []
+        body = b""
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            body = renderer.render(data, renderer.media_type, {})
+            tiempos.append((time.perf_counter() - t0) * 1000)
+        return statistics.median(tiempos), body
+
+    def _payloads(self, user, n_movimientos):
+        factory = APIRequestFactory()
+        out = []
+
+        top_branch = (
+            Sale.objects.values("sucursal")
+            .annotate(n=Count("id"), d=Min("creado_en"), h=Max("creado_en"))
+            .order_by("-n")
+            .first()
+        )
+        if top_branch:
+            req = factory.get("/", {
+                "desde": timezone.localtime(top_branch["d"]).date().isoformat(),
+                "hasta": timezone.localtime(top_branch["h"]).date().isoformat(),
+            })
+            # los reportes por sucursal exigen ser el owner de la sucursal
+            owner = Branch.objects.get(pk=top_branch["sucursal"]).owner or user
+            force_authenticate(req, user=owner)
+            view = BranchViewSet.as_view({"get": "ventas_rango"})
+            out.append(("ventas_rango", view(req, pk=top_branch["sucursal"]).data))
+
+        top_prod = (
+            StockMovement.objects.values("producto", "sucursal")
+            .annotate(n=Count("id"))
+            .order_by("-n")
+            .first()
+        )
+        if top_prod:
+            req = factory.get("/", {"sucursal": top_prod["sucursal"]})
+            force_authenticate(req, user=user)
+            out.append(("kardex_producto", kardex_producto(req, producto_id=top_prod["producto"]).data))
+
+        # listado de movimientos: mismo queryset/serializer que el viewset, acotado a N filas
+        req = factory.get("/")
+        force_authenticate(req, user=user)
+        viewset = StockMovementViewSet(request=Request(req), format_kwarg=None, action="list")
+        qs = viewset.get_queryset()[:n_movimientos]
+        data = viewset.get_serializer(qs, many=True).data
+        if data:
+            out.append(("movimientos", data))
+        return out
@@ -0,0 +1,93 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from SysstockApp import outbox
+from SysstockApp.models import OutboxEvent, WebhookEndpoint
+
+
+class Command(BaseCommand):
+    help = (
+        "Entrega los eventos del outbox (ventas, movimientos de stock) a los webhooks configurados: "
+        "lotes en orden por endpoint, reintentos con backoff exponencial. Corre en loop; --una-vez "
+        "hace un solo ciclo (cron). Se pueden correr varios: cada endpoint lo toma un worker a la vez."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--una-vez", action="store_true", help="Un ciclo y salir.")
+        parser.add_argument("--intervalo", type=float, default=1.0, help="Segundos entre ciclos sin trabajo.")
+        parser.add_argument("--lote", type=int, help="Eventos por POST (default SYSSTOCK_WEBHOOK_LOTE).")
+        parser.add_argument("--hilos", type=int, default=4, help="Endpoints entregados en paralelo.")
+        parser.add_argument("--lease", type=int, default=60, help="Segundos que un worker retiene un endpoint.")
+        parser.add_argument("--estado", action="store_true", help="Muestra cursor, pendientes y errores y sale.")
+        parser.add_argument(
+            "--purgar-dias", type=int,
+            help="Borra los eventos de más de N días ya entregados a todos los endpoints activos y sale.",
+        )
+        parser.add_argument(
+            "--database", default=DEFAULT_DB_ALIAS,
+            help="Base (alias) sobre la que corre: un shard de empresas (ver shards.py).",
+        )
+
+    def handle(self, *args, **opts):
+        if opts["estado"]:
+            return self._estado(opts["database"])
+        if opts["purgar_dias"] is not None:
+            borrados = outbox.purgar(opts["purgar_dias"], using=opts["database"])
+            self.stdout.write(self.style.SUCCESS(f"✔ {borrados} eventos purgados."))
+            return
+
+        with ThreadPoolExecutor(max(opts["hilos"], 1), thread_name_prefix="webhooks") as pool:
+            try:
+                while True:
+                    entregados, fallidos = self._ciclo(pool, opts)
+                    if entregados or fallidos:
+                        self.stdout.write(f"{entregados} eventos entregados, {fallidos} lotes fallidos")
+                    if opts["una_vez"]:
+                        break
+                    if not entregados:
+                        time.sleep(opts["intervalo"])
+            except KeyboardInterrupt:
+                pass
+
+    def _ciclo(self, pool, opts):
+        ids = outbox.endpoints_a_entregar(using=opts["database"])
+        resultados = pool.map(lambda pk: self._entregar(pk, opts), ids)
+        entregados = fallidos = 0
+        for r in resultados:
+            if r is not None:
+                entregados += r[0]
+                fallidos += r[1]
+        return entregados, fallidos
+
+    @staticmethod
+    def _entregar(pk, opts):
+        try:
+            return outbox.entregar(pk, lote=opts["lote"], lease=opts["lease"], using=opts["database"])
+        finally:
+            connections.close_all()  # conexiones del hilo del pool
+
+    def _estado(self, using):
+        endpoints = list(WebhookEndpoint.objects.using(using).order_by("id"))
+        if not endpoints:
+            self.stdout.write("No hay webhooks configurados.")
+            return
+        header = f"{'id':>4} {'empresa':>7} {'activo':<6} {'cursor':>10} {'pend.':>8} {'intentos':>8}  próximo / error"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for ep in endpoints:
+            filtro = Q(owner_id=ep.owner_id, id__gt=ep.cursor)
+            if ep.tipos:
+                filtro &= Q(tipo__in=ep.tipos)
+            pendientes = OutboxEvent.objects.using(using).filter(filtro).aggregate(n=Count("id"))["n"]
+            detalle = ""
+            if ep.intentos:
+                detalle = f"{timezone.localtime(ep.proximo_intento):%H:%M:%S} {ep.ultimo_error[:60]}"
+            self.stdout.write(
+                f"{ep.id:>4} {ep.owner_id:>7} {'sí' if ep.activo else 'no':<6} {ep.cursor:>10} "
+                f"{pendientes:>8} {ep.intentos:>8}  {detalle}"
+            )
@@ -0,0 +1,417 @@
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test.utils import override_settings
+
+from SysstockApp.conteos import aplicar_conteo
+from SysstockApp.models import Branch, Product, StockBalance, StockMovement
+
+User = get_user_model()
+
+ZIPF_S = 1.2
+PASOS = ("scan", "checkout", "egreso", "stock")
+
+
+# =========================
+#  Clientes (in-process / HTTP)
+# =========================
+class _ClienteLocal:
+    """Stack completo de Django/DRF en el mismo proceso (APIClient), una conexión de DB por thread."""
+
+    def __init__(self, user):
+        from rest_framework.test import APIClient
+
+        self.client = APIClient(raise_request_exception=False)
+        self.client.force_authenticate(user)
+
+    def get(self, path, params=None):
+        r = self.client.get(path, params or {})
+        return r.status_code, _json(r.content)
+
+    def post(self, path, data):
+        r = self.client.post(path, data, format="json")
+        return r.status_code, _json(r.content)
+
+    def cerrar(self):
+        connection.close()
+
+
+class _ClienteHTTP:
+    """Contra un servidor levantado (runserver / gunicorn / uvicorn), con un JWT emitido para el usuario."""
+
+    def __init__(self, user, base, timeout):
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        self.base = base.rstrip("/")
+        self.timeout = timeout
+        self.headers = {
+            "Authorization": f"Bearer {RefreshToken.for_user(user).access_token}",
+            "Accept": "application/json",
+        }
+
+    def _pedir(self, req):
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as r:
+                return r.status, _json(r.read())
+        except urllib.error.HTTPError as e:
+            return e.code, _json(e.read())
+
+    def get(self, path, params=None):
+        url = self.base + path + ("?" + urllib.parse.urlencode(params) if params else "")
+        return self._pedir(urllib.request.Request(url, headers=self.headers))
+
+    def post(self, path, data):
+        body = json.dumps(data).encode()
+        headers = {**self.headers, "Content-Type": "application/json"}
+        return self._pedir(urllib.request.Request(self.base + path, data=body, headers=headers, method="POST"))
+
+    def cerrar(self):
+        pass
+
+
+def _json(contenido):
+    try:
+        return json.loads(contenido or b"null")
+    except ValueError:
+        return None
+
+
+def _percentiles(valores):
+    if not valores:
+        return {"p50": None, "p95": None, "p99": None}
+    if len(valores) == 1:
+        return {"p50": valores[0], "p95": valores[0], "p99": valores[0]}
+    q = statistics.quantiles(valores, n=100, method="inclusive")
+    return {"p50": round(q[49], 2), "p95": round(q[94], 2), "p99": round(q[98], 2)}
+
+
+# =========================
+#  Terminal
+# =========================
+class _Terminal(threading.Thread):
+    """
+    Ciclo de caja: escanear ítems (search por SKU) -> cobrar (POST /ventas/) ->
+    a veces una merma (POST /movimientos/ OUT, compite por los mismos saldos) ->
+    consultar stock.
+    """
+
+    def __init__(self, numero, cliente, sucursal_id, productos, cum_weights, opts, fin):
+        super().__init__(daemon=True, name=f"terminal-{numero}")
+        self.cliente = cliente
+        self.sucursal_id = sucursal_id
+        self.productos = productos
+        self.cum_weights = cum_weights
+        self.opts = opts
+        self.fin = fin
+        self.rnd = random.Random(opts["seed"] * 1000 + numero)
+        self.latencias = defaultdict(list)
+        self.status = Counter()
+        self.errores = Counter()
+        self.ventas_ok = 0
+        self.rechazadas = 0
+        self.unidades = Counter()
+        self.egresos_ok = 0
+        self.egresos_rechazados = 0
+        self.egresadas = Counter()
+        self.stock_negativo_visto = 0
+
+    def _medir(self, paso, func, *args):
+        t0 = time.perf_counter()
+        try:
+            status, data = func(*args)
+        except Exception as e:  # timeouts, conexión rechazada, etc.
+            status, data = "error", None
+            self.errores[type(e).__name__] += 1
+        self.latencias[paso].append((time.perf_counter() - t0) * 1000)
+        self.status[(paso, status)] += 1
+        return status, data
+
+    def run(self):
+        try:
+            hechas = 0
+            while not self.fin.is_set() and (self.opts["ventas"] is None or hechas < self.opts["ventas"]):
+                self._ciclo()
+                hechas += 1
+        finally:
+            self.cliente.cerrar()
+
+    def _ciclo(self):
+        rnd = self.rnd
+        k = rnd.randint(1, self.opts["items_max"])
+        elegidos = {p["id"]: p for p in rnd.choices(self.productos, cum_weights=self.cum_weights, k=k)}
+
+        items = []
+        for p in elegidos.values():
+            self._medir("scan", self.cliente.get, "/api/productos/search/", {
+                "q": p["sku"], "sucursal": self.sucursal_id, "limit": 5,
+            })
+            items.append({"producto": p["id"], "cantidad": rnd.randint(1, self.opts["cantidad_max"])})
+
+        status, _ = self._medir("checkout", self.cliente.post, "/api/ventas/", {
+            "sucursal": self.sucursal_id, "items": items,
+        })
+        if status == 201:
+            self.ventas_ok += 1
+            for it in items:
+                self.unidades[it["producto"]] += it["cantidad"]
+        elif status == 400:
+            self.rechazadas += 1  # stock insuficiente: esperado cuando se agota
+
+        if rnd.random() < self.opts["egresos"]:
+            p = rnd.choices(self.productos, cum_weights=self.cum_weights)[0]
+            cantidad = rnd.randint(1, self.opts["cantidad_max"])
+            status, _ = self._medir("egreso", self.cliente.post, "/api/movimientos/", {
+                "producto": p["id"], "sucursal": self.sucursal_id, "tipo": "OUT",
+                "cantidad": cantidad, "motivo": "load_pos: merma",
+            })
+            if status == 201:
+                self.egresos_ok += 1
+                self.egresadas[p["id"]] += cantidad
+            elif status == 400:
+                self.egresos_rechazados += 1
+
+        pid = items[0]["producto"]
+        status, data = self._medir("stock", self.cliente.get, f"/api/productos/{pid}/")
+        if status == 200 and isinstance(data, dict) and (data.get("stock_actual") or 0) < 0:
+            self.stock_negativo_visto += 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de carga de caja (POS): N terminales concurrentes hacen escanear -> cobrar -> "
+        "(a veces) registrar una merma por /api/movimientos/ -> consultar stock contra una sucursal. Informa p50/p95/p99 y ventas/s, y verifica al final "
+        "que ningún saldo quedó negativo ni difiere de sus movimientos (sobreventa / updates perdidos). "
+        "ESCRIBE ventas reales: usalo sobre una base sembrada (seed_demo / seed_scale), no en producción."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--terminales", type=int, default=8)
+        parser.add_argument("--ventas", type=int, default=50, help="Ventas por terminal (ignorado con --duracion).")
+        parser.add_argument("--duracion", type=float, help="Segundos de carga (en vez de --ventas).")
+        parser.add_argument("--sucursal", type=int, help="Sucursal (default: la de más productos con stock).")
+        parser.add_argument("--productos", type=int, default=20, help="Productos 'calientes' que se venden.")
+        parser.add_argument("--stock-inicial", type=int, help="Ajusta antes el stock de esos productos a N.")
+        parser.add_argument("--items-max", type=int, default=4)
+        parser.add_argument("--cantidad-max", type=int, default=3)
+        parser.add_argument(
+            "--egresos", type=float, default=0.2,
+            help="Fracción de ciclos que además registran una merma (OUT por /api/movimientos/).",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--url", help="Base de un servidor levantado (http://localhost:8000). Default: in-process.")
+        parser.add_argument("--timeout", type=float, default=10.0)
+        parser.add_argument("--json", action="store_true", help="Salida JSON.")
+
+    def handle(self, *args, **opts):
+        if opts["duracion"]:
+            opts["ventas"] = None
+        sucursal = self._sucursal(opts["sucursal"])
+        productos = self._productos(sucursal, opts)
+        usuarios = self._usuarios(sucursal)
+
+        if opts["stock_inicial"] is not None:
+            aplicar_conteo(
+                sucursal, {p["sku"]: opts["stock_inicial"] for p in productos}, motivo="load_pos: stock inicial"
+            )
+        antes = self._saldos(sucursal, productos)
+        self.negativos_previos = self._negativos(sucursal)
+
+        # Zipf: pocos productos concentran las ventas (y la contención sobre sus saldos)
+        cum_weights = list(accumulate(1.0 / k ** ZIPF_S for k in range(1, len(productos) + 1)))
+        fin = threading.Event()
+        terminales = []
+        for n in range(opts["terminales"]):
+            user = usuarios[n % len(usuarios)]
+            cliente = _ClienteHTTP(user, opts["url"], opts["timeout"]) if opts["url"] else _ClienteLocal(user)
+            terminales.append(_Terminal(n, cliente, sucursal.id, productos, cum_weights, opts, fin))
+
+        # el APIClient usa Host 'testserver'; los 400 por falta de stock no van al log de django.request
+        hosts = settings.ALLOWED_HOSTS if opts["url"] else [*settings.ALLOWED_HOSTS, "testserver"]
+        logger = logging.getLogger("django.request")
+        nivel = logger.level
+        logger.setLevel(logging.ERROR)
+        # in-process se mide la caja, no los límites por empresa (con --url los aplica el servidor)
+        with override_settings(ALLOWED_HOSTS=hosts, SYSSTOCK_RATE_LIMIT_ENABLED=False):
+            t0 = time.perf_counter()
+            for t in terminales:
+                t.start()
+            if opts["duracion"]:
+                fin.wait(opts["duracion"])
+                fin.set()
+            for t in terminales:
+                t.join()
+            segundos = time.perf_counter() - t0
+        logger.setLevel(nivel)
+
+        reporte = self._reporte(sucursal, productos, terminales, antes, segundos, opts)
+        if opts["json"]:
+            self.stdout.write(json.dumps(reporte, indent=2, ensure_ascii=False))
+        else:
+            self._imprimir(reporte)
+        if reporte["problemas"]:
+            raise CommandError("Inconsistencias de stock: " + "; ".join(reporte["problemas"]))
+
+    # -------------------------
+    # Preparación
+    # -------------------------
+    def _sucursal(self, sucursal_id):
+        if sucursal_id:
+            try:
+                return Branch.objects.get(pk=sucursal_id)
+            except Branch.DoesNotExist:
+                raise CommandError(f"No existe la sucursal {sucursal_id}.")
+        top = (
+            StockBalance.objects.filter(cantidad__gt=0, producto__sku__isnull=False)
+            .values("sucursal").annotate(n=Count("id")).order_by("-n").first()
+        )
+        if not top:
+            raise CommandError("No hay productos con stock: corré seed_demo o seed_scale primero.")
+        return Branch.objects.get(pk=top["sucursal"])
+
+    def _productos(self, sucursal, opts):
+        qs = (
+            Product.objects.filter(sucursal=sucursal, sku__isnull=False, saldos__sucursal=sucursal)
+            .exclude(sku="")
+            .order_by("-saldos__cantidad", "id")
+            .values("id", "sku")
+        )
+        if opts["stock_inicial"] is None:
+            qs = qs.filter(saldos__cantidad__gt=0)
+        productos = list(qs[: opts["productos"]])
+        if not productos:
+            raise CommandError(f"La sucursal {sucursal.id} no tiene productos con SKU y stock.")
+        return productos
+
+    def _usuarios(self, sucursal):
+        """Los empleados de la sucursal (como en una caja real); si no hay, el admin dueño."""
+        usuarios = list(User.objects.filter(rol="limMerchant", sucursal=sucursal, is_active=True).order_by("id"))
+        if not usuarios and sucursal.owner_id:
+            usuarios = [sucursal.owner]
+        if not usuarios:
+            raise CommandError(f"La sucursal {sucursal.id} no tiene empleados ni dueño para autenticar.")
+        return usuarios
+
+    def _saldos(self, sucursal, productos):
+        return dict(
+            StockBalance.objects.filter(sucursal=sucursal, producto_id__in=[p["id"] for p in productos])
+            .values_list("producto_id", "cantidad")
+        )
+
+    def _negativos(self, sucursal):
+        return dict(
+            StockBalance.objects.filter(sucursal=sucursal, cantidad__lt=0).values_list("producto_id", "cantidad")
+        )
+
+    # -------------------------
+    # Verificación y reporte
+    # -------------------------
+    def _reporte(self, sucursal, productos, terminales, antes, segundos, opts):
+        latencias, status, errores = defaultdict(list), Counter(), Counter()
+        unidades, egresadas = Counter(), Counter()
+        ventas_ok = rechazadas = egresos_ok = egresos_rechazados = negativo_visto = 0
+        for t in terminales:
+            for paso, valores in t.latencias.items():
+                latencias[paso].extend(valores)
+            status.update(t.status)
+            errores.update(t.errores)
+            unidades.update(t.unidades)
+            egresadas.update(t.egresadas)
+            ventas_ok += t.ventas_ok
+            rechazadas += t.rechazadas
+            egresos_ok += t.egresos_ok
+            egresos_rechazados += t.egresos_rechazados
+            negativo_visto += t.stock_negativo_visto
+
+        despues = self._saldos(sucursal, productos)
+        ids = [p["id"] for p in productos]
+        problemas = []
+
+        # solo los que quedaron negativos (o más negativos) durante la corrida
+        negativos = [
+            (pid, cantidad) for pid, cantidad in self._negativos(sucursal).items()
+            if cantidad < self.negativos_previos.get(pid, 0)
+        ]
+        if negativos:
+            problemas.append(f"{len(negativos)} saldo(s) negativo(s) (sobreventa): {negativos[:10]}")
+        if negativo_visto:
+            problemas.append(f"{negativo_visto} consulta(s) de stock devolvieron stock negativo")
+
+        # el saldo mantenido tiene que coincidir con la suma de sus movimientos
+        sumas = dict(
+            StockMovement.objects.filter(sucursal=sucursal, producto_id__in=ids)
+            .values("producto_id").annotate(s=Sum("cantidad_signed")).values_list("producto_id", "s")
+        )
+        distintos = [(pid, despues.get(pid), sumas.get(pid) or 0) for pid in ids if despues.get(pid, 0) != (sumas.get(pid) or 0)]
+        if distintos:
+            problemas.append(f"saldo != suma de movimientos en {len(distintos)} producto(s): {distintos[:10]}")
+
+        # unidades vendidas + mermas (201) == lo que bajaron los saldos (sin otra actividad en paralelo)
+        salidas = unidades + egresadas
+        perdidos = [
+            (pid, antes.get(pid, 0) - despues.get(pid, 0), salidas[pid])
+            for pid in ids if antes.get(pid, 0) - despues.get(pid, 0) != salidas[pid]
+        ]
+        if perdidos:
+            problemas.append(
+                f"unidades vendidas + mermas != baja de saldo en {len(perdidos)} producto(s): {perdidos[:10]}"
+            )
+
+        checkouts = len(latencias["checkout"])
+        return {
+            "sucursal": sucursal.id,
+            "modo": opts["url"] or "in-process",
+            "base": connection.vendor,
+            "terminales": opts["terminales"],
+            "segundos": round(segundos, 2),
+            "checkouts": checkouts,
+            "ventas_ok": ventas_ok,
+            "rechazadas_sin_stock": rechazadas,
+            "mermas_ok": egresos_ok,
+            "mermas_sin_stock": egresos_rechazados,
+            "checkouts_por_segundo": round(checkouts / segundos, 2) if segundos else None,
+            "ventas_por_segundo": round(ventas_ok / segundos, 2) if segundos else None,
+            "latencia_ms": {paso: _percentiles(latencias[paso]) for paso in PASOS},
+            "status": {f"{paso} {st}": n for (paso, st), n in sorted(status.items(), key=str)},
+            "errores": dict(errores),
+            "unidades_vendidas": sum(unidades.values()),
+            "unidades_merma": sum(egresadas.values()),
+            "stock_restante": sum(despues.values()),
+            "problemas": problemas,
+        }
+
+    def _imprimir(self, r):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f">> POS sucursal {r['sucursal']} ({r['modo']}, {r['base']}): "
+            f"{r['terminales']} terminales, {r['segundos']}s"
+        ))
+        self.stdout.write(
+            f"  checkouts={r['checkouts']}  ok={r['ventas_ok']}  sin_stock={r['rechazadas_sin_stock']}  "
+            f"-> {r['checkouts_por_segundo']} checkouts/s, {r['ventas_por_segundo']} ventas/s"
+        )
+        self.stdout.write(f"  mermas ok={r['mermas_ok']}  sin_stock={r['mermas_sin_stock']}")
+        self.stdout.write(f"  {'paso':<10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for paso, p in r["latencia_ms"].items():
+            self.stdout.write(f"  {paso:<10} {p['p50'] or '-':>9} {p['p95'] or '-':>9} {p['p99'] or '-':>9}")
+        self.stdout.write("  status: " + ", ".join(f"{k}={v}" for k, v in r["status"].items()))
+        if r["errores"]:
+            self.stdout.write("  errores: " + ", ".join(f"{k}={v}" for k, v in r["errores"].items()))
+        self.stdout.write(
+            f"  unidades vendidas={r['unidades_vendidas']}  merma={r['unidades_merma']}  "
+            f"stock restante={r['stock_restante']}"
+        )
+        if not r["problemas"]:
+            self.stdout.write(self.style.SUCCESS("✔ Sin sobreventa: ningún saldo negativo y saldos = movimientos."))
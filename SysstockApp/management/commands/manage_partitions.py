@@ -0,0 +1,81 @@
+import datetime as dt
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from SysstockApp import particiones
+
+
+class Command(BaseCommand):
+    help = (
+        "Mantenimiento del particionado mensual de StockMovement y SaleItem (solo MySQL, ver "
+        "particiones.py): crea los meses por adelantado (default, para un cron mensual), "
+        "particiona tablas existentes, fusiona los meses ya archivados de movimientos y elimina "
+        "meses viejos de ventas (sus ítems y las ventas mismas). En SQLite no hace nada."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--adelante", type=int, help="Meses por adelantado (default SYSSTOCK_PARTITIONS_AHEAD).")
+        parser.add_argument(
+            "--inicializar", action="store_true",
+            help="Particiona las tablas que no lo están (reescribe la tabla: ventana de mantenimiento).",
+        )
+        parser.add_argument(
+            "--compactar-antes", metavar="AAAA-MM",
+            help="Fusiona las particiones de movimientos anteriores a ese mes (archive_movements primero).",
+        )
+        parser.add_argument(
+            "--eliminar-items-antes", metavar="AAAA-MM",
+            help=(
+                "Borra las ventas anteriores a ese mes y hace DROP de sus particiones de ítems "
+                "(irreversible; con --confirmar)."
+            ),
+        )
+        parser.add_argument("--confirmar", action="store_true", help="Requerido por --eliminar-items-antes.")
+        parser.add_argument("--sql", action="store_true", help="Muestra el SQL sin ejecutarlo.")
+        parser.add_argument("--estado", action="store_true", help="Particiones y filas estimadas, y salir.")
+
+    def handle(self, *args, **opts):
+        if not particiones.soportado():
+            self.stdout.write(f"Particionado solo en MySQL: nada que hacer (motor {connection.vendor}).")
+            return
+        if opts["estado"]:
+            return self._estado()
+
+        ejecutar = not opts["sql"]
+        sentencias = []
+        if opts["inicializar"]:
+            sentencias += particiones.inicializar(adelante=opts["adelante"], ejecutar=ejecutar)
+        sentencias += particiones.crear_adelante(adelante=opts["adelante"], ejecutar=ejecutar)
+        if opts["compactar_antes"]:
+            try:
+                sentencias += particiones.compactar_movimientos(self._mes(opts["compactar_antes"]), ejecutar=ejecutar)
+            except ValueError as e:
+                raise CommandError(str(e))
+        if opts["eliminar_items_antes"]:
+            if ejecutar and not opts["confirmar"]:
+                raise CommandError("--eliminar-items-antes borra ventas y sus ítems: agregar --confirmar.")
+            sentencias += particiones.eliminar_items(self._mes(opts["eliminar_items_antes"]), ejecutar=ejecutar)
+
+        for sql in sentencias:
+            self.stdout.write(sql + ";" if opts["sql"] else f"✔ {sql[:140]}")
+        if not sentencias:
+            self.stdout.write("Particiones al día.")
+
+    @staticmethod
+    def _mes(valor):
+        try:
+            return dt.datetime.strptime(valor, "%Y-%m").date()
+        except ValueError:
+            raise CommandError(f"Mes inválido {valor!r} (AAAA-MM).")
+
+    def _estado(self):
+        for modelo in particiones.modelos():
+            tabla = modelo._meta.db_table
+            lista = particiones.particiones(tabla)
+            if not lista:
+                self.stdout.write(f"{tabla}: sin particionar (--inicializar)")
+                continue
+            self.stdout.write(f"{tabla}: {len(lista)} particiones")
+            for nombre, filas in lista:
+                self.stdout.write(f"  {nombre:<10} {filas:>12,}")
@@ -0,0 +1,44 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count
+
+from SysstockApp import shards
+from SysstockApp.models import TenantShard
+
+
+class Command(BaseCommand):
+    help = (
+        "Aplica las migraciones en default y en cada shard de SYSSTOCK_SHARDS (ver shards.py). "
+        "Todos los shards tienen el esquema completo. --estado lista las empresas por alias."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--alias", action="append", help="Solo estos aliases (repetible).")
+        parser.add_argument("--estado", action="store_true", help="Empresas por alias, y salir.")
+
+    def handle(self, *args, **opts):
+        if opts["estado"]:
+            return self._estado()
+        todos = [DEFAULT_DB_ALIAS, *shards.aliases()]
+        elegidos = opts["alias"] or todos
+        desconocidos = sorted(set(elegidos) - set(todos))
+        if desconocidos:
+            raise CommandError(f"Aliases sin configurar en SYSSTOCK_SHARDS: {', '.join(desconocidos)}")
+        for alias in elegidos:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"== {alias}"))
+            call_command("migrate", database=alias, interactive=False, verbosity=opts["verbosity"], stdout=self.stdout)
+
+    def _estado(self):
+        por_alias = dict(
+            TenantShard.objects.using(DEFAULT_DB_ALIAS).values_list("alias").annotate(n=Count("id")).order_by()
+        )
+        moviendo = list(TenantShard.objects.using(DEFAULT_DB_ALIAS).filter(moviendo=True).values_list("owner_id", flat=True))
+        for alias in [DEFAULT_DB_ALIAS, *shards.aliases()]:
+            detalle = "el resto" if alias == DEFAULT_DB_ALIAS else f"{por_alias.get(alias, 0)} empresas"
+            self.stdout.write(f"{alias:<20} {detalle}")
+        huerfanos = sorted(set(por_alias) - {DEFAULT_DB_ALIAS, *shards.aliases()})
+        if huerfanos:
+            self.stdout.write(self.style.WARNING(f"Aliases del registro sin configurar (van a default): {huerfanos}"))
+        if moviendo:
+            self.stdout.write(self.style.WARNING(f"Empresas con move_tenant a medias: {moviendo}"))
@@ -0,0 +1,139 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from SysstockApp import search, shards
+from SysstockApp.models import Branch, TenantShard
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve los datos de una empresa (admin dueño de las sucursales) a otro alias de base "
+        "(default o un shard de SYSSTOCK_SHARDS, ver shards.py). Bloquea sus escrituras (503), "
+        "copia con los mismos ids, verifica los conteos, cambia el registro y borra el origen. "
+        "Si falla antes de cambiar el registro, la empresa sigue donde estaba."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("empresa", help="Id o username del admin dueño.")
+        parser.add_argument("alias", help="Alias destino ('default' o un shard).")
+        parser.add_argument("--lote", type=int, default=1000, help="Filas por INSERT / DELETE.")
+        parser.add_argument(
+            "--espera", type=float,
+            help="Segundos que se espera a que los procesos vean el registro (default SYSSTOCK_SHARD_CACHE_SECONDS + 1).",
+        )
+        parser.add_argument("--conservar-origen", action="store_true", help="No borra los datos del origen.")
+        parser.add_argument("--simular", action="store_true", help="Solo cuenta las filas a mover.")
+
+    def handle(self, *args, **opts):
+        if not shards.activo():
+            raise CommandError("Sin SYSSTOCK_SHARDS no hay a dónde mover.")
+        owner = self._owner(opts["empresa"])
+        destino = opts["alias"]
+        if destino not in (DEFAULT_DB_ALIAS, *shards.aliases()):
+            raise CommandError(f"Alias '{destino}' no está en SYSSTOCK_SHARDS.")
+        origen = (
+            TenantShard.objects.using(DEFAULT_DB_ALIAS).filter(owner=owner).values_list("alias", flat=True).first()
+            or DEFAULT_DB_ALIAS
+        )
+        if origen == destino:
+            self.stdout.write(f"La empresa {owner.pk} ya está en '{destino}'.")
+            return
+
+        sucursales = list(Branch.objects.using(DEFAULT_DB_ALIAS).filter(owner=owner).values_list("pk", flat=True))
+        conteos = {
+            modelo: shards.filas(modelo, owner.pk, sucursales, origen).count()
+            for modelo in shards.tablas() if not shards.es_control(modelo)
+        }
+        self.stdout.write(f"Empresa {owner.pk} ({owner.username}): '{origen}' -> '{destino}'")
+        for modelo, n in conteos.items():
+            self.stdout.write(f"  {modelo.__name__:<22} {n:>10,}")
+        if opts["simular"]:
+            return
+
+        espera = opts["espera"] if opts["espera"] is not None else settings.SYSSTOCK_SHARD_CACHE_SECONDS + 1
+        lote = max(opts["lote"], 1)
+        t0 = time.perf_counter()
+
+        # 1) escrituras de la empresa bloqueadas; que todos los procesos lo vean antes de copiar
+        TenantShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            owner=owner, defaults={"alias": origen, "moviendo": True}
+        )
+        self._esperar(espera, "bloqueando escrituras")
+        try:
+            self._copiar(owner, sucursales, origen, destino, conteos, lote)
+        except Exception as e:
+            TenantShard.objects.using(DEFAULT_DB_ALIAS).filter(owner=owner).update(moviendo=False)
+            raise CommandError(f"No se movió (la empresa sigue en '{origen}'): {e}")
+
+        # 2) el registro apunta al destino; los procesos con el registro viejo siguen leyendo el origen
+        TenantShard.objects.using(DEFAULT_DB_ALIAS).filter(owner=owner).update(alias=destino, moviendo=False)
+        shards.olvidar()
+        self.stdout.write(self.style.SUCCESS(f"✔ Empresa {owner.pk} en '{destino}' ({time.perf_counter() - t0:.1f}s)"))
+
+        # 3) origen
+        if opts["conservar_origen"]:
+            self.stdout.write(self.style.WARNING(f"Datos del origen '{origen}' conservados (--conservar-origen)."))
+            return
+        self._esperar(espera, "procesos leyendo el origen")
+        borrados = self._borrar(owner, sucursales, origen, lote)
+        self.stdout.write(self.style.SUCCESS(f"✔ {borrados:,} filas borradas de '{origen}'."))
+
+    def _owner(self, valor):
+        User = get_user_model()
+        filtro = {"pk": int(valor)} if valor.isdigit() else {"username": valor}
+        owner = User.objects.using(DEFAULT_DB_ALIAS).filter(**filtro).first()
+        if owner is None or owner.rol != "admin":
+            raise CommandError(f"No hay un admin '{valor}'.")
+        return owner
+
+    def _esperar(self, segundos, motivo):
+        if segundos > 0:
+            self.stdout.write(f"… {segundos:.0f}s ({motivo})")
+            time.sleep(segundos)
+
+    def _copiar(self, owner, sucursales, origen, destino, conteos, lote):
+        modelos = shards.tablas()
+        with transaction.atomic(using=destino):
+            # restos de un intento anterior cortado después del commit
+            for modelo in reversed(modelos):
+                if not shards.es_control(modelo):
+                    self._borrar_filas(shards.filas(modelo, owner.pk, sucursales, destino), lote)
+            for modelo in modelos:
+                if shards.es_control(modelo):
+                    # usuarios y sucursales: los de default, espejados
+                    if destino != DEFAULT_DB_ALIAS:
+                        shards.espejar(shards.filas(modelo, owner.pk, sucursales, DEFAULT_DB_ALIAS), destino)
+                    continue
+                base = shards.base_de(modelo, destino)
+                with transaction.atomic(using=base):
+                    n = shards.copiar(modelo, shards.filas(modelo, owner.pk, sucursales, origen), base, lote)
+                en_destino = shards.filas(modelo, owner.pk, sucursales, destino).count()
+                en_origen = shards.filas(modelo, owner.pk, sucursales, origen).count()
+                if not n == en_destino == en_origen == conteos[modelo]:
+                    raise ValueError(
+                        f"{modelo.__name__}: {conteos[modelo]} al empezar, {en_origen} en el origen, "
+                        f"{n} copiadas, {en_destino} en el destino."
+                    )
+                self.stdout.write(f"  {modelo.__name__:<22} {n:>10,} copiadas")
+            shards.reiniciar_secuencias([m for m in modelos if not shards.es_control(m)], destino)
+        if connections[destino].vendor == "sqlite":
+            search.crear_indice_fts(connections[destino])
+
+    def _borrar(self, owner, sucursales, origen, lote):
+        # en default usuarios y sucursales son los de control: se quedan
+        modelos = [
+            m for m in reversed(shards.tablas()) if not (shards.es_control(m) and origen == DEFAULT_DB_ALIAS)
+        ]
+        # ids antes de borrar: borrar las sucursales desengancha a los empleados (SET_NULL)
+        qs = [shards.filas(m, owner.pk, sucursales, origen) for m in modelos]
+        ids = [list(q.order_by().values_list("pk", flat=True)) for q in qs]
+        with transaction.atomic(using=origen):
+            return sum(shards.borrar(q.model, i, q.db, lote) for q, i in zip(qs, ids))
+
+    @staticmethod
+    def _borrar_filas(qs, lote):
+        return shards.borrar(qs.model, list(qs.order_by().values_list("pk", flat=True)), qs.db, lote)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from SysstockApp.search import reindexar_productos
+
+
+class Command(BaseCommand):
+    help = "Recalcula Product.busqueda y reconstruye el índice de búsqueda (FTS5 en SQLite)."
+
+    def handle(self, *args, **opts):
+        total = reindexar_productos()
+        self.stdout.write(self.style.SUCCESS(f"✔ Índice de búsqueda reconstruido ({total} productos)."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from SysstockApp.models import Product
+from SysstockApp.stock import reconstruir_saldos
+
+
+class Command(BaseCommand):
+    help = "Recalcula los saldos de stock (StockBalance) y el set de bajo stock desde los movimientos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sucursal", type=int, help="Solo los productos de esta sucursal.")
+        parser.add_argument(
+            "--database", default=DEFAULT_DB_ALIAS,
+            help="Base (alias) sobre la que corre: un shard de empresas (ver shards.py).",
+        )
+
+    def handle(self, *args, **opts):
+        productos = Product.objects.using(opts["database"])
+        if opts.get("sucursal"):
+            productos = productos.filter(sucursal_id=opts["sucursal"])
+        total = reconstruir_saldos(productos, using=opts["database"])
+        self.stdout.write(self.style.SUCCESS(f"✔ Saldos reconstruidos ({total})."))
@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+
+from SysstockApp import shards, tareas
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de tareas en segundo plano (SYSSTOCK_TASKS_BACKEND=db): toma las tareas vencidas con "
+        "un lease, las ejecuta en un pool de hilos y reprograma las fallidas con backoff. Se pueden "
+        "correr varios. --una-vez hace un ciclo (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hilos", type=int, default=4, help="Tareas ejecutadas en paralelo.")
+        parser.add_argument("--lote", type=int, default=50, help="Tareas tomadas por ciclo.")
+        parser.add_argument("--lease", type=int, default=300, help="Segundos que una tarea tomada queda reservada.")
+        parser.add_argument("--intervalo", type=float, default=1.0, help="Segundos entre ciclos sin trabajo.")
+        parser.add_argument("--una-vez", action="store_true", help="Un ciclo y salir.")
+        parser.add_argument("--estado", action="store_true", help="Cantidad por tarea y estado, y salir.")
+        parser.add_argument("--purgar-dias", type=int, help="Borra las tareas hechas hace más de N días y sale.")
+        parser.add_argument(
+            "--database", default=DEFAULT_DB_ALIAS,
+            help="Base (alias) sobre la que corre: un shard de empresas (ver shards.py).",
+        )
+
+    def handle(self, *args, **opts):
+        using = opts["database"]
+        if opts["estado"]:
+            return self._estado(using)
+        if opts["purgar_dias"] is not None:
+            purgadas = tareas.purgar(opts["purgar_dias"], using=using)
+            self.stdout.write(self.style.SUCCESS(f"✔ {purgadas} tareas purgadas."))
+            return
+        if tareas.backend() != "db":
+            raise CommandError(
+                f"SYSSTOCK_TASKS_BACKEND={tareas.backend()!r}: run_tasks solo ejecuta el backend 'db' "
+                "(el local corre en los hilos de cada proceso web)."
+            )
+
+        with ThreadPoolExecutor(max(opts["hilos"], 1), thread_name_prefix="tareas") as pool:
+            try:
+                while True:
+                    tomadas = tareas.tomar_pendientes(opts["lote"], opts["lease"], using=using)
+                    if tomadas:
+                        resultados = list(pool.map(lambda t: self._correr(t, using), tomadas))
+                        self.stdout.write(f"{resultados.count(True)} ok, {resultados.count(False)} con error")
+                    if opts["una_vez"]:
+                        break
+                    if not tomadas:
+                        time.sleep(opts["intervalo"])
+            except KeyboardInterrupt:
+                pass
+        connections.close_all()
+
+    @staticmethod
+    def _correr(t, using):
+        close_old_connections()
+        try:
+            # lo que la tarea consulte sin .using() va a la misma base (ver shards.usar)
+            with shards.usar(using):
+                return tareas.correr_tomada(t, using=using)
+        finally:
+            close_old_connections()
+
+    def _estado(self, using):
+        cuenta = tareas.estado_db(using=using)
+        if not cuenta:
+            self.stdout.write("No hay tareas.")
+            return
+        self.stdout.write(f"{'tarea':<30} {'pendiente':>10} {'hecha':>10} {'fallida':>10}")
+        for nombre in sorted({n for n, _ in cuenta}):
+            self.stdout.write(
+                f"{nombre:<30} {cuenta.get((nombre, 'pendiente'), 0):>10} "
+                f"{cuenta.get((nombre, 'hecha'), 0):>10} {cuenta.get((nombre, 'fallida'), 0):>10}"
+            )
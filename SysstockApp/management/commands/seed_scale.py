@@ -0,0 +1,306 @@
+import math
+import random
+import time as _time
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from SysstockApp.models import Branch, Category, Product, Sale, SaleItem, StockMovement, Transfer
+from SysstockApp.search import reindexar_productos, texto_busqueda
+from SysstockApp.stock import reconstruir_saldos
+
+User = get_user_model()
+
+CATEGORIAS = [
+    "Bebidas", "Snacks", "Lácteos", "Almacén", "Limpieza", "Perfumería",
+    "Congelados", "Panadería", "Fiambrería", "Golosinas", "Mascotas", "Bazar",
+]
+MARCAS = ["Sol", "Andina", "Pampa", "Delta", "Norte", "Cumbre", "Río", "Estrella", "Fénix", "Lago"]
+PRESENTACIONES = ["250ml", "500ml", "1L", "1.5L", "2L", "90g", "200g", "500g", "1kg", "x6", "x12"]
+
+# pesos de cantidad por ítem (1 unidad es lo más común)
+CANTIDADES = [1, 2, 3, 4, 6, 12]
+PESOS_CANTIDAD = [60, 20, 9, 5, 4, 2]
+CUM_CANTIDAD = list(accumulate(PESOS_CANTIDAD))
+# unidades promedio por venta (~2.4 ítems x ~1.9 unidades), para dimensionar reposiciones
+UNIDADES_POR_VENTA = 4.5
+# forma de la curva de popularidad (Zipf): pocos productos concentran las ventas
+ZIPF_S = 1.1
+# estacionalidad semanal (lunes..domingo)
+FACTOR_DIA = [0.85, 0.9, 0.95, 1.0, 1.2, 1.35, 0.75]
+
+
+# columnas de las tablas de historia (se insertan como tuplas, ver _Insertador)
+COLUMNAS = {
+    Sale: ("id", "sucursal", "usuario", "creado_en"),
+    SaleItem: ("id", "venta", "producto", "cantidad", "precio_unit", "creado_en"),
+    StockMovement: (
+        "id", "producto", "sucursal", "tipo", "cantidad", "cantidad_signed",
+        "motivo", "costo_unit", "apertura", "usuario", "creado_en",
+    ),
+}
+
+
+def _siguiente_id(modelo):
+    return (modelo.objects.aggregate(m=Max("id"))["m"] or 0) + 1
+
+
+class _Insertador:
+    """
+    Filas de ventas / ítems / movimientos como tuplas, escritas con executemany
+    en lotes de 'lote' filas (una transacción por lote, ventas antes que ítems).
+
+    No pasa por bulk_create: con decenas de millones de filas el costo de
+    instanciar el modelo y compilar cada campo del INSERT domina (~6x más lento).
+    Ids explícitos: los ítems necesitan venta_id y MySQL no devuelve pks.
+    """
+
+    def __init__(self, lote):
+        qn = connection.ops.quote_name
+        self.lote = lote
+        self.sql, self.filas, self.totales = {}, {}, {}
+        for modelo, campos in COLUMNAS.items():
+            columnas = [modelo._meta.get_field(c).column for c in campos]
+            self.sql[modelo] = (
+                f"INSERT INTO {qn(modelo._meta.db_table)} ({', '.join(qn(c) for c in columnas)}) "
+                f"VALUES ({', '.join(['%s'] * len(columnas))})"
+            )
+            self.filas[modelo] = []
+            self.totales[modelo] = 0
+
+    def agregar(self, modelo, fila):
+        filas = self.filas[modelo]
+        filas.append(fila)
+        if len(filas) >= self.lote:
+            self.flush()
+
+    def flush(self):
+        with transaction.atomic(), connection.cursor() as cur:
+            for modelo in (Sale, SaleItem, StockMovement):
+                filas = self.filas[modelo]
+                if filas:
+                    cur.executemany(self.sql[modelo], filas)
+                    self.totales[modelo] += len(filas)
+                    self.filas[modelo] = []
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera datos sintéticos a escala (empresas, sucursales, productos, historia de ventas "
+        "y movimientos) por lotes y con semilla fija. Ver --help para los tamaños."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--empresas", type=int, default=2)
+        parser.add_argument("--sucursales", type=int, default=3, help="Sucursales por empresa.")
+        parser.add_argument("--productos", type=int, default=500, help="Productos por sucursal.")
+        parser.add_argument("--dias", type=int, default=90, help="Días de historia hasta hoy.")
+        parser.add_argument("--ventas-dia", type=int, default=200, help="Ventas promedio por sucursal y día.")
+        parser.add_argument("--items-max", type=int, default=8, help="Máximo de ítems por venta.")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--lote", type=int, default=5000, help="Filas por INSERT (executemany) y transacción.")
+        parser.add_argument("--prefijo", default="scale", help="Prefijo de usuarios/sucursales generados.")
+        parser.add_argument("--password", default="1234")
+        parser.add_argument("--force", action="store_true", help="Borra antes los datos con el mismo prefijo.")
+        parser.add_argument(
+            "--sin-reconstruir", action="store_true",
+            help="No reconstruye saldos ni índice de búsqueda al final (hacerlo luego con "
+                 "rebuild_stock_balances / rebuild_search_index).",
+        )
+
+    def handle(self, *args, **opts):
+        self.opts = opts
+        self.rnd = random.Random(opts["seed"])
+        self.lote = max(100, opts["lote"])
+        prefijo = opts["prefijo"]
+
+        existentes = User.objects.filter(username__startswith=f"{prefijo}_admin_")
+        if existentes.exists():
+            if not opts["force"]:
+                raise CommandError(f"Ya hay datos con prefijo '{prefijo}'. Usá --force o otro --prefijo.")
+            self._borrar(prefijo)
+
+        t0 = _time.perf_counter()
+        self.stdout.write(self.style.MIGRATE_HEADING(">> Seed scale SysStock"))
+        self.ids_venta = _siguiente_id(Sale)
+        self.ids_item = _siguiente_id(SaleItem)
+        self.ids_mov = _siguiente_id(StockMovement)
+        self.filas = _Insertador(self.lote)
+
+        for e in range(opts["empresas"]):
+            self._empresa(prefijo, e)
+        self.filas.flush()
+
+        totales = self.filas.totales
+        self.stdout.write(
+            f"  ventas={totales[Sale]:,}  items={totales[SaleItem]:,}  "
+            f"movimientos={totales[StockMovement]:,}  ({_time.perf_counter() - t0:.1f}s)"
+        )
+
+        if not opts["sin_reconstruir"]:
+            qs = Product.objects.filter(sucursal__owner__username__startswith=f"{prefijo}_admin_")
+            t1 = _time.perf_counter()
+            reconstruir_saldos(qs)
+            reindexar_productos(qs)
+            self.stdout.write(f"  saldos e índice de búsqueda reconstruidos ({_time.perf_counter() - t1:.1f}s)")
+
+        self.stdout.write(self.style.SUCCESS(f"✔ Seed scale listo en {_time.perf_counter() - t0:.1f}s."))
+        self.stdout.write(f"  admins: {prefijo}_admin_<n> / {opts['password']}")
+
+    # -------------------------
+    # Estructura (empresa, sucursales, catálogo)
+    # -------------------------
+    def _empresa(self, prefijo, e):
+        opts = self.opts
+        password = make_password(opts["password"])  # un solo hash: create_user por fila es lento
+
+        with transaction.atomic():
+            admin = User.objects.create(
+                username=f"{prefijo}_admin_{e}", email=f"{prefijo}_admin_{e}@mail.com",
+                password=password, rol="admin", company_name=f"Empresa {prefijo} {e}",
+            )
+            Category.objects.bulk_create([Category(nombre=n, owner=admin) for n in CATEGORIAS])
+            categorias = list(Category.objects.filter(owner=admin).order_by("id"))
+            Branch.objects.bulk_create([
+                Branch(name=f"{prefijo.title()} {e}-{s}", address=f"Calle {s} #{e}", owner=admin)
+                for s in range(opts["sucursales"])
+            ])
+            sucursales = list(Branch.objects.filter(owner=admin).order_by("id"))
+            User.objects.bulk_create([
+                User(
+                    username=f"{prefijo}_emp_{e}_{i}", email=f"{prefijo}_emp_{e}_{i}@mail.com",
+                    password=password, rol="limMerchant", sucursal=b,
+                )
+                for i, b in enumerate(sucursales)
+            ])
+            empleados = {u.sucursal_id: u for u in User.objects.filter(username__startswith=f"{prefijo}_emp_{e}_")}
+
+        # mismo catálogo (mismos SKUs) en todas las sucursales: el SKU es único por sucursal (ProductSerializer)
+        # y las transferencias mapean por SKU
+        catalogo = []
+        for i in range(opts["productos"]):
+            costo = Decimal(round(math.exp(self.rnd.gauss(6.5, 0.9)), 0))  # ~ 100 .. 5000
+            catalogo.append({
+                "sku": f"E{e}-{i:06d}",
+                "nombre": f"{self.rnd.choice(MARCAS)} {self.rnd.choice(CATEGORIAS)} {i} {self.rnd.choice(PRESENTACIONES)}",
+                "categoria": categorias[self.rnd.randrange(len(categorias))],
+                "costo": costo,
+                "precio": (costo * Decimal(self.rnd.uniform(1.3, 1.8))).quantize(Decimal("1")),
+                "stock_min": self.rnd.choice([None, 5, 10, 20]),
+            })
+
+        for b in sucursales:
+            with transaction.atomic():
+                Product.objects.bulk_create([
+                    Product(
+                        nombre=c["nombre"], sku=c["sku"], precio=c["precio"], categoria=c["categoria"],
+                        sucursal=b, stock_min=c["stock_min"], busqueda=texto_busqueda(c["nombre"], c["sku"]),
+                    )
+                    for c in catalogo
+                ], batch_size=self.lote)
+            productos = list(Product.objects.filter(sucursal=b).order_by("id").values_list("id", "sku", "precio"))
+            self._historia(b, admin, empleados.get(b.id), productos, {c["sku"]: c["costo"] for c in catalogo})
+            self.stdout.write(
+                f"  empresa {e} / {b.name}: {len(productos)} productos, "
+                f"{self.filas.totales[Sale] + len(self.filas.filas[Sale]):,} ventas acumuladas"
+            )
+
+    # -------------------------
+    # Historia de ventas y movimientos
+    # -------------------------
+    def _historia(self, branch, admin, empleado, productos, costos):
+        opts = self.opts
+        rnd = self.rnd
+        n = len(productos)
+        if n == 0:
+            return
+
+        # popularidad Zipf: el producto en la posición k (orden aleatorio por sucursal) pesa 1/k^s
+        poblacion = list(range(n))
+        rnd.shuffle(poblacion)
+        cum_weights = list(accumulate(1.0 / k ** ZIPF_S for k in range(1, n + 1)))
+
+        # lote de reposición ~ demanda esperada de 2 semanas del producto (mínimo 20)
+        unidades_14_dias = opts["ventas_dia"] * 14 * UNIDADES_POR_VENTA
+        peso = [0.0] * n
+        anterior = 0.0
+        for i, acum in zip(poblacion, cum_weights):
+            peso[i] = acum - anterior
+            anterior = acum
+        lote_reposicion = [max(20, int(unidades_14_dias * w / anterior)) for w in peso]
+        stock = [0] * n
+
+        ops = connection.ops
+        tz = timezone.get_current_timezone()
+        inicio = timezone.localdate() - timedelta(days=opts["dias"])
+        usuarios = [admin.id, empleado.id] if empleado else [admin.id]
+        precios = [str(p[2]) for p in productos]
+        costos = [str(costos[p[1]]) for p in productos]
+        agregar = self.filas.agregar
+
+        def reponer(i, cuando):
+            cantidad = lote_reposicion[i]
+            stock[i] += cantidad
+            agregar(StockMovement, (
+                self.ids_mov, productos[i][0], branch.id, "IN", cantidad, cantidad,
+                "Reposición", costos[i], False, admin.id, cuando,
+            ))
+            self.ids_mov += 1
+
+        apertura = ops.adapt_datetimefield_value(timezone.make_aware(datetime.combine(inicio, time(8, 0)), tz))
+        for i in range(n):
+            reponer(i, apertura)
+
+        for d in range(opts["dias"] + 1):
+            dia = inicio + timedelta(days=d)
+            media = opts["ventas_dia"] * FACTOR_DIA[dia.weekday()]
+            cantidad_ventas = max(0, int(rnd.gauss(media, math.sqrt(max(media, 1)))))
+            base = timezone.make_aware(datetime.combine(dia, time(9, 0)), tz)
+            # ventas entre las 9 y las 21, en orden
+            for s in sorted(rnd.randrange(12 * 3600) for _ in range(cantidad_ventas)):
+                cuando = base + timedelta(seconds=s)
+                creado_en = ops.adapt_datetimefield_value(cuando)
+                venta_id = self.ids_venta
+                self.ids_venta += 1
+                usuario = usuarios[rnd.randrange(len(usuarios))]
+                agregar(Sale, (venta_id, branch.id, usuario, creado_en))
+
+                items = min(opts["items_max"], 1 + int(rnd.expovariate(0.6)))
+                for i in set(rnd.choices(poblacion, cum_weights=cum_weights, k=items)):
+                    cantidad = rnd.choices(CANTIDADES, cum_weights=CUM_CANTIDAD)[0]
+                    if stock[i] < cantidad:
+                        reponer(i, ops.adapt_datetimefield_value(cuando - timedelta(minutes=5)))
+                    stock[i] -= cantidad
+                    pid = productos[i][0]
+                    agregar(SaleItem, (self.ids_item, venta_id, pid, cantidad, precios[i], creado_en))
+                    agregar(StockMovement, (
+                        self.ids_mov, pid, branch.id, "OUT", cantidad, -cantidad,
+                        f"Venta #{venta_id}", None, False, usuario, creado_en,
+                    ))
+                    self.ids_item += 1
+                    self.ids_mov += 1
+
+    # -------------------------
+    # --force
+    # -------------------------
+    def _borrar(self, prefijo):
+        self.stdout.write(f"  borrando datos previos '{prefijo}'...")
+        admins = User.objects.filter(username__startswith=f"{prefijo}_admin_")
+        branches = Branch.objects.filter(owner__in=admins)
+        with transaction.atomic():
+            SaleItem.objects.filter(venta__sucursal__in=branches).delete()
+            Sale.objects.filter(sucursal__in=branches).delete()
+            StockMovement.objects.filter(sucursal__in=branches).delete()
+            Transfer.objects.filter(origen__in=branches).delete()
+            Product.objects.filter(sucursal__in=branches).delete()
+            User.objects.filter(username__startswith=f"{prefijo}_emp_").delete()
+            branches.delete()
+            Category.objects.filter(owner__in=admins).delete()
+            admins.delete()
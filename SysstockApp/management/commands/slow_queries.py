@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SysstockApp.diagnostico import CONSULTAS_LENTAS
+
+
+class Command(BaseCommand):
+    help = (
+        "Lista las últimas queries lentas (SYSSTOCK_SLOW_QUERY_MS) con vista, tenant y EXPLAIN. "
+        "Lee el cache compartido SYSSTOCK_DIAGNOSTICO_CACHE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--id", help="Muestra una sola entrada completa (SQL, parámetros, EXPLAIN).")
+        parser.add_argument("--vista", help="Filtra por nombre de vista (p.ej. sucursales-ventas-rango).")
+        parser.add_argument("--json", action="store_true", help="Salida JSON.")
+        parser.add_argument("--clear", action="store_true", help="Vacía el buffer.")
+
+    def handle(self, *args, **opts):
+        if opts["clear"]:
+            CONSULTAS_LENTAS.limpiar()
+            self.stdout.write(self.style.SUCCESS("✔ Buffer de queries lentas vacío."))
+            return
+
+        if opts["id"]:
+            registro = CONSULTAS_LENTAS.obtener(opts["id"])
+            if registro is None:
+                raise CommandError(f"No existe la entrada {opts['id']}.")
+            items = [registro]
+        else:
+            items = CONSULTAS_LENTAS.listar()
+            if opts["vista"]:
+                items = [r for r in items if r["vista"] == opts["vista"]]
+            items = items[: opts["limit"]]
+
+        if opts["json"]:
+            self.stdout.write(json.dumps(items, indent=2, ensure_ascii=False, default=str))
+            return
+        if not items:
+            self.stdout.write("Sin queries lentas registradas.")
+            return
+
+        for r in items:
+            self.stdout.write(
+                f"[{r['id']}] {r['fecha']}  {r['duracion_ms']:.1f} ms  {r['metodo']} {r['vista']}  tenant={r['tenant']}"
+            )
+            if opts["id"]:
+                self.stdout.write(f"  SQL: {r['sql']}")
+                self.stdout.write(f"  params: {r['params']}")
+                plan = r["explain"]
+                if plan is not None and not isinstance(plan, str):
+                    plan = json.dumps(plan, indent=2, default=str)
+                self.stdout.write("  EXPLAIN:\n" + "\n".join(f"    {l}" for l in str(plan).splitlines()))
+            else:
+                self.stdout.write(f"  {r['sql'][:160]}")
@@ -0,0 +1,45 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from SysstockApp import replica
+
+
+class Command(BaseCommand):
+    help = (
+        "Copia la base SQLite del primario sobre la réplica 'reporting' (stand-in local de la "
+        "replicación). Con --estado solo muestra el atraso medido."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--estado", action="store_true", help="Muestra atraso y disponibilidad sin copiar.")
+
+    def handle(self, *args, **opts):
+        if not replica.configurada():
+            raise CommandError("No hay alias 'reporting' (definí REPORTING_DATABASE_URL).")
+
+        if opts["estado"]:
+            replica.reiniciar_estado()
+            ok = replica.replica_disponible()
+            lag = replica.lag_replica()
+            self.stdout.write(f"lag={lag if lag is None else round(lag, 2)}s  disponible={'sí' if ok else 'no'}")
+            return
+
+        primario, copia = connections[DEFAULT_DB_ALIAS], connections[replica.ALIAS]
+        if primario.vendor != "sqlite" or copia.vendor != "sqlite":
+            raise CommandError("sync_replica solo aplica a SQLite; en MySQL/PostgreSQL replica el motor.")
+        if primario.settings_dict["NAME"] == copia.settings_dict["NAME"]:
+            raise CommandError("'default' y 'reporting' apuntan al mismo archivo.")
+
+        copia.close()
+        origen = sqlite3.connect(primario.settings_dict["NAME"])
+        destino = sqlite3.connect(copia.settings_dict["NAME"])
+        try:
+            with destino:
+                origen.backup(destino)
+        finally:
+            destino.close()
+            origen.close()
+        replica.reiniciar_estado()
+        self.stdout.write(self.style.SUCCESS(f"✔ Réplica sincronizada ({copia.settings_dict['NAME']})."))
@@ -0,0 +1,113 @@
+import hmac
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from SysstockApp.outbox import firma
+
+
+class _Receptor:
+    """Estado del receptor: último id por endpoint, duplicados, desórdenes y firmas inválidas."""
+
+    def __init__(self, secreto, fallar, latencia, archivo):
+        self.secreto = secreto
+        self.fallar = fallar
+        self.latencia = latencia
+        self.archivo = archivo
+        self.lock = threading.Lock()
+        self.ultimo = {}
+        self.vistos = {}
+        self.cuenta = {"lotes": 0, "eventos": 0, "rechazados": 0, "duplicados": 0, "desordenados": 0, "firma_invalida": 0}
+
+    def recibir(self, headers, body):
+        """Devuelve (status, mensaje)."""
+        if self.latencia:
+            time.sleep(self.latencia / 1000)
+        if self.secreto:
+            esperada = firma(self.secreto, headers.get("X-Sysstock-Timestamp", ""), body)
+            if not hmac.compare_digest(esperada, headers.get("X-Sysstock-Firma", "")):
+                with self.lock:
+                    self.cuenta["firma_invalida"] += 1
+                return 401, "firma inválida"
+        if self.fallar and random.random() < self.fallar:
+            with self.lock:
+                self.cuenta["rechazados"] += 1
+            return 503, "falla simulada"
+
+        endpoint = headers.get("X-Sysstock-Endpoint", "?")
+        eventos = json.loads(body)["eventos"]
+        with self.lock:
+            self.cuenta["lotes"] += 1
+            ultimo = self.ultimo.get(endpoint, 0)
+            vistos = self.vistos.setdefault(endpoint, set())
+            for ev in eventos:
+                if ev["id"] in vistos:
+                    # reintento de un lote ya recibido (la respuesta anterior no llegó): se ignora
+                    self.cuenta["duplicados"] += 1
+                    continue
+                if ev["id"] < ultimo:
+                    self.cuenta["desordenados"] += 1
+                vistos.add(ev["id"])
+                self.cuenta["eventos"] += 1
+                ultimo = max(ultimo, ev["id"])
+            self.ultimo[endpoint] = ultimo
+            if self.archivo:
+                with open(self.archivo, "a") as f:
+                    for ev in eventos:
+                        f.write(json.dumps({"endpoint": endpoint, **ev}) + "\n")
+        return 200, f"{len(eventos)} eventos"
+
+
+class Command(BaseCommand):
+    help = (
+        "Receptor HTTP local para probar deliver_webhooks: valida la firma, controla orden y "
+        "duplicados por endpoint y puede simular fallas (--fallar 0.3) y latencia."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--puerto", type=int, default=8099)
+        parser.add_argument("--secreto", help="Secreto del endpoint (GET /api/webhooks/<id>/) para validar la firma.")
+        parser.add_argument("--fallar", type=float, default=0.0, help="Fracción de lotes respondidos con 503.")
+        parser.add_argument("--latencia", type=float, default=0.0, help="ms de espera por lote.")
+        parser.add_argument("--guardar", help="Agrega cada evento recibido (JSON por línea) a este archivo.")
+
+    def handle(self, *args, **opts):
+        receptor = _Receptor(opts["secreto"], opts["fallar"], opts["latencia"], opts["guardar"])
+        stdout = self.stdout
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                status, mensaje = receptor.recibir(self.headers, body)
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.end_headers()
+                self.wfile.write(mensaje.encode())
+                stdout.write(f"{status} lote {self.headers.get('X-Sysstock-Lote')}: {mensaje}")
+
+            def do_GET(self):
+                # GET /: contadores (para scripts de prueba)
+                with receptor.lock:
+                    datos = {**receptor.cuenta, "ultimo_por_endpoint": receptor.ultimo}
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(json.dumps(datos).encode())
+
+            def log_message(self, *args):
+                pass
+
+        servidor = ThreadingHTTPServer((opts["host"], opts["puerto"]), Handler)
+        self.stdout.write(f"Receptor en http://{opts['host']}:{opts['puerto']}/ (Ctrl+C para salir)")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            self.stdout.write(json.dumps(receptor.cuenta))
@@ -0,0 +1,155 @@
+"""
+Métricas por request (cantidad de queries, tiempo SQL, tiempo total, bytes)
+agregadas por nombre de URL en histogramas, expuestas en formato texto de
+Prometheus en /metrics.
+
+Los histogramas viven en memoria del proceso: con varios workers de
+gunicorn cada uno expone los suyos (scrapear por worker o sumar en Prometheus).
+"""
+import hmac
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from . import coalescencia, eventos, limites, tareas
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_QUERIES = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# nombre -> (help, buckets)
+HISTOGRAMAS = {
+    "sysstock_http_request_duration_seconds": ("Tiempo total del request.", BUCKETS_SEGUNDOS),
+    "sysstock_http_request_sql_seconds": ("Tiempo en SQL por request.", BUCKETS_SEGUNDOS),
+    "sysstock_http_request_queries": ("Cantidad de queries SQL por request.", BUCKETS_QUERIES),
+    "sysstock_http_response_bytes": ("Tamaño de la respuesta (bytes, ya comprimida).", BUCKETS_BYTES),
+}
+CONTADOR_REQUESTS = "sysstock_http_requests_total"
+
+
+class Registry:
+    """Histogramas por (vista, método) y contador por (vista, método, status)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist = {}
+        self._requests = {}
+
+    def observar(self, vista, metodo, status, duracion, sql, queries, tamanio):
+        labels = (vista, metodo)
+        with self._lock:
+            hist = self._hist.get(labels)
+            if hist is None:
+                hist = self._hist[labels] = {name: Histogram(b) for name, (_, b) in HISTOGRAMAS.items()}
+            hist["sysstock_http_request_duration_seconds"].observe(duracion)
+            hist["sysstock_http_request_sql_seconds"].observe(sql)
+            hist["sysstock_http_request_queries"].observe(queries)
+            if tamanio is not None:
+                hist["sysstock_http_response_bytes"].observe(tamanio)
+            key = (vista, metodo, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._hist.clear()
+            self._requests.clear()
+
+    def exportar(self):
+        """Texto de exposición de Prometheus (0.0.4)."""
+        with self._lock:
+            hist = {k: {n: (list(h.counts), h.sum, h.count) for n, h in v.items()} for k, v in self._hist.items()}
+            requests = dict(self._requests)
+
+        out = [
+            f"# HELP {CONTADOR_REQUESTS} Requests atendidos.",
+            f"# TYPE {CONTADOR_REQUESTS} counter",
+        ]
+        for (vista, metodo, status), n in sorted(requests.items()):
+            out.append(f'{CONTADOR_REQUESTS}{{view="{_esc(vista)}",method="{metodo}",status="{status}"}} {n}')
+
+        for name, (ayuda, buckets) in HISTOGRAMAS.items():
+            out.append(f"# HELP {name} {ayuda}")
+            out.append(f"# TYPE {name} histogram")
+            for (vista, metodo), valores in sorted(hist.items()):
+                counts, total, count = valores[name]
+                labels = f'view="{_esc(vista)}",method="{metodo}"'
+                acumulado = 0
+                for le, c in zip(buckets, counts):
+                    acumulado += c
+                    out.append(f'{name}_bucket{{{labels},le="{le}"}} {acumulado}')
+                out.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+                out.append(f"{name}_sum{{{labels}}} {round(total, 6)!r}")
+                out.append(f"{name}_count{{{labels}}} {count}")
+        return "\n".join(out) + "\n"
+
+
+def _esc(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Registry()
+
+
+# =========================
+#  Acceso (token o superuser)
+# =========================
+def usuario_request(request):
+    """
+    Usuario del request: sesión (admin de Django) o JWT del header Authorization.
+    Para vistas/middleware fuera de DRF.
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return user
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+
+    try:
+        resultado = JWTAuthentication().authenticate(request)
+    except Exception:
+        return None
+    return resultado[0] if resultado else None
+
+
+def _token_valido(request):
+    token = getattr(settings, "SYSSTOCK_METRICS_TOKEN", None)
+    if not token:
+        return False
+    auth = request.META.get("HTTP_AUTHORIZATION", "")
+    if not auth.startswith("Bearer "):
+        return False
+    return hmac.compare_digest(auth[len("Bearer "):].strip(), token)
+
+
+def metrics_view(request):
+    """
+    GET /metrics  (Authorization: Bearer <SYSSTOCK_METRICS_TOKEN>, o superuser)
+    """
+    if not _token_valido(request):
+        user = usuario_request(request)
+        if user is None or not user.is_superuser:
+            return HttpResponseForbidden("Se requiere token de métricas o superuser.")
+    cuerpo = (
+        REGISTRY.exportar() + eventos.exportar_metricas() + tareas.exportar_metricas()
+        + coalescencia.exportar_metricas() + limites.exportar_metricas()
+    )
+    return HttpResponse(cuerpo, content_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,429 @@
+import json
+import re
+import threading
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+from . import diagnostico, replica, shards
+from .asincrono import envolver_sql
+from .diagnostico import registrar_lentas, umbral_lentas_ms, vista_de
+from .metrics import REGISTRY, usuario_request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+
+# =========================
+#  Compresión de respuestas (brotli / gzip)
+# =========================
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Comprime respuestas JSON/MessagePack/texto por encima de
+    SYSSTOCK_COMPRESSION_MIN_BYTES. Los .xlsx ya vienen comprimidos (zip) y no
+    se tocan.
+
+    - gzip: como GZipMiddleware, con un relleno de largo aleatorio
+      (max_random_bytes) que mitiga BREACH.
+    - brotli (si el cliente lo acepta y el paquete está instalado): no admite
+      ese relleno, así que solo va a requests sin cookies (JWT / POS). BREACH
+      necesita que el navegador de la víctima mande sus credenciales solo, y
+      eso pasa con cookies (sesión del admin / API navegable), no con un header
+      Authorization.
+    """
+
+    COMPRESSIBLE_TYPES = (
+        "application/json",
+        "application/msgpack",
+        "application/vnd.oai.openapi",
+        "application/javascript",
+        "text/",
+    )
+    _accepts_br = re.compile(r"\bbr\b")
+    _accepts_gzip = re.compile(r"\bgzip\b")
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+
+        min_bytes = getattr(settings, "SYSSTOCK_COMPRESSION_MIN_BYTES", 1024)
+        if len(response.content) < min_bytes:
+            return response
+
+        content_type = response.get("Content-Type", "")
+        if not content_type.startswith(self.COMPRESSIBLE_TYPES):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        accept = request.META.get("HTTP_ACCEPT_ENCODING", "")
+
+        if brotli is not None and self._accepts_br.search(accept) and not request.META.get("HTTP_COOKIE"):
+            quality = getattr(settings, "SYSSTOCK_BROTLI_QUALITY", 4)
+            compressed, encoding = brotli.compress(response.content, quality=quality), "br"
+        elif self._accepts_gzip.search(accept):
+            compressed = compress_string(response.content, max_random_bytes=self.max_random_bytes)
+            encoding = "gzip"
+        else:
+            return response
+
+        # si no achica, no vale la pena
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(response.content))
+        response.headers["Content-Encoding"] = encoding
+        # ETag fuerte deja de valer sobre el cuerpo comprimido
+        if response.has_header("ETag"):
+            response.headers["ETag"] = re.sub(r'^"', 'W/"', response.headers["ETag"])
+        return response
+
+
+# =========================
+#  Métricas por request (queries / SQL / tiempo total / bytes)
+# =========================
+class _ContadorSQL:
+    """
+    execute_wrapper: cuenta queries y acumula su tiempo. Con umbral (segundos)
+    guarda además las queries lentas para diagnostico.registrar_lentas.
+    Las vistas async lo comparten entre los hilos del pool (ver asincrono).
+    """
+
+    __slots__ = ("queries", "segundos", "umbral", "lentas", "_lock")
+
+    def __init__(self, umbral=None):
+        self.queries = 0
+        self.segundos = 0.0
+        self.umbral = umbral
+        self.lentas = []
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            dur = time.perf_counter() - t0
+            with self._lock:
+                self.segundos += dur
+                self.queries += 1
+            if self.umbral is not None and dur >= self.umbral:
+                self.lentas.append((context["connection"].alias, sql, params, many, dur))
+
+
+class QueryMetricsMiddleware:
+    """
+    Mide cada request con asincrono.envolver_sql (todas las conexiones, también
+    las del pool de las vistas async):
+    - header Server-Timing: db (tiempo SQL + cantidad de queries), app, total
+    - histogramas por nombre de URL en metrics.REGISTRY (ver /metrics)
+    - queries por encima de SYSSTOCK_SLOW_QUERY_MS -> diagnostico.CONSULTAS_LENTAS (con EXPLAIN)
+    Va primero en MIDDLEWARE para medir el request completo. Se apaga con
+    SYSSTOCK_METRICS_ENABLED = False. Sync y async (no bloquea el event loop en ASGI).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, "SYSSTOCK_METRICS_ENABLED", True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _contador():
+        umbral_ms = umbral_lentas_ms()
+        return _ContadorSQL(umbral=umbral_ms / 1000 if umbral_ms else None)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        contador = self._contador()
+        t0 = time.perf_counter()
+        with envolver_sql(contador):
+            response = self.get_response(request)
+        self._registrar(request, response, contador, time.perf_counter() - t0)
+        if contador.lentas:
+            registrar_lentas(request, contador.lentas)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        contador = self._contador()
+        t0 = time.perf_counter()
+        with envolver_sql(contador):
+            response = await self.get_response(request)
+        self._registrar(request, response, contador, time.perf_counter() - t0)
+        if contador.lentas:
+            # EXPLAIN: acceso a la base, fuera del event loop
+            await sync_to_async(registrar_lentas)(request, contador.lentas)
+        return response
+
+    @staticmethod
+    def _registrar(request, response, contador, total):
+        app = max(total - contador.segundos, 0.0)
+        response["Server-Timing"] = ", ".join((
+            f'db;dur={contador.segundos * 1000:.1f};desc="{contador.queries} queries"',
+            f"app;dur={app * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ))
+
+        vista = vista_de(request)
+        tamanio = None if response.streaming else len(response.content)
+        REGISTRY.observar(
+            vista, request.method, response.status_code,
+            total, contador.segundos, contador.queries, tamanio,
+        )
+
+
+# =========================
+#  Profiling a pedido (?_profile=1, solo superuser)
+# =========================
+class _LogSQL:
+    """execute_wrapper: guarda (sql, ms) de cada query del request perfilado."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < diagnostico.MAX_QUERIES_PERFIL:
+                self.queries.append({"sql": sql[:2000], "ms": round((time.perf_counter() - t0) * 1000, 3)})
+
+
+class ProfilingMiddleware:
+    """
+    ?_profile=1 (o =cprofile): corre el request bajo cProfile.
+    ?_profile=sample: profiler por muestreo (speedscope).
+    El perfil y el log de queries se guardan en diagnostico.PERFILES y la
+    respuesta normal sale con X-Profile-Id. Con &_profile_out=1 se devuelve el
+    perfil en lugar de la respuesta (texto, o &_profile_format=pstats|speedscope).
+
+    Solo superusers (sesión o JWT); SYSSTOCK_PROFILING_ENABLED = False lo apaga.
+    Sin ?_profile el costo es un lookup en GET. En ASGI el request perfilado
+    corre en un hilo aparte: de una vista async el perfil muestra sobre todo la
+    espera (las queries sí quedan en el log).
+    """
+
+    PARAM = "_profile"
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, "SYSSTOCK_PROFILING_ENABLED", True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _modo(self, request):
+        modo = request.GET.get(self.PARAM) if self.enabled else None
+        return None if not modo or modo in ("0", "false") else modo
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        modo = self._modo(request)
+        if modo is None:
+            return self.get_response(request)
+        return self._perfilar(request, modo, self.get_response)
+
+    async def __acall__(self, request):
+        modo = self._modo(request)
+        if modo is None:
+            return await self.get_response(request)
+        return await sync_to_async(self._perfilar)(request, modo, async_to_sync(self.get_response))
+
+    def _perfilar(self, request, modo, get_response):
+        user = usuario_request(request)
+        if user is None or not user.is_superuser:
+            return get_response(request)
+
+        log = _LogSQL()
+        t0 = time.perf_counter()
+        with envolver_sql(log):
+            if modo == "sample":
+                muestreador = diagnostico.Muestreador(
+                    threading.get_ident(), getattr(settings, "SYSSTOCK_PROFILE_SAMPLE_INTERVAL", 0.001)
+                )
+                muestreador.start()
+                try:
+                    response = get_response(request)
+                finally:
+                    muestreador.detener()
+            else:
+                response, stats = diagnostico.perfil_cprofile(lambda: get_response(request))
+        duracion_ms = (time.perf_counter() - t0) * 1000
+
+        vista = vista_de(request)
+        if modo == "sample":
+            tipo, texto = "sample", muestreador.texto()
+            datos = muestreador.speedscope(f"{request.method} {vista}", duracion_ms)
+        else:
+            tipo, texto = "cprofile", diagnostico.pstats_texto(stats)
+            datos = diagnostico.pstats_binario(stats)
+
+        registro = diagnostico.PERFILES.agregar({
+            "tipo": tipo,
+            "vista": vista,
+            "metodo": request.method,
+            "path": request.get_full_path(),
+            "tenant": diagnostico.etiqueta_tenant(user),
+            "status": response.status_code,
+            "duracion_ms": round(duracion_ms, 2),
+            "sql_ms": round(sum(q["ms"] for q in log.queries), 2),
+            "queries": log.queries,
+            "texto": texto,
+            "datos": datos,
+        })
+
+        if request.GET.get("_profile_out") in ("1", "true"):
+            return respuesta_perfil(registro, request.GET.get("_profile_format"))
+        response["X-Profile-Id"] = registro["id"]
+        return response
+
+
+def respuesta_perfil(registro, formato=None):
+    """Descarga del perfil: texto (default), pstats (.prof) o speedscope (.json)."""
+    if formato == "pstats" and registro["tipo"] == "cprofile":
+        resp = HttpResponse(registro["datos"], content_type="application/octet-stream")
+        resp["Content-Disposition"] = f'attachment; filename="perfil-{registro["id"]}.prof"'
+        return resp
+    if formato == "speedscope" and registro["tipo"] == "sample":
+        resp = HttpResponse(json.dumps(registro["datos"]), content_type="application/json")
+        resp["Content-Disposition"] = f'attachment; filename="perfil-{registro["id"]}.speedscope.json"'
+        return resp
+    queries = "\n".join(f'{q["ms"]:9.3f} ms  {q["sql"]}' for q in registro["queries"])
+    cuerpo = (
+        f'{registro["metodo"]} {registro["path"]} -> {registro["status"]}  '
+        f'{registro["duracion_ms"]} ms (SQL {registro["sql_ms"]} ms, {len(registro["queries"])} queries)\n\n'
+        f'{registro["texto"]}\n--- Queries ---\n{queries}\n'
+    )
+    return HttpResponse(cuerpo, content_type="text/plain; charset=utf-8")
+
+
+# =========================
+#  Réplica de lectura: pinning al primario después de escribir
+# =========================
+class ReplicaMiddleware:
+    """
+    Resetea el estado del router por request. Si el request escribió, fija al
+    primario por SYSSTOCK_REPLICA_PIN_SECONDS al usuario autenticado (en la
+    cache: con JWT el usuario se conoce recién en la vista, así que se consulta
+    en la primera lectura de reporte) y deja además la cookie, de respaldo para
+    clientes con cookies. Mientras tanto los reportes de ese cliente leen del
+    primario (ve lo que acaba de escribir aunque la réplica atrase). Sin alias
+    'reporting' no hace nada.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _fijado(self, request):
+        try:
+            desde = float(request.COOKIES.get(replica.COOKIE, ""))
+        except ValueError:
+            return False
+        return time.time() - desde < self._segundos()
+
+    @staticmethod
+    def _segundos():
+        return float(getattr(settings, "SYSSTOCK_REPLICA_PIN_SECONDS", 5))
+
+    def _iniciar(self, request):
+        # DRF deja el usuario autenticado (JWT) en request.user al autenticar
+        return replica.iniciar_request(
+            fijado=self._fijado(request),
+            pendiente=lambda: replica.usuario_fijado(getattr(request, "user", None)),
+        )
+
+    def _fijar(self, request, response):
+        if replica.escribio():
+            replica.fijar_usuario(getattr(request, "user", None), self._segundos())
+            response.set_cookie(
+                replica.COOKIE, f"{time.time():.3f}", max_age=int(self._segundos()) or 1,
+                httponly=True, samesite="Lax",
+            )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replica.configurada():
+            return self.get_response(request)
+        tokens = self._iniciar(request)
+        try:
+            response = self.get_response(request)
+            self._fijar(request, response)
+        finally:
+            replica.terminar_request(tokens)
+        return response
+
+    async def __acall__(self, request):
+        if not replica.configurada():
+            return await self.get_response(request)
+        tokens = self._iniciar(request)
+        try:
+            response = await self.get_response(request)
+            self._fijar(request, response)
+        finally:
+            replica.terminar_request(tokens)
+        return response
+
+
+# =========================
+#  Sharding por empresa: contexto limpio por request
+# =========================
+class ShardMiddleware:
+    """
+    Arranca cada request sin empresa (el alias lo fija TenantJWTAuthentication,
+    ver shards.py) y lo descarta al terminar: el hilo no arrastra el alias de un
+    request al siguiente. Sin SYSSTOCK_SHARDS no hace nada.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not shards.activo():
+            return self.get_response(request)
+        token = shards.iniciar_request()
+        try:
+            return self.get_response(request)
+        finally:
+            shards.terminar_request(token)
+
+    async def __acall__(self, request):
+        if not shards.activo():
+            return await self.get_response(request)
+        token = shards.iniciar_request()
+        try:
+            return await self.get_response(request)
+        finally:
+            shards.terminar_request(token)
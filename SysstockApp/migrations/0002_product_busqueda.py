@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:23
+
+from django.db import migrations, models
+
+from SysstockApp.search import FTS_TABLE, MYSQL_FULLTEXT_INDEX, texto_busqueda
+
+
+def poblar_busqueda(apps, schema_editor):
+    Product = apps.get_model("SysstockApp", "Product")
+    db = schema_editor.connection.alias
+    lote = []
+    for p in Product.objects.using(db).only("id", "nombre", "sku").iterator(chunk_size=2000):
+        p.busqueda = texto_busqueda(p.nombre, p.sku)
+        lote.append(p)
+        if len(lote) >= 2000:
+            Product.objects.using(db).bulk_update(lote, ["busqueda"])
+            lote = []
+    if lote:
+        Product.objects.using(db).bulk_update(lote, ["busqueda"])
+
+
+def crear_indice(apps, schema_editor):
+    conn = schema_editor.connection
+    table = apps.get_model("SysstockApp", "Product")._meta.db_table
+    if conn.vendor == "sqlite":
+        from SysstockApp.search import crear_indice_fts
+        crear_indice_fts(conn)
+    elif conn.vendor == "mysql":
+        schema_editor.execute(
+            f"ALTER TABLE `{table}` ADD FULLTEXT INDEX `{MYSQL_FULLTEXT_INDEX}` (`busqueda`) WITH PARSER ngram"
+        )
+
+
+def borrar_indice(apps, schema_editor):
+    conn = schema_editor.connection
+    table = apps.get_model("SysstockApp", "Product")._meta.db_table
+    if conn.vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif conn.vendor == "mysql":
+        schema_editor.execute(f"ALTER TABLE `{table}` DROP INDEX `{MYSQL_FULLTEXT_INDEX}`")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SysstockApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='busqueda',
+            field=models.CharField(blank=True, default='', editable=False, max_length=400),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['sucursal', 'busqueda'], name='SysstockApp_sucursa_a5e2f0_idx'),
+        ),
+        migrations.RunPython(poblar_busqueda, migrations.RunPython.noop),
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
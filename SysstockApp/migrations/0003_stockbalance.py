@@ -0,0 +1,73 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:28
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, IntegerField, Sum, When
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def poblar_saldos(apps, schema_editor):
+    """Saldo inicial de cada producto (y de cada producto/sucursal con movimientos)."""
+    Product = apps.get_model("SysstockApp", "Product")
+    StockMovement = apps.get_model("SysstockApp", "StockMovement")
+    StockBalance = apps.get_model("SysstockApp", "StockBalance")
+    db = schema_editor.connection.alias
+    default = int(getattr(settings, "SYSSTOCK_LOW_STOCK_THRESHOLD", 5))
+
+    signed = Case(
+        When(tipo="IN", then=F("cantidad")),
+        When(tipo="OUT", then=-F("cantidad")),
+        default=0,
+        output_field=IntegerField(),
+    )
+    totales = {
+        (r["producto_id"], r["sucursal_id"]): r["s"] or 0
+        for r in StockMovement.objects.using(db)
+        .values("producto_id", "sucursal_id").annotate(s=Sum(signed)).order_by()
+    }
+    stock_min = dict(Product.objects.using(db).values_list("id", "stock_min"))
+    claves = set(totales) | set(Product.objects.using(db).values_list("id", "sucursal_id"))
+
+    ahora = timezone.now()
+    nuevos = []
+    for p, s in sorted(claves):
+        cantidad = totales.get((p, s), 0)
+        limite = stock_min.get(p) if stock_min.get(p) is not None else default
+        bajo = cantidad <= limite
+        nuevos.append(StockBalance(
+            producto_id=p, sucursal_id=s, cantidad=cantidad, limite=limite,
+            bajo_stock=bajo, bajo_stock_desde=ahora if bajo else None,
+        ))
+    StockBalance.objects.using(db).bulk_create(nuevos, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SysstockApp', '0002_product_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField(default=0)),
+                ('limite', models.IntegerField(default=0)),
+                ('bajo_stock', models.BooleanField(default=False)),
+                ('bajo_stock_desde', models.DateTimeField(blank=True, null=True)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='SysstockApp.product')),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='SysstockApp.branch')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['sucursal', 'bajo_stock'], name='SysstockApp_sucursa_e78c25_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockbalance',
+            constraint=models.UniqueConstraint(fields=('producto', 'sucursal'), name='stockbalance_producto_sucursal_uniq'),
+        ),
+        migrations.RunPython(poblar_saldos, migrations.RunPython.noop),
+    ]
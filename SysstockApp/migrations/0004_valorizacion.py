@@ -0,0 +1,74 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:32
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from SysstockApp.valorizacion import reproducir
+
+
+def valorizar_saldos(apps, schema_editor):
+    """Costo promedio / valor (y capas FIFO) de los saldos existentes, reproduciendo los movimientos."""
+    StockMovement = apps.get_model("SysstockApp", "StockMovement")
+    StockBalance = apps.get_model("SysstockApp", "StockBalance")
+    CostLayer = apps.get_model("SysstockApp", "CostLayer")
+    db = schema_editor.connection.alias
+    fifo = getattr(settings, "SYSSTOCK_VALUATION_FIFO", False)
+
+    movs = defaultdict(list)
+    for row in (
+        StockMovement.objects.using(db)
+        .order_by("creado_en", "id")
+        .values_list("producto_id", "sucursal_id", "tipo", "cantidad", "costo_unit", "id")
+        .iterator(chunk_size=5000)
+    ):
+        movs[(row[0], row[1])].append(row[2:])
+
+    saldos, capas = [], []
+    for bal in StockBalance.objects.using(db).all().iterator(chunk_size=2000):
+        key = (bal.producto_id, bal.sucursal_id)
+        _, bal.costo_promedio, bal.valor, abiertas = reproducir(movs.get(key, ()), fifo=fifo)
+        saldos.append(bal)
+        capas.extend(CostLayer(producto_id=key[0], sucursal_id=key[1], **c) for c in abiertas)
+    StockBalance.objects.using(db).bulk_update(saldos, ["costo_promedio", "valor"], batch_size=1000)
+    CostLayer.objects.using(db).bulk_create(capas, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SysstockApp', '0003_stockbalance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockbalance',
+            name='costo_promedio',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='stockbalance',
+            name='valor',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=16),
+        ),
+        migrations.CreateModel(
+            name='CostLayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField()),
+                ('restante', models.PositiveIntegerField()),
+                ('costo_unit', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('movimiento', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='capas_costo', to='SysstockApp.stockmovement')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='capas_costo', to='SysstockApp.product')),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='capas_costo', to='SysstockApp.branch')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['producto', 'sucursal', 'restante'], name='SysstockApp_product_8c01ea_idx')],
+            },
+        ),
+        migrations.RunPython(valorizar_saldos, migrations.RunPython.noop),
+    ]
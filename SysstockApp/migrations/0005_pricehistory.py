@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('SysstockApp', '0004_valorizacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('precio_anterior', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('precio_nuevo', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('motivo', models.CharField(blank=True, max_length=255, null=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial_precios', to='SysstockApp.product')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-creado_en'],
+                'indexes': [models.Index(fields=['producto', 'creado_en'], name='SysstockApp_product_c4694a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('SysstockApp', '0008_backgroundtask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockmovement',
+            name='apertura',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='costo_unit',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=14, null=True),
+        ),
+        migrations.CreateModel(
+            name='StockMovementArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True)),
+                ('tipo', models.CharField(choices=[('IN', 'Ingreso'), ('OUT', 'Egreso')], max_length=3)),
+                ('cantidad', models.PositiveIntegerField()),
+                ('cantidad_signed', models.IntegerField()),
+                ('motivo', models.CharField(blank=True, max_length=255, null=True)),
+                ('costo_unit', models.DecimalField(blank=True, decimal_places=4, max_digits=14, null=True)),
+                ('creado_en', models.DateTimeField()),
+                ('archivado_en', models.DateTimeField(auto_now_add=True)),
+                ('producto', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='SysstockApp.product')),
+                ('sucursal', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='SysstockApp.branch')),
+                ('transferencia', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='SysstockApp.transfer')),
+                ('usuario', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['creado_en', 'original_id'],
+                'indexes': [models.Index(fields=['producto', 'sucursal', 'creado_en'], name='SysstockApp_product_fbee43_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:52
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+import django.utils.timezone
+
+from SysstockApp import particiones
+
+LOTE = 50000
+
+
+def copiar_fecha_venta(apps, schema_editor):
+    """SaleItem.creado_en = fecha de su venta, por rangos de id."""
+    Sale = apps.get_model("SysstockApp", "Sale")
+    SaleItem = apps.get_model("SysstockApp", "SaleItem")
+    db = schema_editor.connection.alias
+    ultimo = SaleItem.objects.using(db).aggregate(m=Max("id"))["m"] or 0
+    fecha = Subquery(Sale.objects.using(db).filter(pk=OuterRef("venta_id")).values("creado_en")[:1])
+    for inicio in range(0, ultimo, LOTE):
+        (SaleItem.objects.using(db)
+         .filter(id__gt=inicio, id__lte=inicio + LOTE)
+         .update(creado_en=Coalesce(fecha, F("creado_en"))))
+
+
+def particionar(apps, schema_editor):
+    # solo MySQL; con SYSSTOCK_PARTITIONS_ON_MIGRATE=0 queda para `manage_partitions --inicializar`
+    if settings.SYSSTOCK_PARTITIONS_ON_MIGRATE:
+        particiones.inicializar(using=schema_editor.connection.alias, apps=apps)
+
+
+def quitar_particiones(apps, schema_editor):
+    particiones.quitar(using=schema_editor.connection.alias, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('SysstockApp', '0009_archivo_movimientos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saleitem',
+            name='creado_en',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='costlayer',
+            name='movimiento',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='capas_costo', to='SysstockApp.stockmovement'),
+        ),
+        migrations.AlterField(
+            model_name='saleitem',
+            name='producto',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, to='SysstockApp.product'),
+        ),
+        migrations.AlterField(
+            model_name='saleitem',
+            name='venta',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='SysstockApp.sale'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='producto',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='SysstockApp.product'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='sucursal',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, to='SysstockApp.branch'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='transferencia',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos', to='SysstockApp.transfer'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='usuario',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='saleitem',
+            index=models.Index(fields=['creado_en'], name='SysstockApp_creado__bc4152_idx'),
+        ),
+        migrations.RunPython(copiar_fecha_venta, migrations.RunPython.noop),
+        migrations.RunPython(particionar, quitar_particiones),
+    ]
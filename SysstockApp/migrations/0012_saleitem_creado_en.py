@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SysstockApp', '0011_tenantshard'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='saleitem',
+            name='creado_en',
+            field=models.DateTimeField(blank=True),
+        ),
+    ]
@@ -1,6 +1,10 @@
 from django.conf import settings
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
 from django.db.models import F, Q, Sum, DecimalField
+from django.utils import timezone
+
+from .search import texto_busqueda
 
 
 # =========================
@@ -71,13 +75,24 @@ class Product(models.Model):
     sku = models.CharField(max_length=64, null=True, blank=True)
     stock_min = models.PositiveIntegerField(null=True, blank=True)
 
+    # "nombre sku" normalizado (sin acentos, minúsculas) para búsqueda/autocomplete
+    busqueda = models.CharField(max_length=400, editable=False, blank=True, default="")
+
     class Meta:
         indexes = [
             models.Index(fields=["nombre"]),
             models.Index(fields=["sucursal"]),
             models.Index(fields=["categoria"]),
+            models.Index(fields=["sucursal", "busqueda"]),
         ]
 
+    def save(self, *args, **kwargs):
+        self.busqueda = texto_busqueda(self.nombre, self.sku)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"nombre", "sku"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"busqueda"}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         cat = self.categoria.nombre if self.categoria else "Sin categoría"
         return f"{self.nombre} ({cat})"
@@ -91,6 +106,31 @@ class Product(models.Model):
         return agg["total"] or 0
 
 
+# =========================
+#  Historial de precios (actualizaciones masivas)
+# =========================
+class PriceHistory(models.Model):
+    producto = models.ForeignKey(Product, related_name="historial_precios", on_delete=models.CASCADE)
+    precio_anterior = models.DecimalField(max_digits=12, decimal_places=2)
+    precio_nuevo = models.DecimalField(max_digits=12, decimal_places=2)
+
+    # opcional: motivo (p.ej. "Ajuste inflación marzo")
+    motivo = models.CharField(max_length=255, blank=True, null=True)
+
+    # auditoría
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-creado_en"]
+        indexes = [
+            models.Index(fields=["producto", "creado_en"]),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id}: {self.precio_anterior} -> {self.precio_nuevo}"
+
+
 # =========================
 #  Movimientos de stock
 # =========================
@@ -99,8 +139,13 @@ class StockMovement(models.Model):
     OUT = "OUT"
     TYPES = [(IN, "Ingreso"), (OUT, "Egreso")]
 
-    producto = models.ForeignKey(Product, related_name="movimientos", on_delete=models.CASCADE)
-    sucursal = models.ForeignKey(Branch, on_delete=models.PROTECT)
+    # sin FKs reales (db_constraint=False): en MySQL la tabla se particiona por mes
+    # (ver particiones.py) e InnoDB no admite FKs en tablas particionadas. Los
+    # on_delete los sigue resolviendo Django.
+    producto = models.ForeignKey(
+        Product, related_name="movimientos", on_delete=models.CASCADE, db_constraint=False
+    )
+    sucursal = models.ForeignKey(Branch, on_delete=models.PROTECT, db_constraint=False)
     tipo = models.CharField(max_length=3, choices=TYPES)
     cantidad = models.PositiveIntegerField()  # entero positivo
     # campo firmado para agilizar SUM (IN=+cantidad, OUT=-cantidad)
@@ -109,12 +154,24 @@ class StockMovement(models.Model):
     # opcional: motivo/memo del movimiento
     motivo = models.CharField(max_length=255, blank=True, null=True)
 
-    # opcional: costo unitario (no impacta stock; útil para valorización a futuro)
-    costo_unit = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    # opcional: costo unitario (no impacta stock; alimenta la valorización, ver valorizacion.py).
+    # 4 decimales: las aperturas de archive_movements llevan el costo promedio / de capa exacto.
+    costo_unit = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True)
+
+    # opcional: transferencia entre sucursales que generó el movimiento (OUT origen / IN destino)
+    transferencia = models.ForeignKey(
+        "Transfer", related_name="movimientos", on_delete=models.SET_NULL, null=True, blank=True,
+        db_constraint=False,
+    )
+
+    # saldo de apertura que reemplaza a los movimientos archivados (ver archivo.py)
+    apertura = models.BooleanField(default=False, editable=False)
 
     # auditoría
-    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
-    creado_en = models.DateTimeField(auto_now_add=True)
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False
+    )
+    creado_en = models.DateTimeField(auto_now_add=True)  # clave de partición
 
     class Meta:
         ordering = ["-creado_en"]
@@ -124,13 +181,132 @@ class StockMovement(models.Model):
         ]
 
     def save(self, *args, **kwargs):
+        from .stock import aplicar_movimientos
+
         self.cantidad_signed = int(self.cantidad) if self.tipo == self.IN else -int(self.cantidad)
-        super().save(*args, **kwargs)
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            anterior = None
+            if not self._state.adding and self.pk:
+                anterior = (
+                    StockMovement.objects.using(using)
+                    .filter(pk=self.pk)
+                    .only("producto_id", "sucursal_id", "tipo", "cantidad")
+                    .first()
+                )
+            super().save(*args, **kwargs)
+            # saldo mantenido (StockBalance): revierte la versión anterior si es una edición
+            aplicar_movimientos([self], revertidos=[anterior] if anterior else (), using=using)
+
+    def delete(self, *args, **kwargs):
+        from .stock import aplicar_movimientos
+
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            deleted = super().delete(*args, **kwargs)
+            aplicar_movimientos([], revertidos=[self], using=using)
+            return deleted
 
     def __str__(self):
         return f"{self.tipo} {self.producto_id} x {self.cantidad} @ suc {self.sucursal_id}"
 
 
+class StockMovementArchive(models.Model):
+    """
+    Movimiento archivado por archive_movements: en StockMovement lo reemplaza el
+    movimiento de apertura de su producto/sucursal. Puede vivir en otra base
+    (alias 'archivo', ver archivo.py), por eso sin FKs reales.
+    """
+    original_id = models.BigIntegerField(unique=True)  # StockMovement.id
+    producto = models.ForeignKey(
+        Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    sucursal = models.ForeignKey(
+        Branch, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    tipo = models.CharField(max_length=3, choices=StockMovement.TYPES)
+    cantidad = models.PositiveIntegerField()
+    cantidad_signed = models.IntegerField()
+    motivo = models.CharField(max_length=255, blank=True, null=True)
+    costo_unit = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True)
+    transferencia = models.ForeignKey(
+        "Transfer", on_delete=models.DO_NOTHING, db_constraint=False, related_name="+", null=True
+    )
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+", null=True
+    )
+    creado_en = models.DateTimeField()
+    archivado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["creado_en", "original_id"]
+        indexes = [
+            models.Index(fields=["producto", "sucursal", "creado_en"]),
+        ]
+
+    def __str__(self):
+        return f"Archivado #{self.original_id} {self.tipo} {self.producto_id} x {self.cantidad} @ suc {self.sucursal_id}"
+
+
+# =========================
+#  Transferencias entre sucursales
+# =========================
+class Transfer(models.Model):
+    """
+    Cabecera de una transferencia; las líneas son los pares de movimientos
+    (OUT en origen / IN en destino) con transferencia = esta.
+    """
+    origen = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name="transferencias_salida")
+    destino = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name="transferencias_entrada")
+    motivo = models.CharField(max_length=255, blank=True, null=True)
+
+    # auditoría
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-creado_en"]
+
+    def __str__(self):
+        return f"Transferencia #{self.id}: suc {self.origen_id} -> suc {self.destino_id}"
+
+
+# =========================
+#  Saldos de stock (mantenidos por movimiento)
+# =========================
+class StockBalance(models.Model):
+    """
+    Stock actual por producto/sucursal, actualizado en la misma transacción que
+    cada movimiento (ver stock.aplicar_movimientos). Mantiene además el set de
+    bajo stock: bajo_stock = cantidad <= limite.
+    """
+    producto = models.ForeignKey(Product, related_name="saldos", on_delete=models.CASCADE)
+    sucursal = models.ForeignKey(Branch, related_name="saldos", on_delete=models.CASCADE)
+    cantidad = models.IntegerField(default=0)
+
+    # stock_min del producto o el umbral por defecto de la empresa
+    limite = models.IntegerField(default=0)
+    bajo_stock = models.BooleanField(default=False)
+    bajo_stock_desde = models.DateTimeField(null=True, blank=True)
+
+    # valorización mantenida (promedio ponderado; valor FIFO si está activo)
+    costo_promedio = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    valor = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["producto", "sucursal"], name="stockbalance_producto_sucursal_uniq")
+        ]
+        indexes = [
+            models.Index(fields=["sucursal", "bajo_stock"]),
+        ]
+
+    def __str__(self):
+        return f"Saldo {self.producto_id} @ suc {self.sucursal_id}: {self.cantidad}"
+
+
 # =========================
 #  Ventas
 # =========================
@@ -155,15 +331,173 @@ class Sale(models.Model):
 
 
 class SaleItem(models.Model):
-    venta = models.ForeignKey(Sale, related_name="items", on_delete=models.CASCADE)
-    producto = models.ForeignKey(Product, on_delete=models.PROTECT)
+    # sin FKs reales: tabla particionada por mes en MySQL (ver StockMovement y particiones.py)
+    venta = models.ForeignKey(Sale, related_name="items", on_delete=models.CASCADE, db_constraint=False)
+    producto = models.ForeignKey(Product, on_delete=models.PROTECT, db_constraint=False)
     cantidad = models.PositiveIntegerField()  # entero positivo
     precio_unit = models.DecimalField(max_digits=12, decimal_places=2)
+    # copia de venta.creado_en: clave de partición, los reportes por fecha podan sin el join
+    creado_en = models.DateTimeField(blank=True)
 
     class Meta:
         constraints = [
             models.CheckConstraint(check=Q(cantidad__gte=1), name="saleitem_cantidad_gte_1")
         ]
+        indexes = [
+            models.Index(fields=["creado_en"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        # sin fecha (venta.items.create, admin): la de su venta, así cae en la partición de la venta
+        if self.creado_en is None:
+            self.creado_en = self.venta.creado_en
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Item venta {self.venta_id}: {self.producto_id} x {self.cantidad}"
+
+
+# =========================
+#  Capas de costo FIFO (solo con SYSSTOCK_VALUATION_FIFO)
+# =========================
+class CostLayer(models.Model):
+    """
+    Una capa por ingreso (IN) con su costo; los egresos consumen 'restante'
+    de las capas más viejas del mismo producto/sucursal.
+    """
+    producto = models.ForeignKey(Product, related_name="capas_costo", on_delete=models.CASCADE)
+    sucursal = models.ForeignKey(Branch, related_name="capas_costo", on_delete=models.CASCADE)
+    # sin FK real: StockMovement está particionada en MySQL (no admite FKs entrantes)
+    movimiento = models.ForeignKey(
+        StockMovement, related_name="capas_costo", on_delete=models.SET_NULL, null=True, blank=True,
+        db_constraint=False,
+    )
+    cantidad = models.PositiveIntegerField()
+    restante = models.PositiveIntegerField()
+    costo_unit = models.DecimalField(max_digits=14, decimal_places=4)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["producto", "sucursal", "restante"]),
+        ]
+
+    def __str__(self):
+        return f"Capa {self.producto_id} @ suc {self.sucursal_id}: {self.restante}/{self.cantidad} x {self.costo_unit}"
+
+
+# =========================
+#  Outbox de eventos y webhooks
+# =========================
+class OutboxEvent(models.Model):
+    """
+    Evento escrito en la misma transacción que el cambio que lo origina (venta,
+    movimiento de stock): si la transacción se revierte, el evento tampoco existe.
+    deliver_webhooks los entrega por id creciente (ver outbox.py).
+    Sin FKs reales: el evento sobrevive aunque se borre la sucursal o el usuario.
+    """
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+", null=True
+    )
+    sucursal = models.ForeignKey(
+        Branch, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+", null=True
+    )
+    tipo = models.CharField(max_length=64)
+    datos = models.JSONField(encoder=DjangoJSONEncoder)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["owner", "id"]),
+        ]
+
+    def __str__(self):
+        return f"Evento #{self.id} {self.tipo} @ suc {self.sucursal_id}"
+
+
+class WebhookEndpoint(models.Model):
+    """
+    Destino de los eventos de una empresa. 'cursor' es el último OutboxEvent.id
+    entregado: los lotes salen en orden y un lote fallido se reintenta (con
+    backoff) antes de seguir, así el receptor nunca ve eventos desordenados.
+    """
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="webhooks")
+    url = models.URLField(max_length=500)
+    # HMAC-SHA256 de "<timestamp>.<cuerpo>" en X-Sysstock-Firma
+    secreto = models.CharField(max_length=64)
+    # tipos de evento a entregar ([] = todos)
+    tipos = models.JSONField(default=list, blank=True)
+    activo = models.BooleanField(default=True)
+
+    # estado de entrega (lo mantiene deliver_webhooks)
+    cursor = models.BigIntegerField(default=0)
+    intentos = models.PositiveIntegerField(default=0)  # fallos seguidos del lote actual
+    proximo_intento = models.DateTimeField(null=True, blank=True)
+    tomado_hasta = models.DateTimeField(null=True, blank=True)  # lease del worker que lo está entregando
+    ultimo_error = models.TextField(blank=True, default="")
+    ultima_entrega = models.DateTimeField(null=True, blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"Webhook #{self.id} {self.url} ({self.owner_id})"
+
+
+# =========================
+#  Tareas en segundo plano (backend "db", ver tareas.py)
+# =========================
+class BackgroundTask(models.Model):
+    PENDIENTE = "pendiente"
+    HECHA = "hecha"
+    FALLIDA = "fallida"
+    ESTADOS = [(PENDIENTE, "Pendiente"), (HECHA, "Hecha"), (FALLIDA, "Fallida")]
+
+    nombre = models.CharField(max_length=100)
+    args = models.JSONField(encoder=DjangoJSONEncoder, default=list)
+    kwargs = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    # idempotencia: una clave repetida no se vuelve a encolar
+    clave = models.CharField(max_length=200, unique=True, null=True, blank=True)
+
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=4)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    tomada_hasta = models.DateTimeField(null=True, blank=True)  # lease del worker que la ejecuta
+    ultimo_error = models.TextField(blank=True, default="")
+
+    creado_en = models.DateTimeField(auto_now_add=True)
+    terminada_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["estado", "proximo_intento"]),
+        ]
+
+    def __str__(self):
+        return f"Tarea #{self.id} {self.nombre} ({self.estado})"
+
+
+# =========================
+#  Sharding por empresa (registro, ver shards.py)
+# =========================
+class TenantShard(models.Model):
+    """
+    Dónde viven los datos de una empresa (owner de Branch). Sin fila, en default.
+    Vive siempre en default; move_tenant la actualiza.
+    """
+    owner = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="shard")
+    alias = models.CharField(max_length=50)
+    # move_tenant copiando: escrituras de la empresa rechazadas (503) hasta que termine
+    moviendo = models.BooleanField(default=False)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"Empresa {self.owner_id} -> {self.alias}{' (moviendo)' if self.moviendo else ''}"
@@ -0,0 +1,83 @@
+"""
+Notificaciones de cruce de bajo stock (entrada/salida del set de bajo stock).
+
+Backends configurables en settings.SYSSTOCK_LOW_STOCK_HOOKS:
+  - "log":     logger 'sysstock.alertas'
+  - "queue":   cola en memoria (ALERTAS) para consumidores locales
+  - "webhook": POST JSON a settings.SYSSTOCK_LOW_STOCK_WEBHOOK_URL
+
+Cada hook corre como tarea en segundo plano ("alertas.hook", ver tareas.py):
+fuera del request, después del commit y con reintentos (un webhook caído se
+reintenta sin repetir el log). "queue" es del proceso y se llena al confirmar.
+"""
+import hashlib
+import json
+import logging
+import queue
+import urllib.request
+from functools import partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .tareas import encolar, tarea
+
+logger = logging.getLogger("sysstock.alertas")
+
+# consumidores locales: ALERTAS.get() / get_nowait()
+ALERTAS = queue.Queue(maxsize=10000)
+
+
+def notificar_cruces(eventos, using=DEFAULT_DB_ALIAS):
+    """Encola un hook por tarea; llamar dentro de la transacción que produjo los cruces."""
+    hooks = getattr(settings, "SYSSTOCK_LOW_STOCK_HOOKS", ["log"])
+    digest = hashlib.sha1(json.dumps(eventos, sort_keys=True, default=str).encode()).hexdigest()[:20]
+    for hook in hooks:
+        if hook not in HOOKS:
+            logger.error("Hook de alertas de stock desconocido: %r", hook)
+        elif hook in EN_PROCESO:
+            transaction.on_commit(partial(HOOKS[hook], eventos), using=using)
+        else:
+            encolar("alertas.hook", hook, eventos, clave=f"alertas:{hook}:{digest}", using=using)
+
+
+@tarea("alertas.hook", reintentos=5)
+def ejecutar_hook(hook, eventos):
+    HOOKS[hook](eventos)
+
+
+def _hook_log(eventos):
+    for ev in eventos:
+        nivel = logging.WARNING if ev["evento"] == "stock.bajo" else logging.INFO
+        logger.log(
+            nivel, "%s producto=%s sucursal=%s stock=%s limite=%s",
+            ev["evento"], ev["producto_id"], ev["sucursal_id"], ev["stock"], ev["limite"],
+        )
+
+
+def _hook_queue(eventos):
+    for ev in eventos:
+        try:
+            ALERTAS.put_nowait(ev)
+        except queue.Full:
+            logger.warning("Cola de alertas llena; se descarta %s", ev)
+
+
+def _hook_webhook(eventos):
+    url = getattr(settings, "SYSSTOCK_LOW_STOCK_WEBHOOK_URL", None)
+    if not url:
+        return
+    # corre en la tarea: un error se propaga y la tarea se reintenta
+    body = json.dumps({"eventos": eventos}).encode()
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+    with urllib.request.urlopen(req, timeout=getattr(settings, "SYSSTOCK_LOW_STOCK_WEBHOOK_TIMEOUT", 5)):
+        pass
+
+
+HOOKS = {
+    "log": _hook_log,
+    "queue": _hook_queue,
+    "webhook": _hook_webhook,
+}
+# hooks que tienen que correr en este proceso (no como tarea)
+EN_PROCESO = {"queue"}
@@ -0,0 +1,417 @@
+"""
+Outbox transaccional y entrega de webhooks (reemplaza el polling de /api/ventas/).
+
+Escritura (dentro de la transacción del cambio, un INSERT por transacción):
+  - "venta.creada":      SaleSerializer.create
+  - "stock.movimiento":  cada movimiento aplicado (stock.aplicar_movimientos)
+  - "stock.reversion":   versión anterior de un movimiento editado o borrado
+  SYSSTOCK_OUTBOX_ENABLED=False deja de escribirlos.
+
+Entrega (manage.py deliver_webhooks):
+  - cada WebhookEndpoint lleva su cursor (último id entregado); se piden los
+    eventos de su empresa con id > cursor, en lotes de SYSSTOCK_WEBHOOK_LOTE,
+    y se hace un POST por lote. 2xx avanza el cursor; cualquier otra respuesta
+    reintenta el MISMO lote con backoff exponencial: el orden por endpoint se
+    mantiene (un endpoint caído no frena a los demás).
+  - un lease (tomado_hasta) evita que dos workers entreguen el mismo endpoint.
+  - los ids se asignan al insertar pero se ven al confirmar: una transacción
+    lenta puede confirmar un id menor que otro ya visible. Solo se entregan
+    eventos con más de SYSSTOCK_OUTBOX_ASENTAMIENTO segundos, así el cursor no
+    salta ids que todavía no se veían.
+  - entrega al menos una vez: el receptor deduplica por id de evento
+    (X-Sysstock-Lote trae el rango del lote).
+
+Destinos (las URLs las carga cada empresa y el POST sale desde nuestra red):
+  - al crear: https obligatorio y, si SYSSTOCK_WEBHOOK_HOSTS no está vacío, solo
+    esos hosts (".dominio" acepta subdominios).
+  - al enviar: el host se resuelve y se conecta a la IP ya chequeada; loopback,
+    redes privadas, link-local (169.254.169.254) y demás no globales se rechazan
+    sin conectar. Sin proxies ni redirecciones.
+  SYSSTOCK_WEBHOOK_ALLOW_PRIVATE=True levanta ambas reglas (solo desarrollo).
+"""
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import logging
+import random
+import secrets
+import socket
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+logger = logging.getLogger("sysstock.webhooks")
+
+TIPOS = ("venta.creada", "stock.movimiento", "stock.reversion")
+
+
+def habilitado():
+    return getattr(settings, "SYSSTOCK_OUTBOX_ENABLED", True)
+
+
+def nuevo_secreto():
+    return secrets.token_hex(32)
+
+
+# =========================
+#  Escritura (en la transacción del cambio)
+# =========================
+def registrar(eventos, using=DEFAULT_DB_ALIAS):
+    """eventos: [(owner_id, sucursal_id, tipo, datos)]. Un solo INSERT."""
+    from .models import OutboxEvent
+
+    if not eventos or not habilitado():
+        return
+    OutboxEvent.objects.using(using).bulk_create(
+        [OutboxEvent(owner_id=o, sucursal_id=s, tipo=t, datos=d) for o, s, t, d in eventos], batch_size=500
+    )
+
+
+def evento_venta(venta, items):
+    """(owner, sucursal, "venta.creada", datos) con las líneas ya armadas (SaleItem sin guardar o guardados)."""
+    return (venta.sucursal.owner_id, venta.sucursal_id, "venta.creada", {
+        "id": venta.id,
+        "usuario_id": venta.usuario_id,
+        "creado_en": venta.creado_en,
+        "total": sum(it.cantidad * it.precio_unit for it in items),
+        "items": [
+            {"producto_id": it.producto_id, "sku": it.producto.sku, "cantidad": it.cantidad,
+             "precio_unit": it.precio_unit}
+            for it in items
+        ],
+    })
+
+
+def registrar_movimientos(movimientos, revertidos, saldos, using=DEFAULT_DB_ALIAS, previos=()):
+    """Eventos de los movimientos aplicados (y revertidos) con el saldo resultante, después de 'previos'."""
+    if not habilitado() or not (movimientos or revertidos or previos):
+        return
+    owners = _owners([*movimientos, *revertidos], using)
+    eventos = list(previos) + [
+        (owners.get(m.sucursal_id), m.sucursal_id, tipo, {
+            "movimiento_id": m.pk,  # con bulk_create: cargado por stock.insertar_movimientos (MySQL)
+            "producto_id": m.producto_id,
+            "tipo": m.tipo,
+            "cantidad": m.cantidad,
+            "motivo": m.motivo,
+            "costo_unit": m.costo_unit,
+            "transferencia_id": m.transferencia_id,
+            "usuario_id": m.usuario_id,
+            "creado_en": m.creado_en,
+            "saldo": saldos.get((m.producto_id, m.sucursal_id)),
+        })
+        for tipo, lista in (("stock.reversion", revertidos), ("stock.movimiento", movimientos))
+        for m in lista
+    ]
+    registrar(eventos, using=using)
+
+
+def _owners(movimientos, using):
+    """{sucursal_id: owner_id}; usa la sucursal ya cargada en el movimiento si la hay."""
+    from .models import Branch, StockMovement
+
+    campo = StockMovement._meta.get_field("sucursal")
+    owners = {m.sucursal_id: m.sucursal.owner_id for m in movimientos if campo.is_cached(m)}
+    faltan = {m.sucursal_id for m in movimientos} - set(owners)
+    if faltan:
+        owners.update(Branch.objects.using(using).filter(id__in=faltan).values_list("id", "owner_id"))
+    return owners
+
+
+# =========================
+#  Entrega
+# =========================
+def _lote_default():
+    return int(getattr(settings, "SYSSTOCK_WEBHOOK_LOTE", 100))
+
+
+def backoff(intentos):
+    """Segundos hasta el próximo intento: base * 2^(n-1), con tope y ±20% de jitter."""
+    base = float(getattr(settings, "SYSSTOCK_WEBHOOK_BACKOFF_BASE", 2))
+    tope = float(getattr(settings, "SYSSTOCK_WEBHOOK_BACKOFF_MAX", 600))
+    return min(tope, base * 2 ** max(intentos - 1, 0)) * random.uniform(0.8, 1.2)
+
+
+def pendientes(endpoint, lote=None, using=DEFAULT_DB_ALIAS):
+    """Próximos eventos del endpoint en orden de id (solo los ya asentados)."""
+    from .models import OutboxEvent
+
+    corte = timezone.now() - timedelta(seconds=float(getattr(settings, "SYSSTOCK_OUTBOX_ASENTAMIENTO", 5)))
+    qs = OutboxEvent.objects.using(using).filter(owner_id=endpoint.owner_id, id__gt=endpoint.cursor)
+    if endpoint.tipos:
+        qs = qs.filter(tipo__in=endpoint.tipos)
+    eventos = []
+    for ev in qs.order_by("id")[: lote or _lote_default()]:
+        if ev.creado_en > corte:
+            break  # todo lo que sigue es más nuevo: esperar a que se asiente
+        eventos.append(ev)
+    return eventos
+
+
+def cuerpo(eventos):
+    return json.dumps(
+        {"eventos": [
+            {"id": ev.id, "tipo": ev.tipo, "sucursal_id": ev.sucursal_id, "creado_en": ev.creado_en, "datos": ev.datos}
+            for ev in eventos
+        ]},
+        cls=DjangoJSONEncoder,
+    ).encode()
+
+
+def firma(secreto, timestamp, body):
+    return "sha256=" + hmac.new(secreto.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+
+
+class EntregaFallida(Exception):
+    def __init__(self, mensaje, status=None):
+        super().__init__(mensaje)
+        self.status = status
+
+
+# =========================
+#  Destinos permitidos
+# =========================
+def _privadas_permitidas():
+    return getattr(settings, "SYSSTOCK_WEBHOOK_ALLOW_PRIVATE", False)
+
+
+def _host_en_lista(host):
+    permitidos = getattr(settings, "SYSSTOCK_WEBHOOK_HOSTS", ())
+    if not permitidos:
+        return True
+    host = host.lower().rstrip(".")
+    return any(
+        host == p.lstrip(".") or (p.startswith(".") and host.endswith(p))
+        for p in (p.lower() for p in permitidos)
+    )
+
+
+def _ip_no_global(valor):
+    ip = ipaddress.ip_address(valor.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return not ip.is_global or ip.is_multicast
+
+
+def validar_url(url):
+    """Mensaje de error (400) para la URL de un endpoint, o None."""
+    if _privadas_permitidas():
+        return None
+    partes = urllib.parse.urlsplit(url)
+    if partes.scheme != "https":
+        return "La URL del webhook debe ser https."
+    host = partes.hostname or ""
+    if host == "localhost" or host.endswith(".localhost"):
+        return "La URL no puede apuntar a una dirección privada o local."
+    if not _host_en_lista(host):
+        return "Host no permitido para webhooks (SYSSTOCK_WEBHOOK_HOSTS)."
+    try:
+        if _ip_no_global(host):
+            return "La URL no puede apuntar a una dirección privada o local."
+    except ValueError:
+        pass  # nombre: se resuelve y se chequea al enviar
+    return None
+
+
+def direccion_permitida(host, port):
+    """IP a la que conectar para 'host': la resuelta, si todas son globales (EntregaFallida si no)."""
+    try:
+        ips = [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    except OSError as e:
+        raise EntregaFallida(f"DNS: {e}") from e
+    if _privadas_permitidas():
+        return ips[0]
+    if not _host_en_lista(host) or any(_ip_no_global(ip) for ip in ips):
+        raise EntregaFallida("Destino no permitido (dirección privada o local).")
+    return ips[0]
+
+
+class _ConexionChequeada:
+    """Conecta a la IP chequeada (sin segunda resolución); certificado y SNI siguen siendo del host."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = self._conectar
+
+    def _conectar(self, address, timeout, source_address=None):
+        host, port = address
+        return socket.create_connection((direccion_permitida(host, port), port), timeout, source_address)
+
+
+class _ConexionHTTPS(_ConexionChequeada, http.client.HTTPSConnection):
+    pass
+
+
+class _ConexionHTTP(_ConexionChequeada, http.client.HTTPConnection):
+    pass
+
+
+class _HandlerHTTPS(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_ConexionHTTPS, req, context=self._context)
+
+
+class _HandlerHTTP(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        if not _privadas_permitidas():
+            raise EntregaFallida("La URL del webhook debe ser https.")
+        return self.do_open(_ConexionHTTP, req)
+
+
+class _SinRedirecciones(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None  # el 3xx queda como HTTPError
+
+
+_opener = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}), _HandlerHTTPS(), _HandlerHTTP(), _SinRedirecciones()
+)
+
+
+def enviar(endpoint, eventos):
+    """Un POST con el lote; EntregaFallida si la respuesta no es 2xx."""
+    body = cuerpo(eventos)
+    timestamp = str(int(time.time()))
+    req = urllib.request.Request(
+        endpoint.url,
+        data=body,
+        method="POST",
+        headers={
+            "Content-Type": "application/json",
+            "User-Agent": "SysStock-Webhooks/1",
+            "X-Sysstock-Endpoint": str(endpoint.id),
+            "X-Sysstock-Lote": f"{eventos[0].id}-{eventos[-1].id}",
+            "X-Sysstock-Timestamp": timestamp,
+            "X-Sysstock-Firma": firma(endpoint.secreto, timestamp, body),
+        },
+    )
+    try:
+        with _opener.open(req, timeout=float(getattr(settings, "SYSSTOCK_WEBHOOK_TIMEOUT", 10))) as r:
+            r.read()
+    except urllib.error.HTTPError as e:
+        raise EntregaFallida(f"HTTP {e.code}", status=e.code) from e
+    except OSError as e:  # conexión rechazada, timeout, DNS
+        raise EntregaFallida(f"{type(e).__name__}: {e}") from e
+
+
+def tomar(endpoint_id, lease, using=DEFAULT_DB_ALIAS):
+    """Lease atómico (UPDATE condicional): True si este worker se quedó con el endpoint."""
+    from .models import WebhookEndpoint
+
+    ahora = timezone.now()
+    return bool(
+        WebhookEndpoint.objects.using(using)
+        .filter(Q(tomado_hasta__isnull=True) | Q(tomado_hasta__lt=ahora), pk=endpoint_id)
+        .update(tomado_hasta=ahora + timedelta(seconds=lease))
+    )
+
+
+def entregar_endpoint(endpoint, lote=None, max_lotes=10, lease=60, using=DEFAULT_DB_ALIAS):
+    """
+    Entrega hasta max_lotes lotes seguidos del endpoint (ya tomado; cada lote
+    entregado renueva el lease). Devuelve (eventos entregados, lotes fallidos).
+    """
+    from .models import OutboxEvent, WebhookEndpoint
+
+    entregados = 0
+    for _ in range(max_lotes):
+        eventos = pendientes(endpoint, lote, using=using)
+        if not eventos:
+            if endpoint.tipos:
+                # con filtro de tipos el cursor igual avanza sobre los eventos que no le tocan
+                corte = timezone.now() - timedelta(seconds=float(getattr(settings, "SYSSTOCK_OUTBOX_ASENTAMIENTO", 5)))
+                tope = (
+                    OutboxEvent.objects.using(using)
+                    .filter(owner_id=endpoint.owner_id, id__gt=endpoint.cursor, creado_en__lte=corte)
+                    .aggregate(m=Max("id"))["m"]
+                )
+                if tope:
+                    endpoint.cursor = tope
+                    WebhookEndpoint.objects.using(using).filter(pk=endpoint.pk).update(cursor=tope)
+            break
+        try:
+            enviar(endpoint, eventos)
+        except EntregaFallida as e:
+            endpoint.intentos += 1
+            campos = {
+                "intentos": endpoint.intentos,
+                "ultimo_error": str(e)[:1000],
+                "proximo_intento": timezone.now() + timedelta(seconds=backoff(endpoint.intentos)),
+            }
+            if e.status == 410:  # Gone: el receptor pide que no se le mande más
+                campos["activo"] = False
+            WebhookEndpoint.objects.using(using).filter(pk=endpoint.pk).update(**campos)
+            logger.warning(
+                "Webhook %s: lote %s-%s falló (%s), intento %s",
+                endpoint.pk, eventos[0].id, eventos[-1].id, e, endpoint.intentos,
+            )
+            return entregados, 1
+        endpoint.cursor = eventos[-1].id
+        endpoint.intentos = 0
+        entregados += len(eventos)
+        WebhookEndpoint.objects.using(using).filter(pk=endpoint.pk).update(
+            cursor=endpoint.cursor, intentos=0, proximo_intento=None, ultimo_error="",
+            ultima_entrega=timezone.now(), tomado_hasta=timezone.now() + timedelta(seconds=lease),
+        )
+        if len(eventos) < (lote or _lote_default()):
+            break
+    return entregados, 0
+
+
+def entregar(endpoint_id, lote=None, lease=60, using=DEFAULT_DB_ALIAS):
+    """Toma el endpoint, entrega lo pendiente y lo suelta. None si otro worker lo tenía."""
+    from .models import WebhookEndpoint
+
+    if not tomar(endpoint_id, lease, using=using):
+        return None
+    try:
+        endpoint = WebhookEndpoint.objects.using(using).get(pk=endpoint_id)
+        return entregar_endpoint(endpoint, lote, lease=lease, using=using)
+    finally:
+        WebhookEndpoint.objects.using(using).filter(pk=endpoint_id).update(tomado_hasta=None)
+
+
+def endpoints_a_entregar(using=DEFAULT_DB_ALIAS):
+    """Ids de endpoints activos sin backoff pendiente ni lease vigente."""
+    from .models import WebhookEndpoint
+
+    ahora = timezone.now()
+    return list(
+        WebhookEndpoint.objects.using(using)
+        .filter(activo=True)
+        .filter(Q(proximo_intento__isnull=True) | Q(proximo_intento__lte=ahora))
+        .filter(Q(tomado_hasta__isnull=True) | Q(tomado_hasta__lt=ahora))
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+
+def cursor_inicial(owner_id, using=DEFAULT_DB_ALIAS):
+    """Un endpoint nuevo arranca en el último evento de la empresa (no recibe la historia)."""
+    from .models import OutboxEvent
+
+    return OutboxEvent.objects.using(using).filter(owner_id=owner_id).aggregate(m=Max("id"))["m"] or 0
+
+
+def purgar(dias, using=DEFAULT_DB_ALIAS):
+    """
+    Borra eventos de más de `dias` que ya entregaron todos los endpoints activos
+    (id <= menor cursor). Devuelve la cantidad borrada.
+    """
+    from .models import OutboxEvent, WebhookEndpoint
+
+    qs = OutboxEvent.objects.using(using).filter(creado_en__lt=timezone.now() - timedelta(days=dias))
+    minimo = WebhookEndpoint.objects.using(using).filter(activo=True).aggregate(m=Min("cursor"))["m"]
+    if minimo is not None:
+        qs = qs.filter(id__lte=minimo)
+    return qs.delete()[0]
@@ -0,0 +1,279 @@
+"""
+Particionado mensual por rango (MySQL) de StockMovement y SaleItem sobre creado_en.
+
+- Una partición por mes, p<AAAAMM>, con VALUES LESS THAN el primer instante del
+  mes siguiente (en UTC, como se guarda creado_en), y una 'pmax' (MAXVALUE) que
+  normalmente queda vacía: manage_partitions crea los meses por adelantado
+  partiendo pmax (instantáneo si está vacía).
+- InnoDB exige la clave de partición en toda clave única y no admite FKs: la PK
+  pasa a (id, creado_en) (Django sigue usando id, que sigue siendo AUTO_INCREMENT)
+  y los FKs de/hacia estas tablas son db_constraint=False.
+- La poda necesita un rango sobre la columna: las vistas filtran con
+  rango_fechas() (no con __date, que envuelve la columna en una función) y los
+  ítems de venta por su propio creado_en (copia del de la venta).
+- Mantenimiento: los meses viejos de StockMovement se archivan (archivo.py) y
+  sus particiones, que quedan solo con aperturas, se fusionan en una; las de
+  SaleItem se pueden eliminar (DROP PARTITION, sin DELETE fila por fila) junto
+  con sus ventas (DELETE por lotes antes del DROP: no quedan ventas sin ítems).
+
+En SQLite (desarrollo) y otros motores todo es no-op.
+"""
+import datetime as dt
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+PMAX = "pmax"
+TABLAS = ("StockMovement", "SaleItem")
+COLUMNA = "creado_en"
+
+
+def soportado(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == "mysql"
+
+
+def modelos(apps=None):
+    """Modelos particionados (de 'apps' si viene de una migración)."""
+    if apps is None:
+        from django.apps import apps
+    return [apps.get_model("SysstockApp", nombre) for nombre in TABLAS]
+
+
+# =========================
+#  Rangos de fechas (consultas que podan)
+# =========================
+def rango_fechas(desde, hasta):
+    """
+    'YYYY-MM-DD' locales -> (inicio, fin) aware para filtrar
+    creado_en__gte=inicio, creado_en__lt=fin (ambos días incluidos).
+    """
+    try:
+        d = dt.date.fromisoformat(desde)
+        h = dt.date.fromisoformat(hasta)
+    except (TypeError, ValueError):
+        raise ValidationError({"detail": "Parámetros 'desde'/'hasta' inválidos (YYYY-MM-DD)."})
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(dt.datetime.combine(d, dt.time.min), tz),
+        timezone.make_aware(dt.datetime.combine(h + dt.timedelta(days=1), dt.time.min), tz),
+    )
+
+
+# =========================
+#  Meses y nombres
+# =========================
+def mes(valor):
+    """Primer día del mes (UTC) de un datetime aware o de una fecha."""
+    if isinstance(valor, dt.datetime):
+        valor = valor.astimezone(dt.timezone.utc).date() if timezone.is_aware(valor) else valor.date()
+    return valor.replace(day=1)
+
+
+def siguiente(m):
+    return (m.replace(day=28) + dt.timedelta(days=4)).replace(day=1)
+
+
+def meses(desde, hasta):
+    """Meses de 'desde' a 'hasta' inclusive."""
+    m = mes(desde)
+    while m <= hasta:
+        yield m
+        m = siguiente(m)
+
+
+def nombre(m):
+    return f"p{m:%Y%m}"
+
+
+def mes_de(nombre_particion):
+    """'p202610' -> date(2026, 10, 1); None para pmax u otros nombres."""
+    try:
+        return dt.datetime.strptime(nombre_particion[1:], "%Y%m").date()
+    except ValueError:
+        return None
+
+
+def _limite(m):
+    return f"'{siguiente(m):%Y-%m-%d} 00:00:00'"
+
+
+def _definicion(m):
+    return f"PARTITION {nombre(m)} VALUES LESS THAN ({_limite(m)})"
+
+
+# =========================
+#  DDL (MySQL)
+# =========================
+def sql_inicializar(tabla, desde, hasta):
+    partes = [_definicion(m) for m in meses(desde, hasta)]
+    partes.append(f"PARTITION {PMAX} VALUES LESS THAN (MAXVALUE)")
+    return (
+        f"ALTER TABLE `{tabla}` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `{COLUMNA}`) "
+        f"PARTITION BY RANGE COLUMNS(`{COLUMNA}`) ({', '.join(partes)})"
+    )
+
+
+def sql_quitar(tabla):
+    return f"ALTER TABLE `{tabla}` REMOVE PARTITIONING, DROP PRIMARY KEY, ADD PRIMARY KEY (`id`)"
+
+
+def sql_crear(tabla, nuevos):
+    partes = [_definicion(m) for m in nuevos]
+    partes.append(f"PARTITION {PMAX} VALUES LESS THAN (MAXVALUE)")
+    return f"ALTER TABLE `{tabla}` REORGANIZE PARTITION {PMAX} INTO ({', '.join(partes)})"
+
+
+def sql_fusionar(tabla, nombres):
+    """Fusiona particiones consecutivas en la última (mismo límite superior)."""
+    ultimo = mes_de(nombres[-1])
+    return (
+        f"ALTER TABLE `{tabla}` REORGANIZE PARTITION {', '.join(nombres)} "
+        f"INTO ({_definicion(ultimo)})"
+    )
+
+
+def sql_eliminar(tabla, nombres):
+    return f"ALTER TABLE `{tabla}` DROP PARTITION {', '.join(nombres)}"
+
+
+def sql_eliminar_ventas(tabla, m, lote):
+    """Un lote de las ventas anteriores al fin del mes 'm' (por PK: cada lote arranca donde quedó el anterior)."""
+    return f"DELETE FROM `{tabla}` WHERE `{COLUMNA}` < {_limite(m)} ORDER BY `id` LIMIT {lote}"
+
+
+# =========================
+#  Estado
+# =========================
+def particiones(tabla, using=DEFAULT_DB_ALIAS):
+    """[(nombre, filas_estimadas)] en orden; [] si la tabla no está particionada."""
+    if not soportado(using):
+        return []
+    with connections[using].cursor() as cur:
+        cur.execute(
+            "SELECT PARTITION_NAME, TABLE_ROWS FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION",
+            [tabla],
+        )
+        return [(n, filas or 0) for n, filas in cur.fetchall()]
+
+
+def _ultimo_mes(nombres):
+    meses_ = [m for m in map(mes_de, nombres) if m]
+    return max(meses_) if meses_ else None
+
+
+def hasta_adelante(adelante=None):
+    """Último mes que tiene que existir: el actual + SYSSTOCK_PARTITIONS_AHEAD."""
+    adelante = settings.SYSSTOCK_PARTITIONS_AHEAD if adelante is None else adelante
+    m = mes(timezone.now())
+    for _ in range(adelante):
+        m = siguiente(m)
+    return m
+
+
+# =========================
+#  Operaciones (devuelven el SQL ejecutado)
+# =========================
+def _ejecutar(sql, using, ejecutar):
+    if ejecutar:
+        with connections[using].cursor() as cur:
+            cur.execute(sql)
+    return sql
+
+
+def inicializar(using=DEFAULT_DB_ALIAS, adelante=None, ejecutar=True, apps=None):
+    """Particiona las tablas que todavía no lo están (reescribe la tabla: ventana de mantenimiento)."""
+    if not soportado(using):
+        return []
+    hechas = []
+    for modelo in modelos(apps):
+        tabla = modelo._meta.db_table
+        if particiones(tabla, using):
+            continue
+        primero = modelo.objects.using(using).order_by(COLUMNA).values_list(COLUMNA, flat=True).first()
+        desde = mes(primero) if primero else mes(timezone.now())
+        hechas.append(_ejecutar(sql_inicializar(tabla, desde, hasta_adelante(adelante)), using, ejecutar))
+    return hechas
+
+
+def quitar(using=DEFAULT_DB_ALIAS, apps=None):
+    if not soportado(using):
+        return []
+    hechas = []
+    for modelo in modelos(apps):
+        tabla = modelo._meta.db_table
+        if particiones(tabla, using):
+            hechas.append(_ejecutar(sql_quitar(tabla), using, True))
+    return hechas
+
+
+def crear_adelante(using=DEFAULT_DB_ALIAS, adelante=None, ejecutar=True):
+    """Agrega los meses que falten hasta el actual + 'adelante' (parte pmax)."""
+    if not soportado(using):
+        return []
+    hechas = []
+    hasta = hasta_adelante(adelante)
+    for modelo in modelos():
+        tabla = modelo._meta.db_table
+        nombres = [n for n, _ in particiones(tabla, using)]
+        ultimo = _ultimo_mes(nombres)
+        if ultimo is None:
+            continue
+        nuevos = list(meses(siguiente(ultimo), hasta))
+        if nuevos:
+            hechas.append(_ejecutar(sql_crear(tabla, nuevos), using, ejecutar))
+    return hechas
+
+
+def anteriores(tabla, antes_de, using=DEFAULT_DB_ALIAS):
+    """Particiones de meses que terminan antes (o justo en) el mes 'antes_de'."""
+    return [n for n, _ in particiones(tabla, using) if mes_de(n) and siguiente(mes_de(n)) <= antes_de]
+
+
+def compactar_movimientos(antes_de, using=DEFAULT_DB_ALIAS, ejecutar=True):
+    """
+    Fusiona las particiones de StockMovement anteriores al mes 'antes_de' en una.
+    Tienen que haberse archivado antes (archive_movements con corte <= ese mes):
+    si queda algún movimiento que no sea de apertura, no hace nada.
+    """
+    from .models import StockMovement
+
+    tabla = StockMovement._meta.db_table
+    nombres = anteriores(tabla, antes_de, using)
+    if len(nombres) < 2:
+        return []
+    with connections[using].cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM `{tabla}` PARTITION ({', '.join(nombres)}) WHERE apertura = 0")
+        vivos = cur.fetchone()[0]
+    if vivos:
+        raise ValueError(
+            f"{vivos} movimientos sin archivar en {nombres[0]}..{nombres[-1]}: correr archive_movements primero."
+        )
+    return [_ejecutar(sql_fusionar(tabla, nombres), using, ejecutar)]
+
+
+def eliminar_items(antes_de, using=DEFAULT_DB_ALIAS, ejecutar=True, lote=10000):
+    """
+    Elimina las ventas anteriores al mes 'antes_de' (irreversible): primero las
+    Sale (DELETE por lotes, cada uno en su transacción) y después el DROP de las
+    particiones de SaleItem. Los ítems llevan el creado_en de su venta, así que
+    son exactamente las ventas de esas particiones. Cortado a mitad, se vuelve a
+    correr (las particiones siguen ahí hasta el DROP). Los saldos no cambian.
+    """
+    from .models import Sale, SaleItem
+
+    tabla = SaleItem._meta.db_table
+    nombres = anteriores(tabla, antes_de, using)
+    if not nombres:
+        return []
+    borrar = sql_eliminar_ventas(Sale._meta.db_table, mes_de(nombres[-1]), lote)
+    if ejecutar:
+        with connections[using].cursor() as cur:
+            while True:
+                cur.execute(borrar)
+                if cur.rowcount < lote:
+                    break
+    return [borrar, _ejecutar(sql_eliminar(tabla, nombres), using, ejecutar)]
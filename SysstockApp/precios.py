@@ -0,0 +1,60 @@
+"""
+Actualización masiva de precios (ajustes por inflación).
+
+Un solo UPDATE sobre el queryset ya scopeado por tenant; el historial
+(PriceHistory) se arma leyendo precio anterior/nuevo y se inserta con
+bulk_create.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, Value
+from django.db.models.functions import Greatest, Round
+
+from . import shards
+
+# el precio nunca queda en 0 ni negativo (misma regla que ProductSerializer.validate_precio)
+PRECIO_MINIMO = Decimal("0.01")
+LOTE_HISTORIAL = 2000
+
+
+def expresion_precio(porcentaje=None, monto=None):
+    """
+    precio * (1 + porcentaje/100)  ó  precio + monto, redondeado a 2 decimales
+    y con piso PRECIO_MINIMO.
+    """
+    campo = DecimalField(max_digits=12, decimal_places=2)
+    if porcentaje is not None:
+        factor = Decimal(1) + Decimal(porcentaje) / Decimal(100)
+        nuevo = F("precio") * Value(factor, output_field=DecimalField(max_digits=12, decimal_places=6))
+    else:
+        nuevo = F("precio") + Value(Decimal(monto), output_field=campo)
+    return Greatest(Round(nuevo, 2, output_field=campo), Value(PRECIO_MINIMO, output_field=campo), output_field=campo)
+
+
+def actualizar_precios(qs, porcentaje=None, monto=None, historial=True, usuario=None, motivo=None):
+    """
+    Aplica el ajuste a todos los productos de qs. Devuelve (actualizados, filas_historial).
+    """
+    nuevo = expresion_precio(porcentaje=porcentaje, monto=monto)
+    qs = qs.order_by()
+
+    with transaction.atomic(using=shards.alias()):
+        if not historial:
+            return qs.update(precio=nuevo), 0
+
+        anteriores = dict(qs.select_for_update().values_list("id", "precio"))
+        actualizados = qs.update(precio=nuevo)
+
+        from .models import PriceHistory
+
+        filas = [
+            PriceHistory(
+                producto_id=pid, precio_anterior=anteriores[pid], precio_nuevo=precio,
+                usuario=usuario, motivo=motivo,
+            )
+            for pid, precio in qs.values_list("id", "precio").iterator(chunk_size=LOTE_HISTORIAL)
+            if pid in anteriores and precio != anteriores[pid]
+        ]
+        PriceHistory.objects.bulk_create(filas, batch_size=LOTE_HISTORIAL)
+    return actualizados, len(filas)
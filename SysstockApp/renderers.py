@@ -0,0 +1,85 @@
+"""
+Renderers/parsers rápidos para la API.
+
+- ORJSONRenderer: mismo JSON que el JSONRenderer de DRF (Decimal -> número,
+  fechas con el encoder de DRF: 'Z' para UTC y la precisión que use esa
+  versión), pero serializado con orjson.
+  Si orjson no está instalado cae al JSONRenderer de DRF.
+- MessagePackRenderer / MessagePackParser: 'application/msgpack' para los
+  clientes POS propios (requiere el paquete msgpack).
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - dependencia opcional
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+_drf_encoder = encoders.JSONEncoder()
+
+
+def _default(obj):
+    """
+    Tipos que orjson/msgpack no serializan nativamente (Decimal, lazy strings,
+    QuerySet, ...) y fechas/horas: misma conversión que el encoder de DRF.
+    """
+    return _drf_encoder.default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+
+        # fechas por _default: el formato propio de orjson no siempre coincide con el de DRF
+        # (DRF < 3.15 corta los microsegundos a milisegundos)
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            option |= orjson.OPT_INDENT_2
+
+        ret = orjson.dumps(data, default=_default, option=option)
+        # Igual que DRF: U+2028/U+2029 escapados para que el JSON sea JS válido
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+def _msgpack_default(obj):
+    value = _default(obj)
+    # QuerySet -> tuple: msgpack lo empaqueta como array
+    return list(value) if isinstance(value, tuple) else value
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = MSGPACK_MEDIA_TYPE
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_msgpack_default, use_bin_type=True, datetime=False)
+
+
+class MessagePackParser(BaseParser):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except Exception as exc:
+            raise ParseError(f"MessagePack inválido: {exc}")
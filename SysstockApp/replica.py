@@ -0,0 +1,229 @@
+"""
+Réplica de lectura para reportes (alias de base 'reporting').
+
+- Las vistas de reportes / exportaciones se marcan con @vista_de_reporte:
+  sus lecturas van a 'reporting'. Todo lo demás (y toda escritura) va a 'default'.
+- Pinning: si el request escribió, el resto del request lee del primario, y
+  ReplicaMiddleware lo recuerda SYSSTOCK_REPLICA_PIN_SECONDS para que los
+  reportes de ese cliente también lean del primario (read-your-writes):
+  por usuario autenticado en CACHES[SYSSTOCK_REPLICA_PIN_CACHE] (los clientes
+  JWT no mandan cookies) y, de respaldo, en la cookie.
+- Atraso: si la réplica atrasa más de SYSSTOCK_REPLICA_MAX_LAG segundos (o no
+  se puede medir), los reportes vuelven al primario hasta el próximo chequeo.
+
+Sin REPORTING_DATABASE_URL no existe el alias y el router no cambia nada.
+Local: REPORTING_DATABASE_URL=sqlite:///... y `manage.py sync_replica` copia
+la base SQLite del primario sobre la réplica.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+ALIAS = "reporting"
+COOKIE = "sysstock_primario"
+PREFIJO = "sysstock:primario:"
+
+logger = logging.getLogger("sysstock.replica")
+
+_reporte = contextvars.ContextVar("sysstock_reporte", default=False)
+_fijado = contextvars.ContextVar("sysstock_fijado_primario", default=False)
+_escribio = contextvars.ContextVar("sysstock_escribio", default=False)
+_pendiente = contextvars.ContextVar("sysstock_fijado_pendiente", default=None)
+
+
+def configurada():
+    return ALIAS in settings.DATABASES
+
+
+# =========================
+#  Marcado de vistas / requests
+# =========================
+@contextmanager
+def lecturas_de_reporte():
+    token = _reporte.set(True)
+    try:
+        yield
+    finally:
+        _reporte.reset(token)
+
+
+def vista_de_reporte(func):
+    """Las lecturas de la vista (solo lectura) van a la réplica. Va debajo de @api_view / @action."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with lecturas_de_reporte():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def iniciar_request(fijado=False, pendiente=None):
+    """
+    'pendiente': callable que dice si el cliente escribió hace poco; se evalúa
+    en la primera lectura de reporte, cuando el request ya está autenticado.
+    """
+    return _fijado.set(fijado), _escribio.set(False), _pendiente.set(None if fijado else pendiente)
+
+
+def terminar_request(tokens):
+    _fijado.reset(tokens[0])
+    _escribio.reset(tokens[1])
+    _pendiente.reset(tokens[2])
+
+
+def fijado():
+    if _fijado.get():
+        return True
+    pendiente = _pendiente.get()
+    if pendiente is None:
+        return False
+    # una sola vez por request (y sin recursión si pendiente() lee la base)
+    _pendiente.set(None)
+    _fijado.set(bool(pendiente()))
+    return _fijado.get()
+
+
+def escribio():
+    return _escribio.get()
+
+
+# =========================
+#  Read-your-writes por usuario
+# =========================
+def _cache():
+    return caches[getattr(settings, "SYSSTOCK_REPLICA_PIN_CACHE", "default")]
+
+
+def _clave(user):
+    return f"{PREFIJO}usuario:{user.pk}"
+
+
+def fijar_usuario(user, segundos):
+    """Los reportes de 'user' leen del primario durante 'segundos'."""
+    if user is not None and user.is_authenticated:
+        _cache().set(_clave(user), time.time(), timeout=max(int(segundos), 1))
+
+
+def usuario_fijado(user):
+    return user is not None and user.is_authenticated and _cache().get(_clave(user)) is not None
+
+
+# =========================
+#  Atraso de la réplica
+# =========================
+_estado = {"chequeado": None, "ok": True, "lag": None}
+_lock = threading.Lock()
+
+
+def _mtime_sqlite(nombre):
+    """Última escritura del archivo (incluye el -wal si la base está en modo WAL)."""
+    tiempos = [os.path.getmtime(p) for p in (nombre, f"{nombre}-wal") if os.path.exists(p)]
+    return max(tiempos) if tiempos else 0.0
+
+
+def lag_replica():
+    """
+    Segundos de atraso de la réplica:
+    - MySQL: Seconds_Behind_Source / _Master (sin estado de réplica -> 0)
+    - PostgreSQL: now() - pg_last_xact_replay_timestamp() en standby
+    - SQLite (stand-in local): desde la última copia, si el primario cambió después
+    None si no se puede medir (replicación cortada).
+    """
+    conn = connections[ALIAS]
+    if conn.vendor == "sqlite":
+        primario = _mtime_sqlite(connections[DEFAULT_DB_ALIAS].settings_dict["NAME"])
+        copia = _mtime_sqlite(conn.settings_dict["NAME"])
+        return max(0.0, time.time() - copia) if primario > copia else 0.0
+
+    with conn.cursor() as cur:
+        if conn.vendor == "mysql":
+            try:
+                cur.execute("SHOW REPLICA STATUS")
+            except Exception:
+                cur.execute("SHOW SLAVE STATUS")  # MySQL < 8.0.22 / MariaDB
+            fila = cur.fetchone()
+            if not fila:
+                return 0.0
+            estado = dict(zip([c[0] for c in cur.description], fila))
+            valor = estado.get("Seconds_Behind_Source", estado.get("Seconds_Behind_Master"))
+            return None if valor is None else float(valor)
+        if conn.vendor == "postgresql":
+            cur.execute(
+                "SELECT CASE WHEN pg_is_in_recovery() "
+                "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) ELSE 0 END"
+            )
+            return float(cur.fetchone()[0])
+    return 0.0
+
+
+def replica_disponible():
+    """¿La réplica está dentro del atraso tolerado? Se mide cada SYSSTOCK_REPLICA_LAG_CHECK_SECONDS."""
+    if not configurada():
+        return False
+    max_lag = getattr(settings, "SYSSTOCK_REPLICA_MAX_LAG", None)
+    if max_lag is None:
+        return True
+
+    ahora = time.monotonic()
+    intervalo = float(getattr(settings, "SYSSTOCK_REPLICA_LAG_CHECK_SECONDS", 1.0))
+    with _lock:
+        if _estado["chequeado"] is not None and ahora - _estado["chequeado"] < intervalo:
+            return _estado["ok"]
+        _estado["chequeado"] = ahora
+
+    try:
+        lag = lag_replica()
+    except Exception as e:
+        lag = None
+        logger.warning("replica.error alias=%s %s", ALIAS, e)
+    ok = lag is not None and lag <= float(max_lag)
+    with _lock:
+        if not ok and _estado["ok"]:
+            logger.warning("replica.atrasada lag=%s max=%s: reportes al primario", lag, max_lag)
+        _estado.update(ok=ok, lag=lag)
+    return ok
+
+
+def estado():
+    return {"configurada": configurada(), "ok": _estado["ok"], "lag": _estado["lag"]}
+
+
+def reiniciar_estado():
+    with _lock:
+        _estado.update(chequeado=None, ok=True, lag=None)
+
+
+# =========================
+#  Router
+# =========================
+class ReportingRouter:
+    """DATABASE_ROUTERS: lecturas de vistas de reporte -> 'reporting'; el resto -> default."""
+
+    def db_for_read(self, model, **hints):
+        if not _reporte.get() or _escribio.get() or fijado():
+            return None
+        # dentro de una transacción del primario se lee lo propio
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return ALIAS if replica_disponible() else None
+
+    def db_for_write(self, model, **hints):
+        _escribio.set(True)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # misma base lógica: los objetos leídos de la réplica se pueden relacionar con los del primario
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # la réplica recibe el esquema por replicación (o por sync_replica en local)
+        return False if db == ALIAS else None
@@ -0,0 +1,244 @@
+"""
+Búsqueda rápida de productos (autocomplete del POS).
+
+- Product.busqueda guarda "nombre sku" normalizado (sin acentos, minúsculas).
+- SQLite: tabla virtual FTS5 (tokenizer trigram) sincronizada por signals.
+- MySQL: índice FULLTEXT (parser ngram) sobre Product.busqueda.
+- Otros motores: LIKE sobre la columna normalizada.
+"""
+import unicodedata
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+FTS_TABLE = "sysstock_producto_fts"
+MYSQL_FULLTEXT_INDEX = "sysstock_producto_busqueda_ft"
+
+# trigram necesita al menos 3 caracteres por término
+MIN_TRIGRAM = 3
+
+_fts_tokenizer = {}  # alias -> tokenizer (con shards cada base tiene su tabla)
+
+
+# =========================
+#  Normalización
+# =========================
+def normalizar_texto(texto) -> str:
+    """
+    'Café Ñandú 1,5L' -> 'cafe nandu 1,5l'
+    """
+    if not texto:
+        return ""
+    texto = unicodedata.normalize("NFKD", str(texto))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.lower().split())
+
+
+def texto_busqueda(nombre, sku) -> str:
+    return normalizar_texto(f"{nombre or ''} {sku or ''}")
+
+
+def _terminos(q):
+    return normalizar_texto(q).split()
+
+
+# =========================
+#  SQLite FTS5
+# =========================
+def crear_indice_fts(conn):
+    """
+    Crea la tabla FTS5 (trigram si la versión de SQLite lo soporta; si no,
+    unicode61 con índice de prefijos) y la carga con los productos existentes.
+    """
+    from .models import Product
+
+    table = Product._meta.db_table
+    with conn.cursor() as cur:
+        try:
+            cur.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(busqueda, tokenize='trigram')")
+        except Exception:
+            cur.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5(busqueda, tokenize='unicode61', prefix='2 3 4')"
+            )
+        cur.execute(f"DELETE FROM {FTS_TABLE}")
+        cur.execute(f'INSERT INTO {FTS_TABLE}(rowid, busqueda) SELECT id, busqueda FROM "{table}"')
+
+
+def borrar_indice_fts(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def _tokenizer_fts(conn):
+    """'trigram' | 'unicode61' | None (tabla inexistente)."""
+    if conn.alias not in _fts_tokenizer:
+        with conn.cursor() as cur:
+            cur.execute("SELECT sql FROM sqlite_master WHERE name = %s", [FTS_TABLE])
+            row = cur.fetchone()
+        if not row:
+            return None
+        _fts_tokenizer[conn.alias] = "trigram" if "trigram" in row[0] else "unicode61"
+    return _fts_tokenizer[conn.alias]
+
+
+def _match_fts(terminos, tokenizer):
+    """
+    Arma la expresión MATCH. Devuelve (expr, terminos_cortos): los términos que
+    trigram no puede indexar (<3 caracteres) se resuelven con LIKE.
+    """
+    usables, cortos = [], []
+    for t in terminos:
+        if tokenizer == "trigram" and len(t) < MIN_TRIGRAM:
+            cortos.append(t)
+            continue
+        t = t.replace('"', '""')
+        usables.append(f'"{t}"' if tokenizer == "trigram" else f'"{t}"*')
+    return " AND ".join(usables), cortos
+
+
+def indexar_producto(producto, using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor != "sqlite" or not _tokenizer_fts(connection):
+        return
+    with connection.cursor() as cur:
+        cur.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [producto.pk])
+        cur.execute(f"INSERT INTO {FTS_TABLE}(rowid, busqueda) VALUES (%s, %s)", [producto.pk, producto.busqueda])
+
+
+def desindexar_producto(producto_id, using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor != "sqlite" or not _tokenizer_fts(connection):
+        return
+    with connection.cursor() as cur:
+        cur.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [producto_id])
+
+
+def reindexar_productos(qs=None):
+    """
+    Recalcula Product.busqueda (para filas creadas con bulk_create/update) y
+    reconstruye el índice FTS. Devuelve la cantidad de productos procesados.
+    """
+    from .models import Product
+
+    qs = qs if qs is not None else Product.objects.all()
+    total = 0
+    lote = []
+    for p in qs.only("id", "nombre", "sku", "busqueda").iterator(chunk_size=2000):
+        nuevo = texto_busqueda(p.nombre, p.sku)
+        if nuevo != p.busqueda:
+            p.busqueda = nuevo
+            lote.append(p)
+        if len(lote) >= 2000:
+            Product.objects.using(qs.db).bulk_update(lote, ["busqueda"])
+            lote = []
+        total += 1
+    if lote:
+        Product.objects.using(qs.db).bulk_update(lote, ["busqueda"])
+
+    connection = connections[qs.db]
+    if connection.vendor == "sqlite":
+        crear_indice_fts(connection)
+    return total
+
+
+# =========================
+#  Consultas
+# =========================
+def _sql_ids(qs):
+    return qs.order_by().values("id").query.sql_with_params()
+
+
+def filtrar_productos(qs, q):
+    """
+    Filtra (sin rankear) un queryset de productos por el texto q.
+    Usa el índice del motor; mantiene el orden/scoping del queryset recibido.
+    """
+    terminos = _terminos(q)
+    if not terminos:
+        return qs
+
+    table = qs.model._meta.db_table
+    connection = connections[qs.db]
+    if connection.vendor == "sqlite":
+        tokenizer = _tokenizer_fts(connection)
+        if tokenizer:
+            expr, cortos = _match_fts(terminos, tokenizer)
+            if expr:
+                qs = qs.filter(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expr]))
+            for t in cortos:
+                qs = qs.filter(busqueda__contains=t)
+            return qs
+    elif connection.vendor == "mysql":
+        boolean = " ".join(f'+"{t}"' for t in terminos)
+        return qs.extra(where=[f"MATCH(`{table}`.`busqueda`) AGAINST (%s IN BOOLEAN MODE)"], params=[boolean])
+
+    for t in terminos:
+        qs = qs.filter(busqueda__contains=t)
+    return qs
+
+
+def buscar_productos(qs, q, limit=20):
+    """
+    Top-N productos del queryset (ya scopeado por tenant) que matchean q.
+    Orden: SKU exacto, prefijo del nombre, relevancia del índice, id.
+    """
+    terminos = _terminos(q)
+    if not terminos:
+        return []
+    q_norm = " ".join(terminos)
+    table = qs.model._meta.db_table
+    connection = connections[qs.db]
+
+    if connection.vendor == "sqlite":
+        tokenizer = _tokenizer_fts(connection)
+        expr, cortos = _match_fts(terminos, tokenizer) if tokenizer else ("", terminos)
+        if expr:
+            scoped_sql, scoped_params = _sql_ids(qs)
+            extra = "".join(" AND p.busqueda LIKE %s" for _ in cortos)
+            sql = (
+                f'SELECT p.id FROM {FTS_TABLE} f JOIN "{table}" p ON p.id = f.rowid '
+                f"WHERE {FTS_TABLE} MATCH %s AND p.id IN ({scoped_sql}){extra} "
+                f"ORDER BY CASE WHEN lower(p.sku) = %s THEN 0 WHEN p.busqueda LIKE %s THEN 1 ELSE 2 END, "
+                f"f.rank, p.id LIMIT %s"
+            )
+            params = [expr, *scoped_params, *[f"%{t}%" for t in cortos], q_norm, f"{q_norm}%", int(limit)]
+            with connection.cursor() as cur:
+                cur.execute(sql, params)
+                ids = [row[0] for row in cur.fetchall()]
+            por_id = qs.model.objects.using(qs.db).select_related("categoria", "sucursal").in_bulk(ids)
+            return [por_id[i] for i in ids if i in por_id]
+
+    if connection.vendor == "mysql":
+        boolean = " ".join(f'+"{t}"' for t in terminos)
+        relevancia = RawSQL(f"MATCH(`{table}`.`busqueda`) AGAINST (%s IN BOOLEAN MODE)", [boolean])
+        qs = filtrar_productos(qs, q).annotate(_relevancia=relevancia)
+        orden_relevancia = ["-_relevancia"]
+    else:
+        qs = filtrar_productos(qs, q)
+        orden_relevancia = []
+
+    qs = qs.annotate(
+        _prioridad=Case(
+            When(sku__iexact=q_norm, then=Value(0)),
+            When(busqueda__startswith=q_norm, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        )
+    )
+    return list(qs.select_related("categoria", "sucursal").order_by("_prioridad", *orden_relevancia, "id")[:limit])
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    ?search= de productos sobre el índice normalizado (en vez de icontains
+    sobre nombre/sku).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return filtrar_productos(queryset, " ".join(terms))
@@ -1,21 +1,77 @@
+from collections import defaultdict
+from decimal import Decimal
+from functools import partial
+
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import Q, Sum, prefetch_related_objects
+from django.db.models.functions import Lower
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 
 from .models import (
     Category,
     Branch,
     Product,
     StockMovement,
+    StockBalance,
     Sale,
     SaleItem,
+    Transfer,
+    WebhookEndpoint,
 )
+from . import eventos as stream
+from . import outbox, shards
+from .stock import LOTE, aplicar_movimientos, insertar_movimientos
+
+
+# =========================
+#  Sparse fieldsets (?fields= / ?expand=)
+# =========================
+def _csv_param(request, name):
+    raw = request.query_params.get(name) if request is not None else None
+    if not raw:
+        return set()
+    return {x.strip() for x in raw.split(",") if x.strip()}
+
+
+def campos_solicitados(request):
+    """
+    Devuelve (fields, expand) pedidos por query params en lecturas (GET/HEAD):
+    - fields: set de campos raíz, o None si no se restringió
+    - expand: set de FKs a devolver anidados (Meta.expandable_fields)
+    """
+    if request is None or not hasattr(request, "query_params") or request.method not in SAFE_METHODS:
+        return None, set()
+    fields = _csv_param(request, "fields")
+    return (fields or None), _csv_param(request, "expand")
+
+
+class SparseFieldsMixin:
+    """
+    - ?fields=id,nombre   -> solo esos campos en la respuesta
+    - ?expand=categoria   -> el FK se devuelve como objeto (ver Meta.expandable_fields)
+    Solo aplica al serializer raíz; los anidados responden completos.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, expand = campos_solicitados(self.context.get("request"))
+        if fields is None and not expand:
+            return
+
+        expandable = getattr(self.Meta, "expandable_fields", {})
+        expand = {name for name in expand if name in expandable}
+        if fields is not None:
+            for name in set(self.fields) - fields - expand:
+                self.fields.pop(name)
+        for name in expand:
+            self.fields[name] = expandable[name](read_only=True)
 
 
 # =========================
 #  Categorías
 # =========================
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ["id", "nombre"]
@@ -68,7 +124,7 @@ class CategorySerializer(serializers.ModelSerializer):
 # =========================
 #  Sucursales
 # =========================
-class BranchSerializer(serializers.ModelSerializer):
+class BranchSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Branch
         fields = ["id", "name", "address", "telefono"]
@@ -83,7 +139,7 @@ class BranchSerializer(serializers.ModelSerializer):
 # =========================
 #  Productos (stock_actual + SKU + stock_min)
 # =========================
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     categoria_nombre = serializers.CharField(source="categoria.nombre", read_only=True)
     sucursal_nombre = serializers.CharField(source="sucursal.name", read_only=True)
     stock_actual = serializers.SerializerMethodField()
@@ -106,8 +162,13 @@ class ProductSerializer(serializers.ModelSerializer):
             "stock_min",
         ]
         read_only_fields = ["id", "categoria_nombre", "sucursal_nombre", "stock_actual"]
+        expandable_fields = {"categoria": CategorySerializer, "sucursal": BranchSerializer}
 
     def get_stock_actual(self, obj):
+        # anotado por ProductViewSet.get_queryset (evita 2 aggregates por producto)
+        anotado = getattr(obj, "_stock_actual", None)
+        if anotado is not None:
+            return int(anotado)
         tot_in = (
             StockMovement.objects.filter(producto=obj, sucursal=obj.sucursal, tipo="IN")
             .aggregate(s=Sum("cantidad"))
@@ -149,24 +210,14 @@ class ProductSerializer(serializers.ModelSerializer):
         if creating and not sku:
             raise serializers.ValidationError({"sku": "El SKU es obligatorio al crear el producto."})
 
-        # Unicidad de SKU por empresa (owner)
-        if sku:
-            request = self.context.get("request")
-            if request and request.user and request.user.is_authenticated:
-                user = request.user
-                if getattr(user, "rol", None) == "admin":
-                    owner = user
-                elif getattr(user, "rol", None) == "limMerchant":
-                    suc = getattr(user, "sucursal", None)
-                    owner = suc.owner if suc else None
-                else:
-                    owner = user
-                if owner and sucursal:
-                    qs = Product.objects.filter(sucursal__owner=owner, sku__iexact=sku)
-                    if self.instance:
-                        qs = qs.exclude(pk=self.instance.pk)
-                    if qs.exists():
-                        raise serializers.ValidationError({"sku": "Este SKU ya existe en tu empresa."})
+        # Unicidad de SKU por sucursal (sin distinguir mayúsculas): el mismo artículo
+        # tiene el mismo SKU en cada sucursal de la empresa (así se mapean las transferencias)
+        if sku and sucursal:
+            qs = Product.objects.filter(sucursal=sucursal, sku__iexact=sku)
+            if self.instance:
+                qs = qs.exclude(pk=self.instance.pk)
+            if qs.exists():
+                raise serializers.ValidationError({"sku": "Este SKU ya existe en esta sucursal."})
         return attrs
 
 
@@ -193,10 +244,48 @@ class TipoMovimientoField(serializers.ChoiceField):
         return super().to_internal_value(mapped)
 
 
+# =========================
+#  Actualización masiva de precios
+# =========================
+class BulkPriceSerializer(serializers.Serializer):
+    """
+    Body de POST /api/productos/bulk-price/:
+    - porcentaje (ej. 12.5 / -10) o monto (ej. 150 / -20): exactamente uno
+    - filtros: categoria, sucursal, skus (al menos uno)
+    - historial: guarda PriceHistory por producto (default True)
+    """
+    MAX_SKUS = 10000
+
+    porcentaje = serializers.DecimalField(max_digits=7, decimal_places=3, required=False, allow_null=True)
+    monto = serializers.DecimalField(max_digits=12, decimal_places=2, required=False, allow_null=True)
+
+    categoria = serializers.IntegerField(required=False, allow_null=True)
+    sucursal = serializers.IntegerField(required=False, allow_null=True)
+    skus = serializers.ListField(
+        child=serializers.CharField(max_length=64), required=False, allow_empty=False, max_length=MAX_SKUS
+    )
+
+    historial = serializers.BooleanField(required=False, default=True)
+    motivo = serializers.CharField(max_length=255, required=False, allow_blank=True, allow_null=True)
+
+    def validate_porcentaje(self, value):
+        if value is not None and value <= -100:
+            raise serializers.ValidationError("El porcentaje debe ser mayor a -100.")
+        return value
+
+    def validate(self, attrs):
+        porcentaje, monto = attrs.get("porcentaje"), attrs.get("monto")
+        if (porcentaje is None) == (monto is None):
+            raise serializers.ValidationError("Indicá 'porcentaje' o 'monto' (uno solo).")
+        if not any(attrs.get(k) for k in ("categoria", "sucursal", "skus")):
+            raise serializers.ValidationError("Indicá al menos un filtro: 'categoria', 'sucursal' o 'skus'.")
+        return attrs
+
+
 # =========================
 #  Movimientos de stock
 # =========================
-class StockMovementSerializer(serializers.ModelSerializer):
+class StockMovementSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     tipo = TipoMovimientoField(choices=("IN", "OUT"))
     cantidad = serializers.IntegerField(min_value=1)  # entero positivo
     motivo = serializers.CharField(required=False, allow_blank=True, allow_null=True)
@@ -220,16 +309,19 @@ class StockMovementSerializer(serializers.ModelSerializer):
             "usuario_username",
             "producto_nombre",
             "sucursal_nombre",
+            "apertura",
             "creado_en",
         ]
         read_only_fields = [
             "id",
+            "apertura",
             "usuario",
             "usuario_username",
             "producto_nombre",
             "sucursal_nombre",
             "creado_en",
         ]
+        expandable_fields = {"sucursal": BranchSerializer}
 
     def validate(self, attrs):
         # OUT no puede superar stock disponible
@@ -242,34 +334,78 @@ class StockMovementSerializer(serializers.ModelSerializer):
             return attrs
 
         if tipo == "OUT":
-            tot_in = (
-                StockMovement.objects.filter(producto=producto, sucursal=sucursal, tipo="IN")
-                .aggregate(s=Sum("cantidad"))
-                .get("s")
-                or 0
-            )
-            tot_out = (
-                StockMovement.objects.filter(producto=producto, sucursal=sucursal, tipo="OUT")
-                .aggregate(s=Sum("cantidad"))
-                .get("s")
+            # chequeo rápido sobre el saldo mantenido; create/update lo repiten con el saldo bloqueado
+            disponible = (
+                StockBalance.objects.filter(producto=producto, sucursal=sucursal)
+                .values_list("cantidad", flat=True).first()
                 or 0
             )
-            disponible = tot_in - tot_out
+            anterior = self.instance
+            if anterior is not None and anterior.tipo == "OUT" and (
+                (anterior.producto_id, anterior.sucursal_id) == (producto.id, sucursal.id)
+            ):
+                disponible += anterior.cantidad  # al editar, su propio egreso vuelve al saldo
             if cantidad > disponible:
                 raise serializers.ValidationError({"cantidad": f"Stock insuficiente. Disponible: {disponible}"})
         return attrs
 
+    @shards.atomic_empresa
     def create(self, validated_data):
         request = self.context.get("request")
         if request and request.user and request.user.is_authenticated:
             validated_data["usuario"] = request.user
-        return super().create(validated_data)
+        movimiento = super().create(validated_data)
+        _verificar_saldo(movimiento)
+        return movimiento
+
+    @shards.atomic_empresa
+    def update(self, instance, validated_data):
+        movimiento = super().update(instance, validated_data)
+        _verificar_saldo(movimiento)
+        return movimiento
+
+
+def _verificar_saldo(movimiento):
+    """
+    Revalida un OUT ya aplicado con su saldo bloqueado (select_for_update), en
+    la transacción que lo escribe: en SQLite el INSERT ya tomó el lock de
+    escritura; en MySQL un egreso concurrente espera el lock del saldo y lee
+    el descuento de este. Si el saldo quedó negativo se revierte todo (400).
+    """
+    if movimiento.tipo != "OUT":
+        return
+    saldo = (
+        StockBalance.objects.select_for_update()
+        .filter(producto_id=movimiento.producto_id, sucursal_id=movimiento.sucursal_id)
+        .values_list("cantidad", flat=True).first()
+        or 0
+    )
+    if saldo < 0:
+        raise serializers.ValidationError(
+            {"cantidad": f"Stock insuficiente. Disponible: {saldo + movimiento.cantidad}"}
+        )
 
 
 # =========================
 #  Ventas (crea items y OUT automáticos)
 # =========================
+def _entero(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+class _ProductoItemField(serializers.PrimaryKeyRelatedField):
+    """PK de producto que toma los productos precargados por SaleSerializer (sin un get por ítem)."""
+
+    def to_internal_value(self, data):
+        producto = self.context.get("_productos", {}).get(_entero(data))
+        return producto if producto is not None else super().to_internal_value(data)
+
+
 class SaleItemSerializer(serializers.ModelSerializer):
+    producto = _ProductoItemField(queryset=Product.objects.all())
     producto_nombre = serializers.CharField(source="producto.nombre", read_only=True)
     cantidad = serializers.IntegerField(min_value=1)  # entero positivo
 
@@ -296,7 +432,32 @@ class SaleItemSerializer(serializers.ModelSerializer):
         return value
 
 
-class SaleSerializer(serializers.ModelSerializer):
+_TOTAL_FIELD = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+def _verificar_stock(sucursal, items, bloquear=False):
+    """
+    Stock disponible de todos los productos de la venta en una query (saldos
+    mantenidos). Un mismo producto en varios ítems suma. bloquear=True: con
+    select_for_update, dentro de la transacción que descuenta el stock.
+    """
+    pedidos = defaultdict(int)
+    for it in items:
+        pedidos[it["producto"]] += it["cantidad"]
+
+    qs = StockBalance.objects.filter(sucursal=sucursal, producto__in=[p.id for p in pedidos])
+    if bloquear:
+        qs = qs.select_for_update().order_by("producto_id")
+    disponibles = dict(qs.values_list("producto_id", "cantidad"))
+    for producto, cantidad in pedidos.items():
+        disponible = disponibles.get(producto.id, 0)
+        if cantidad > disponible:
+            raise serializers.ValidationError(
+                f"Stock insuficiente para '{producto.nombre}'. Disponible: {disponible}"
+            )
+
+
+class SaleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Crea la venta y sus items.
     Por cada item, registra automáticamente un movimiento OUT.
@@ -304,89 +465,322 @@ class SaleSerializer(serializers.ModelSerializer):
     items = SaleItemSerializer(many=True, required=True)
     sucursal_nombre = serializers.CharField(source="sucursal.name", read_only=True)
     usuario_username = serializers.CharField(source="usuario.username", read_only=True)
+    total = serializers.SerializerMethodField()
 
     class Meta:
         model = Sale
-        fields = ["id", "sucursal", "sucursal_nombre", "usuario", "usuario_username", "creado_en", "items"]
-        read_only_fields = ["id", "usuario", "usuario_username", "creado_en", "sucursal_nombre"]
+        fields = ["id", "sucursal", "sucursal_nombre", "usuario", "usuario_username", "creado_en", "total", "items"]
+        read_only_fields = ["id", "usuario", "usuario_username", "creado_en", "sucursal_nombre", "total"]
+        expandable_fields = {"sucursal": BranchSerializer}
+
+    def get_total(self, obj):
+        # anotado por SaleViewSet.get_queryset; si no, items prefetcheados; si no, aggregate
+        total = getattr(obj, "_total", None)
+        if total is None:
+            if "items" in getattr(obj, "_prefetched_objects_cache", {}):
+                total = sum(it.cantidad * it.precio_unit for it in obj.items.all())
+            else:
+                total = obj.total
+        return _TOTAL_FIELD.to_representation(total or 0)
+
+    def to_internal_value(self, data):
+        # precarga en una sola query los productos de todos los ítems (ver _ProductoItemField)
+        items = data.get("items") if hasattr(data, "get") else None
+        if isinstance(items, list):
+            ids = {_entero(raw.get("producto")) for raw in items if isinstance(raw, dict)}
+            ids.discard(None)
+            self.context["_productos"] = Product.objects.in_bulk(ids) if ids else {}
+        return super().to_internal_value(data)
 
     def validate(self, attrs):
         sucursal = attrs.get("sucursal", getattr(self.instance, "sucursal", None))
-        items = self.initial_data.get("items", [])
+        items = attrs.get("items") or []
 
-        if not items or not isinstance(items, list):
+        if not items:
             raise serializers.ValidationError({"items": "Debes enviar al menos un ítem."})
         if not sucursal:
             raise serializers.ValidationError({"sucursal": "Sucursal requerida."})
 
-        for raw in items:
-            producto_id = raw.get("producto")
-            cantidad = raw.get("cantidad")
-            if not producto_id or not cantidad:
-                raise serializers.ValidationError("Cada ítem requiere 'producto' y 'cantidad'.")
-
-            try:
-                producto = Product.objects.get(pk=producto_id)
-            except Product.DoesNotExist:
-                raise serializers.ValidationError(f"Producto inválido: {producto_id}")
-
-            if producto.sucursal_id != sucursal.id:
+        for it in items:
+            if it["producto"].sucursal_id != sucursal.id:
                 raise serializers.ValidationError("El producto no pertenece a esta sucursal.")
-
-            tot_in = (
-                StockMovement.objects.filter(producto=producto, sucursal=sucursal, tipo="IN")
-                .aggregate(s=Sum("cantidad"))
-                .get("s")
-                or 0
-            )
-            tot_out = (
-                StockMovement.objects.filter(producto=producto, sucursal=sucursal, tipo="OUT")
-                .aggregate(s=Sum("cantidad"))
-                .get("s")
-                or 0
-            )
-            disponible = tot_in - tot_out
-            if cantidad > disponible:
-                raise serializers.ValidationError(
-                    f"Stock insuficiente para '{producto.nombre}'. Disponible: {disponible}"
-                )
+        _verificar_stock(sucursal, items)
 
         return attrs
 
-    @transaction.atomic
+    @shards.atomic_empresa
     def create(self, validated_data):
         items_data = validated_data.pop("items", [])
         request = self.context.get("request")
         if request and request.user and request.user.is_authenticated:
             validated_data["usuario"] = request.user
 
+        # la venta se inserta antes de releer los saldos: en SQLite eso toma el lock de escritura
         venta = Sale.objects.create(**validated_data)
+        # revalida con los saldos bloqueados: dos cajas concurrentes no venden la misma unidad
+        _verificar_stock(venta.sucursal, items_data, bloquear=True)
+        usuario = validated_data.get("usuario")
 
+        items, movimientos = [], []
         for it in items_data:
-            producto = (
-                it["producto"] if isinstance(it["producto"], Product)
-                else Product.objects.get(pk=it["producto"])
-            )
+            producto = it["producto"]
             cantidad = it["cantidad"]
             # 👉 si no viene precio_unit, usamos producto.precio
-            precio_unit = it.get("precio_unit") or producto.precio
-
-            # Crear item
-            SaleItem.objects.create(
+            items.append(SaleItem(
                 venta=venta,
                 producto=producto,
                 cantidad=cantidad,
-                precio_unit=precio_unit,
-            )
-
-            # Registrar salida de stock por cada item
-            StockMovement.objects.create(
+                precio_unit=it.get("precio_unit") or producto.precio,
+                creado_en=venta.creado_en,  # clave de partición (ver particiones.py)
+            ))
+            # salida de stock por cada item
+            movimientos.append(StockMovement(
                 tipo="OUT",
                 cantidad=cantidad,
+                cantidad_signed=-cantidad,
                 motivo=f"Venta #{venta.id} - {producto.nombre}",
                 producto=producto,
                 sucursal=venta.sucursal,
-                usuario=validated_data.get("usuario"),
-            )
-
+                usuario=usuario,
+            ))
+
+        # cantidad de queries constante: un INSERT por tabla + actualización de saldos
+        SaleItem.objects.bulk_create(items, batch_size=LOTE)
+        insertar_movimientos(movimientos, using=shards.alias())
+        # evento de la venta para los webhooks: mismo INSERT que los de sus movimientos (outbox)
+        aplicar_movimientos(movimientos, using=shards.alias(), eventos=[outbox.evento_venta(venta, items)])
+        prefetch_related_objects([venta], "items__producto")
+        if stream.activo(venta.sucursal_id):
+            transaction.on_commit(partial(stream.publicar, venta.sucursal_id, "venta", {
+                "id": venta.id,
+                "total": float(sum(it.cantidad * it.precio_unit for it in items)),
+                "items": len(items),
+                "usuario_id": venta.usuario_id,
+                "creado_en": venta.creado_en.isoformat(),
+            }), using=shards.alias())
         return venta
+
+
+# =========================
+#  Transferencias entre sucursales
+# =========================
+class TransferItemSerializer(serializers.Serializer):
+    # producto de la sucursal origen, por id o por SKU
+    producto = serializers.IntegerField(required=False)
+    sku = serializers.CharField(required=False, max_length=64)
+    cantidad = serializers.IntegerField(min_value=1)
+
+    def validate(self, attrs):
+        if not attrs.get("producto") and not attrs.get("sku"):
+            raise serializers.ValidationError("Cada ítem requiere 'producto' o 'sku'.")
+        return attrs
+
+
+class TransferSerializer(serializers.ModelSerializer):
+    """
+    Transfiere muchos productos de una sucursal a otra de la misma empresa.
+    Cada producto de origen se mapea al producto de destino con el mismo SKU.
+    Valida disponibilidad en una sola query y escribe los pares OUT/IN con
+    bulk_create, todo en una transacción.
+    """
+    items = TransferItemSerializer(many=True, write_only=True)
+    lineas = serializers.SerializerMethodField()
+    origen_nombre = serializers.CharField(source="origen.name", read_only=True)
+    destino_nombre = serializers.CharField(source="destino.name", read_only=True)
+    usuario_username = serializers.CharField(source="usuario.username", read_only=True)
+
+    MAX_ITEMS = 5000
+
+    class Meta:
+        model = Transfer
+        fields = [
+            "id", "origen", "origen_nombre", "destino", "destino_nombre", "motivo",
+            "usuario", "usuario_username", "creado_en", "items", "lineas",
+        ]
+        read_only_fields = ["id", "origen_nombre", "destino_nombre", "usuario", "usuario_username", "creado_en", "lineas"]
+
+    def get_lineas(self, obj):
+        lineas = getattr(obj, "_lineas", None)
+        if lineas is None:
+            # movimientos prefetcheados por TransferViewSet.get_queryset
+            salidas = {m.producto.sku: m for m in obj.movimientos.all() if m.tipo == "OUT"}
+            entradas = {m.producto.sku: m for m in obj.movimientos.all() if m.tipo == "IN"}
+            lineas = [
+                (m.producto, entradas[sku].producto if sku in entradas else None, m.cantidad)
+                for sku, m in salidas.items()
+            ]
+        return [
+            {
+                "sku": po.sku,
+                "producto_origen": po.id,
+                "producto_destino": pd.id if pd else None,
+                "nombre": po.nombre,
+                "cantidad": cantidad,
+            }
+            for po, pd, cantidad in lineas
+        ]
+
+    def validate(self, attrs):
+        origen, destino = attrs["origen"], attrs["destino"]
+        items = attrs.get("items") or []
+
+        if not items:
+            raise serializers.ValidationError({"items": "Debes enviar al menos un ítem."})
+        if len(items) > self.MAX_ITEMS:
+            raise serializers.ValidationError({"items": f"Máximo {self.MAX_ITEMS} ítems por transferencia."})
+        if origen.id == destino.id:
+            raise serializers.ValidationError({"destino": "El destino debe ser distinto del origen."})
+        if origen.owner_id != destino.owner_id:
+            raise serializers.ValidationError({"destino": "Las sucursales deben ser de la misma empresa."})
+
+        request = self.context.get("request")
+        user = getattr(request, "user", None)
+        if user is not None and not user.is_superuser:
+            if getattr(user, "rol", None) == "admin" and origen.owner_id != user.id:
+                raise serializers.ValidationError({"origen": "Esta sucursal no te pertenece."})
+            if getattr(user, "rol", None) == "limMerchant" and user.sucursal_id != origen.id:
+                raise serializers.ValidationError({"origen": "No tienes permiso para esta sucursal."})
+
+        # productos de origen (por id o SKU, sin distinguir mayúsculas como ProductSerializer) en una query
+        ids = {it["producto"] for it in items if it.get("producto")}
+        skus = {it["sku"].lower() for it in items if it.get("sku")}
+        origen_qs = (
+            Product.objects.filter(sucursal=origen).annotate(_sku=Lower("sku"))
+            .filter(Q(id__in=ids) | Q(_sku__in=skus)).order_by("id")
+        )
+        por_id, por_sku = {}, {}
+        for p in origen_qs:
+            por_id[p.id] = p
+            por_sku.setdefault(p._sku, p)
+
+        cantidades = defaultdict(int)
+        faltan = []
+        for it in items:
+            p = por_id.get(it["producto"]) if it.get("producto") else por_sku.get(it["sku"].lower())
+            if p is None:
+                faltan.append(it.get("producto") or it.get("sku"))
+                continue
+            cantidades[p] += it["cantidad"]
+        if faltan:
+            raise serializers.ValidationError({"items": f"Productos inexistentes en la sucursal origen: {faltan}"})
+
+        sin_sku = [p.nombre for p in cantidades if not p.sku]
+        if sin_sku:
+            raise serializers.ValidationError({"items": f"Productos sin SKU (no se pueden mapear): {sin_sku}"})
+
+        # mapeo por SKU en destino, en una query
+        destino_por_sku = {}
+        for p in (
+            Product.objects.filter(sucursal=destino).annotate(_sku=Lower("sku"))
+            .filter(_sku__in={p.sku.lower() for p in cantidades}).order_by("id")
+        ):
+            destino_por_sku.setdefault(p._sku, p)
+        sin_destino = sorted(p.sku for p in cantidades if p.sku.lower() not in destino_por_sku)
+        if sin_destino:
+            raise serializers.ValidationError({"items": f"SKUs inexistentes en la sucursal destino: {sin_destino}"})
+
+        attrs["lineas"] = [(p, destino_por_sku[p.sku.lower()], cant) for p, cant in cantidades.items()]
+        return attrs
+
+    @shards.atomic_empresa
+    def create(self, validated_data):
+        lineas = validated_data.pop("lineas")
+        validated_data.pop("items", None)
+        request = self.context.get("request")
+        if request and request.user and request.user.is_authenticated:
+            validated_data["usuario"] = request.user
+        origen, destino = validated_data["origen"], validated_data["destino"]
+
+        # disponibilidad en una sola pasada (saldos bloqueados hasta el commit)
+        saldos = {
+            bal.producto_id: bal
+            for bal in StockBalance.objects.select_for_update()
+            .filter(sucursal=origen, producto_id__in=[po.id for po, _, _ in lineas])
+            .order_by("producto_id")
+        }
+        insuficientes = []
+        for po, _, cantidad in lineas:
+            disponible = saldos[po.id].cantidad if po.id in saldos else 0
+            if cantidad > disponible:
+                insuficientes.append(
+                    f"Stock insuficiente para '{po.nombre}' ({po.sku}). Disponible: {disponible}, solicitado: {cantidad}"
+                )
+        if insuficientes:
+            raise serializers.ValidationError({"items": insuficientes})
+
+        transfer = Transfer.objects.create(**validated_data)
+        usuario = validated_data.get("usuario")
+        movimientos = []
+        for po, pd, cantidad in lineas:
+            # la entrada en destino lleva el costo promedio del origen
+            bal = saldos.get(po.id)
+            costo = bal.costo_promedio.quantize(Decimal("0.01")) if bal and bal.costo_promedio else None
+            movimientos += [
+                StockMovement(
+                    tipo="OUT", cantidad=cantidad, cantidad_signed=-cantidad, costo_unit=costo,
+                    producto=po, sucursal=origen, usuario=usuario, transferencia=transfer,
+                    motivo=f"Transferencia #{transfer.id} a {destino.name}",
+                ),
+                StockMovement(
+                    tipo="IN", cantidad=cantidad, cantidad_signed=cantidad, costo_unit=costo,
+                    producto=pd, sucursal=destino, usuario=usuario, transferencia=transfer,
+                    motivo=f"Transferencia #{transfer.id} desde {origen.name}",
+                ),
+            ]
+        insertar_movimientos(movimientos, using=shards.alias())
+        aplicar_movimientos(movimientos, using=shards.alias())
+
+        transfer._lineas = lineas
+        return transfer
+
+
+# =========================
+#  Webhooks (destinos del outbox)
+# =========================
+class WebhookEndpointSerializer(serializers.ModelSerializer):
+    tipos = serializers.ListField(
+        child=serializers.ChoiceField(choices=outbox.TIPOS), required=False, allow_empty=True
+    )
+
+    class Meta:
+        model = WebhookEndpoint
+        fields = [
+            "id",
+            "url",
+            "tipos",
+            "activo",
+            "secreto",
+            "cursor",
+            "intentos",
+            "proximo_intento",
+            "ultimo_error",
+            "ultima_entrega",
+            "creado_en",
+        ]
+        read_only_fields = [
+            "id",
+            "secreto",
+            "cursor",
+            "intentos",
+            "proximo_intento",
+            "ultimo_error",
+            "ultima_entrega",
+            "creado_en",
+        ]
+
+    def validate_url(self, value):
+        # la entrega sale desde nuestra red: nada de http ni direcciones internas (ver outbox)
+        error = outbox.validar_url(value)
+        if error:
+            raise serializers.ValidationError(error)
+        return value
+
+    def create(self, validated_data):
+        # el dueño es el admin que lo crea; arranca en el último evento (no recibe la historia)
+        owner = self.context["request"].user
+        return WebhookEndpoint.objects.create(
+            owner=owner,
+            secreto=outbox.nuevo_secreto(),
+            cursor=outbox.cursor_inicial(owner.id, using=shards.alias()),
+            **validated_data,
+        )
@@ -0,0 +1,341 @@
+"""
+Sharding por empresa (opcional): los datos de cada empresa (el owner de
+Branch) en su propio alias de base.
+
+- Registro: TenantShard (en default) empresa -> alias; sin fila, la empresa
+  vive en default. ubicacion() lo cachea SYSSTOCK_SHARD_CACHE_SECONDS por proceso.
+- Contexto: TenantJWTAuthentication fija el alias del request al autenticar
+  (contextvar, ShardMiddleware lo limpia). Admin -> su empresa; empleado -> el
+  owner de su sucursal; superuser -> header X-Sysstock-Tenant (id del admin) o default.
+- ShardRouter: los modelos de la empresa (productos, movimientos, ventas,
+  saldos, outbox...) van al alias del contexto. Usuarios, sucursales, auth y el
+  registro viven en default (control) y se espejan al shard de su empresa
+  (signals), así los FKs y los joins (sucursal__owner, usuario__username)
+  funcionan dentro del shard.
+- Fuera de un request (comandos): usar(alias), o --database en los workers
+  (deliver_webhooks, run_tasks, archive_movements, rebuild_stock_balances).
+- migrate_shards migra cada alias; move_tenant mueve una empresa de alias
+  (escrituras de esa empresa en 503 mientras copia).
+
+Los ids de los datos son por base: move_tenant conserva los ids y aborta si
+chocan con los de otra empresa en el destino (un shard por empresa grande).
+Sin SYSSTOCK_SHARDS no hay aliases extra y nada de esto cambia el comportamiento.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+HEADER = "HTTP_X_SYSSTOCK_TENANT"
+# modelos de SysstockApp que viven en default (el resto es de la empresa)
+CONTROL = ("branch", "tenantshard")
+
+_alias = contextvars.ContextVar("sysstock_shard", default=None)
+
+
+def aliases():
+    return [a for a in getattr(settings, "SYSSTOCK_SHARDS", ()) if a in settings.DATABASES]
+
+
+def activo():
+    return bool(aliases())
+
+
+def alias():
+    """Base de los datos de la empresa del contexto (default sin sharding)."""
+    return _alias.get() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def usar(alias_):
+    token = _alias.set(alias_)
+    try:
+        yield
+    finally:
+        _alias.reset(token)
+
+
+def iniciar_request():
+    return _alias.set(None)
+
+
+def terminar_request(token):
+    _alias.reset(token)
+
+
+def activar(alias_):
+    """Fija el alias en el contexto actual (vistas async: la autenticación corre en el pool)."""
+    _alias.set(alias_)
+
+
+def atomic_empresa(func):
+    """Como @transaction.atomic, pero sobre la base de la empresa del request."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with transaction.atomic(using=alias()):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+# =========================
+#  Registro (cacheado por proceso)
+# =========================
+_cache = {}
+_lock = threading.Lock()
+
+
+def _cacheado(clave, calcular):
+    ahora = time.monotonic()
+    with _lock:
+        hit = _cache.get(clave)
+        if hit is not None and hit[1] > ahora:
+            return hit[0]
+    valor = calcular()
+    with _lock:
+        _cache[clave] = (valor, ahora + float(getattr(settings, "SYSSTOCK_SHARD_CACHE_SECONDS", 5)))
+    return valor
+
+
+def olvidar():
+    with _lock:
+        _cache.clear()
+
+
+def ubicacion(owner_id):
+    """(alias, moviendo) de la empresa."""
+    from .models import TenantShard
+
+    def calcular():
+        fila = (
+            TenantShard.objects.using(DEFAULT_DB_ALIAS)
+            .filter(owner_id=owner_id).values_list("alias", "moviendo").first()
+        )
+        return fila if fila and fila[0] in settings.DATABASES else (DEFAULT_DB_ALIAS, bool(fila and fila[1]))
+
+    return _cacheado(("empresa", owner_id), calcular)
+
+
+def owner_de_sucursal(sucursal_id):
+    from .models import Branch
+
+    return _cacheado(
+        ("sucursal", sucursal_id),
+        lambda: Branch.objects.using(DEFAULT_DB_ALIAS).filter(pk=sucursal_id).values_list("owner_id", flat=True).first(),
+    )
+
+
+def owner_de(user, request=None):
+    """Empresa (id del admin) del usuario; None = sin empresa (default)."""
+    if user.is_superuser:
+        valor = request.META.get(HEADER) if request is not None else None
+        return int(valor) if valor and valor.isdigit() else None
+    if getattr(user, "rol", None) == "admin":
+        return user.pk
+    return owner_de_sucursal(user.sucursal_id) if getattr(user, "sucursal_id", None) else None
+
+
+class EmpresaEnMovimiento(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "La empresa se está moviendo de base de datos: reintentá en unos segundos."
+    default_code = "empresa_en_movimiento"
+
+    def __init__(self):
+        super().__init__()
+        self.wait = max(int(float(getattr(settings, "SYSSTOCK_SHARD_CACHE_SECONDS", 5))), 1)  # Retry-After
+
+
+def fijar(user, request=None):
+    """Fija el alias de la empresa de 'user' para el resto del request y lo devuelve."""
+    if not activo():
+        return None
+    owner_id = owner_de(user, request)
+    alias_, moviendo = ubicacion(owner_id) if owner_id else (DEFAULT_DB_ALIAS, False)
+    if moviendo and request is not None and request.method not in SAFE_METHODS:
+        raise EmpresaEnMovimiento()
+    _alias.set(alias_)
+    return alias_
+
+
+class TenantJWTAuthentication(JWTAuthentication):
+    """JWT de SimpleJWT + alias de la empresa del usuario (ver fijar)."""
+
+    def authenticate(self, request):
+        resultado = super().authenticate(request)
+        if resultado is not None:
+            fijar(resultado[0], request)
+        return resultado
+
+
+# =========================
+#  Router
+# =========================
+def _de_empresa(model):
+    meta = model._meta
+    return meta.app_label == "SysstockApp" and meta.model_name not in CONTROL
+
+
+class ShardRouter:
+    """
+    DATABASE_ROUTERS (primero): modelos de la empresa -> alias del contexto.
+    Sin contexto (o empresa en default) no decide: siguen archivo / réplica.
+    """
+
+    def _db(self, model):
+        if not _de_empresa(model):
+            return None
+        actual = _alias.get()
+        return actual if actual and actual != DEFAULT_DB_ALIAS else None
+
+    def db_for_read(self, model, **hints):
+        return self._db(model)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # usuarios y sucursales (default) se relacionan con los datos del shard (espejados ahí)
+        if activo() and {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, *aliases()}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # cada shard tiene el esquema completo (también auth, para los espejos)
+        return True if db in aliases() else None
+
+
+# =========================
+#  Espejo de usuarios y sucursales (default -> shard)
+# =========================
+def owner_de_instancia(instance):
+    from .models import Branch
+
+    if isinstance(instance, Branch):
+        return instance.owner_id
+    return owner_de(instance)
+
+
+def espejar(objetos, destino):
+    """Inserta o actualiza las filas (mismo pk) en 'destino'."""
+    for obj in objetos:
+        modelo = type(obj)
+        campos = {f.attname: getattr(obj, f.attname) for f in modelo._meta.concrete_fields if not f.primary_key}
+        if not modelo._base_manager.using(destino).filter(pk=obj.pk).update(**campos):
+            modelo._base_manager.using(destino).bulk_create([modelo(pk=obj.pk, **campos)])
+
+
+def destino_espejo(instance, using):
+    """Shard donde espejar un usuario / sucursal guardado en default (None = no hace falta)."""
+    if not activo() or using != DEFAULT_DB_ALIAS:
+        return None
+    owner_id = owner_de_instancia(instance)
+    destino = ubicacion(owner_id)[0] if owner_id else DEFAULT_DB_ALIAS
+    return None if destino == DEFAULT_DB_ALIAS else destino
+
+
+# =========================
+#  Mover una empresa (move_tenant)
+# =========================
+def tablas():
+    """Modelos de la empresa en orden de dependencias (control primero)."""
+    from django.contrib.auth import get_user_model
+
+    from . import models as m
+
+    return [
+        get_user_model(), m.Branch, m.Category, m.Product, m.PriceHistory, m.Transfer,
+        m.StockMovement, m.StockMovementArchive, m.StockBalance, m.CostLayer, m.Sale, m.SaleItem,
+        m.OutboxEvent, m.WebhookEndpoint,
+    ]
+
+
+def es_control(modelo):
+    return not _de_empresa(modelo)
+
+
+def base_de(modelo, using):
+    """El archivo de default puede vivir en su alias propio (ver archivo.alias)."""
+    from .archivo import alias as alias_archivo
+    from .models import StockMovementArchive
+
+    return alias_archivo(using) if modelo is StockMovementArchive else using
+
+
+def filas(modelo, owner_id, sucursales, using):
+    """Queryset de las filas de la empresa en 'using' (sucursales: ids, leídos de default)."""
+    from django.contrib.auth import get_user_model
+    from django.db.models import Q
+
+    from . import models as m
+
+    qs = modelo._base_manager.using(base_de(modelo, using))
+    if modelo is get_user_model():
+        return qs.filter(Q(pk=owner_id) | Q(sucursal_id__in=sucursales))
+    if modelo in (m.Branch, m.Category, m.OutboxEvent, m.WebhookEndpoint):
+        return qs.filter(owner_id=owner_id)
+    if modelo is m.PriceHistory:
+        return qs.filter(producto__sucursal_id__in=sucursales)
+    if modelo is m.Transfer:
+        return qs.filter(origen_id__in=sucursales)
+    if modelo is m.SaleItem:
+        return qs.filter(venta__sucursal_id__in=sucursales)
+    return qs.filter(sucursal_id__in=sucursales)
+
+
+def copiar(modelo, qs, destino, lote=1000):
+    """
+    Copia las filas con sus ids (INSERT raw: conserva creado_en y demás
+    auto_now). Aborta con ValueError si algún id ya existe en el destino.
+    """
+    campos = modelo._meta.local_concrete_fields
+    conn = connections[destino]
+    total = 0
+    buffer = []
+
+    def volcar():
+        ids = [o.pk for o in buffer]
+        if modelo._base_manager.using(destino).filter(pk__in=ids).exists():
+            raise ValueError(
+                f"{modelo.__name__}: ids {ids[0]}..{ids[-1]} ya existen en '{destino}' (otra empresa): "
+                "mover a un shard sin esos ids."
+            )
+        tam = max(conn.ops.bulk_batch_size(campos, buffer), 1)
+        for i in range(0, len(buffer), tam):
+            modelo._base_manager._insert(buffer[i:i + tam], fields=campos, using=destino, raw=True)
+
+    for obj in qs.order_by("pk").iterator(chunk_size=lote):
+        buffer.append(obj)
+        if len(buffer) >= lote:
+            volcar()
+            total += len(buffer)
+            buffer = []
+    if buffer:
+        volcar()
+        total += len(buffer)
+    return total
+
+
+def reiniciar_secuencias(modelos, using):
+    """Después de insertar ids explícitos (PostgreSQL; SQLite / MySQL ajustan solos)."""
+    sqls = connections[using].ops.sequence_reset_sql(no_style(), modelos)
+    if sqls:
+        with connections[using].cursor() as cur:
+            for sql in sqls:
+                cur.execute(sql)
+
+
+def borrar(modelo, ids, using, lote=1000):
+    """Borra por lotes de ids (sin Model.delete: los saldos no se recalculan)."""
+    from .stock import _lotes
+
+    for parte in _lotes(ids, size=lote):
+        modelo._base_manager.using(using).filter(pk__in=parte).delete()
+    return len(ids)
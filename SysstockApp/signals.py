@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import shards
+from .models import Branch, Product
+from .search import desindexar_producto, indexar_producto
+from .stock import sincronizar_producto
+
+
+# =========================
+#  Índice de búsqueda de productos (FTS5 en SQLite)
+# =========================
+@receiver(post_save, sender=Product)
+def _producto_guardado(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    indexar_producto(instance, using=using)
+
+
+# =========================
+#  Saldo / límite de bajo stock del producto
+# =========================
+@receiver(post_save, sender=Product)
+def _producto_saldo(sender, instance, created=False, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    sincronizar_producto(instance, creado=created, using=using)
+
+
+@receiver(post_delete, sender=Product)
+def _producto_borrado(sender, instance, using=None, **kwargs):
+    desindexar_producto(instance.pk, using=using)
+
+
+# =========================
+#  Espejo de usuarios / sucursales en el shard de su empresa (ver shards.py)
+# =========================
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_save, sender=Branch)
+def _espejar_guardado(sender, instance, raw=False, using=None, **kwargs):
+    destino = None if raw else shards.destino_espejo(instance, using)
+    if destino:
+        shards.espejar([instance], destino)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+@receiver(pre_delete, sender=Branch)
+def _espejar_borrado(sender, instance, using=None, **kwargs):
+    # antes que en default: si el shard lo protege (ProtectedError), no se borra en ninguno
+    destino = shards.destino_espejo(instance, using)
+    if destino:
+        for obj in sender._base_manager.using(destino).filter(pk=instance.pk):
+            obj.delete()
@@ -0,0 +1,341 @@
+"""
+Saldos de stock mantenidos (StockBalance) y set de bajo stock por sucursal.
+
+Cada movimiento (save/delete de StockMovement, o bulk_create + aplicar_movimientos)
+actualiza el saldo de su producto/sucursal dentro de la misma transacción.
+Cuando el saldo cruza el límite (stock_min o el umbral por defecto) se encola
+la notificación de bajo stock (tarea en segundo plano, sale al confirmar).
+El costo promedio y el valor del saldo se mantienen en el mismo paso (ver valorizacion.py).
+Con streams abiertos, los saldos nuevos y los cruces se publican en eventos.py.
+Los movimientos aplicados quedan además en el outbox (outbox.py) para los webhooks.
+"""
+from collections import defaultdict, deque
+from functools import partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.db.models import Case, F, IntegerField, Sum, When
+from django.utils import timezone
+
+from . import eventos as stream
+from . import outbox, valorizacion
+from .notifications import notificar_cruces
+
+# tamaño de lote para IN (...) y bulk_update
+LOTE = 500
+
+
+def limite_default() -> int:
+    """Umbral de bajo stock por defecto de la empresa (si el producto no tiene stock_min)."""
+    return int(getattr(settings, "SYSSTOCK_LOW_STOCK_THRESHOLD", 5))
+
+
+def limite_producto(stock_min) -> int:
+    return int(stock_min) if stock_min is not None else limite_default()
+
+
+def delta_movimiento(tipo, cantidad) -> int:
+    """IN suma, OUT resta (misma regla que el cálculo por aggregates)."""
+    if tipo == "IN":
+        return int(cantidad)
+    if tipo == "OUT":
+        return -int(cantidad)
+    return 0
+
+
+def _signed():
+    return Case(
+        When(tipo="IN", then=F("cantidad")),
+        When(tipo="OUT", then=-F("cantidad")),
+        default=0,
+        output_field=IntegerField(),
+    )
+
+
+def _lotes(items, size=LOTE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# =========================
+#  Aplicación de movimientos
+# =========================
+def insertar_movimientos(movimientos, using=DEFAULT_DB_ALIAS):
+    """
+    bulk_create de StockMovement dejando el pk en cada objeto: las capas FIFO
+    y el outbox de aplicar_movimientos lo guardan. MySQL no devuelve las filas
+    de un INSERT múltiple; ahí se releen en la misma transacción.
+    """
+    from .models import StockMovement
+
+    desde = timezone.now()
+    StockMovement.objects.using(using).bulk_create(movimientos, batch_size=LOTE)
+    if not connections[using].features.can_return_rows_from_bulk_insert:
+        _releer_pks(movimientos, desde, using)
+    return movimientos
+
+
+def _releer_pks(movimientos, desde, using):
+    """
+    Asigna los ids recién insertados por (producto, sucursal, tipo, cantidad,
+    motivo, usuario, creado_en): creado_en es auto_now_add con microsegundos,
+    y entre iguales los ids van en orden de inserción.
+    """
+    from .models import StockMovement
+
+    campos = ("producto_id", "sucursal_id", "tipo", "cantidad", "motivo", "usuario_id", "creado_en")
+    pendientes = defaultdict(deque)
+    for m in movimientos:
+        if m.pk is None:
+            pendientes[tuple(getattr(m, c) for c in campos)].append(m)
+    if not pendientes:
+        return
+    sucursales = {m.sucursal_id for cola in pendientes.values() for m in cola}
+    for lote in _lotes({m.producto_id for cola in pendientes.values() for m in cola}):
+        for fila in (
+            StockMovement.objects.using(using)
+            .filter(producto_id__in=lote, sucursal_id__in=sucursales, creado_en__gte=desde)
+            .order_by("id")
+            .values_list("id", *campos)
+        ):
+            cola = pendientes.get(fila[1:])
+            if cola:
+                cola.popleft().pk = fila[0]
+
+
+def aplicar_movimientos(movimientos, revertidos=(), using=DEFAULT_DB_ALIAS, eventos=()):
+    """
+    Actualiza StockBalance para movimientos YA insertados (y revierte los de
+    'revertidos', p.ej. la versión anterior de un movimiento editado o uno borrado).
+    Pensado para llamarse dentro de la transacción que escribe los movimientos;
+    en la misma transacción deja los eventos en el outbox (ver outbox.py), junto
+    con 'eventos' del llamador (p.ej. la venta) en el mismo INSERT.
+    Devuelve {(producto_id, sucursal_id): saldo}.
+    """
+    deltas = defaultdict(int)
+    por_clave = defaultdict(list)
+    for m in movimientos:
+        key = (m.producto_id, m.sucursal_id)
+        deltas[key] += delta_movimiento(m.tipo, m.cantidad)
+        por_clave[key].append(m)
+    recalcular = set()
+    for m in revertidos:
+        key = (m.producto_id, m.sucursal_id)
+        deltas[key] -= delta_movimiento(m.tipo, m.cantidad)
+        recalcular.add(key)
+    if not deltas:
+        return {}
+    with transaction.atomic(using=using, savepoint=False):
+        saldos = actualizar_saldos(deltas, movimientos=por_clave, recalcular=recalcular, using=using)
+        outbox.registrar_movimientos(movimientos, revertidos, saldos, using=using, previos=eventos)
+    return saldos
+
+
+def actualizar_saldos(deltas, movimientos=None, recalcular=(), using=DEFAULT_DB_ALIAS):
+    """
+    deltas: {(producto_id, sucursal_id): delta}. Set-based: un SELECT ... FOR UPDATE
+    y un bulk_update por lote, más la creación de los saldos que falten.
+    movimientos: {clave: [StockMovement]} para actualizar el costo en orden;
+    las claves en 'recalcular' (ediciones/borrados) revalorizan desde los movimientos.
+    """
+    movimientos = movimientos or {}
+    from .models import StockBalance
+
+    with transaction.atomic(using=using):
+        saldos = {}
+        claves = sorted(deltas)  # orden fijo de locks -> sin deadlocks entre transacciones
+        for lote in _lotes({p for p, _ in claves}):
+            for bal in (
+                StockBalance.objects.using(using)
+                .select_for_update()
+                .filter(producto_id__in=lote)
+                .order_by("producto_id", "sucursal_id")
+            ):
+                saldos[(bal.producto_id, bal.sucursal_id)] = bal
+
+        faltantes = {k for k in claves if k not in saldos}
+        if faltantes:
+            # el saldo inicial sale de los movimientos (que ya incluyen los recién insertados)
+            for bal in _crear_saldos(sorted(faltantes), using=using):
+                saldos[(bal.producto_id, bal.sucursal_id)] = bal
+
+        ahora = timezone.now()
+        cambiados, eventos, revalorizar = [], [], []
+        for key in claves:
+            bal = saldos[key]
+            if key in faltantes:
+                continue
+            if key in recalcular:
+                revalorizar.append(bal)
+            else:
+                previo = bal.cantidad
+                for m in movimientos.get(key, ()):
+                    valorizacion.aplicar_movimiento(bal, m, using=using)
+                    bal.cantidad += delta_movimiento(m.tipo, m.cantidad)
+                bal.cantidad = previo
+            bal.cantidad += deltas[key]
+            bal.actualizado_en = ahora
+            evento = _recalcular_bajo_stock(bal, ahora)
+            if evento:
+                eventos.append(evento)
+            cambiados.append(bal)
+
+        valorizacion.recalcular(revalorizar, using=using)
+
+        for lote in _lotes(cambiados):
+            StockBalance.objects.using(using).bulk_update(
+                lote, ["cantidad", "bajo_stock", "bajo_stock_desde", "costo_promedio", "valor", "actualizado_en"]
+            )
+
+        if eventos:
+            _notificar(eventos, using=using)
+        if stream.activo():
+            cambios = [(k, saldos[k].cantidad, saldos[k].bajo_stock) for k in claves]
+            transaction.on_commit(partial(_publicar_saldos, cambios), using=using)
+        return {k: saldos[k].cantidad for k in claves}
+
+
+def _crear_saldos(claves, using=DEFAULT_DB_ALIAS):
+    """Crea StockBalance para (producto, sucursal) sin saldo, calculado desde los movimientos."""
+    from .models import Product, StockBalance, StockMovement
+
+    pids = {p for p, _ in claves}
+    totales = {}
+    stock_min = {}
+    for lote in _lotes(pids):
+        for r in (
+            StockMovement.objects.using(using)
+            .filter(producto_id__in=lote)
+            .values("producto_id", "sucursal_id")
+            .annotate(s=Sum(_signed()))
+            .order_by()
+        ):
+            totales[(r["producto_id"], r["sucursal_id"])] = r["s"] or 0
+        stock_min.update(Product.objects.using(using).filter(id__in=lote).values_list("id", "stock_min"))
+
+    ahora = timezone.now()
+    nuevos = []
+    for p, s in claves:
+        cantidad = totales.get((p, s), 0)
+        limite = limite_producto(stock_min.get(p))
+        bajo = cantidad <= limite
+        nuevos.append(StockBalance(
+            producto_id=p, sucursal_id=s, cantidad=cantidad, limite=limite,
+            bajo_stock=bajo, bajo_stock_desde=ahora if bajo else None,
+        ))
+    valorizacion.recalcular(nuevos, using=using)
+    try:
+        with transaction.atomic(using=using):
+            StockBalance.objects.using(using).bulk_create(nuevos, batch_size=LOTE)
+    except IntegrityError:
+        # otra transacción creó alguno en paralelo: se recalcula desde los movimientos
+        for bal in nuevos:
+            StockBalance.objects.using(using).update_or_create(
+                producto_id=bal.producto_id, sucursal_id=bal.sucursal_id,
+                defaults={"cantidad": bal.cantidad, "limite": bal.limite,
+                          "bajo_stock": bal.bajo_stock, "bajo_stock_desde": bal.bajo_stock_desde,
+                          "costo_promedio": bal.costo_promedio, "valor": bal.valor},
+            )
+    return nuevos
+
+
+def _recalcular_bajo_stock(bal, ahora):
+    """Actualiza bal.bajo_stock; si cruzó el límite devuelve el evento a notificar."""
+    bajo = bal.cantidad <= bal.limite
+    if bajo == bal.bajo_stock:
+        return None
+    bal.bajo_stock = bajo
+    bal.bajo_stock_desde = ahora if bajo else None
+    return {
+        "evento": "stock.bajo" if bajo else "stock.normal",
+        "producto_id": bal.producto_id,
+        "sucursal_id": bal.sucursal_id,
+        "stock": bal.cantidad,
+        "limite": bal.limite,
+        "fecha": ahora.isoformat(),
+    }
+
+
+def _notificar(eventos, using=DEFAULT_DB_ALIAS):
+    """Cruces de bajo stock: hooks como tareas en segundo plano y, con streams abiertos, al bus. Salen al confirmar."""
+    notificar_cruces(eventos, using=using)
+    if stream.activo():
+        transaction.on_commit(partial(_publicar_cruces, eventos), using=using)
+
+
+def _publicar_cruces(eventos):
+    for ev in eventos:
+        stream.publicar(ev["sucursal_id"], ev["evento"], ev)
+
+
+def _publicar_saldos(cambios):
+    por_sucursal = defaultdict(list)
+    for (producto_id, sucursal_id), cantidad, bajo in cambios:
+        por_sucursal[sucursal_id].append({"producto_id": producto_id, "stock": cantidad, "bajo_stock": bajo})
+    for sucursal_id, saldos in por_sucursal.items():
+        stream.publicar(sucursal_id, "stock", {"saldos": saldos})
+
+
+# =========================
+#  Cambios de producto (alta / stock_min)
+# =========================
+def sincronizar_producto(producto, creado=False, using=DEFAULT_DB_ALIAS):
+    """
+    Alta de producto: crea su saldo en 0 (todavía no tiene movimientos).
+    Cambio de stock_min: actualiza el límite y notifica si eso lo hace cruzar.
+    """
+    from .models import StockBalance
+
+    limite = limite_producto(producto.stock_min)
+    if creado:
+        StockBalance.objects.using(using).get_or_create(
+            producto=producto, sucursal_id=producto.sucursal_id,
+            defaults={"cantidad": 0, "limite": limite, "bajo_stock": 0 <= limite, "bajo_stock_desde": timezone.now()},
+        )
+        return
+
+    with transaction.atomic(using=using):
+        saldos = list(StockBalance.objects.using(using).select_for_update().filter(producto=producto))
+        if not saldos:
+            _crear_saldos([(producto.pk, producto.sucursal_id)], using=using)
+            return
+
+        ahora = timezone.now()
+        eventos = []
+        for bal in saldos:
+            if bal.limite == limite:
+                continue
+            bal.limite = limite
+            evento = _recalcular_bajo_stock(bal, ahora)
+            if evento:
+                eventos.append(evento)
+            bal.save(update_fields=["limite", "bajo_stock", "bajo_stock_desde", "actualizado_en"])
+        if eventos:
+            _notificar(eventos, using=using)
+
+
+def reconstruir_saldos(productos=None, using=DEFAULT_DB_ALIAS):
+    """
+    Recalcula todos los saldos desde los movimientos (después de cargas masivas,
+    o para reparar). No notifica cruces. Devuelve la cantidad de saldos escritos.
+    """
+    from .models import Product, StockBalance, StockMovement
+
+    qs = productos if productos is not None else Product.objects.using(using).all()
+    total = 0
+    with transaction.atomic(using=using):
+        for lote in _lotes(qs.values_list("id", "sucursal_id").order_by("id"), size=2000):
+            pids = [p for p, _ in lote]
+            StockBalance.objects.using(using).filter(producto_id__in=pids).delete()
+            claves = set(lote)
+            # también los saldos de movimientos en otra sucursal que la del producto
+            claves.update(
+                StockMovement.objects.using(using)
+                .filter(producto_id__in=pids)
+                .order_by()
+                .values_list("producto_id", "sucursal_id")
+                .distinct()
+            )
+            total += len(_crear_saldos(sorted(claves), using=using))
+    return total
@@ -0,0 +1,355 @@
+"""
+Tareas en segundo plano para los efectos que no tienen que demorar la respuesta
+(notificaciones de bajo stock, y lo que se agregue): la caja solo paga sus INSERTs.
+
+    @tarea("alertas.hook", reintentos=5)
+    def ejecutar_hook(hook, eventos): ...
+
+    encolar("alertas.hook", "webhook", eventos, clave="alertas:webhook:...")
+
+Backend (SYSSTOCK_TASKS_BACKEND):
+  - "local": cola en memoria + SYSSTOCK_TASKS_WORKERS hilos por proceso. La tarea
+    sale al confirmar la transacción (transaction.on_commit). Sin durabilidad: lo
+    encolado se pierde si el proceso muere. Con la cola llena se ejecuta en el
+    hilo que encoló (más lento, pero no se pierde).
+  - "db": una fila BackgroundTask escrita DENTRO de la transacción (se confirma o
+    se revierte con el cambio) que ejecuta `manage.py run_tasks` en otro proceso.
+  - "inmediato": en el mismo hilo al confirmar, un solo intento (scripts, debug).
+
+Reintentos: si la tarea levanta una excepción se reprograma con backoff
+exponencial, hasta `reintentos` veces; después queda fallida (log, métrica y,
+en "db", estado en la tabla).
+Idempotencia: `clave` descarta encolados repetidos (db: UNIQUE; local: las
+últimas SYSSTOCK_TASKS_CLAVES). La ejecución es al menos una vez (un worker
+que muere a mitad de una tarea la deja para otro): las tareas deben tolerar
+correr dos veces. Los argumentos tienen que ser serializables a JSON.
+"""
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+logger = logging.getLogger("sysstock.tareas")
+
+_REGISTRO = {}
+
+
+class TareaDesconocida(LookupError):
+    pass
+
+
+def tarea(nombre, reintentos=3):
+    """Registra la función como tarea `nombre` (se sigue pudiendo llamar directo)."""
+    def decorador(func):
+        _REGISTRO[nombre] = (func, reintentos)
+        return func
+    return decorador
+
+
+def _tarea(nombre):
+    try:
+        return _REGISTRO[nombre]
+    except KeyError:
+        raise TareaDesconocida(f"Tarea desconocida: {nombre}") from None
+
+
+def backend():
+    return getattr(settings, "SYSSTOCK_TASKS_BACKEND", "local")
+
+
+def backoff(intento):
+    """Segundos antes del reintento `intento` (1, 2, ...): base * 2^(n-1), con tope y ±20% de jitter."""
+    base = float(getattr(settings, "SYSSTOCK_TASKS_BACKOFF_BASE", 1))
+    tope = float(getattr(settings, "SYSSTOCK_TASKS_BACKOFF_MAX", 300))
+    return min(tope, base * 2 ** max(intento - 1, 0)) * random.uniform(0.8, 1.2)
+
+
+# =========================
+#  Métricas (por proceso)
+# =========================
+class Metricas:
+    """Contadores por (tarea, resultado): encolada, duplicada, en_linea, ok, error, reintento, fallida."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = defaultdict(int)
+        self._duracion = defaultdict(lambda: [0.0, 0])
+
+    def contar(self, nombre, resultado):
+        with self._lock:
+            self._contadores[(nombre, resultado)] += 1
+
+    def duracion(self, nombre, segundos):
+        with self._lock:
+            d = self._duracion[nombre]
+            d[0] += segundos
+            d[1] += 1
+
+    def exportar(self):
+        with self._lock:
+            contadores = dict(self._contadores)
+            duracion = {k: tuple(v) for k, v in self._duracion.items()}
+        out = [
+            "# HELP sysstock_tareas_total Tareas en segundo plano por resultado.",
+            "# TYPE sysstock_tareas_total counter",
+        ]
+        out += [
+            f'sysstock_tareas_total{{tarea="{n}",resultado="{r}"}} {v}'
+            for (n, r), v in sorted(contadores.items())
+        ]
+        out += [
+            "# HELP sysstock_tareas_duracion_seconds Tiempo de ejecución de las tareas.",
+            "# TYPE sysstock_tareas_duracion_seconds summary",
+        ]
+        for n, (suma, cuenta) in sorted(duracion.items()):
+            out += [
+                f'sysstock_tareas_duracion_seconds_sum{{tarea="{n}"}} {suma:.6f}',
+                f'sysstock_tareas_duracion_seconds_count{{tarea="{n}"}} {cuenta}',
+            ]
+        return out
+
+
+METRICAS = Metricas()
+
+
+def ejecutar(nombre, args=(), kwargs=None):
+    """Corre la tarea una vez (mide y cuenta ok/error); las excepciones se propagan."""
+    func, _ = _tarea(nombre)
+    t0 = time.perf_counter()
+    try:
+        func(*args, **(kwargs or {}))
+    except Exception:
+        METRICAS.contar(nombre, "error")
+        raise
+    else:
+        METRICAS.contar(nombre, "ok")
+    finally:
+        METRICAS.duracion(nombre, time.perf_counter() - t0)
+
+
+# =========================
+#  Encolar
+# =========================
+def encolar(nombre, *args, clave=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Encola la tarea para después del commit (o en la transacción, con "db").
+    Fuera de una transacción sale en el acto.
+    """
+    _tarea(nombre)  # falla ya, no en el worker
+    modo = backend()
+    if modo == "db":
+        _encolar_db(nombre, args, kwargs, clave, using)
+    elif modo == "inmediato":
+        transaction.on_commit(partial(_inmediato, nombre, args, kwargs), using=using)
+    else:
+        transaction.on_commit(partial(LOCAL.poner, nombre, args, kwargs, clave), using=using)
+
+
+def _inmediato(nombre, args, kwargs):
+    try:
+        ejecutar(nombre, args, kwargs)
+    except Exception:
+        METRICAS.contar(nombre, "fallida")
+        logger.exception("Falló la tarea %s", nombre)
+
+
+# =========================
+#  Backend local (hilos del proceso)
+# =========================
+class _Local:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._cola = None
+        self._claves = OrderedDict()
+
+    def _arrancar(self):
+        # por proceso: después de un fork (gunicorn --preload) los hilos del padre no existen
+        if self._pid == os.getpid():
+            return
+        self._cola = queue.Queue(maxsize=int(getattr(settings, "SYSSTOCK_TASKS_QUEUE", 10000)))
+        self._claves.clear()
+        for i in range(int(getattr(settings, "SYSSTOCK_TASKS_WORKERS", 2))):
+            threading.Thread(target=self._loop, name=f"sysstock-tareas-{i}", daemon=True).start()
+        self._pid = os.getpid()
+
+    def poner(self, nombre, args, kwargs, clave=None, intento=0):
+        with self._lock:
+            self._arrancar()
+            if clave is not None and intento == 0:
+                if clave in self._claves:
+                    METRICAS.contar(nombre, "duplicada")
+                    return
+                self._claves[clave] = None
+                if len(self._claves) > int(getattr(settings, "SYSSTOCK_TASKS_CLAVES", 10000)):
+                    self._claves.popitem(last=False)
+            cola = self._cola
+        item = (nombre, args, kwargs, intento)
+        try:
+            cola.put_nowait(item)
+        except queue.Full:
+            METRICAS.contar(nombre, "en_linea")
+            self._correr(item)
+            return
+        if intento == 0:
+            METRICAS.contar(nombre, "encolada")
+
+    def _loop(self):
+        cola = self._cola
+        while True:
+            item = cola.get()
+            try:
+                self._correr(item)
+            finally:
+                cola.task_done()
+                close_old_connections()  # como al terminar un request: conexiones vencidas o rotas
+
+    def _correr(self, item):
+        nombre, args, kwargs, intento = item
+        try:
+            ejecutar(nombre, args, kwargs)
+        except Exception as e:
+            _, reintentos = _tarea(nombre)
+            if intento < reintentos:
+                METRICAS.contar(nombre, "reintento")
+                logger.warning("Tarea %s falló (%s); reintento %s/%s", nombre, e, intento + 1, reintentos)
+                espera = threading.Timer(backoff(intento + 1), self.poner, (nombre, args, kwargs, None, intento + 1))
+                espera.daemon = True
+                espera.start()
+            else:
+                METRICAS.contar(nombre, "fallida")
+                logger.exception("Tarea %s falló después de %s reintentos", nombre, reintentos)
+
+    def pendientes(self):
+        cola = self._cola
+        return cola.unfinished_tasks if cola is not None and self._pid == os.getpid() else 0
+
+    def drenar(self, timeout=5.0):
+        """Espera (hasta timeout) a que la cola se vacíe; True si terminó todo."""
+        limite = time.monotonic() + timeout
+        while self.pendientes():
+            if time.monotonic() >= limite:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+LOCAL = _Local()
+
+
+# =========================
+#  Backend db (BackgroundTask + run_tasks)
+# =========================
+def _encolar_db(nombre, args, kwargs, clave, using):
+    from .models import BackgroundTask
+
+    _, reintentos = _tarea(nombre)
+    # ignore_conflicts: una clave repetida no inserta (ni rompe la transacción del llamador)
+    BackgroundTask.objects.using(using).bulk_create(
+        [BackgroundTask(nombre=nombre, args=list(args), kwargs=kwargs, clave=clave, max_intentos=reintentos + 1)],
+        ignore_conflicts=clave is not None,
+    )
+    METRICAS.contar(nombre, "encolada")
+
+
+def tomar_pendientes(lote, lease, using=DEFAULT_DB_ALIAS):
+    """Reserva hasta `lote` tareas vencidas (lease por fila, UPDATE condicional). Devuelve las tomadas."""
+    from .models import BackgroundTask
+
+    ahora = timezone.now()
+    libres = Q(tomada_hasta__isnull=True) | Q(tomada_hasta__lt=ahora)
+    candidatas = list(
+        BackgroundTask.objects.using(using)
+        .filter(libres, estado=BackgroundTask.PENDIENTE, proximo_intento__lte=ahora)
+        .order_by("proximo_intento", "id")
+        .values_list("id", flat=True)[:lote]
+    )
+    tomadas = [
+        pk for pk in candidatas
+        if BackgroundTask.objects.using(using).filter(libres, pk=pk, estado=BackgroundTask.PENDIENTE)
+        .update(tomada_hasta=ahora + timedelta(seconds=lease))
+    ]
+    return list(BackgroundTask.objects.using(using).filter(pk__in=tomadas).order_by("proximo_intento", "id"))
+
+
+def correr_tomada(t, using=DEFAULT_DB_ALIAS):
+    """Ejecuta una tarea tomada y guarda el resultado; True si terminó bien."""
+    from .models import BackgroundTask
+
+    t.intentos += 1
+    try:
+        ejecutar(t.nombre, t.args, t.kwargs)
+    except Exception as e:
+        t.ultimo_error = f"{type(e).__name__}: {e}"[:1000]
+        if isinstance(e, TareaDesconocida) or t.intentos >= t.max_intentos:
+            t.estado = BackgroundTask.FALLIDA
+            t.terminada_en = timezone.now()
+            METRICAS.contar(t.nombre, "fallida")
+            logger.exception("Tarea %s #%s falló después de %s intentos", t.nombre, t.pk, t.intentos)
+        else:
+            t.proximo_intento = timezone.now() + timedelta(seconds=backoff(t.intentos))
+            METRICAS.contar(t.nombre, "reintento")
+            logger.warning("Tarea %s #%s falló (%s); intento %s/%s", t.nombre, t.pk, e, t.intentos, t.max_intentos)
+        ok = False
+    else:
+        t.estado = BackgroundTask.HECHA
+        t.terminada_en = timezone.now()
+        t.ultimo_error = ""
+        ok = True
+    t.tomada_hasta = None
+    t.save(
+        using=using,
+        update_fields=["estado", "intentos", "proximo_intento", "tomada_hasta", "ultimo_error", "terminada_en"],
+    )
+    return ok
+
+
+def estado_db(using=DEFAULT_DB_ALIAS):
+    """{(nombre, estado): cantidad}."""
+    from .models import BackgroundTask
+
+    return {
+        (r["nombre"], r["estado"]): r["n"]
+        for r in BackgroundTask.objects.using(using).values("nombre", "estado").annotate(n=Count("id")).order_by()
+    }
+
+
+def purgar(dias, using=DEFAULT_DB_ALIAS):
+    """Borra las tareas hechas hace más de `dias`; devuelve la cantidad."""
+    from .models import BackgroundTask
+
+    return (
+        BackgroundTask.objects.using(using)
+        .filter(estado=BackgroundTask.HECHA, terminada_en__lt=timezone.now() - timedelta(days=dias))
+        .delete()[0]
+    )
+
+
+def exportar_metricas():
+    """Líneas Prometheus de las tareas (se agregan a /metrics)."""
+    out = METRICAS.exportar()
+    out += [
+        "# HELP sysstock_tareas_en_cola Tareas en la cola local de este proceso (incluye las en curso).",
+        "# TYPE sysstock_tareas_en_cola gauge",
+        f"sysstock_tareas_en_cola {LOCAL.pendientes()}",
+    ]
+    if backend() == "db":
+        from .models import BackgroundTask
+
+        pendientes = BackgroundTask.objects.filter(estado=BackgroundTask.PENDIENTE).count()
+        out += [
+            "# HELP sysstock_tareas_pendientes Tareas pendientes en la tabla (backend db).",
+            "# TYPE sysstock_tareas_pendientes gauge",
+            f"sysstock_tareas_pendientes {pendientes}",
+        ]
+    return "\n".join(out) + "\n"
@@ -0,0 +1,44 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from ..models import Branch, Product, StockBalance, StockMovement
+from ..serializers import StockMovementSerializer
+
+
+class EgresoMovimientoTests(APITestCase):
+    """Los OUT de /api/movimientos/ no pueden dejar el saldo negativo."""
+
+    def setUp(self):
+        admin = get_user_model().objects.create_user("adm", "a@a.com", "x", rol="admin")
+        self.sucursal = Branch.objects.create(name="Central", owner=admin)
+        self.producto = Product.objects.create(nombre="Yerba", sku="YT-1", precio=100, sucursal=self.sucursal)
+        self.client.force_authenticate(admin)
+        self.assertEqual(self._mover("IN", 5).status_code, 201)
+
+    def _mover(self, tipo, cantidad):
+        return self.client.post("/api/movimientos/", {
+            "producto": self.producto.id, "sucursal": self.sucursal.id, "tipo": tipo, "cantidad": cantidad,
+        }, format="json")
+
+    def _saldo(self):
+        return StockBalance.objects.get(producto=self.producto, sucursal=self.sucursal).cantidad
+
+    def test_egreso_mayor_al_saldo(self):
+        r = self._mover("OUT", 6)
+        self.assertEqual(r.status_code, 400)
+        self.assertIn("cantidad", r.json())
+        self.assertEqual(self._saldo(), 5)
+
+    def test_egreso_revalidado_con_el_saldo_bloqueado(self):
+        # otro egreso ganó la carrera después del chequeo rápido de validate():
+        # el saldo bloqueado dentro de la transacción lo rechaza y no queda nada aplicado
+        with mock.patch.object(StockMovementSerializer, "validate", lambda self, attrs: attrs):
+            r = self._mover("OUT", 6)
+        self.assertEqual(r.status_code, 400, r.content)
+        self.assertEqual(self._saldo(), 5)
+        self.assertFalse(StockMovement.objects.filter(tipo="OUT").exists())
+
+        self.assertEqual(self._mover("OUT", 5).status_code, 201)
+        self.assertEqual(self._saldo(), 0)
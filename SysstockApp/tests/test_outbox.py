@@ -0,0 +1,273 @@
+import io
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from .. import outbox
+from ..models import Branch, OutboxEvent, Product, StockMovement, WebhookEndpoint
+
+
+class _Receptor:
+    """Servidor HTTP local que hace de receptor de webhooks: guarda cada POST y responde según 'respuestas'."""
+
+    def __init__(self):
+        self.recibidos = []
+        self.respuestas = []  # status por POST, en orden; vacío = 200
+        receptor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                receptor.recibidos.append((self.path, dict(self.headers), body))
+                status = receptor.respuestas.pop(0) if receptor.respuestas else 200
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.hilo = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.hilo.start()
+
+    def cerrar(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def ids(self, path=None):
+        """ids de evento de cada POST recibido (opcionalmente solo los de 'path')."""
+        return [
+            [ev["id"] for ev in json.loads(body)["eventos"]]
+            for p, _, body in self.recibidos if path is None or p == path
+        ]
+
+
+# receptor en 127.0.0.1 por http: solo con las direcciones privadas permitidas
+@override_settings(
+    SYSSTOCK_WEBHOOK_ALLOW_PRIVATE=True, SYSSTOCK_OUTBOX_ASENTAMIENTO=0, SYSSTOCK_WEBHOOK_LOTE=2,
+    SYSSTOCK_WEBHOOK_BACKOFF_BASE=2, SYSSTOCK_WEBHOOK_BACKOFF_MAX=600,
+)
+class EntregaWebhooksTests(TestCase):
+    def setUp(self):
+        self.receptor = _Receptor()
+        self.addCleanup(self.receptor.cerrar)
+        self.admin = get_user_model().objects.create_user("adm", "a@a.com", "x", rol="admin")
+        self.sucursal = Branch.objects.create(name="Central", owner=self.admin)
+
+    def _eventos(self, n, owner=None):
+        owner = owner or self.admin
+        outbox.registrar([(owner.id, self.sucursal.id, "venta.creada", {"n": i}) for i in range(n)])
+        return list(OutboxEvent.objects.filter(owner=owner).order_by("id").values_list("id", flat=True))
+
+    def _endpoint(self, path="/hook", owner=None):
+        return WebhookEndpoint.objects.create(
+            owner=owner or self.admin, url=self.receptor.url + path, secreto=outbox.nuevo_secreto()
+        )
+
+    def test_lotes_en_orden_y_firmados(self):
+        ids = self._eventos(5)
+        ep = self._endpoint()
+
+        self.assertEqual(outbox.entregar(ep.id), (5, 0))
+
+        self.assertEqual(self.receptor.ids(), [ids[0:2], ids[2:4], ids[4:5]])
+        _, headers, body = self.receptor.recibidos[0]
+        self.assertEqual(headers["X-Sysstock-Lote"], f"{ids[0]}-{ids[1]}")
+        self.assertEqual(
+            headers["X-Sysstock-Firma"], outbox.firma(ep.secreto, headers["X-Sysstock-Timestamp"], body)
+        )
+        ep.refresh_from_db()
+        self.assertEqual((ep.cursor, ep.intentos, ep.tomado_hasta), (ids[-1], 0, None))
+
+    def test_reintenta_el_mismo_lote_con_backoff(self):
+        ids = self._eventos(3)
+        ep = self._endpoint()
+        self.receptor.respuestas = [503]
+
+        antes = timezone.now()
+        with self.assertLogs("sysstock.webhooks", "WARNING"):
+            self.assertEqual(outbox.entregar(ep.id), (0, 1))
+        ep.refresh_from_db()
+        self.assertEqual((ep.cursor, ep.intentos, ep.ultimo_error), (0, 1, "HTTP 503"))
+        # base 2s ±20% de jitter
+        self.assertGreaterEqual(ep.proximo_intento, antes + timedelta(seconds=1.6))
+        self.assertLessEqual(ep.proximo_intento, timezone.now() + timedelta(seconds=2.4))
+        self.assertNotIn(ep.id, outbox.endpoints_a_entregar())
+
+        WebhookEndpoint.objects.filter(pk=ep.pk).update(proximo_intento=timezone.now())
+        self.assertEqual(outbox.endpoints_a_entregar(), [ep.id])
+        self.assertEqual(outbox.entregar(ep.id), (3, 0))
+        # el lote fallido sale de nuevo, entero, antes que el siguiente
+        self.assertEqual(self.receptor.ids(), [ids[0:2], ids[0:2], ids[2:3]])
+        ep.refresh_from_db()
+        self.assertEqual((ep.cursor, ep.intentos, ep.proximo_intento), (ids[-1], 0, None))
+
+    def test_backoff_exponencial_con_tope(self):
+        with mock.patch("SysstockApp.outbox.random.uniform", return_value=1):
+            self.assertEqual([outbox.backoff(n) for n in (1, 2, 3, 4)], [2, 4, 8, 16])
+            self.assertEqual(outbox.backoff(20), 600)
+
+    def test_410_desactiva_el_endpoint(self):
+        self._eventos(1)
+        ep = self._endpoint()
+        self.receptor.respuestas = [410]
+        with self.assertLogs("sysstock.webhooks", "WARNING"):
+            outbox.entregar(ep.id)
+        ep.refresh_from_db()
+        self.assertFalse(ep.activo)
+
+    def test_un_endpoint_caido_no_frena_a_los_demas(self):
+        ids = self._eventos(4)
+        caido = self._endpoint("/caido")
+        sano = self._endpoint("/sano")
+        self.receptor.respuestas = [500]  # el primer POST es el del endpoint caído (orden por id)
+
+        with self.assertLogs("sysstock.webhooks", "WARNING"):
+            for pk in outbox.endpoints_a_entregar():
+                outbox.entregar(pk)
+        self.assertEqual(self.receptor.ids("/sano"), [ids[0:2], ids[2:4]])
+        self.assertEqual(self.receptor.ids("/caido"), [ids[0:2]])
+
+        WebhookEndpoint.objects.filter(pk=caido.pk).update(proximo_intento=None)
+        outbox.entregar(caido.pk)
+        self.assertEqual(self.receptor.ids("/caido"), [ids[0:2], ids[0:2], ids[2:4]])
+        sano.refresh_from_db()
+        caido.refresh_from_db()
+        self.assertEqual((sano.cursor, caido.cursor), (ids[-1], ids[-1]))
+
+    def test_solo_eventos_de_su_empresa_y_sus_tipos(self):
+        otro = get_user_model().objects.create_user("otro", "o@a.com", "x", rol="admin")
+        self._eventos(2, owner=otro)
+        ids = self._eventos(2)
+        outbox.registrar([(self.admin.id, self.sucursal.id, "stock.movimiento", {})])
+        ep = self._endpoint()
+        ep.tipos = ["venta.creada"]
+        ep.save()
+
+        outbox.entregar(ep.id)
+        self.assertEqual(self.receptor.ids(), [ids])
+        ep.refresh_from_db()
+        # el cursor pasa también sobre los tipos que no le tocan
+        self.assertEqual(ep.cursor, OutboxEvent.objects.filter(owner=self.admin).latest("id").id)
+
+    def test_lease_de_otro_worker(self):
+        self._eventos(1)
+        ep = self._endpoint()
+        WebhookEndpoint.objects.filter(pk=ep.pk).update(tomado_hasta=timezone.now() + timedelta(seconds=60))
+        self.assertIsNone(outbox.entregar(ep.id))
+        self.assertEqual(self.receptor.recibidos, [])
+
+
+@override_settings(SYSSTOCK_WEBHOOK_ALLOW_PRIVATE=True, SYSSTOCK_OUTBOX_ASENTAMIENTO=0)
+class DeliverWebhooksCommandTests(TransactionTestCase):
+    """El worker (deliver_webhooks --una-vez) entrega desde su pool de hilos."""
+
+    def test_una_vez(self):
+        receptor = _Receptor()
+        self.addCleanup(receptor.cerrar)
+        admin = get_user_model().objects.create_user("adm", "a@a.com", "x", rol="admin")
+        outbox.registrar([(admin.id, None, "venta.creada", {"n": i}) for i in range(3)])
+        ep = WebhookEndpoint.objects.create(owner=admin, url=receptor.url + "/hook", secreto="s")
+
+        out = io.StringIO()
+        call_command("deliver_webhooks", "--una-vez", "--lote", "2", stdout=out)
+
+        self.assertIn("3 eventos entregados, 0 lotes fallidos", out.getvalue())
+        self.assertEqual([len(lote) for lote in receptor.ids()], [2, 1])
+        ep.refresh_from_db()
+        self.assertEqual(ep.cursor, OutboxEvent.objects.latest("id").id)
+
+
+class DestinosWebhooksTests(APITestCase):
+    """SSRF: las URLs las carga cada empresa y el POST sale desde nuestra red."""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_user("adm", "a@a.com", "x", rol="admin")
+        self.client.force_authenticate(self.admin)
+
+    def test_alta_rechaza_destinos_internos(self):
+        for url in (
+            "http://hooks.example.com/x",
+            "https://127.0.0.1/x",
+            "https://localhost/x",
+            "https://api.localhost/x",
+            "https://169.254.169.254/latest/meta-data/",
+            "https://10.0.0.5/x",
+            "https://[::ffff:127.0.0.1]/x",
+        ):
+            with self.subTest(url=url):
+                r = self.client.post("/api/webhooks/", {"url": url}, format="json")
+                self.assertEqual(r.status_code, 400, r.content)
+                self.assertIn("url", r.json())
+        r = self.client.post("/api/webhooks/", {"url": "https://hooks.example.com/x"}, format="json")
+        self.assertEqual(r.status_code, 201, r.content)
+
+    @override_settings(SYSSTOCK_WEBHOOK_HOSTS=[".example.com"])
+    def test_lista_de_hosts(self):
+        self.assertIsNone(outbox.validar_url("https://hooks.example.com/x"))
+        self.assertIsNotNone(outbox.validar_url("https://example.org/x"))
+
+    def test_envio_no_conecta_a_nombres_que_resuelven_a_ips_internas(self):
+        receptor = _Receptor()
+        self.addCleanup(receptor.cerrar)
+        ep = WebhookEndpoint(id=1, owner=self.admin, secreto="s",
+                             url=f"https://hooks.example.com:{receptor.server.server_port}/x")
+        ev = OutboxEvent(id=1, tipo="venta.creada", datos={}, creado_en=timezone.now())
+        resuelto = [(2, 1, 6, "", ("127.0.0.1", receptor.server.server_port))]
+        with mock.patch("SysstockApp.outbox.socket.getaddrinfo", return_value=resuelto):
+            with self.assertRaisesMessage(outbox.EntregaFallida, "Destino no permitido"):
+                outbox.enviar(ep, [ev])
+        self.assertEqual(receptor.recibidos, [])
+
+    def test_http_plano_no_sale(self):
+        receptor = _Receptor()
+        self.addCleanup(receptor.cerrar)
+        ep = WebhookEndpoint(id=1, owner=self.admin, secreto="s", url=receptor.url + "/x")
+        ev = OutboxEvent(id=1, tipo="venta.creada", datos={}, creado_en=timezone.now())
+        with self.assertRaises(outbox.EntregaFallida):
+            outbox.enviar(ep, [ev])
+        self.assertEqual(receptor.recibidos, [])
+
+
+class EventosMovimientoTests(APITestCase):
+    """movimiento_id de los eventos stock.movimiento apunta al movimiento insertado."""
+
+    def setUp(self):
+        admin = get_user_model().objects.create_user("adm", "a@a.com", "x", rol="admin")
+        self.sucursal = Branch.objects.create(name="Central", owner=admin)
+        self.productos = [
+            Product.objects.create(nombre=f"Yerba {i}", sku=f"YT-{i}", precio=100, sucursal=self.sucursal)
+            for i in range(3)
+        ]
+        for p in self.productos:
+            StockMovement.objects.create(producto=p, sucursal=self.sucursal, tipo="IN", cantidad=10)
+        self.client.force_authenticate(admin)
+
+    def _vender(self):
+        r = self.client.post("/api/ventas/", {
+            "sucursal": self.sucursal.id,
+            "items": [{"producto": p.id, "cantidad": 2} for p in self.productos],
+        }, format="json")
+        self.assertEqual(r.status_code, 201, r.content)
+        salidas = dict(StockMovement.objects.filter(tipo="OUT").values_list("producto_id", "id"))
+        eventos = OutboxEvent.objects.filter(tipo="stock.movimiento", datos__tipo="OUT")
+        self.assertEqual({ev.datos["producto_id"]: ev.datos["movimiento_id"] for ev in eventos}, salidas)
+
+    def test_venta(self):
+        self._vender()
+
+    def test_venta_sin_returning_en_bulk_insert(self):
+        # como MySQL: bulk_create no devuelve los ids
+        with mock.patch.object(type(connection.features), "can_return_rows_from_bulk_insert", False):
+            self._vender()
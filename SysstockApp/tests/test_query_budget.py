@@ -0,0 +1,338 @@
+"""
+Presupuesto de queries por endpoint: que ningún cambio vuelva a meter N+1 en
+ProductSerializer, SaleSerializer, los reportes de BranchViewSet, etc.
+
+Arma dos datasets con seed_scale (chico y FACTOR veces más grande) y llama cada
+ruta de SysstockApp/urls.py y AccountAdmin/urls.py como superuser, admin y
+limMerchant: los GET descubiertos de los resolvers y las escrituras principales
+(ventas, movimientos, productos, transferencias, precios, conteo) con payloads
+que crecen con el dataset. Cada ruta / rol es un subTest que falla si sus
+queries crecen con las filas o superan las del baseline (perf/query_budget.json).
+
+- Las queries se cuentan en todas las conexiones (envolver_sql): las vistas
+  async consultan desde el pool de asincrono, que assertNumQueries no ve.
+  Por eso también es TransactionTestCase: el pool no ve datos sin confirmar.
+- Al terminar escribe cantidades y tiempos (mediana) en SYSSTOCK_QUERY_BUDGET_SALIDA
+  (por defecto el mismo perf/query_budget.json, claves ordenadas para diffear en CI).
+- Tarda: se puede saltear con --exclude-tag=perf.
+"""
+import io
+import json
+import logging
+import os
+import re
+import statistics
+import threading
+import time
+from datetime import timedelta
+from itertools import count
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings, tag
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ..asincrono import envolver_sql
+from ..models import Branch, Category, Product, Sale, StockMovement, Transfer, WebhookEndpoint
+
+User = get_user_model()
+
+BASELINE = Path(settings.BASE_DIR) / "perf" / "query_budget.json"
+URLCONFS = ("SysstockApp.urls", "AccountAdmin.urls")
+ROLES = ("superuser", "admin", "limMerchant")
+METODOS = ("get", "post", "put", "patch", "delete")
+
+# dataset chico; el grande multiplica productos y ventas por FACTOR
+PRODUCTOS = 30
+VENTAS_DIA = 8
+DIAS = 14
+FACTOR = 4
+REPETICIONES = 3  # por GET (tiempo = mediana)
+
+# objeto que va en {pk} según el prefijo del nombre de la ruta
+PK_POR_RUTA = {
+    "admin-users": "empleado",
+    "sucursales": "sucursal",
+    "async-sucursal": "sucursal",
+    "categorias": "categoria",
+    "productos": "producto",
+    "movimientos": "movimiento",
+    "ventas": "venta",
+    "transferencias": "transferencia",
+    "webhooks": "webhook",
+}
+
+# query string por nombre de ruta (el resto se llama sin parámetros)
+PARAMS = {
+    "sucursales-ventas-rango": lambda c: {"desde": c["desde"], "hasta": c["hasta"]},
+    "sucursales-ventas-por-producto": lambda c: {"desde": c["desde"], "hasta": c["hasta"]},
+    "sucursales-ventas-por-dia": lambda c: {"desde": c["desde"], "hasta": c["hasta"]},
+    "sucursales-ventas-export-xlsx": lambda c: {"desde": c["desde"], "hasta": c["hasta"]},
+    "productos-search": lambda c: {"q": "sol"},
+    "kardex-producto": lambda c: {"sucursal": c["sucursal"]},
+    "kardex-producto-xlsx": lambda c: {"sucursal": c["sucursal"]},
+}
+
+
+# escrituras: (nombre de ruta, método, kwargs de la URL, payload(ctx, escala));
+# el payload crece con la escala para detectar N+1 por ítem
+def _venta(c, escala):
+    return {"sucursal": c["sucursal"], "items": [{"producto": p, "cantidad": 1} for p in c["productos"][: 3 * escala]]}
+
+
+def _transferencia(c, escala):
+    return {
+        "origen": c["sucursal"], "destino": c["otra_sucursal"], "motivo": "query budget",
+        "items": [{"sku": s, "cantidad": 1} for s in c["skus"][: 3 * escala]],
+    }
+
+
+_SKUS = count(1)
+
+
+def _producto(c, escala):
+    n = next(_SKUS)  # nombre y SKU únicos: se crea una vez por rol
+    return {"nombre": f"Producto budget {n}", "sku": f"QB-{n}", "precio": "10",
+            "sucursal": c["sucursal"], "categoria": c["categoria"]}
+
+
+ESCRITURAS = [
+    ("ventas-list", "post", {}, _venta),
+    ("movimientos-list", "post", {}, lambda c, e: {
+        "producto": c["producto"], "sucursal": c["sucursal"], "tipo": "IN", "cantidad": 5,
+    }),
+    ("productos-list", "post", {}, _producto),
+    ("transferencias-list", "post", {}, _transferencia),
+    ("productos-bulk-price", "post", {}, lambda c, e: {
+        "porcentaje": "1", "sucursal": c["sucursal"], "skus": c["skus"][: 3 * e],
+    }),
+    ("sucursales-conteo", "post", {"pk": "sucursal"}, lambda c, e: {
+        "items": [{"sku": s, "cantidad": 7} for s in c["skus"][: 3 * e]],
+    }),
+    ("webhooks-list", "post", {}, lambda c, e: {"url": "https://hooks.example.com/sysstock", "tipos": ["venta.creada"]}),
+]
+
+
+def _legible(template):
+    """'^sucursales/(?P<pk>[^/.]+)/resumen/$' -> '/api/sucursales/{pk}/resumen/'"""
+    template = re.sub(r"\(\?P<(\w+)>[^)]*\)", r"{\1}", template)
+    template = re.sub(r"<(?:\w+:)?(\w+)>", r"{\1}", template)
+    return "/api/" + template.replace("^", "").replace("$", "")
+
+
+def _rutas():
+    """(nombre, template, URLPattern, métodos) de cada ruta de URLCONFS, sin los sufijos .<format>."""
+    def recorrer(patrones, prefijo):
+        for p in patrones:
+            if isinstance(p, URLResolver):
+                yield from recorrer(p.url_patterns, prefijo + str(p.pattern))
+            else:
+                yield prefijo + str(p.pattern), p
+
+    vistas = set()
+    for urlconf in URLCONFS:
+        for template, p in recorrer(get_resolver(urlconf).url_patterns, ""):
+            if p.name is None or "format" in p.pattern.regex.groupindex or p.name in vistas:
+                continue
+            vistas.add(p.name)
+            callback = p.callback
+            acciones = getattr(callback, "actions", None)
+            if acciones:
+                metodos = sorted(acciones)
+            else:
+                cls = getattr(callback, "cls", None) or getattr(callback, "view_class", None)
+                # vistas Django planas (las async): solo GET
+                metodos = [m for m in METODOS if hasattr(cls, m)] if cls is not None else ["get"]
+            yield p.name, _legible(template), p, metodos
+
+
+class _Contador:
+    """execute_wrapper que solo cuenta queries (todas las conexiones)."""
+
+    def __init__(self):
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.queries += 1
+        return execute(sql, params, many, context)
+
+
+# =========================
+#  Dataset y medición
+# =========================
+def _dataset(escala):
+    call_command("flush", interactive=False, verbosity=0)
+    call_command(
+        "seed_scale", prefijo="qb", empresas=2, sucursales=2, seed=1234,
+        productos=PRODUCTOS * escala, ventas_dia=VENTAS_DIA * escala, dias=DIAS,
+        stdout=io.StringIO(),
+    )
+    admin = User.objects.get(username="qb_admin_0")
+    empleado = User.objects.get(username="qb_emp_0_0")
+    sucursal = empleado.sucursal
+    productos = list(Product.objects.filter(sucursal=sucursal).order_by("id").values_list("id", "sku"))
+    hoy = timezone.localdate()
+    return {
+        "usuarios": {
+            "superuser": User.objects.create_superuser("qb_su", "qb_su@mail.com", "x"),
+            "admin": admin,
+            "limMerchant": empleado,
+        },
+        "sucursal": sucursal.id,
+        "otra_sucursal": Branch.objects.filter(owner=admin).exclude(id=sucursal.id).order_by("id")[0].id,
+        "empleado": empleado.id,
+        "categoria": Category.objects.filter(owner=admin).order_by("id")[0].id,
+        "productos": [p for p, _ in productos],
+        "skus": [s for _, s in productos],
+        "producto": productos[0][0],
+        "desde": (hoy - timedelta(days=DIAS)).isoformat(),
+        "hasta": hoy.isoformat(),
+    }
+
+
+def _objetos_creados(ctx):
+    """ids de venta / movimiento / transferencia / webhook (existen después de las escrituras)."""
+    ctx["venta"] = Sale.objects.filter(sucursal_id=ctx["sucursal"]).order_by("-id").values_list("id", flat=True)[0]
+    ctx["movimiento"] = (
+        StockMovement.objects.filter(sucursal_id=ctx["sucursal"]).order_by("-id").values_list("id", flat=True)[0]
+    )
+    ctx["transferencia"] = (
+        Transfer.objects.filter(origen_id=ctx["sucursal"]).order_by("-id").values_list("id", flat=True).first()
+    )
+    ctx["webhook"] = (
+        WebhookEndpoint.objects.filter(owner=ctx["usuarios"]["admin"]).values_list("id", flat=True).first()
+    )
+
+
+def _medir(client, metodo, url, datos, repeticiones):
+    """Devuelve (status, queries, ms): queries = máximo de las corridas, ms = mediana."""
+    queries, tiempos, status = 0, [], None
+    for _ in range(repeticiones):
+        contador = _Contador()
+        # envolver_sql: cuenta también las queries que las vistas async corren en el pool
+        with envolver_sql(contador):
+            t0 = time.perf_counter()
+            if metodo == "get":
+                resp = client.get(url, datos)
+            else:
+                resp = getattr(client, metodo)(url, datos, format="json")
+            tiempos.append((time.perf_counter() - t0) * 1000)
+        status = resp.status_code
+        queries = max(queries, contador.queries)
+    return status, queries, round(statistics.median(tiempos), 2)
+
+
+def _registrar(resultados, clave, rol, escala, medicion):
+    status, queries, ms = medicion
+    r = resultados.setdefault(clave, {}).setdefault(rol, {"status": {}, "queries": {}, "ms": {}})
+    r["status"][str(escala)] = status
+    r["queries"][str(escala)] = queries
+    r["ms"][str(escala)] = ms
+
+
+def _url(nombre, kwargs_pattern, ctx):
+    kwargs = {}
+    for k in kwargs_pattern:
+        if k == "pk":
+            objeto = next((v for pre, v in PK_POR_RUTA.items() if nombre.startswith(pre + "-")), None)
+            valor = ctx.get(objeto) if objeto else None
+        elif k == "producto_id":
+            valor = ctx["producto"]
+        else:
+            valor = "inexistente"
+        if valor is None:
+            return None
+        kwargs[k] = valor
+    return reverse(nombre, kwargs=kwargs)
+
+
+def _cliente(usuario):
+    client = APIClient()
+    client.force_authenticate(usuario)
+    return client
+
+
+def _medir_todo(ctx, escala, resultados):
+    rutas = list(_rutas())
+    templates = {nombre: template for nombre, template, _, _ in rutas}
+
+    # escrituras primero (dejan ventas / transferencias para los detalles)
+    for nombre, metodo, kwargs, payload in ESCRITURAS:
+        if nombre not in templates:
+            continue
+        url = reverse(nombre, kwargs={k: ctx[v] for k, v in kwargs.items()})
+        # calentamiento: caches por proceso (p.ej. el índice FTS de search.py) fuera de la cuenta
+        _medir(_cliente(ctx["usuarios"]["superuser"]), metodo, url, payload(ctx, escala), 1)
+        for rol in ROLES:
+            medicion = _medir(_cliente(ctx["usuarios"][rol]), metodo, url, payload(ctx, escala), 1)
+            _registrar(resultados, f"{metodo.upper()} {templates[nombre]}", rol, escala, medicion)
+    _objetos_creados(ctx)
+
+    for nombre, template, pattern, metodos in rutas:
+        if "get" not in metodos:
+            continue
+        url = _url(nombre, pattern.pattern.regex.groupindex, ctx)
+        if url is None:
+            continue
+        params = PARAMS.get(nombre, lambda c: {})(ctx)
+        for rol in ROLES:
+            client = _cliente(ctx["usuarios"][rol])
+            _medir(client, "get", url, params, 1)  # calentamiento (caches, imports)
+            medicion = _medir(client, "get", url, params, REPETICIONES)
+            _registrar(resultados, f"GET {template}", rol, escala, medicion)
+
+
+def _escribir(resultados):
+    salida = Path(os.environ.get("SYSSTOCK_QUERY_BUDGET_SALIDA") or BASELINE)
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    datos = {
+        "escalas": [1, FACTOR],
+        "dataset": {"productos": PRODUCTOS, "ventas_dia": VENTAS_DIA, "dias": DIAS},
+        "rutas": resultados,
+    }
+    salida.write_text(json.dumps(datos, indent=2, sort_keys=True, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+# =========================
+#  Test
+# =========================
+@tag("perf")
+# sin EXPLAIN de lentas ni perfiles: agregarían queries a la cuenta; sin límites: 429
+@override_settings(SYSSTOCK_SLOW_QUERY_MS=None, SYSSTOCK_PROFILING_ENABLED=False, SYSSTOCK_RATE_LIMIT_ENABLED=False)
+class PresupuestoQueriesTests(TransactionTestCase):
+    maxDiff = None
+
+    def setUp(self):
+        # los 403/404 esperados por rol no van al log de django.request
+        logger = logging.getLogger("django.request")
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.ERROR)
+        try:
+            self.baseline = json.loads(BASELINE.read_text(encoding="utf-8"))["rutas"]
+        except (OSError, ValueError, KeyError):
+            self.baseline = {}
+
+    def test_queries_por_ruta(self):
+        resultados = {}
+        for escala in (1, FACTOR):
+            _medir_todo(_dataset(escala), escala, resultados)
+        _escribir(resultados)
+
+        chica, grande = "1", str(FACTOR)
+        for clave, roles in sorted(resultados.items()):
+            for rol, r in sorted(roles.items()):
+                with self.subTest(ruta=clave, rol=rol):
+                    q = r["queries"]
+                    self.assertLess(max(r["status"].values()), 500)
+                    self.assertLessEqual(q[grande], q[chica], "las queries crecen con el dataset")
+                    anterior = self.baseline.get(clave, {}).get(rol)
+                    if anterior:
+                        self.assertLessEqual(
+                            max(q.values()), max(anterior["queries"].values()), "más queries que el baseline"
+                        )
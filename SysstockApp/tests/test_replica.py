@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import override_settings
+from rest_framework.test import APITransactionTestCase
+
+from .. import replica
+from ..models import Branch, Product
+
+
+@override_settings(
+    SYSSTOCK_REPLICA_MAX_LAG=None,
+    SYSSTOCK_RATE_LIMIT_ENABLED=False,
+    SYSSTOCK_COALESCE_ENABLED=False,
+)
+class ReplicaFijadoTests(APITransactionTestCase):
+    """
+    Read-your-writes con la réplica en un segundo archivo SQLite (copia vieja
+    del primario): el que escribió lee del primario aunque no mande cookies (JWT).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # la réplica se agrega después de preparar las bases de test: es un archivo
+        # aparte que no migra ni se vacía (la llena _sincronizar)
+        super().setUpClass()
+        cls._dir = tempfile.TemporaryDirectory()
+        config = {"ENGINE": "django.db.backends.sqlite3", "NAME": os.path.join(cls._dir.name, "replica.sqlite3")}
+        cls._bases = mock.patch.dict(settings.DATABASES, {replica.ALIAS: config})
+        cls._bases.start()
+        connections.settings[replica.ALIAS] = connections.configure_settings(
+            {DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS], replica.ALIAS: dict(config)}
+        )[replica.ALIAS]
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[replica.ALIAS].close()
+        del connections.settings[replica.ALIAS]
+        cls._bases.stop()
+        cls._dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_user("adm", "a@a.com", "x", rol="admin")
+        self.sucursal = Branch.objects.create(name="Central", owner=self.admin)
+        self.empleado = User.objects.create_user(
+            "emp", "e@a.com", "x", rol="limMerchant", sucursal=self.sucursal,
+        )
+        self.producto = Product.objects.create(nombre="Yerba", sku="YT-1", precio=100, sucursal=self.sucursal)
+        self._sincronizar()
+        cache.clear()
+
+    def _sincronizar(self):
+        """Copia el primario sobre la réplica (como sync_replica); después queda atrasada."""
+        primario = connections[DEFAULT_DB_ALIAS]
+        primario.ensure_connection()
+        connections[replica.ALIAS].close()
+        destino = sqlite3.connect(connections[replica.ALIAS].settings_dict["NAME"])
+        try:
+            with destino:
+                primario.connection.backup(destino)
+        finally:
+            destino.close()
+
+    def _jwt(self, user):
+        r = self.client.post("/api/token/", {"username": user.username, "password": "x"}, format="json")
+        self.assertEqual(r.status_code, 200, r.content)
+        return {"HTTP_AUTHORIZATION": f"Bearer {r.json()['access']}"}
+
+    def _kardex(self, credenciales):
+        self.client.cookies.clear()  # cliente JWT: sin cookies
+        r = self.client.get(
+            f"/api/productos/{self.producto.id}/kardex", {"sucursal": self.sucursal.id}, **credenciales,
+        )
+        self.assertEqual(r.status_code, 200, r.content)
+        return len(r.json()["items"])
+
+    def test_jwt_lee_lo_que_escribio(self):
+        admin, empleado = self._jwt(self.admin), self._jwt(self.empleado)
+        self.client.cookies.clear()
+        r = self.client.post("/api/movimientos/", {
+            "producto": self.producto.id, "sucursal": self.sucursal.id, "tipo": "IN", "cantidad": 5,
+        }, format="json", **admin)
+        self.assertEqual(r.status_code, 201, r.content)
+
+        self.assertEqual(self._kardex(admin), 1)     # fijado al primario por usuario
+        self.assertEqual(self._kardex(empleado), 0)  # no escribió: lee la réplica atrasada
+
+        cache.clear()  # vencido el fijado, el mismo usuario vuelve a la réplica
+        self.assertEqual(self._kardex(admin), 0)
+
+    def test_cookie_de_respaldo(self):
+        admin = self._jwt(self.admin)
+        r = self.client.post("/api/movimientos/", {
+            "producto": self.producto.id, "sucursal": self.sucursal.id, "tipo": "IN", "cantidad": 5,
+        }, format="json", **admin)
+        self.assertEqual(r.status_code, 201, r.content)
+        cookie = r.cookies[replica.COOKIE].value
+
+        cache.clear()
+        self.client.cookies[replica.COOKIE] = cookie
+        r = self.client.get(
+            f"/api/productos/{self.producto.id}/kardex", {"sucursal": self.sucursal.id}, **admin,
+        )
+        self.assertEqual(len(r.json()["items"]), 1)
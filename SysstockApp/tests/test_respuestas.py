@@ -0,0 +1,42 @@
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import skipIf
+
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from rest_framework.renderers import JSONRenderer
+
+from ..middleware import CompressionMiddleware, brotli
+from ..renderers import ORJSONRenderer
+
+
+class ORJSONRendererTests(TestCase):
+    def test_mismo_json_que_drf(self):
+        datos = {
+            "utc": datetime(2026, 1, 2, 3, 4, 5, 123456, tzinfo=dt_timezone.utc),
+            "offset": datetime(2026, 1, 2, 3, 4, 5, 120000, tzinfo=dt_timezone(timedelta(hours=-3))),
+            "naive": datetime(2026, 1, 2, 3, 4, 5),
+            "dia": date(2026, 1, 2),
+            "hora": time(1, 2, 3, 456789),
+            "monto": Decimal("10.50"),
+            7: "clave no str",
+        }
+        self.assertEqual(ORJSONRenderer().render(datos), JSONRenderer().render(datos))
+
+
+class CompressionMiddlewareTests(TestCase):
+    def _comprimir(self, **meta):
+        cuerpo = b'{"items": [' + b", ".join(b'{"sku": "YT-%d"}' % i for i in range(200)) + b"]}"
+        middleware = CompressionMiddleware(lambda request: HttpResponse(cuerpo, content_type="application/json"))
+        return middleware(RequestFactory().get("/api/productos/", **meta))
+
+    def test_gzip_con_relleno_aleatorio(self):
+        largos = {len(self._comprimir(HTTP_ACCEPT_ENCODING="gzip").content) for _ in range(20)}
+        self.assertGreater(len(largos), 1)
+
+    @skipIf(brotli is None, "brotli no está instalado")
+    def test_brotli_solo_sin_cookies(self):
+        r = self._comprimir(HTTP_ACCEPT_ENCODING="br, gzip")
+        self.assertEqual(r["Content-Encoding"], "br")
+        r = self._comprimir(HTTP_ACCEPT_ENCODING="br, gzip", HTTP_COOKIE="sessionid=abc")
+        self.assertEqual(r["Content-Encoding"], "gzip")
@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import override_settings
+from rest_framework.test import APITransactionTestCase
+
+from .. import shards
+from ..models import Branch, Product, TenantShard
+
+SHARDS = ("shard1", "shard2")
+
+
+@override_settings(SYSSTOCK_SHARDS=list(SHARDS), SYSSTOCK_RATE_LIMIT_ENABLED=False)
+class ShardsTests(APITransactionTestCase):
+    """
+    Sharding por empresa con cada shard en su archivo SQLite: A y B viven en
+    shard1, C en default; shard2 arranca vacío.
+    """
+
+    reset_sequences = True  # ids desde 1 en default, como en cada shard
+
+    @classmethod
+    def setUpClass(cls):
+        # los shards se agregan después de preparar las bases de test: cada test
+        # los arranca desde una copia del esquema migrado (_restaurar)
+        super().setUpClass()
+        cls._dir = tempfile.TemporaryDirectory()
+        config = {
+            a: {"ENGINE": "django.db.backends.sqlite3", "NAME": os.path.join(cls._dir.name, f"{a}.sqlite3")}
+            for a in SHARDS
+        }
+        cls._bases = mock.patch.dict(settings.DATABASES, config)
+        cls._bases.start()
+        configurados = connections.configure_settings(
+            {DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS], **{a: dict(c) for a, c in config.items()}}
+        )
+        for a in SHARDS:
+            connections.settings[a] = configurados[a]
+        cls._esquema = os.path.join(cls._dir.name, "esquema.sqlite3")
+        call_command("migrate", database=SHARDS[0], verbosity=0)
+        cls._copiar(settings.DATABASES[SHARDS[0]]["NAME"], cls._esquema)
+
+    @classmethod
+    def tearDownClass(cls):
+        for a in SHARDS:
+            connections[a].close()
+            del connections.settings[a]
+        cls._bases.stop()
+        cls._dir.cleanup()
+        shards.olvidar()
+        super().tearDownClass()
+
+    @staticmethod
+    def _copiar(origen, destino):
+        for a in SHARDS:
+            connections[a].close()
+        o, d = sqlite3.connect(origen), sqlite3.connect(destino)
+        try:
+            with d:
+                o.backup(d)
+        finally:
+            d.close()
+            o.close()
+
+    def setUp(self):
+        for a in SHARDS:
+            self._copiar(self._esquema, settings.DATABASES[a]["NAME"])
+        shards.olvidar()
+        User = get_user_model()
+        self.empresas = {}
+        for nombre, alias in (("a", "shard1"), ("b", "shard1"), ("c", DEFAULT_DB_ALIAS)):
+            admin = User.objects.create_user(f"adm_{nombre}", f"{nombre}@a.com", "x", rol="admin")
+            if alias != DEFAULT_DB_ALIAS:
+                TenantShard.objects.create(owner=admin, alias=alias)
+                shards.olvidar()
+                admin.save()  # con el registro ya puesto: se espeja
+            sucursal = Branch.objects.create(name=f"Central {nombre}", owner=admin)
+            empleado = User.objects.create_user(
+                f"emp_{nombre}", f"e{nombre}@a.com", "x", rol="limMerchant", sucursal=sucursal,
+            )
+            with shards.usar(alias):
+                productos = [
+                    Product.objects.create(nombre=f"Yerba {nombre}{i}", sku=f"Y{nombre}-{i}", precio=100, sucursal=sucursal)
+                    for i in range(2)
+                ]
+            self.empresas[nombre] = {
+                "admin": admin, "sucursal": sucursal, "empleado": empleado,
+                "productos": sorted(p.sku for p in productos),
+            }
+
+    def _jwt(self, user):
+        r = self.client.post("/api/token/", {"username": user.username, "password": "x"}, format="json")
+        self.assertEqual(r.status_code, 200, r.content)
+        return {"HTTP_AUTHORIZATION": f"Bearer {r.json()['access']}"}
+
+    def _skus_api(self, user):
+        r = self.client.get("/api/productos/", **self._jwt(user))
+        self.assertEqual(r.status_code, 200, r.content)
+        datos = r.json()
+        return sorted(p["sku"] for p in (datos["results"] if isinstance(datos, dict) else datos))
+
+    @staticmethod
+    def _skus(alias, empresa):
+        return sorted(
+            Product.objects.using(alias).filter(sucursal=empresa["sucursal"]).values_list("sku", flat=True)
+        )
+
+    def test_ruteo_por_empresa(self):
+        a, c = self.empresas["a"], self.empresas["c"]
+        self.assertEqual(self._skus("shard1", a), a["productos"])
+        self.assertEqual(self._skus(DEFAULT_DB_ALIAS, a), [])
+        self.assertEqual(self._skus(DEFAULT_DB_ALIAS, c), c["productos"])
+        self.assertEqual(self._skus("shard1", c), [])
+
+        # admin y empleado (por el dueño de su sucursal) leen la base de su empresa
+        self.assertEqual(self._skus_api(a["admin"]), a["productos"])
+        self.assertEqual(self._skus_api(a["empleado"]), a["productos"])
+        self.assertEqual(self._skus_api(c["empleado"]), c["productos"])
+
+    def test_espejo_de_usuarios_y_sucursales(self):
+        a, c = self.empresas["a"], self.empresas["c"]
+        User = get_user_model()
+        self.assertEqual(
+            set(User.objects.using("shard1").values_list("username", flat=True)),
+            {"adm_a", "emp_a", "adm_b", "emp_b"},
+        )
+        self.assertFalse(Branch.objects.using("shard1").filter(pk=c["sucursal"].pk).exists())
+
+        a["sucursal"].name = "Casa central"
+        a["sucursal"].save()
+        self.assertEqual(Branch.objects.using("shard1").get(pk=a["sucursal"].pk).name, "Casa central")
+
+        a["empleado"].delete()
+        self.assertFalse(User.objects.using("shard1").filter(username="emp_a").exists())
+
+    def test_move_tenant_mueve_solo_una_empresa(self):
+        a, b = self.empresas["a"], self.empresas["b"]
+        call_command("move_tenant", "adm_a", "shard2", espera=0, stdout=StringIO())
+
+        self.assertEqual(TenantShard.objects.get(owner=a["admin"]).alias, "shard2")
+        self.assertFalse(TenantShard.objects.get(owner=a["admin"]).moviendo)
+        self.assertEqual(self._skus("shard2", a), a["productos"])
+        self.assertEqual(self._skus("shard1", a), [])
+        self.assertTrue(get_user_model().objects.using("shard2").filter(username="emp_a").exists())
+        self.assertFalse(get_user_model().objects.using("shard1").filter(username="emp_a").exists())
+        # B sigue en shard1 con todo lo suyo
+        self.assertEqual(TenantShard.objects.get(owner=b["admin"]).alias, "shard1")
+        self.assertEqual(self._skus("shard1", b), b["productos"])
+        self.assertEqual(self._skus("shard2", b), [])
+
+        self.assertEqual(self._skus_api(a["empleado"]), a["productos"])
+        self.assertEqual(self._skus_api(b["admin"]), b["productos"])
+
+    def test_move_tenant_con_ids_en_uso(self):
+        # los productos de C (default) tienen los mismos ids que los de A y B en shard1
+        c = self.empresas["c"]
+        with self.assertRaises(CommandError):
+            call_command("move_tenant", "adm_c", "shard1", espera=0, stdout=StringIO())
+        self.assertFalse(TenantShard.objects.get(owner=c["admin"]).moviendo)
+        self.assertEqual(TenantShard.objects.get(owner=c["admin"]).alias, DEFAULT_DB_ALIAS)
+        self.assertEqual(self._skus(DEFAULT_DB_ALIAS, c), c["productos"])
+        self.assertEqual(self._skus_api(c["admin"]), c["productos"])
@@ -0,0 +1,101 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from ..models import Branch, Category, CostLayer, Product, StockBalance, StockMovement
+
+
+class TransferenciaProductosApiTests(APITestCase):
+    """Transferencias entre sucursales con productos dados de alta por /api/productos/."""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_user("adm", "a@a.com", "x", rol="admin")
+        self.origen = Branch.objects.create(name="Central", owner=self.admin)
+        self.destino = Branch.objects.create(name="Norte", owner=self.admin)
+        self.categoria = Category.objects.create(nombre="Bebidas", owner=self.admin)
+        self.client.force_authenticate(self.admin)
+
+    def _producto(self, sucursal, sku):
+        r = self.client.post("/api/productos/", {
+            "nombre": "Yerba", "sku": sku, "precio": "100.00",
+            "categoria": self.categoria.id, "sucursal": sucursal.id,
+        }, format="json")
+        self.assertEqual(r.status_code, 201, r.content)
+        return r.json()["id"]
+
+    def test_mismo_sku_en_otra_sucursal_de_la_empresa(self):
+        self._producto(self.origen, "YT-1")
+        self._producto(self.destino, "YT-1")
+        r = self.client.post("/api/productos/", {
+            "nombre": "Yerba 2", "sku": "yt-1", "precio": "100.00",
+            "categoria": self.categoria.id, "sucursal": self.origen.id,
+        }, format="json")
+        self.assertEqual(r.status_code, 400)
+        self.assertIn("sku", r.json())
+
+    def test_transferencia_de_producto_creado_por_api(self):
+        po = self._producto(self.origen, "YT-1")
+        pd = self._producto(self.destino, "yt-1")  # mismo SKU, otra capitalización
+        r = self.client.post("/api/movimientos/", {
+            "producto": po, "sucursal": self.origen.id, "tipo": "IN", "cantidad": 10,
+        }, format="json")
+        self.assertEqual(r.status_code, 201, r.content)
+
+        r = self.client.post("/api/transferencias/", {
+            "origen": self.origen.id, "destino": self.destino.id,
+            "items": [{"sku": "Yt-1", "cantidad": 4}],
+        }, format="json")
+        self.assertEqual(r.status_code, 201, r.content)
+
+        saldos = dict(StockBalance.objects.values_list("producto_id", "cantidad"))
+        self.assertEqual(saldos[po], 6)
+        self.assertEqual(saldos[pd], 4)
+
+
+@override_settings(SYSSTOCK_VALUATION_FIFO=True)
+class ValorizacionFifoTransferenciaTests(APITestCase):
+    """Las entradas de una transferencia abren su capa FIFO ligada al movimiento."""
+
+    def setUp(self):
+        admin = get_user_model().objects.create_user("adm", "a@a.com", "x", rol="admin")
+        self.origen = Branch.objects.create(name="Central", owner=admin)
+        self.destino = Branch.objects.create(name="Norte", owner=admin)
+        self.po = Product.objects.create(nombre="Yerba", sku="YT-1", precio=300, sucursal=self.origen)
+        self.pd = Product.objects.create(nombre="Yerba", sku="YT-1", precio=300, sucursal=self.destino)
+        self.client.force_authenticate(admin)
+        for costo in ("100.00", "200.00"):
+            r = self.client.post("/api/movimientos/", {
+                "producto": self.po.id, "sucursal": self.origen.id, "tipo": "IN",
+                "cantidad": 10, "costo_unit": costo,
+            }, format="json")
+            self.assertEqual(r.status_code, 201, r.content)
+
+    def _transferir(self):
+        r = self.client.post("/api/transferencias/", {
+            "origen": self.origen.id, "destino": self.destino.id,
+            "items": [{"sku": "YT-1", "cantidad": 15}],
+        }, format="json")
+        self.assertEqual(r.status_code, 201, r.content)
+
+        origen = StockBalance.objects.get(producto=self.po)
+        destino = StockBalance.objects.get(producto=self.pd)
+        # origen: salen las 10 de $100 y 5 de $200; entran a destino al promedio ($150)
+        self.assertEqual((origen.cantidad, origen.valor), (5, Decimal("1000.00")))
+        self.assertEqual((destino.cantidad, destino.valor), (15, Decimal("2250.00")))
+        entrada = StockMovement.objects.get(producto=self.pd, tipo="IN")
+        capa = CostLayer.objects.get(producto=self.pd)
+        self.assertEqual(capa.movimiento_id, entrada.id)
+        self.assertEqual((capa.restante, capa.costo_unit), (15, Decimal("150.0000")))
+
+    def test_transferencia(self):
+        self._transferir()
+
+    def test_transferencia_sin_returning_en_bulk_insert(self):
+        # como MySQL: bulk_create no devuelve los ids
+        with mock.patch.object(type(connection.features), "can_return_rows_from_bulk_insert", False):
+            self._transferir()
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from ..models import Branch, Product, Sale
+
+
+class SaleItemFechaTests(TestCase):
+    """SaleItem.creado_en es la clave de partición: tiene que ser la de su venta."""
+
+    def test_item_sin_fecha_toma_la_de_la_venta(self):
+        admin = get_user_model().objects.create_user("adm", "a@a.com", "x", rol="admin")
+        sucursal = Branch.objects.create(name="Central", owner=admin)
+        producto = Product.objects.create(nombre="Yerba", sku="YT-1", precio=100, sucursal=sucursal)
+        venta = Sale.objects.create(sucursal=sucursal)
+        hace_un_mes = timezone.now() - timedelta(days=31)
+        Sale.objects.filter(pk=venta.pk).update(creado_en=hace_un_mes)
+        venta.refresh_from_db()
+
+        item = venta.items.create(producto=producto, cantidad=1, precio_unit=100)
+        item.refresh_from_db()
+        self.assertEqual(item.creado_en, hace_un_mes)
@@ -2,10 +2,13 @@ from rest_framework.routers import DefaultRouter
 from django.urls import path, include
 from .views import (
     CategoryViewSet, BranchViewSet, ProductViewSet,
-    StockMovementViewSet, SaleViewSet,
-    low_stock, export_sales_excel,
+    StockMovementViewSet, SaleViewSet, TransferViewSet, WebhookEndpointViewSet,
+    low_stock, alertas_stock, export_sales_excel,
     ventas_hoy_empresa,
     kardex_producto, kardex_producto_xlsx,
+    dashboard_empresa, valorizacion_empresa,
+    consultas_lentas, perfiles, perfil_detalle,
+    resumen_async, dashboard_empresa_async, stream_sucursal,
 )
 
 router = DefaultRouter()
@@ -14,6 +17,8 @@ router.register(r"sucursales", BranchViewSet, basename="sucursales")
 router.register(r"productos", ProductViewSet, basename="productos")
 router.register(r"movimientos", StockMovementViewSet, basename="movimientos")
 router.register(r"ventas", SaleViewSet, basename="ventas")
+router.register(r"transferencias", TransferViewSet, basename="transferencias")
+router.register(r"webhooks", WebhookEndpointViewSet, basename="webhooks")
 
 urlpatterns = [
     path("", include(router.urls)),
@@ -21,12 +26,34 @@ urlpatterns = [
     # Bajo stock (usa stock_min o threshold global)
     path("stock/low/", low_stock, name="stock-low"),
 
+    # Set de bajo stock mantenido (cruces de stock_min / umbral de la empresa)
+    path("stock/alertas/", alertas_stock, name="stock-alertas"),
+
     # Exportar ventas globales (solo admin)
     path("ventas/export/xlsx/", export_sales_excel, name="ventas-export-xlsx"),
 
     # Ventas del día por empresa (JSON)
     path("ventas/hoy/empresa", ventas_hoy_empresa, name="ventas-hoy-empresa"),
 
+    # Dashboard consolidado de todas las sucursales de la empresa
+    path("dashboard/empresa/", dashboard_empresa, name="dashboard-empresa"),
+
+    # Valorización del inventario de todas las sucursales de la empresa
+    path("valorizacion/empresa/", valorizacion_empresa, name="valorizacion-empresa"),
+
+    # Diagnóstico (superuser): queries lentas con EXPLAIN
+    path("diagnostico/consultas-lentas/", consultas_lentas, name="diagnostico-consultas-lentas"),
+    # Perfiles generados con ?_profile=1 / ?_profile=sample
+    path("diagnostico/perfiles/", perfiles, name="diagnostico-perfiles"),
+    path("diagnostico/perfiles/<str:perfil_id>/", perfil_detalle, name="diagnostico-perfil-detalle"),
+
+    # Variantes async (ASGI): agregados independientes en paralelo
+    path("async/sucursales/<int:pk>/resumen/", resumen_async, name="async-sucursal-resumen"),
+    path("async/dashboard/empresa/", dashboard_empresa_async, name="async-dashboard-empresa"),
+
+    # Cambios de stock / ventas de la sucursal en vivo (SSE, ASGI)
+    path("stream/sucursales/<int:pk>/", stream_sucursal, name="stream-sucursal"),
+
     # Kardex por producto (JSON + Excel)
     path("productos/<int:producto_id>/kardex", kardex_producto, name="kardex-producto"),
     path("productos/<int:producto_id>/kardex/xlsx", kardex_producto_xlsx, name="kardex-producto-xlsx"),
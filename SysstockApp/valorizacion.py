@@ -0,0 +1,196 @@
+"""
+Valorización de inventario mantenida junto con el saldo (StockBalance).
+
+- Costo promedio ponderado: cada IN recalcula el promedio con su costo_unit
+  (si no trae costo entra al promedio vigente); los OUT salen al promedio.
+- FIFO (opcional, settings.SYSSTOCK_VALUATION_FIFO): cada IN abre una capa
+  (CostLayer) y los OUT consumen las capas más viejas. StockBalance.valor
+  pasa a ser el valor de las capas abiertas.
+
+Cambiar de método requiere `python manage.py rebuild_stock_balances`.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+
+PROMEDIO = "promedio"
+FIFO = "fifo"
+
+CERO = Decimal("0")
+_Q_COSTO = Decimal("0.0001")
+_Q_VALOR = Decimal("0.01")
+
+
+def metodo() -> str:
+    return FIFO if getattr(settings, "SYSSTOCK_VALUATION_FIFO", False) else PROMEDIO
+
+
+def _costo(valor) -> Decimal:
+    return Decimal(valor).quantize(_Q_COSTO)
+
+
+def _valor(valor) -> Decimal:
+    return Decimal(valor).quantize(_Q_VALOR)
+
+
+# =========================
+#  Cálculo puro (sin DB)
+# =========================
+def nuevo_promedio(cantidad, promedio, entrada, costo_unit) -> Decimal:
+    """
+    Promedio ponderado después de una entrada. Con stock previo <= 0 el
+    promedio anterior no pesa (no hay unidades valorizadas).
+    """
+    previo = max(int(cantidad), 0)
+    total = previo + int(entrada)
+    if total <= 0:
+        return _costo(promedio)
+    return _costo((previo * Decimal(promedio) + int(entrada) * Decimal(costo_unit)) / total)
+
+
+def consumir_capas(capas, cantidad) -> Decimal:
+    """
+    Consume 'cantidad' de las capas (ordenadas de la más vieja a la más nueva),
+    modificando capa["restante"]. Devuelve el costo consumido.
+    """
+    pendiente = int(cantidad)
+    costo = CERO
+    for capa in capas:
+        if pendiente <= 0:
+            break
+        usa = min(capa["restante"], pendiente)
+        if usa <= 0:
+            continue
+        capa["restante"] -= usa
+        pendiente -= usa
+        costo += usa * capa["costo_unit"]
+    return costo
+
+
+def reproducir(movimientos, fifo=False):
+    """
+    Recorre los movimientos (tipo, cantidad, costo_unit, id) en orden cronológico.
+    Devuelve (cantidad, costo_promedio, valor, capas); 'capas' solo con fifo.
+    """
+    cantidad, promedio = 0, CERO
+    capas = []
+    for tipo, cant, costo_unit, mov_id in movimientos:
+        if tipo == "IN":
+            costo = Decimal(costo_unit) if costo_unit is not None else promedio
+            promedio = nuevo_promedio(cantidad, promedio, cant, costo)
+            cantidad += int(cant)
+            if fifo:
+                capas.append({"movimiento_id": mov_id, "cantidad": int(cant), "restante": int(cant), "costo_unit": _costo(costo)})
+        elif tipo == "OUT":
+            cantidad -= int(cant)
+            if fifo:
+                consumir_capas(capas, cant)
+
+    if fifo:
+        valor = sum((c["restante"] * c["costo_unit"] for c in capas), CERO)
+        capas = [c for c in capas if c["restante"] > 0]
+    else:
+        valor = max(cantidad, 0) * promedio
+    return cantidad, promedio, _valor(valor), capas
+
+
+# =========================
+#  Aplicación incremental (dentro de stock.actualizar_saldos)
+# =========================
+def aplicar_movimiento(bal, mov, using=DEFAULT_DB_ALIAS):
+    """
+    Actualiza costo_promedio/valor de 'bal' por un movimiento recién insertado.
+    bal.cantidad es el saldo ANTERIOR al movimiento (el llamador lo actualiza después).
+    """
+    from .stock import delta_movimiento
+
+    fifo = metodo() == FIFO
+    posterior = bal.cantidad + delta_movimiento(mov.tipo, mov.cantidad)
+
+    if mov.tipo == "IN":
+        costo = Decimal(mov.costo_unit) if mov.costo_unit is not None else Decimal(bal.costo_promedio)
+        bal.costo_promedio = nuevo_promedio(bal.cantidad, bal.costo_promedio, mov.cantidad, costo)
+        if fifo:
+            _abrir_capa(bal, mov, costo, using)
+            bal.valor = _valor(Decimal(bal.valor) + int(mov.cantidad) * _costo(costo))
+    elif mov.tipo == "OUT" and fifo:
+        bal.valor = _valor(max(Decimal(bal.valor) - _consumir_capas_db(bal, mov.cantidad, using), CERO))
+
+    if not fifo:
+        bal.valor = _valor(max(posterior, 0) * Decimal(bal.costo_promedio))
+
+
+def _abrir_capa(bal, mov, costo, using):
+    from .models import CostLayer
+
+    CostLayer.objects.using(using).create(
+        producto_id=bal.producto_id, sucursal_id=bal.sucursal_id, movimiento_id=mov.pk,
+        cantidad=mov.cantidad, restante=mov.cantidad, costo_unit=_costo(costo),
+    )
+
+
+def _consumir_capas_db(bal, cantidad, using):
+    from .models import CostLayer
+
+    capas = list(
+        CostLayer.objects.using(using)
+        .select_for_update()
+        .filter(producto_id=bal.producto_id, sucursal_id=bal.sucursal_id, restante__gt=0)
+        .order_by("id")
+    )
+    datos = [{"restante": c.restante, "costo_unit": c.costo_unit} for c in capas]
+    costo = consumir_capas(datos, cantidad)
+    cambiadas = []
+    for capa, d in zip(capas, datos):
+        if capa.restante != d["restante"]:
+            capa.restante = d["restante"]
+            cambiadas.append(capa)
+    if cambiadas:
+        CostLayer.objects.using(using).bulk_update(cambiadas, ["restante"])
+    return costo
+
+
+# =========================
+#  Recalculo desde movimientos (saldos nuevos, ediciones/borrados, rebuild)
+# =========================
+def recalcular(saldos, using=DEFAULT_DB_ALIAS):
+    """
+    Recalcula costo_promedio/valor (y las capas FIFO) de los StockBalance dados
+    reproduciendo sus movimientos. No toca bal.cantidad ni guarda los saldos.
+    """
+    from .models import CostLayer, StockMovement
+    from .stock import _lotes
+
+    if not saldos:
+        return
+    fifo = metodo() == FIFO
+    por_clave = {(b.producto_id, b.sucursal_id): b for b in saldos}
+
+    movs = defaultdict(list)
+    for lote in _lotes({p for p, _ in por_clave}):
+        for row in (
+            StockMovement.objects.using(using)
+            .filter(producto_id__in=lote)
+            .order_by("creado_en", "id")
+            .values_list("producto_id", "sucursal_id", "tipo", "cantidad", "costo_unit", "id")
+        ):
+            if (row[0], row[1]) in por_clave:
+                movs[(row[0], row[1])].append(row[2:])
+
+    capas = []
+    for key, bal in por_clave.items():
+        _, bal.costo_promedio, bal.valor, abiertas = reproducir(movs.get(key, ()), fifo=fifo)
+        capas.extend(
+            CostLayer(producto_id=key[0], sucursal_id=key[1], **c) for c in abiertas
+        )
+
+    for lote in _lotes(por_clave):
+        claves = Q()
+        for p, s in lote:
+            claves |= Q(producto_id=p, sucursal_id=s)
+        CostLayer.objects.using(using).filter(claves).delete()
+    if capas:
+        CostLayer.objects.using(using).bulk_create(capas, batch_size=1000)
@@ -1,31 +1,59 @@
 # =========================
 # IMPORTS
 # =========================
-from rest_framework import viewsets, permissions, filters, status
-from rest_framework.exceptions import PermissionDenied
+from rest_framework import mixins, viewsets, permissions, filters, status
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, PermissionDenied, ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, throttle_classes
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
 from django.utils.timezone import localdate
 from datetime import datetime, time
+import asyncio
+import math
 
 from openpyxl import Workbook
-from django.http import HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
 
-from django.db.models import Sum
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Prefetch, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 
-from .models import Category, Branch, Product, StockMovement, Sale
+from .models import (
+    Category, Branch, Product, StockMovement, StockBalance, Sale, SaleItem, Transfer, WebhookEndpoint,
+)
 from .serializers import (
     CategorySerializer,
     BranchSerializer,
     ProductSerializer,
     StockMovementSerializer,
     SaleSerializer,
+    BulkPriceSerializer,
+    TransferSerializer,
+    WebhookEndpointSerializer,
+    campos_solicitados,
 )
-from AccountAdmin.permissions import IsAdmin  # alias válido a IsAdminRole
+from .conteos import ConteoInvalido, aplicar_conteo, diferencias, leer_conteo, resumen as resumen_conteo
+from .precios import actualizar_precios
+from .search import ProductSearchFilter, buscar_productos
+from .stock import limite_default
+from .valorizacion import metodo as metodo_valorizacion
+from .diagnostico import CONSULTAS_LENTAS, PERFILES, etiqueta_tenant
+from .middleware import respuesta_perfil
+from .replica import vista_de_reporte
+from .archivo import historia
+from .particiones import rango_fechas
+from .asincrono import en_pool, reunir
+from . import eventos as stream
+from . import coalescencia, shards
+from .limites import LimiteCatalogo, LimiteCheckout, LimiteExportaciones, LimiteReportes, permitir
+from .renderers import ORJSONRenderer
+from AccountAdmin.permissions import IsAdmin, IsSuperuser  # IsAdmin: alias válido a IsAdminRole
 
 
 # =========================
@@ -60,16 +88,181 @@ def _scope_by_branch_on_model(qs, user, branch_field="sucursal"):
 
 
 # =========================
-# HELPER DE STOCK (por movimientos)
+# RANGOS DE FECHA (sobre la columna: podan particiones, ver particiones.py)
+# =========================
+def _rango_fechas(desde, hasta):
+    """Filtro para ?desde=&hasta= (días locales, ambos incluidos) sin envolver creado_en en DATE()."""
+    inicio, fin = rango_fechas(desde, hasta)
+    return {"creado_en__gte": inicio, "creado_en__lt": fin}
+
+
+def _items_prefetch(**rango):
+    """Prefetch de Sale.items acotado por la fecha copiada en el ítem (poda las particiones de SaleItem)."""
+    return Prefetch("items", queryset=SaleItem.objects.filter(**rango))
+
+
+# =========================
+# HELPER DE STOCK
 # =========================
-def _stock_actual_producto(producto: Product) -> int:
+def _stock_actual_subquery():
     """
-    Calcula stock actual por producto como:
-    stock = ENTRADAS ('IN') - SALIDAS ('OUT')
+    Expresión para annotate() sobre Product: stock actual en su sucursal, leído
+    del saldo mantenido (StockBalance) en vez de sumar movimientos.
     """
-    entradas = StockMovement.objects.filter(producto=producto, tipo="IN").aggregate(total=Sum("cantidad"))["total"] or 0
-    salidas  = StockMovement.objects.filter(producto=producto, tipo="OUT").aggregate(total=Sum("cantidad"))["total"] or 0
-    return int(entradas - salidas)
+    sub = (
+        StockBalance.objects
+        .filter(producto=OuterRef("pk"), sucursal=OuterRef("sucursal"))
+        .values("cantidad")[:1]
+    )
+    return Coalesce(Subquery(sub, output_field=IntegerField()), 0)
+
+
+def _threshold_param(request):
+    """
+    ?threshold= explícito (int) o None: sin threshold se usa el set de bajo stock
+    mantenido (stock_min o umbral por defecto de la empresa).
+    """
+    raw = request.query_params.get("threshold")
+    if raw is None:
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        return limite_default()
+
+
+def _limit_param(request, default, maximo, minimo=0):
+    """?limit= acotado a [minimo, maximo]; 400 si no es un entero (un negativo no llega al slicing)."""
+    raw = request.query_params.get("limit")
+    if raw is None:
+        return default
+    try:
+        return max(minimo, min(int(raw), maximo))
+    except ValueError:
+        raise ValidationError({"limit": "Debe ser un número entero."})
+
+
+def _bajo_stock_qs(threshold=None):
+    """
+    StockBalance de productos en bajo stock (en la sucursal del producto).
+    - threshold None: lee el set mantenido (índice sucursal + bajo_stock), O(items bajos)
+    - threshold int:  compara el saldo contra stock_min o threshold en una query
+    """
+    qs = StockBalance.objects.filter(producto__sucursal_id=F("sucursal_id"))
+    if threshold is None:
+        return qs.filter(bajo_stock=True)
+    return qs.filter(cantidad__lte=Coalesce("producto__stock_min", Value(threshold)))
+
+
+def _permiso_resumen(user, branch):
+    """Mensaje de error (403) o None."""
+    if getattr(user, "rol", None) == "limMerchant" and user.sucursal_id != branch.id:
+        return "No tienes permiso para esta sucursal."
+    if getattr(user, "rol", None) == "admin" and branch.owner_id != user.id:
+        return "Esta sucursal no te pertenece."
+    return None
+
+
+def _resumen_ventas_hoy(branch_id, inicio, fin):
+    """Monto vendido en la sucursal dentro de [inicio, fin]."""
+    ventas_hoy_qs = (
+        Sale.objects
+        .filter(sucursal_id=branch_id, creado_en__range=(inicio, fin))
+        .prefetch_related(_items_prefetch(creado_en__range=(inicio, fin)))
+    )
+    return float(sum(
+        sum(float(it.cantidad) * float(it.precio_unit) for it in v.items.all())
+        for v in ventas_hoy_qs
+    ))
+
+
+def _resumen_bajo_stock(branch_id, threshold=None):
+    """Productos en bajo stock de la sucursal (saldos mantenidos por movimientos)."""
+    return [
+        {
+            "id": bal.producto_id,
+            "nombre": bal.producto.nombre,
+            "categoria": bal.producto.categoria.nombre if bal.producto.categoria else None,
+            "stock": bal.cantidad,
+        }
+        for bal in (
+            _bajo_stock_qs(threshold)
+            .filter(sucursal_id=branch_id)
+            .select_related("producto__categoria")
+            .order_by("producto_id")
+        )
+    ]
+
+
+def _armar_resumen(branch, hoy, threshold, ventas_hoy_monto, productos_bajo_stock):
+    return {
+        "sucursal": branch.name,
+        "fecha_hoy": str(hoy),
+        "ventas_hoy": {"monto": ventas_hoy_monto},
+        "threshold": threshold if threshold is not None else limite_default(),
+        "productos_bajo_stock": productos_bajo_stock
+    }
+
+
+def _valorizacion_items(qs, limit):
+    """Detalle de valorización (saldos con stock), de mayor a menor valor."""
+    qs = (
+        qs.filter(cantidad__gt=0)
+        .select_related("producto__categoria")
+        .order_by("-valor", "producto_id")
+    )
+    return [
+        {
+            "producto_id": bal.producto_id,
+            "producto": bal.producto.nombre,
+            "sku": bal.producto.sku,
+            "categoria": bal.producto.categoria.nombre if bal.producto.categoria else None,
+            "cantidad": bal.cantidad,
+            "costo_promedio": float(bal.costo_promedio),
+            "valor": float(bal.valor),
+        }
+        for bal in qs[:limit]
+    ]
+
+
+def _valorizacion_totales(qs, por):
+    """{por: {"unidades", "valor"}} en una query agrupada sobre StockBalance."""
+    rows = (
+        qs.filter(cantidad__gt=0)
+        .values(por)
+        .annotate(unidades=Sum("cantidad"), total=Sum("valor"))
+        .order_by()
+    )
+    return {r[por]: {"unidades": r["unidades"] or 0, "valor": float(r["total"] or 0)} for r in rows}
+
+
+def _total_venta_subquery():
+    """Expresión para annotate() sobre Sale: SUM(cantidad * precio_unit) de sus items."""
+    sub = (
+        SaleItem.objects
+        .filter(venta=OuterRef("pk"))
+        .order_by()
+        .values("venta")
+        .annotate(s=Sum(F("cantidad") * F("precio_unit"), output_field=DecimalField(max_digits=14, decimal_places=2)))
+        .values("s")
+    )
+    return Subquery(sub, output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+# =========================
+# SPARSE FIELDSETS: queryset según ?fields= / ?expand=
+# =========================
+class SparseQuerysetMixin:
+    """
+    Permite a get_queryset() pedir joins/annotations solo para los campos que
+    la respuesta va a mostrar.
+    """
+
+    def _pide(self, *names):
+        fields, expand = campos_solicitados(self.request)
+        if fields is None:
+            return True
+        return any(n in fields or n in expand for n in names)
 
 
 # =========================
@@ -111,7 +304,8 @@ class BranchViewSet(viewsets.ModelViewSet):
     # -------------------------
     # /api/sucursales/<id>/ventas_rango/?desde=YYYY-MM-DD&hasta=YYYY-MM-DD
     # -------------------------
-    @action(detail=True, methods=["get"], url_path="ventas_rango")
+    @action(detail=True, methods=["get"], url_path="ventas_rango", throttle_classes=[LimiteReportes])
+    @vista_de_reporte
     def ventas_rango(self, request, pk=None):
         branch = self.get_object()
         user = request.user
@@ -148,7 +342,7 @@ class BranchViewSet(viewsets.ModelViewSet):
         # Ventas del rango
         ventas = (
             Sale.objects.filter(sucursal=branch, creado_en__range=(desde_dt, hasta_dt))
-            .prefetch_related("items__producto")
+            .prefetch_related(_items_prefetch(creado_en__range=(desde_dt, hasta_dt)), "items__producto")
             .select_related("sucursal")
             .order_by("creado_en")
         )
@@ -187,7 +381,8 @@ class BranchViewSet(viewsets.ModelViewSet):
     # -------------------------
     # /api/sucursales/<id>/ventas_por_producto/?desde=&hasta=
     # -------------------------
-    @action(detail=True, methods=["get"], url_path="ventas_por_producto")
+    @action(detail=True, methods=["get"], url_path="ventas_por_producto", throttle_classes=[LimiteReportes])
+    @vista_de_reporte
     def ventas_por_producto(self, request, pk=None):
         branch = self.get_object()
         u = request.user
@@ -198,9 +393,12 @@ class BranchViewSet(viewsets.ModelViewSet):
 
         desde = request.query_params.get("desde")
         hasta = request.query_params.get("hasta")
-        qs = Sale.objects.filter(sucursal=branch).prefetch_related("items__producto")
+        qs = Sale.objects.filter(sucursal=branch)
         if desde and hasta:
-            qs = qs.filter(creado_en__date__range=(desde, hasta))
+            rango = _rango_fechas(desde, hasta)
+            qs = qs.filter(**rango).prefetch_related(_items_prefetch(**rango), "items__producto")
+        else:
+            qs = qs.prefetch_related("items__producto")
 
         agg = {}
         for v in qs:
@@ -224,7 +422,8 @@ class BranchViewSet(viewsets.ModelViewSet):
     # -------------------------
     # /api/sucursales/<id>/ventas_por_dia/?desde=&hasta=
     # -------------------------
-    @action(detail=True, methods=["get"], url_path="ventas_por_dia")
+    @action(detail=True, methods=["get"], url_path="ventas_por_dia", throttle_classes=[LimiteReportes])
+    @vista_de_reporte
     def ventas_por_dia(self, request, pk=None):
         branch = self.get_object()
         u = request.user
@@ -237,11 +436,14 @@ class BranchViewSet(viewsets.ModelViewSet):
         hasta = request.query_params.get("hasta")
         qs = Sale.objects.filter(sucursal=branch)
         if desde and hasta:
-            qs = qs.filter(creado_en__date__range=(desde, hasta))
+            rango = _rango_fechas(desde, hasta)
+            qs = qs.filter(**rango).prefetch_related(_items_prefetch(**rango))
+        else:
+            qs = qs.prefetch_related("items")
 
         # sumar total por día
         series = {}
-        for v in qs.prefetch_related("items"):
+        for v in qs:
             d = v.creado_en.date()
             tot = sum(it.cantidad * it.precio_unit for it in v.items.all())
             series[d] = series.get(d, 0.0) + float(tot)
@@ -260,7 +462,8 @@ class BranchViewSet(viewsets.ModelViewSet):
     # -------------------------
     # /api/sucursales/<id>/ventas_export/xlsx/?desde=&hasta=
     # -------------------------
-    @action(detail=True, methods=["get"], url_path="ventas_export/xlsx")
+    @action(detail=True, methods=["get"], url_path="ventas_export/xlsx", throttle_classes=[LimiteExportaciones])
+    @vista_de_reporte
     def ventas_export_xlsx(self, request, pk=None):
         branch = self.get_object()
         u = request.user
@@ -278,12 +481,14 @@ class BranchViewSet(viewsets.ModelViewSet):
         qs = (
             Sale.objects
             .filter(sucursal=branch)
-            .prefetch_related("items__producto")
             .select_related("sucursal")
             .order_by("creado_en")
         )
         if desde and hasta:
-            qs = qs.filter(creado_en__date__range=(desde, hasta))
+            rango = _rango_fechas(desde, hasta)
+            qs = qs.filter(**rango).prefetch_related(_items_prefetch(**rango), "items__producto")
+        else:
+            qs = qs.prefetch_related("items__producto")
 
         # Armar Excel
         wb = Workbook()
@@ -314,7 +519,7 @@ class BranchViewSet(viewsets.ModelViewSet):
     # -------------------------
     # /api/sucursales/<id>/resumen/?threshold=5&limit=50
     # -------------------------
-    @action(detail=True, methods=["get"], url_path="resumen")
+    @action(detail=True, methods=["get"], url_path="resumen", throttle_classes=[LimiteReportes])
     def resumen(self, request, pk=None):
         """
         Resumen reducido (usa stock REAL por movimientos, no Product.cantidad).
@@ -322,61 +527,121 @@ class BranchViewSet(viewsets.ModelViewSet):
         - productos_bajo_stock (stock real calculado; usa stock_min si existe)
         """
         branch = self.get_object()
-        u = request.user
 
         # Permisos
-        if getattr(u, "rol", None) == "limMerchant" and u.sucursal_id != branch.id:
-            return Response({"detail": "No tienes permiso para esta sucursal."}, status=403)
-        if getattr(u, "rol", None) == "admin" and branch.owner_id != u.id:
-            return Response({"detail": "Esta sucursal no te pertenece."}, status=403)
+        error = _permiso_resumen(request.user, branch)
+        if error:
+            return Response({"detail": error}, status=403)
 
         # Hoy local -> rango horario aware [00:00:00, 23:59:59]
         hoy = localdate()
         inicio = timezone.make_aware(datetime.combine(hoy, time.min))
         fin    = timezone.make_aware(datetime.combine(hoy, time.max))
 
-        # Ventas HOY (monto)
-        ventas_hoy_qs = (
-            Sale.objects
-            .filter(sucursal=branch, creado_en__range=(inicio, fin))
-            .prefetch_related("items")
-        )
-        ventas_hoy_monto = float(sum(
-            sum(float(it.cantidad) * float(it.precio_unit) for it in v.items.all())
-            for v in ventas_hoy_qs
+        # Threshold de bajo stock (sin ?threshold= se usa el set mantenido)
+        threshold = _threshold_param(request)
+
+        # requests simultáneos del mismo resumen comparten el cálculo (permisos ya chequeados)
+        return Response(coalescencia.compartir(
+            "sucursal-resumen", (branch.id, hoy, threshold),
+            lambda: _armar_resumen(
+                branch, hoy, threshold,
+                ventas_hoy_monto=_resumen_ventas_hoy(branch.id, inicio, fin),
+                productos_bajo_stock=_resumen_bajo_stock(branch.id, threshold),
+            ),
+            modelo=Sale,
         ))
 
-        # Threshold de bajo stock
+    # -------------------------
+    # /api/sucursales/<id>/valorizacion/?limit=100
+    # -------------------------
+    @action(detail=True, methods=["get"], url_path="valorizacion", throttle_classes=[LimiteReportes])
+    def valorizacion(self, request, pk=None):
+        """
+        Valor del inventario de la sucursal (lectura de los saldos mantenidos):
+        - totales (unidades y valor) y por categoría
+        - detalle por producto (costo promedio y valor), de mayor a menor valor
+        """
+        branch = self.get_object()
+        u = request.user
+
+        # Permisos
+        if getattr(u, "rol", None) == "limMerchant" and u.sucursal_id != branch.id:
+            return Response({"detail": "No tienes permiso para esta sucursal."}, status=403)
+        if getattr(u, "rol", None) == "admin" and branch.owner_id != u.id:
+            return Response({"detail": "Esta sucursal no te pertenece."}, status=403)
+
         try:
-            threshold = int(request.query_params.get("threshold", 5))
+            limit = max(0, min(int(request.query_params.get("limit", 100)), 1000))
         except ValueError:
-            threshold = 5
-
-        # Stock bajo (por movimientos)
-        productos_bajo_stock = []
-        for p in Product.objects.filter(sucursal=branch).select_related("categoria"):
-            # stock actual por movimientos
-            entradas = StockMovement.objects.filter(producto=p, tipo="IN").aggregate(s=Sum("cantidad"))["s"] or 0
-            salidas  = StockMovement.objects.filter(producto=p, tipo="OUT").aggregate(s=Sum("cantidad"))["s"] or 0
-            stock_actual = int(entradas - salidas)
-
-            limite = p.stock_min if p.stock_min is not None else threshold
-            if stock_actual <= limite:
-                productos_bajo_stock.append({
-                    "id": p.id,
-                    "nombre": p.nombre,
-                    "categoria": p.categoria.nombre if p.categoria else None,
-                    "stock": stock_actual
-                })
+            limit = 100
+
+        saldos = StockBalance.objects.filter(sucursal=branch)
+        total = _valorizacion_totales(saldos, "sucursal_id").get(branch.id, {"unidades": 0, "valor": 0.0})
+        por_categoria = _valorizacion_totales(saldos, "producto__categoria__nombre")
 
         return Response({
             "sucursal": branch.name,
-            "fecha_hoy": str(hoy),
-            "ventas_hoy": {"monto": ventas_hoy_monto},
-            "threshold": threshold,
-            "productos_bajo_stock": productos_bajo_stock
+            "metodo": metodo_valorizacion(),
+            "unidades": total["unidades"],
+            "valor_total": total["valor"],
+            "por_categoria": [
+                {"categoria": nombre, **v}
+                for nombre, v in sorted(por_categoria.items(), key=lambda kv: -kv[1]["valor"])
+            ],
+            "items": _valorizacion_items(saldos, limit),
         })
 
+    # -------------------------
+    # POST /api/sucursales/<id>/conteo/
+    # -------------------------
+    @action(detail=True, methods=["post"], url_path="conteo")
+    def conteo(self, request, pk=None):
+        """
+        Conteo físico (stocktake): 'archivo' (.csv/.xlsx con columnas sku, cantidad)
+        o JSON {"items": [{"sku", "cantidad"}]}.
+        - confirmar=false (default): preview de diferencias contra el stock actual
+        - confirmar=true: registra todos los ajustes IN/OUT con el mismo 'motivo'
+        - completo=true: los productos que no aparecen en el conteo se ajustan a 0
+        """
+        branch = self.get_object()
+        u = request.user
+
+        # Permisos
+        if getattr(u, "rol", None) == "limMerchant" and u.sucursal_id != branch.id:
+            return Response({"detail": "No tienes permiso para esta sucursal."}, status=403)
+        if getattr(u, "rol", None) == "admin" and branch.owner_id != u.id:
+            return Response({"detail": "Esta sucursal no te pertenece."}, status=403)
+
+        def flag(name):
+            return str(request.data.get(name, "")).lower() in ("1", "true", "yes", "si", "sí")
+
+        try:
+            conteo = leer_conteo(archivo=request.FILES.get("archivo"), items=request.data.get("items"))
+        except ConteoInvalido as e:
+            return Response({"detail": str(e)}, status=400)
+
+        completo = flag("completo")
+        if not flag("confirmar"):
+            resultado = diferencias(branch, conteo, completo=completo)
+            return Response({
+                "sucursal": branch.name,
+                "confirmado": False,
+                **resumen_conteo(resultado),
+                "items": resultado["lineas"],
+            })
+
+        motivo = (request.data.get("motivo") or "").strip() or f"Conteo físico {localdate()}"
+        resultado, movimientos = aplicar_conteo(branch, conteo, motivo[:255], usuario=u, completo=completo)
+        return Response({
+            "sucursal": branch.name,
+            "confirmado": True,
+            "motivo": motivo[:255],
+            "movimientos": movimientos,
+            **resumen_conteo(resultado),
+            "items": resultado["lineas"],
+        }, status=201)
+
     # -------------------------
     # DELETE /api/sucursales/<id>/
     # -------------------------
@@ -408,6 +673,7 @@ class BranchViewSet(viewsets.ModelViewSet):
 class CategoryViewSet(viewsets.ModelViewSet):
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [LimiteCatalogo]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ["id", "nombre"]
     search_fields = ["nombre"]
@@ -440,41 +706,127 @@ class CategoryViewSet(viewsets.ModelViewSet):
 # =========================
 # PRODUCTOS
 # =========================
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [LimiteCatalogo]
 
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, filters.OrderingFilter]
     filterset_fields = ["id", "categoria", "nombre", "sucursal", "sku"]
     search_fields = ["nombre", "sku"]
     ordering_fields = ["id", "nombre", "precio"]
     ordering = ["id"]
 
     def get_queryset(self):
-        qs = Product.objects.select_related("categoria", "sucursal").all().order_by("id")
+        qs = Product.objects.all().order_by("id")
+        related = [
+            rel for rel, campos in (
+                ("categoria", ("categoria", "categoria_nombre")),
+                ("sucursal", ("sucursal", "sucursal_nombre")),
+            )
+            if self._pide(*campos)
+        ]
+        if related:
+            qs = qs.select_related(*related)
+        if self._pide("stock_actual"):
+            qs = qs.annotate(_stock_actual=_stock_actual_subquery())
         return _scope_by_branch_on_model(qs, self.request.user, branch_field="sucursal")
 
+    # -------------------------
+    # /api/productos/search/?q=coca&limit=20&sucursal=<id>
+    # -------------------------
+    @action(detail=False, methods=["get"], url_path="search")
+    def search(self, request):
+        """
+        Autocomplete del POS: top-N productos rankeados (SKU exacto, prefijo, relevancia).
+        """
+        q = (request.query_params.get("q") or "").strip()
+        if not q:
+            return Response({"q": q, "items": []})
+
+        limit = _limit_param(request, 20, 100, minimo=1)
+
+        qs = _scope_by_branch_on_model(Product.objects.all(), request.user, branch_field="sucursal")
+        sucursal_id = request.query_params.get("sucursal")
+        if sucursal_id:
+            try:
+                qs = qs.filter(sucursal_id=int(sucursal_id))
+            except ValueError:
+                return Response({"detail": "Parámetro 'sucursal' inválido."}, status=400)
+
+        items = [
+            {
+                "id": p.id,
+                "nombre": p.nombre,
+                "sku": p.sku,
+                "precio": p.precio,
+                "categoria": p.categoria.nombre if p.categoria else None,
+                "sucursal": p.sucursal_id,
+            }
+            for p in buscar_productos(qs, q, limit=limit)
+        ]
+        return Response({"q": q, "items": items})
+
+    # -------------------------
+    # POST /api/productos/bulk-price/
+    # -------------------------
+    @action(
+        detail=False, methods=["post"], url_path="bulk-price",
+        permission_classes=[permissions.IsAuthenticated, IsAdmin],
+    )
+    def bulk_price(self, request):
+        """
+        Ajuste de precios masivo (porcentaje o monto) por categoría / sucursal / SKUs,
+        en un solo UPDATE dentro de las sucursales del admin.
+        """
+        ser = BulkPriceSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        data = ser.validated_data
+
+        qs = _scope_by_branch_on_model(Product.objects.all(), request.user, branch_field="sucursal")
+        if data.get("categoria"):
+            qs = qs.filter(categoria_id=data["categoria"])
+        if data.get("sucursal"):
+            qs = qs.filter(sucursal_id=data["sucursal"])
+        if data.get("skus"):
+            qs = qs.filter(sku__in=set(data["skus"]))
+
+        actualizados, historial = actualizar_precios(
+            qs,
+            porcentaje=data.get("porcentaje"),
+            monto=data.get("monto"),
+            historial=data["historial"],
+            usuario=request.user,
+            motivo=data.get("motivo") or None,
+        )
+        return Response({"actualizados": actualizados, "historial": historial})
+
 
 # =========================
 # MOVIMIENTOS DE STOCK
 # =========================
-class StockMovementViewSet(viewsets.ModelViewSet):
+class StockMovementViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = StockMovementSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ["id", "tipo", "sucursal", "producto"]
+    filterset_fields = ["id", "tipo", "sucursal", "producto", "apertura"]
     search_fields = ["producto__nombre", "motivo"]
     ordering_fields = ["id", "creado_en"]
     ordering = ["-creado_en"]
 
     def get_queryset(self):
-        qs = (
-            StockMovement.objects
-            .select_related("producto", "sucursal")
-            .all()
-            .order_by("-creado_en")
-        )
+        qs = StockMovement.objects.all().order_by("-creado_en")
+        related = [
+            rel for rel, campos in (
+                ("producto", ("producto_nombre",)),
+                ("sucursal", ("sucursal", "sucursal_nombre")),
+                ("usuario", ("usuario_username",)),
+            )
+            if self._pide(*campos)
+        ]
+        if related:
+            qs = qs.select_related(*related)
         qs = _scope_by_branch_on_model(qs, self.request.user, branch_field="sucursal")
 
         # Filtros opcionales por fecha (YYYY-MM-DD)
@@ -482,7 +834,7 @@ class StockMovementViewSet(viewsets.ModelViewSet):
         hasta = self.request.query_params.get("hasta")
         if desde and hasta:
             try:
-                qs = qs.filter(creado_en__date__range=(desde, hasta))
+                qs = qs.filter(**_rango_fechas(desde, hasta))
             except Exception:
                 pass
 
@@ -492,7 +844,7 @@ class StockMovementViewSet(viewsets.ModelViewSet):
 # =========================
 # VENTAS
 # =========================
-class SaleViewSet(viewsets.ModelViewSet):
+class SaleViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = SaleSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -501,15 +853,91 @@ class SaleViewSet(viewsets.ModelViewSet):
     ordering_fields = ["id", "creado_en"]
     ordering = ["-creado_en"]
 
+    def get_throttles(self):
+        # solo el alta (la caja) usa el bucket de checkout; el listado no lo consume
+        if self.action == "create":
+            return [LimiteCheckout()]
+        return super().get_throttles()
+
+    def get_queryset(self):
+        qs = Sale.objects.all().order_by("-creado_en")
+        related = [
+            rel for rel, campos in (
+                ("sucursal", ("sucursal", "sucursal_nombre")),
+                ("usuario", ("usuario_username",)),
+            )
+            if self._pide(*campos)
+        ]
+        if related:
+            qs = qs.select_related(*related)
+        if self._pide("items"):
+            qs = qs.prefetch_related("items__producto")
+        elif self._pide("total"):
+            qs = qs.annotate(_total=_total_venta_subquery())
+        return _scope_by_branch_on_model(qs, self.request.user, branch_field="sucursal")
+
+
+# =========================
+# TRANSFERENCIAS ENTRE SUCURSALES
+# =========================
+class TransferViewSet(
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    POST /api/transferencias/
+    {"origen": 1, "destino": 2, "motivo": "...", "items": [{"sku": "A1", "cantidad": 5}, {"producto": 7, "cantidad": 2}]}
+    Las transferencias no se editan ni se borran: se corrigen con otra transferencia.
+    """
+    serializer_class = TransferSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ["id", "origen", "destino"]
+    ordering_fields = ["id", "creado_en"]
+    ordering = ["-creado_en"]
+
     def get_queryset(self):
+        branches = _scope_branches(Branch.objects.all(), self.request.user)
         qs = (
-            Sale.objects
-            .select_related("sucursal", "usuario")
-            .prefetch_related("items__producto")
-            .all()
+            Transfer.objects
+            .filter(Q(origen__in=branches) | Q(destino__in=branches))
+            .select_related("origen", "destino", "usuario")
+            .prefetch_related(
+                Prefetch("movimientos", queryset=StockMovement.objects.select_related("producto").order_by("id"))
+            )
             .order_by("-creado_en")
         )
-        return _scope_by_branch_on_model(qs, self.request.user, branch_field="sucursal")
+        return qs
+
+
+# =========================
+# WEBHOOKS (destinos del outbox, solo admin)
+# =========================
+class WebhookEndpointViewSet(viewsets.ModelViewSet):
+    """
+    POST /api/webhooks/ {"url": "https://...", "tipos": ["venta.creada"]}
+    Los eventos de la empresa se entregan en lotes con `manage.py deliver_webhooks`.
+    El secreto (firma HMAC de cada POST) se genera al crear.
+    """
+    serializer_class = WebhookEndpointSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+    ordering = ["id"]
+
+    def get_queryset(self):
+        return WebhookEndpoint.objects.filter(owner=self.request.user).order_by("id")
+
+    @action(detail=True, methods=["post"])
+    def reintentar(self, request, pk=None):
+        """Saca al endpoint del backoff (y lo reactiva): el próximo ciclo del worker lo entrega."""
+        endpoint = self.get_object()
+        endpoint.activo = True
+        endpoint.intentos = 0
+        endpoint.proximo_intento = None
+        endpoint.save(update_fields=["activo", "intentos", "proximo_intento"])
+        return Response(self.get_serializer(endpoint).data)
 
 
 # =========================
@@ -517,42 +945,73 @@ class SaleViewSet(viewsets.ModelViewSet):
 # =========================
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
+@throttle_classes([LimiteReportes])
 def low_stock(request):
     """
-    Lista productos con stock <= threshold (por movimientos).
+    Lista productos con stock <= threshold (saldos mantenidos por movimientos).
     Usa stock_min del producto si está definido; si no, usa 'threshold'.
     Query params:
-      - threshold: int (default 5)
-      - limit:     int (default 50)
+      - threshold: int (default: umbral de la empresa, set de bajo stock mantenido)
+      - limit:     int (default 50, máx. 1000)
     """
-    try:
-        threshold = int(request.query_params.get("threshold", 5))
-    except ValueError:
-        threshold = 5
+    threshold = _threshold_param(request)
 
-    try:
-        limit = int(request.query_params.get("limit", 50))
-    except ValueError:
-        limit = 50
+    limit = _limit_param(request, 50, 1000)
 
-    qs = Product.objects.select_related("categoria", "sucursal").all()
+    qs = _bajo_stock_qs(threshold).select_related("producto__categoria", "sucursal").order_by("producto_id")
     qs = _scope_by_branch_on_model(qs, request.user, branch_field="sucursal")
 
-    rows = []
-    for p in qs:
-        stock_actual = _stock_actual_producto(p)
-        limite = p.stock_min if p.stock_min is not None else threshold
-        if stock_actual <= limite:
-            rows.append({
-                "id": p.id,
-                "producto": p.nombre,
-                "categoria": p.categoria.nombre if p.categoria else None,
-                "sucursal": p.sucursal.name if p.sucursal else None,
-                "stock": stock_actual,
-            })
+    rows = [
+        {
+            "id": bal.producto_id,
+            "producto": bal.producto.nombre,
+            "categoria": bal.producto.categoria.nombre if bal.producto.categoria else None,
+            "sucursal": bal.sucursal.name if bal.sucursal else None,
+            "stock": bal.cantidad,
+        }
+        for bal in qs[:limit]
+    ]
+    return Response({"threshold": threshold if threshold is not None else limite_default(), "items": rows})
 
-    rows = rows[:limit]
-    return Response({"threshold": threshold, "items": rows})
+
+# =========================
+# ALERTAS DE BAJO STOCK (set mantenido)
+# =========================
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([LimiteReportes])
+def alertas_stock(request):
+    """
+    GET /api/stock/alertas/?sucursal=<id>&limit=100
+    Productos actualmente en bajo stock según el set mantenido por movimientos,
+    con el límite aplicado y desde cuándo están bajos (más recientes primero).
+    """
+    limit = _limit_param(request, 100, 1000)
+
+    qs = _bajo_stock_qs().select_related("producto", "sucursal").order_by("-bajo_stock_desde", "producto_id")
+    qs = _scope_by_branch_on_model(qs, request.user, branch_field="sucursal")
+
+    sucursal_id = request.query_params.get("sucursal")
+    if sucursal_id:
+        try:
+            qs = qs.filter(sucursal_id=int(sucursal_id))
+        except ValueError:
+            return Response({"detail": "Parámetro 'sucursal' inválido."}, status=400)
+
+    items = [
+        {
+            "producto_id": bal.producto_id,
+            "producto": bal.producto.nombre,
+            "sku": bal.producto.sku,
+            "sucursal_id": bal.sucursal_id,
+            "sucursal": bal.sucursal.name,
+            "stock": bal.cantidad,
+            "limite": bal.limite,
+            "desde": bal.bajo_stock_desde,
+        }
+        for bal in qs[:limit]
+    ]
+    return Response({"count": len(items), "items": items})
 
 
 # =========================
@@ -560,6 +1019,8 @@ def low_stock(request):
 # =========================
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated, IsAdmin])
+@throttle_classes([LimiteExportaciones])
+@vista_de_reporte
 def export_sales_excel(request):
     # Scope por owner=admin
     qs = (
@@ -600,6 +1061,7 @@ def export_sales_excel(request):
 # =========================
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
+@throttle_classes([LimiteReportes])
 def ventas_hoy_empresa(request):
     """
     GET /api/ventas/hoy/empresa
@@ -616,31 +1078,71 @@ def ventas_hoy_empresa(request):
     start = timezone.make_aware(datetime.combine(hoy, time.min), tz)
     end   = timezone.make_aware(datetime.combine(hoy, time.max), tz)
 
-    qs = (Sale.objects
-          .filter(creado_en__range=(start, end))
-          .prefetch_related("items")
-          .select_related("sucursal"))
+    def calcular():
+        qs = (Sale.objects
+              .filter(creado_en__range=(start, end))
+              .prefetch_related(_items_prefetch(creado_en__range=(start, end)))
+              .select_related("sucursal"))
 
-    # Respeta scoping por sucursal/owner
-    qs = _scope_by_branch_on_model(qs, request.user, branch_field="sucursal")
+        # Respeta scoping por sucursal/owner
+        qs = _scope_by_branch_on_model(qs, request.user, branch_field="sucursal")
 
-    total = 0.0
-    for v in qs:
-        total += float(sum(it.cantidad * it.precio_unit for it in v.items.all()))
+        total = 0.0
+        for v in qs:
+            total += float(sum(it.cantidad * it.precio_unit for it in v.items.all()))
+        return total
 
+    # mismo alcance (empresa / sucursal) y mismo día -> un solo cálculo para los simultáneos
+    total = coalescencia.compartir(
+        "ventas_hoy_empresa", (etiqueta_tenant(request.user), hoy), calcular, modelo=Sale
+    )
     return Response({"fecha": str(hoy), "monto_total_hoy": total})
 
 
 # =========================
 # KARDEX por producto (JSON + XLSX)
 # =========================
+def _movimientos_kardex(request, producto_id, sucursal_id, incluir_archivo=False):
+    """
+    Movimientos del producto en la sucursal en orden cronológico (filtros desde/hasta
+    y scoping por rol). Con incluir_archivo, primero los archivados (todos anteriores
+    a lo vivo) y sin la apertura que los reemplaza. Cada fila trae .archivado.
+    """
+    desde = request.query_params.get("desde")  # formato 'YYYY-MM-DD'
+    hasta = request.query_params.get("hasta")
+
+    qs = StockMovement.objects.filter(producto_id=producto_id, sucursal_id=sucursal_id)
+    if desde and hasta:
+        qs = qs.filter(**_rango_fechas(desde, hasta))
+    qs = _scope_by_branch_on_model(qs, request.user, branch_field="sucursal")
+    vivos = qs.order_by("creado_en", "id").only("id", "creado_en", "tipo", "cantidad", "motivo")
+    if not incluir_archivo:
+        for m in vivos:
+            m.archivado = False
+            yield m
+        return
+
+    # el archivo puede estar en otra base: el scoping se resuelve sobre la sucursal
+    if _scope_branches(Branch.objects.filter(pk=sucursal_id), request.user).exists():
+        for a in historia(producto_id, sucursal_id, desde, hasta).iterator():
+            a.id, a.archivado = a.original_id, True
+            yield a
+    for m in vivos.filter(apertura=False):
+        m.archivado = False
+        yield m
+
+
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
+@throttle_classes([LimiteReportes])
+@vista_de_reporte
 def kardex_producto(request, producto_id):
     """
-    GET /api/productos/<producto_id>/kardex?sucursal=<id>&desde=&hasta=
+    GET /api/productos/<producto_id>/kardex?sucursal=<id>&desde=&hasta=&archivo=1
     Devuelve todos los movimientos de ese producto en esa sucursal,
-    ordenados cronológicamente, con saldo acumulado.
+    ordenados cronológicamente, con saldo acumulado. Los movimientos
+    archivados están resumidos en su saldo de apertura; archivo=1 los
+    trae en su lugar.
     """
     # 1) Validar que venga 'sucursal'
     sucursal_id = request.query_params.get("sucursal")
@@ -653,41 +1155,29 @@ def kardex_producto(request, producto_id):
     except ValueError:
         return Response({"detail": "Parámetro 'sucursal' inválido."}, status=400)
 
-    # 3) Base QuerySet con producto y sucursal
-    qs = (
-        StockMovement.objects
-        .filter(producto_id=producto_id, sucursal_id=sucursal_id)
-        .select_related("producto", "sucursal")
-    )
-
-    # 4) Filtros de fecha (opcionales)
-    desde = request.query_params.get("desde")  # formato 'YYYY-MM-DD'
-    hasta = request.query_params.get("hasta")
-    if desde and hasta:
-        qs = qs.filter(creado_en__date__range=(desde, hasta))
-
-    # 5) Scoping por rol / empresa
-    qs = _scope_by_branch_on_model(qs, request.user, branch_field="sucursal")
-
-    # 6) Orden cronológico
-    qs = qs.order_by("creado_en")
+    # 3) Movimientos (con ?archivo=1 también la historia archivada, ver archivo.py)
+    incluir_archivo = request.query_params.get("archivo") in ("1", "true")
+    filas = _movimientos_kardex(request, producto_id, sucursal_id, incluir_archivo)
 
-    # 7) Construir respuesta con saldo acumulado
+    # 4) Construir respuesta con saldo acumulado
     saldo = 0
     items = []
-    for m in qs:
+    for m in filas:
         delta = m.cantidad if m.tipo == "IN" else -m.cantidad
         saldo += delta
-        items.append({
+        item = {
             "id": m.id,
             "fecha": m.creado_en,   # si querés, después te lo paso en zona horaria local
             "tipo": m.tipo,         # IN / OUT
             "cantidad": m.cantidad,
             "motivo": m.motivo,
             "saldo": saldo,         # saldo luego de este movimiento
-        })
+        }
+        if incluir_archivo:
+            item["archivado"] = m.archivado
+        items.append(item)
 
-    # 8) Respuesta final
+    # 5) Respuesta final
     return Response({
         "producto_id": int(producto_id),
         "sucursal_id": sucursal_id,
@@ -697,15 +1187,19 @@ def kardex_producto(request, producto_id):
 
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
+@throttle_classes([LimiteExportaciones])
+@vista_de_reporte
 def kardex_producto_xlsx(request, producto_id):
     sucursal_id = request.query_params.get("sucursal")
     if not sucursal_id:
         return Response({"detail": "Parámetro 'sucursal' requerido."}, status=400)
-    qs = (StockMovement.objects.filter(producto_id=producto_id, sucursal_id=sucursal_id)
-          .select_related("producto", "sucursal").order_by("creado_en"))
-    d = request.query_params.get("desde"); h = request.query_params.get("hasta")
-    if d and h: qs = qs.filter(creado_en__date__range=(d, h))
-    qs = _scope_by_branch_on_model(qs, request.user, branch_field="sucursal")
+    try:
+        sucursal_id = int(sucursal_id)
+    except ValueError:
+        return Response({"detail": "Parámetro 'sucursal' inválido."}, status=400)
+    qs = _movimientos_kardex(
+        request, producto_id, sucursal_id, request.query_params.get("archivo") in ("1", "true")
+    )
 
     wb = Workbook(); ws = wb.active
     ws.title = "Kardex"
@@ -721,3 +1215,414 @@ def kardex_producto_xlsx(request, producto_id):
     resp = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
     resp['Content-Disposition'] = f'attachment; filename="kardex_producto_{producto_id}_suc_{sucursal_id}.xlsx"'
     wb.save(resp); return resp
+
+
+# =========================
+# DASHBOARD EMPRESA (todas las sucursales en pocas queries agrupadas)
+# =========================
+def _rango_hoy():
+    """(hoy, inicio, fin) del día local, con datetimes aware."""
+    hoy = timezone.localdate()
+    tz = timezone.get_current_timezone()
+    return (
+        hoy,
+        timezone.make_aware(datetime.combine(hoy, time.min), tz),
+        timezone.make_aware(datetime.combine(hoy, time.max), tz),
+    )
+
+
+def _dashboard_ventas(branch_ids, inicio, fin):
+    """{sucursal_id: {"monto", "tickets"}} en una query agrupada."""
+    rows = (
+        SaleItem.objects
+        .filter(venta__sucursal_id__in=branch_ids, creado_en__range=(inicio, fin))
+        .values("venta__sucursal_id")
+        .annotate(
+            monto=Sum(F("cantidad") * F("precio_unit"), output_field=DecimalField(max_digits=14, decimal_places=2)),
+            tickets=Count("venta", distinct=True),
+        )
+        .order_by()
+    )
+    return {
+        r["venta__sucursal_id"]: {"monto": float(r["monto"] or 0), "tickets": r["tickets"]}
+        for r in rows
+    }
+
+
+def _dashboard_bajo_stock(branch_ids, threshold=None):
+    """{sucursal_id: cantidad de productos con stock <= stock_min (o threshold)}."""
+    rows = (
+        _bajo_stock_qs(threshold)
+        .filter(sucursal_id__in=branch_ids)
+        .values("sucursal_id")
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    return {r["sucursal_id"]: r["n"] for r in rows}
+
+
+def _dashboard_top_productos(branch_ids, inicio, fin, top):
+    """{sucursal_id: [top productos vendidos hoy por cantidad]}."""
+    rows = (
+        SaleItem.objects
+        .filter(venta__sucursal_id__in=branch_ids, creado_en__range=(inicio, fin))
+        .values("venta__sucursal_id", "producto_id", "producto__nombre")
+        .annotate(
+            unidades=Sum("cantidad"),
+            monto=Sum(F("cantidad") * F("precio_unit"), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        )
+        .order_by("venta__sucursal_id", "-unidades", "producto_id")
+    )
+    out = {}
+    for r in rows:
+        lista = out.setdefault(r["venta__sucursal_id"], [])
+        if len(lista) < top:
+            lista.append({
+                "producto_id": r["producto_id"],
+                "producto": r["producto__nombre"],
+                "cantidad": r["unidades"],
+                "monto": float(r["monto"] or 0),
+            })
+    return out
+
+
+def _armar_dashboard(branches, hoy, threshold, ventas, bajo_stock, top_productos):
+    sucursales = []
+    for b in branches:
+        v = ventas.get(b.id, {"monto": 0.0, "tickets": 0})
+        sucursales.append({
+            "id": b.id,
+            "nombre": b.name,
+            "ventas_hoy": v,
+            "productos_bajo_stock": bajo_stock.get(b.id, 0),
+            "top_productos": top_productos.get(b.id, []),
+        })
+    return {
+        "fecha": str(hoy),
+        "threshold": threshold if threshold is not None else limite_default(),
+        "totales": {
+            "monto": sum(s["ventas_hoy"]["monto"] for s in sucursales),
+            "tickets": sum(s["ventas_hoy"]["tickets"] for s in sucursales),
+            "productos_bajo_stock": sum(s["productos_bajo_stock"] for s in sucursales),
+        },
+        "sucursales": sucursales,
+    }
+
+
+def _dashboard_params(request):
+    threshold = _threshold_param(request)
+    try:
+        top = max(0, min(int(request.query_params.get("top", 5)), 50))
+    except ValueError:
+        top = 5
+    return threshold, top
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([LimiteReportes])
+def dashboard_empresa(request):
+    """
+    GET /api/dashboard/empresa/?top=5[&threshold=5]
+    Para todas las sucursales del usuario (admin: las suyas; limMerchant: la propia):
+      - ventas de hoy (monto y cantidad de tickets)
+      - cantidad de productos en bajo stock
+      - top productos vendidos hoy
+    4 queries en total, sin importar la cantidad de sucursales.
+    """
+    threshold, top = _dashboard_params(request)
+    hoy, inicio, fin = _rango_hoy()
+
+    branches = list(_scope_branches(Branch.objects.all().order_by("id"), request.user))
+    ids = [b.id for b in branches]
+
+    return Response(_armar_dashboard(
+        branches, hoy, threshold,
+        ventas=_dashboard_ventas(ids, inicio, fin),
+        bajo_stock=_dashboard_bajo_stock(ids, threshold),
+        top_productos=_dashboard_top_productos(ids, inicio, fin, top),
+    ))
+
+
+# =========================
+# VALORIZACIÓN (empresa)
+# =========================
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([LimiteReportes])
+def valorizacion_empresa(request):
+    """
+    GET /api/valorizacion/empresa/
+    Valor del inventario por sucursal y total (admin: sus sucursales;
+    limMerchant: la propia). Una query agrupada sobre los saldos mantenidos.
+    """
+    branches = list(_scope_branches(Branch.objects.all().order_by("id"), request.user))
+    totales = _valorizacion_totales(
+        StockBalance.objects.filter(sucursal_id__in=[b.id for b in branches]), "sucursal_id"
+    )
+
+    sucursales = []
+    for b in branches:
+        t = totales.get(b.id, {"unidades": 0, "valor": 0.0})
+        sucursales.append({"id": b.id, "nombre": b.name, **t})
+    return Response({
+        "metodo": metodo_valorizacion(),
+        "unidades": sum(s["unidades"] for s in sucursales),
+        "valor_total": sum(s["valor"] for s in sucursales),
+        "sucursales": sucursales,
+    })
+
+
+# =========================
+# DIAGNÓSTICO (solo superuser)
+# =========================
+@api_view(["GET", "DELETE"])
+@permission_classes([permissions.IsAuthenticated, IsSuperuser])
+def consultas_lentas(request):
+    """
+    GET    /api/diagnostico/consultas-lentas/?limit=50[&id=<id>]
+    DELETE /api/diagnostico/consultas-lentas/  (vacía el buffer)
+    Últimas queries por encima de SYSSTOCK_SLOW_QUERY_MS, con vista, tenant,
+    parámetros y EXPLAIN.
+    """
+    if request.method == "DELETE":
+        CONSULTAS_LENTAS.limpiar()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    registro_id = request.query_params.get("id")
+    if registro_id:
+        registro = CONSULTAS_LENTAS.obtener(registro_id)
+        if registro is None:
+            return Response({"detail": "No encontrado."}, status=404)
+        return Response(registro)
+
+    try:
+        limit = max(1, min(int(request.query_params.get("limit", 50)), 1000))
+    except ValueError:
+        limit = 50
+    items = CONSULTAS_LENTAS.listar(limit)
+    return Response({"umbral_ms": getattr(settings, "SYSSTOCK_SLOW_QUERY_MS", None), "count": len(items), "items": items})
+
+
+@api_view(["GET", "DELETE"])
+@permission_classes([permissions.IsAuthenticated, IsSuperuser])
+def perfiles(request):
+    """
+    GET    /api/diagnostico/perfiles/?limit=20   (resumen de los últimos perfiles)
+    DELETE /api/diagnostico/perfiles/
+    Los perfiles se generan con ?_profile=1 (cProfile) o ?_profile=sample en cualquier URL.
+    """
+    if request.method == "DELETE":
+        PERFILES.limpiar()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    try:
+        limit = max(1, min(int(request.query_params.get("limit", 20)), 200))
+    except ValueError:
+        limit = 20
+    items = [
+        {k: v for k, v in r.items() if k not in ("datos", "queries", "texto")} | {"queries": len(r["queries"])}
+        for r in PERFILES.listar(limit)
+    ]
+    return Response({"count": len(items), "items": items})
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated, IsSuperuser])
+def perfil_detalle(request, perfil_id):
+    """
+    GET /api/diagnostico/perfiles/<id>/?formato=texto|pstats|speedscope
+    """
+    registro = PERFILES.obtener(perfil_id)
+    if registro is None:
+        return Response({"detail": "No encontrado."}, status=404)
+    return respuesta_perfil(registro, request.query_params.get("formato"))
+
+
+# =========================
+# VISTAS ASYNC (ASGI): agregados independientes en paralelo
+# =========================
+def _autenticar(request):
+    """
+    Autenticación de DRF (JWT) para las vistas async: devuelve el Request de DRF
+    (request.user / request.query_params) y el alias de la empresa (shards).
+    Corre en el pool: el JWT busca el usuario.
+    """
+    drf_request = Request(request, authenticators=[a() for a in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    drf_request.user  # fuerza la autenticación acá y no en el event loop
+    return drf_request, shards.alias()
+
+
+def _json(data, status=200):
+    return HttpResponse(ORJSONRenderer().render(data), content_type="application/json", status=status)
+
+
+async def _request_autenticado(request):
+    """(drf_request, None) o (None, respuesta de error) con los mismos códigos que las vistas DRF."""
+    if request.method != "GET":
+        return None, HttpResponseNotAllowed(["GET"])
+    try:
+        drf_request, alias = await en_pool(_autenticar, request)
+    except AuthenticationFailed as e:
+        return None, _no_autenticado(request, e.detail)
+    if not drf_request.user.is_authenticated:
+        return None, _no_autenticado(request, NotAuthenticated.default_detail)
+    # el pool corre sobre una copia del contexto: el alias se fija acá para las consultas que siguen
+    shards.activar(alias)
+    return drf_request, None
+
+
+def _limitado(drf_request, clase):
+    """429 con Retry-After si la empresa agotó su bucket de 'clase' (limites.py), o None."""
+    permitido, espera = permitir(drf_request, clase)
+    if permitido:
+        return None
+    resp = _json({"detail": "Demasiados requests: reintentá más tarde."}, status=429)
+    resp["Retry-After"] = str(math.ceil(espera))
+    return resp
+
+
+def _no_autenticado(request, detail):
+    # mismo cuerpo que el exception handler de DRF
+    resp = _json(detail if isinstance(detail, dict) else {"detail": detail}, status=401)
+    for autenticador in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        resp["WWW-Authenticate"] = autenticador().authenticate_header(request)
+        break
+    return resp
+
+
+async def resumen_async(request, pk):
+    """
+    GET /api/async/sucursales/<id>/resumen/?threshold=5
+    Igual que /api/sucursales/<id>/resumen/, pero ventas de hoy y bajo stock
+    se consultan en paralelo (asincrono.reunir).
+    """
+    drf_request, error = await _request_autenticado(request)
+    if error:
+        return error
+    limitado = _limitado(drf_request, "reportes")
+    if limitado:
+        return limitado
+
+    branch = await en_pool(
+        lambda: _scope_branches(Branch.objects.filter(pk=pk), drf_request.user).first()
+    )
+    if branch is None:
+        return _json({"detail": "No encontrado."}, status=404)
+    mensaje = _permiso_resumen(drf_request.user, branch)
+    if mensaje:
+        return _json({"detail": mensaje}, status=403)
+
+    hoy, inicio, fin = _rango_hoy()
+    threshold = _threshold_param(drf_request)
+    monto, bajo_stock = await reunir(
+        (_resumen_ventas_hoy, branch.id, inicio, fin),
+        (_resumen_bajo_stock, branch.id, threshold),
+    )
+    return _json(_armar_resumen(branch, hoy, threshold, monto, bajo_stock))
+
+
+async def dashboard_empresa_async(request):
+    """
+    GET /api/async/dashboard/empresa/?top=5[&threshold=5]
+    Igual que /api/dashboard/empresa/, con ventas, bajo stock y top productos en paralelo.
+    """
+    drf_request, error = await _request_autenticado(request)
+    if error:
+        return error
+    limitado = _limitado(drf_request, "reportes")
+    if limitado:
+        return limitado
+
+    threshold, top = _dashboard_params(drf_request)
+    hoy, inicio, fin = _rango_hoy()
+    branches = await en_pool(
+        lambda: list(_scope_branches(Branch.objects.all().order_by("id"), drf_request.user))
+    )
+    ids = [b.id for b in branches]
+
+    ventas, bajo_stock, top_productos = await reunir(
+        (_dashboard_ventas, ids, inicio, fin),
+        (_dashboard_bajo_stock, ids, threshold),
+        (_dashboard_top_productos, ids, inicio, fin, top),
+    )
+    return _json(_armar_dashboard(branches, hoy, threshold, ventas, bajo_stock, top_productos))
+
+
+# =========================
+# STREAM SSE por sucursal (ASGI)
+# =========================
+def _sse(evento_id, tipo, datos):
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (evento_id, tipo.encode(), ORJSONRenderer().render(datos))
+
+
+async def _resumen_sse(branch, threshold):
+    hoy, inicio, fin = _rango_hoy()
+    monto, bajo_stock = await reunir(
+        (_resumen_ventas_hoy, branch.id, inicio, fin),
+        (_resumen_bajo_stock, branch.id, threshold),
+    )
+    return _sse(0, "resumen", _armar_resumen(branch, hoy, threshold, monto, bajo_stock))
+
+
+async def _eventos_sucursal(branch, threshold):
+    sub = stream.BUS.suscribir(branch.id)
+    if sub is None:
+        yield _sse(0, stream.RESYNC, {"motivo": "servidor lleno, reintentar"})
+        return
+    try:
+        yield b"retry: 3000\n\n"
+        # suscripto antes del estado inicial: lo que se confirme mientras se calcula llega después
+        yield await _resumen_sse(branch, threshold)
+
+        loop = asyncio.get_running_loop()
+        latido = float(getattr(settings, "SYSSTOCK_STREAM_HEARTBEAT", 15))
+        cierre = loop.time() + float(getattr(settings, "SYSSTOCK_STREAM_MAX_SECONDS", 300))
+        while (restante := cierre - loop.time()) > 0:
+            evento = await sub.siguiente(min(latido, restante))
+            if evento is None:
+                yield b": ping\n\n"
+                continue
+            yield _sse(*evento)
+            if evento[1] == stream.RESYNC:
+                yield await _resumen_sse(branch, threshold)
+    finally:
+        stream.BUS.desuscribir(sub)
+
+
+async def stream_sucursal(request, pk):
+    """
+    GET /api/stream/sucursales/<id>/?threshold=5   (text/event-stream, solo bajo ASGI)
+    Reemplaza el polling de resumen/ventas de hoy. Eventos:
+      - resumen: estado inicial (mismo cuerpo que /resumen/)
+      - stock: saldos que cambiaron [{producto_id, stock, bajo_stock}]
+      - venta: venta confirmada {id, total, items, usuario_id, creado_en}
+      - stock.bajo / stock.normal: cruces del límite de bajo stock
+      - resync: el cliente no leyó a tiempo y se descartaron eventos; le sigue un resumen
+    Comentarios ': ping' cada SYSSTOCK_STREAM_HEARTBEAT s. El stream se cierra a los
+    SYSSTOCK_STREAM_MAX_SECONDS y EventSource reconecta solo (retry: 3000).
+    """
+    drf_request, error = await _request_autenticado(request)
+    if error:
+        return error
+    if not isinstance(request, ASGIRequest):
+        return _json({"detail": "El stream requiere el servidor ASGI (SYSSTOCK_ASGI=True)."}, status=501)
+
+    branch = await en_pool(
+        lambda: _scope_branches(Branch.objects.filter(pk=pk), drf_request.user).first()
+    )
+    if branch is None:
+        return _json({"detail": "No encontrado."}, status=404)
+    mensaje = _permiso_resumen(drf_request.user, branch)
+    if mensaje:
+        return _json({"detail": mensaje}, status=403)
+    if stream.BUS.lleno():
+        resp = _json({"detail": "Demasiados streams abiertos."}, status=503)
+        resp["Retry-After"] = "5"
+        return resp
+
+    resp = StreamingHttpResponse(
+        _eventos_sucursal(branch, _threshold_param(drf_request)), content_type="text/event-stream"
+    )
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"  # nginx: no bufferear el stream
+    return resp
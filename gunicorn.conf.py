@@ -0,0 +1,33 @@
+"""
+Gunicorn para producción (PORT / WEB_CONCURRENCY como en Railway/Heroku).
+
+  WSGI (default):  gunicorn -c gunicorn.conf.py
+  ASGI:            SYSSTOCK_ASGI=True gunicorn -c gunicorn.conf.py
+
+ASGI corre workers de uvicorn (paquete uvicorn-worker) sobre sysstock.asgi:
+las vistas /api/async/... resuelven sus agregados en paralelo sin ocupar un
+thread por request. Las vistas sync (el resto de la API) se ejecutan bajo
+ASGI en el hilo único de asgiref por worker, así que conviene:
+  - servir /api/async/ desde un servicio ASGI y el resto desde WSGI, o
+  - correr ASGI con más workers (WEB_CONCURRENCY) que un despliegue WSGI.
+Comparar con: python manage.py bench_async --wsgi-url ... --asgi-url ...
+"""
+import multiprocessing
+import os
+
+ASGI = os.getenv("SYSSTOCK_ASGI", "False").lower() in ("1", "true", "yes")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+keepalive = 5
+accesslog = "-"
+
+if ASGI:
+    wsgi_app = "sysstock.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+    # el event loop atiende la concurrencia; las queries van al pool SYSSTOCK_ASYNC_DB_WORKERS
+else:
+    wsgi_app = "sysstock.wsgi:application"
+    worker_class = "gthread"
+    threads = int(os.getenv("GUNICORN_THREADS", "4"))
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sysstock.settings')
 
 application = get_asgi_application()
+
+# SSE (/api/stream/...): cancela el stream si el cliente corta la conexión
+from SysstockApp.eventos import cortar_al_desconectar  # noqa: E402  (después de cargar las apps)
+
+application = cortar_al_desconectar(application)
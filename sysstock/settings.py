@@ -1,4 +1,6 @@
 from pathlib import Path
+import importlib.util
+import tempfile
 import os
 from datetime import timedelta
 import pymysql
@@ -33,7 +35,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "SysstockApp.middleware.QueryMetricsMiddleware",
+    "SysstockApp.middleware.ReplicaMiddleware",
+    "SysstockApp.middleware.ShardMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "SysstockApp.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -41,6 +47,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "SysstockApp.middleware.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "sysstock.urls"
@@ -113,6 +120,103 @@ except (ImportError, ValueError) as e:
         }
     }
 
+# Réplica de lectura para reportes/exportaciones (alias "reporting", ver SysstockApp/replica.py).
+# Local: REPORTING_DATABASE_URL=sqlite:////ruta/replica.sqlite3 + `manage.py sync_replica`.
+REPORTING_DATABASE_URL = os.getenv("REPORTING_DATABASE_URL") or None
+if REPORTING_DATABASE_URL:
+    import dj_database_url
+
+    DATABASES["reporting"] = dj_database_url.parse(
+        REPORTING_DATABASE_URL, conn_max_age=600, conn_health_checks=True
+    )
+    if DATABASES["reporting"]["ENGINE"] == "django.db.backends.mysql":
+        DATABASES["reporting"]["OPTIONS"] = {"charset": "utf8mb4"}
+    # en tests la réplica es la misma base que default
+    DATABASES["reporting"]["TEST"] = {"MIRROR": "default"}
+
+# Archivo de movimientos (alias "archivo", ver SysstockApp/archivo.py). Sin ARCHIVE_DATABASE_URL
+# StockMovementArchive queda en default. Con alias propio: `manage.py migrate --database archivo`.
+ARCHIVE_DATABASE_URL = os.getenv("ARCHIVE_DATABASE_URL") or None
+if ARCHIVE_DATABASE_URL:
+    import dj_database_url
+
+    DATABASES["archivo"] = dj_database_url.parse(ARCHIVE_DATABASE_URL, conn_max_age=600, conn_health_checks=True)
+    if DATABASES["archivo"]["ENGINE"] == "django.db.backends.mysql":
+        DATABASES["archivo"]["OPTIONS"] = {"charset": "utf8mb4"}
+
+# Sharding por empresa (opcional, ver SysstockApp/shards.py): "shard1=<url>,shard2=<url>" agrega
+# esos aliases; la empresa vive donde diga TenantShard (default si no tiene fila).
+# Local: SYSSTOCK_SHARDS=shard1=sqlite:////tmp/s1.sqlite3 + `manage.py migrate_shards`.
+SYSSTOCK_SHARDS = []
+for _shard in filter(None, (s.strip() for s in os.getenv("SYSSTOCK_SHARDS", "").split(","))):
+    import dj_database_url
+
+    _alias, _, _url = (p.strip() for p in _shard.partition("="))
+    SYSSTOCK_SHARDS.append(_alias)
+    DATABASES[_alias] = dj_database_url.parse(_url, conn_max_age=600, conn_health_checks=True)
+    if DATABASES[_alias]["ENGINE"] == "django.db.backends.mysql":
+        DATABASES[_alias]["OPTIONS"] = {"charset": "utf8mb4"}
+
+# segundos que cada proceso cachea el registro empresa -> alias (move_tenant espera este tiempo)
+SYSSTOCK_SHARD_CACHE_SECONDS = float(os.getenv("SYSSTOCK_SHARD_CACHE_SECONDS", "5"))
+
+DATABASE_ROUTERS = [
+    "SysstockApp.shards.ShardRouter",
+    "SysstockApp.archivo.ArchivoRouter",
+    "SysstockApp.replica.ReportingRouter",
+]
+# atraso máximo tolerado (s) antes de mandar los reportes al primario ("" = no medir)
+SYSSTOCK_REPLICA_MAX_LAG = float(os.getenv("SYSSTOCK_REPLICA_MAX_LAG", "5") or 0) or None
+SYSSTOCK_REPLICA_LAG_CHECK_SECONDS = float(os.getenv("SYSSTOCK_REPLICA_LAG_CHECK_SECONDS", "1"))
+# después de escribir, los reportes de ese cliente leen del primario durante N segundos
+# (por usuario en el alias de CACHES dado: LocMem = por proceso, Redis / Memcached = compartido; y cookie)
+SYSSTOCK_REPLICA_PIN_SECONDS = float(os.getenv("SYSSTOCK_REPLICA_PIN_SECONDS", "5"))
+SYSSTOCK_REPLICA_PIN_CACHE = os.getenv("SYSSTOCK_REPLICA_PIN_CACHE", "default")
+
+# Vistas async (/api/async/...): hilos (y conexiones a la base) por worker para sus queries
+SYSSTOCK_ASYNC_DB_WORKERS = int(os.getenv("SYSSTOCK_ASYNC_DB_WORKERS", "8"))
+
+# Stream SSE por sucursal (/api/stream/sucursales/<id>/): eventos en cola por cliente
+# (al llenarse se descartan y se reenvía el resumen), latido, duración máxima y tope por proceso
+SYSSTOCK_STREAM_BUFFER = int(os.getenv("SYSSTOCK_STREAM_BUFFER", "100"))
+SYSSTOCK_STREAM_HEARTBEAT = float(os.getenv("SYSSTOCK_STREAM_HEARTBEAT", "15"))
+SYSSTOCK_STREAM_MAX_SECONDS = float(os.getenv("SYSSTOCK_STREAM_MAX_SECONDS", "300"))
+SYSSTOCK_STREAM_MAX_SUSCRIPTORES = int(os.getenv("SYSSTOCK_STREAM_MAX_SUSCRIPTORES", "1000"))
+
+# Outbox de eventos (ventas / movimientos) y entrega por webhooks (`manage.py deliver_webhooks`):
+# lote por POST, timeout, backoff exponencial (base y tope en s) y antigüedad mínima de un
+# evento antes de entregarlo (deja confirmar a las transacciones con ids menores)
+SYSSTOCK_OUTBOX_ENABLED = os.getenv("SYSSTOCK_OUTBOX_ENABLED", "True") == "True"
+SYSSTOCK_OUTBOX_ASENTAMIENTO = float(os.getenv("SYSSTOCK_OUTBOX_ASENTAMIENTO", "5"))
+SYSSTOCK_WEBHOOK_LOTE = int(os.getenv("SYSSTOCK_WEBHOOK_LOTE", "100"))
+SYSSTOCK_WEBHOOK_TIMEOUT = float(os.getenv("SYSSTOCK_WEBHOOK_TIMEOUT", "10"))
+SYSSTOCK_WEBHOOK_BACKOFF_BASE = float(os.getenv("SYSSTOCK_WEBHOOK_BACKOFF_BASE", "2"))
+SYSSTOCK_WEBHOOK_BACKOFF_MAX = float(os.getenv("SYSSTOCK_WEBHOOK_BACKOFF_MAX", "600"))
+# Destinos de webhooks: hosts permitidos (vacío = cualquiera con https; ".dominio" incluye
+# subdominios). ALLOW_PRIVATE permite http y direcciones internas (solo desarrollo)
+SYSSTOCK_WEBHOOK_HOSTS = [h.strip() for h in os.getenv("SYSSTOCK_WEBHOOK_HOSTS", "").split(",") if h.strip()]
+SYSSTOCK_WEBHOOK_ALLOW_PRIVATE = os.getenv("SYSSTOCK_WEBHOOK_ALLOW_PRIVATE", "False") == "True"
+
+# Tareas en segundo plano (notificaciones de bajo stock, ver SysstockApp/tareas.py):
+# "local" (hilos del proceso), "db" (tabla + `manage.py run_tasks`) o "inmediato";
+# hilos y tamaño de la cola local, claves recordadas para deduplicar y backoff (s)
+SYSSTOCK_TASKS_BACKEND = os.getenv("SYSSTOCK_TASKS_BACKEND", "local")
+SYSSTOCK_TASKS_WORKERS = int(os.getenv("SYSSTOCK_TASKS_WORKERS", "2"))
+SYSSTOCK_TASKS_QUEUE = int(os.getenv("SYSSTOCK_TASKS_QUEUE", "10000"))
+SYSSTOCK_TASKS_CLAVES = int(os.getenv("SYSSTOCK_TASKS_CLAVES", "10000"))
+SYSSTOCK_TASKS_BACKOFF_BASE = float(os.getenv("SYSSTOCK_TASKS_BACKOFF_BASE", "1"))
+SYSSTOCK_TASKS_BACKOFF_MAX = float(os.getenv("SYSSTOCK_TASKS_BACKOFF_MAX", "300"))
+
+# archive_movements: días de movimientos que quedan vivos en StockMovement (el resto va al archivo)
+SYSSTOCK_ARCHIVE_RETENTION_DAYS = int(os.getenv("SYSSTOCK_ARCHIVE_RETENTION_DAYS", "365"))
+
+# Particionado mensual de StockMovement / SaleItem (solo MySQL, ver SysstockApp/particiones.py).
+# La migración 0010 particiona al migrar; con tablas grandes poner 0 y correr
+# `manage.py manage_partitions --inicializar` en una ventana de mantenimiento.
+SYSSTOCK_PARTITIONS_ON_MIGRATE = os.getenv("SYSSTOCK_PARTITIONS_ON_MIGRATE", "1") == "1"
+# meses creados por adelantado (manage_partitions, p.ej. en un cron mensual)
+SYSSTOCK_PARTITIONS_AHEAD = int(os.getenv("SYSSTOCK_PARTITIONS_AHEAD", "3"))
+
 AUTH_PASSWORD_VALIDATORS = []
 
 LANGUAGE_CODE = "es-ar"
@@ -127,7 +231,7 @@ AUTH_USER_MODEL = "AccountAdmin.User"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "SysstockApp.shards.TenantJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
@@ -138,8 +242,86 @@ REST_FRAMEWORK = {
         "rest_framework.filters.SearchFilter",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": [
+        "SysstockApp.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "rest_framework.parsers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
+# MessagePack (Accept: application/msgpack) solo si el paquete está instalado
+if importlib.util.find_spec("msgpack"):
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"].insert(1, "SysstockApp.renderers.MessagePackRenderer")
+    REST_FRAMEWORK["DEFAULT_PARSER_CLASSES"].append("SysstockApp.renderers.MessagePackParser")
+
+# Bajo stock: umbral por defecto de la empresa (si el producto no tiene stock_min)
+# y hooks que se disparan solo al cruzar el límite ("log", "queue", "webhook")
+SYSSTOCK_LOW_STOCK_THRESHOLD = int(os.getenv("SYSSTOCK_LOW_STOCK_THRESHOLD", "5"))
+SYSSTOCK_LOW_STOCK_HOOKS = [h for h in os.getenv("SYSSTOCK_LOW_STOCK_HOOKS", "log").split(",") if h]
+SYSSTOCK_LOW_STOCK_WEBHOOK_URL = os.getenv("SYSSTOCK_LOW_STOCK_WEBHOOK_URL") or None
+SYSSTOCK_LOW_STOCK_WEBHOOK_TIMEOUT = float(os.getenv("SYSSTOCK_LOW_STOCK_WEBHOOK_TIMEOUT", "5"))
+
+# Valorización: costo promedio ponderado; True agrega capas FIFO (StockBalance.valor = FIFO)
+# Al cambiarlo correr: python manage.py rebuild_stock_balances
+SYSSTOCK_VALUATION_FIFO = os.getenv("SYSSTOCK_VALUATION_FIFO", "False").lower() in ("1", "true", "yes")
+
+# Métricas por request (Server-Timing + /metrics en formato Prometheus)
+# /metrics: Authorization: Bearer <SYSSTOCK_METRICS_TOKEN>, o superuser
+SYSSTOCK_METRICS_ENABLED = os.getenv("SYSSTOCK_METRICS_ENABLED", "True") == "True"
+SYSSTOCK_METRICS_TOKEN = os.getenv("SYSSTOCK_METRICS_TOKEN") or None
+
+# Queries lentas (requiere SYSSTOCK_METRICS_ENABLED): umbral en ms (0 = apagado),
+# muestreo 0..1, tamaño del ring buffer y EXPLAIN de cada una
+SYSSTOCK_SLOW_QUERY_MS = float(os.getenv("SYSSTOCK_SLOW_QUERY_MS", "200"))
+SYSSTOCK_SLOW_QUERY_SAMPLE_RATE = float(os.getenv("SYSSTOCK_SLOW_QUERY_SAMPLE_RATE", "1.0"))
+SYSSTOCK_SLOW_QUERY_BUFFER = int(os.getenv("SYSSTOCK_SLOW_QUERY_BUFFER", "200"))
+SYSSTOCK_SLOW_QUERY_EXPLAIN = os.getenv("SYSSTOCK_SLOW_QUERY_EXPLAIN", "True") == "True"
+
+# Profiling a pedido: ?_profile=1 (cProfile) / ?_profile=sample, solo superuser
+SYSSTOCK_PROFILING_ENABLED = os.getenv("SYSSTOCK_PROFILING_ENABLED", "True") == "True"
+SYSSTOCK_PROFILE_BUFFER = int(os.getenv("SYSSTOCK_PROFILE_BUFFER", "20"))
+SYSSTOCK_PROFILE_SAMPLE_INTERVAL = float(os.getenv("SYSSTOCK_PROFILE_SAMPLE_INTERVAL", "0.001"))
+
+# Caches: "diagnostico" compartido entre workers / management commands (archivos en disco)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "diagnostico": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv(
+            "SYSSTOCK_DIAGNOSTICO_DIR", os.path.join(tempfile.gettempdir(), "sysstock-diagnostico")
+        ),
+    },
+}
+SYSSTOCK_DIAGNOSTICO_CACHE = os.getenv("SYSSTOCK_DIAGNOSTICO_CACHE", "diagnostico") or None
+
+# Coalescencia de reportes caros (coalescencia.py): requests idénticos simultáneos
+# comparten un cálculo. Espera máxima de los que esperan; alias de CACHES para
+# coordinar procesos (vacío = solo dentro del proceso) y TTL del resultado publicado
+SYSSTOCK_COALESCE_ENABLED = os.getenv("SYSSTOCK_COALESCE_ENABLED", "True") == "True"
+SYSSTOCK_COALESCE_WAIT = float(os.getenv("SYSSTOCK_COALESCE_WAIT", "10"))
+SYSSTOCK_COALESCE_CACHE = os.getenv("SYSSTOCK_COALESCE_CACHE") or None
+SYSSTOCK_COALESCE_TTL = float(os.getenv("SYSSTOCK_COALESCE_TTL", "2"))
+
+# Límites por empresa y clase de endpoint (limites.py): token bucket de capacidad n
+# que recarga n tokens por período (s, min, h); buckets en el alias de CACHES dado
+# (LocMem = por proceso, Redis / Memcached = compartidos entre procesos)
+SYSSTOCK_RATE_LIMIT_ENABLED = os.getenv("SYSSTOCK_RATE_LIMIT_ENABLED", "True") == "True"
+SYSSTOCK_RATE_LIMITS = os.getenv(
+    "SYSSTOCK_RATE_LIMITS", "checkout=1200/min,catalogo=600/min,reportes=120/min,exportaciones=10/min"
+)
+SYSSTOCK_RATE_LIMIT_CACHE = os.getenv("SYSSTOCK_RATE_LIMIT_CACHE", "default")
+
+# Compresión de respuestas (gzip con relleno anti-BREACH; brotli si está instalado,
+# solo para requests sin cookies)
+SYSSTOCK_COMPRESSION_MIN_BYTES = int(os.getenv("SYSSTOCK_COMPRESSION_MIN_BYTES", "1024"))
+SYSSTOCK_BROTLI_QUALITY = int(os.getenv("SYSSTOCK_BROTLI_QUALITY", "4"))
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
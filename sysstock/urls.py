@@ -3,6 +3,8 @@ from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from SysstockApp.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
 
@@ -14,6 +16,9 @@ urlpatterns = [
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("api/docs/", SpectacularSwaggerView.as_view(url_name="schema"), name="swagger-ui"),
 
+    # Métricas Prometheus (token o superuser)
+    path("metrics", metrics_view, name="metrics"),
+
     # Apps (asegurá el casing exacto del paquete)
     path("api/", include("SysstockApp.urls")),
     path("api/", include("AccountAdmin.urls")),